@@ -1,41 +1,49 @@
-import pandas as pd
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, send_file
-from sqlalchemy import create_engine, text
-from config import MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DB, USERS
+from yukleme_utils import TembelModul, sureli_ice_aktar, acilis_raporu, acilis_raporunu_logla
+# Açılış raporu için modüllerin içe aktarma süreleri bağımlılık sırasıyla ölçülür
+sureli_ice_aktar('flask', 'dateutil.parser', 'config', 'cache_utils', 'database', 'mysql_db',
+                 'prim_utils', 'excel_utils', 'takvim_utils', 'tahsilat_utils')
+
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, Response
+import config
+from config import USERS
 from dateutil import parser
 import logging, pprint
-from datetime import datetime, date
+from datetime import datetime, date, timezone
 from functools import wraps
-from database import prim_db, cari_db, personel_db
-from prim_utils import *
+from database import prim_db, cari_db, personel_db, tedavi_matris_db, prim_taslak_db, sqlite_baglantilari
+from mysql_db import (get_engine, execute_query, pool_durumu, referans_cache,
+                      subeleri_getir, subeleri_getir_cari, doktorlari_getir)
+from prim_utils import (get_hekim_tahsilat_verileri, toplu_prim_taslaklari_hazirla,
+                        tahsilat_kesintilerini_hesapla, odeme_sekli_analiz, prim_hesapla,
+                        validate_prim_data, hesaplama_ozeti, kurus_toplami, tl_degeri,
+                        taslak_olustur, taslak_duzenle, taslak_hesapla, taslak_tahsilat_detaylari,
+                        prim_simulasyonu, PRIM_TASLAK_SURESI, TASLAK_GIDER_ALANLARI,
+                        VARSAYILAN_POS_KESINTISI, BANKA_KESINTISI)
+from excel_utils import ExcelRaporu, fark_stili
+from takvim_utils import (kaynak_kosulu, doktor_adlarini_esle, takvim_olaylari_json, json_kodla,
+                          OLAY_SORGUSU, parmak_izi_etag, df_etag, token_kaydet, takvim_deltasi)
+from tahsilat_utils import (tahsilat_analizi_yap, snapshot_kaydet, snapshot_getir,
+                            analiz_snapshotlari, tedavi_matrisini_guncelle, tam_yenileme_suruyor_mu,
+                            coklu_hekim_sorunlarini_olustur)
+import hashlib
 import json
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import sqlite3
+import uuid
 import io  # Excel için gerekli
 
+# pandas/SQLAlchemy ilk kullanımda yüklenir
+pd = TembelModul('pandas')
+sqlalchemy = TembelModul('sqlalchemy')
+
 app = Flask(__name__)
 app.secret_key = "supersecretkey"
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def get_database_connection():
-    return create_engine(
-        f"mysql+mysqlconnector://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}"
-    )
-
-# --- Güvenli parametreli sorgu yardımcı fonksiyonu ---
-def execute_query(query, params=None):
-    """Güvenli parametreli sorgu çalıştırma"""
-    engine = get_database_connection()
-    try:
-        if params:
-            result = pd.read_sql(text(query), engine, params=params)
-        else:
-            result = pd.read_sql(text(query), engine)
-        return result
-    except Exception as e:
-        logger.error(f"Database query error: {e}")
-        raise
-    finally:
-        engine.dispose()
+    """Paylaşılan MySQL engine'ini döndür (her çağrıda yeni engine oluşturulmaz)"""
+    return get_engine()
 
 # --- Input validation fonksiyonları ---
 def validate_required_fields(data, required_fields):
@@ -121,9 +129,7 @@ def home():
 @login_required
 def get_branches():
     try:
-        query = "SELECT CARI_ID AS id, UNVANI AS name FROM subeler WHERE SILINDI = :silindi ORDER BY UNVANI"
-        df = execute_query(query, {"silindi": "false"})
-        return jsonify(df.to_dict("records"))
+        return jsonify(subeleri_getir())
     except Exception as e:
         logger.error(f"Şubeler API hatası: {e}")
         return jsonify({"error": "Şubeler yüklenemedi"}), 500
@@ -134,35 +140,98 @@ def get_doctors():
     try:
         sube_id = request.args.get("sube_id")
         
-        if sube_id:
-            query = """
-                SELECT CARI_ID AS id, CONCAT(ADI, ' ', SOYADI) AS name, SUBE_ID, 
-                       IFNULL(PRIMYUZDE, 0) AS PRIMYUZDE
-                FROM kartdoktor
-                WHERE SILINDI = :silindi AND SUBE_ID = :sube_id
-                ORDER BY ADI, SOYADI
-            """
-            params = {"silindi": "false", "sube_id": sube_id}
-        else:
-            query = """
-                SELECT CARI_ID AS id, CONCAT(ADI, ' ', SOYADI) AS name, SUBE_ID, 
-                       IFNULL(PRIMYUZDE, 0) AS PRIMYUZDE
-                FROM kartdoktor
-                WHERE SILINDI = :silindi
-                ORDER BY ADI, SOYADI
-            """
-            params = {"silindi": "false"}
-        
-        df = execute_query(query, params)
-        
-        # NaN değerlerini 0 ile değiştir
-        df['PRIMYUZDE'] = df['PRIMYUZDE'].fillna(0)
+        df = doktorlari_getir([sube_id] if sube_id else None)
+        df = df.rename(columns={"CARI_ID": "id", "HEKIM_ADI": "name"})[["id", "name", "SUBE_ID", "PRIMYUZDE"]]
         
         return jsonify(df.to_dict("records"))
     except Exception as e:
         logger.error(f"Doktorlar API hatası: {e}")
         return jsonify({"error": "Doktorlar yüklenemedi"}), 500
 
+# --- MySQL bağlantı havuzu durumu (izleme) ---
+@app.route("/api/admin/db_pool")
+@admin_required
+def db_pool_durumu():
+    try:
+        return jsonify({"success": True, "data": pool_durumu()})
+    except Exception as e:
+        logger.error(f"Havuz durumu API hatası: {e}")
+        return jsonify({"error": "Havuz durumu alınamadı"}), 500
+
+# --- SQLite yazıcı kuyrukları (kuyruk derinliği, grup commit süreleri) ---
+@app.route("/api/admin/sqlite_yazici")
+@admin_required
+def sqlite_yazici_durumu():
+    try:
+        return jsonify({"success": True, "data": sqlite_baglantilari.yazici_durumu()})
+    except Exception as e:
+        logger.error(f"SQLite yazıcı durumu API hatası: {e}")
+        return jsonify({"error": "Yazıcı durumu alınamadı"}), 500
+
+# --- Açılış süreleri (modül içe aktarma ve ilk kullanımda yüklenenler) ---
+@app.route("/api/admin/acilis_raporu")
+@admin_required
+def acilis_raporu_api():
+    try:
+        return jsonify({"success": True, "data": acilis_raporu()})
+    except Exception as e:
+        logger.error(f"Açılış raporu API hatası: {e}")
+        return jsonify({"error": "Açılış raporu alınamadı"}), 500
+
+# --- Referans veri önbelleği (şubeler, hekimler, ödeme şekilleri) ---
+@app.route("/api/admin/referans_cache")
+@admin_required
+def referans_cache_durumu():
+    try:
+        return jsonify({"success": True, "data": referans_cache.istatistikler()})
+    except Exception as e:
+        logger.error(f"Önbellek durumu API hatası: {e}")
+        return jsonify({"error": "Önbellek durumu alınamadı"}), 500
+
+@app.route("/api/admin/referans_cache/temizle", methods=["POST"])
+@admin_required
+def referans_cache_temizle():
+    try:
+        data = request.get_json(silent=True) or {}
+        anahtar = data.get("anahtar")  # subeler / doktorlar / odeme_sekilleri, boşsa tümü
+        silinen = referans_cache.temizle(anahtar)
+        return jsonify({"success": True, "silinen": silinen})
+    except Exception as e:
+        logger.error(f"Önbellek temizleme hatası: {e}")
+        return jsonify({"error": "Önbellek temizlenemedi"}), 500
+
+# --- Tahsilat analizi snapshot deposu durumu ---
+@app.route("/api/admin/analiz_snapshotlari")
+@admin_required
+def analiz_snapshot_durumu():
+    try:
+        return jsonify({"success": True, "data": analiz_snapshotlari.istatistikler()})
+    except Exception as e:
+        logger.error(f"Snapshot durumu API hatası: {e}")
+        return jsonify({"error": "Snapshot durumu alınamadı"}), 500
+
+# --- Hasta x hekim tedavi matrisi (çoklu hekim tespiti için yerel özet) ---
+@app.route("/api/admin/tedavi_matrisi")
+@admin_required
+def tedavi_matrisi_durumu():
+    try:
+        durum = tedavi_matris_db.durum_getir()
+        durum['tam_yenileme_suruyor'] = tam_yenileme_suruyor_mu()
+        return jsonify({"success": True, "data": durum})
+    except Exception as e:
+        logger.error(f"Tedavi matrisi durum API hatası: {e}")
+        return jsonify({"error": "Tedavi matrisi durumu alınamadı"}), 500
+
+@app.route("/api/admin/tedavi_matrisi/yenile", methods=["POST"])
+@admin_required
+def tedavi_matrisi_yenile():
+    try:
+        basladi = tedavi_matrisini_guncelle(tam_yenileme=True)
+        return jsonify({"success": True, "yenileme_basladi": basladi, "data": tedavi_matris_db.durum_getir()})
+    except Exception as e:
+        logger.error(f"Tedavi matrisi yenileme hatası: {e}")
+        return jsonify({"error": "Tedavi matrisi yenilenemedi"}), 500
+
 # --- Kullanıcıya atanmış hekimler ---
 @app.route("/api/me/assignments")
 @login_required
@@ -195,29 +264,12 @@ def get_events():
             "end_date": end_date
         }
 
-        base_query = """
-        SELECT 
-            r.ROWNO,
-            r.ADISOYADI AS hasta_adi,
-            CONCAT(d.ADI, ' ', d.SOYADI) AS doktor_adi,
-            s.UNVANI AS sube_adi,
-            r.TARIH,
-            r.SAATSTART,
-            r.DAKKA,
-            r.SUBE_ID,
-            REPLACE(r.KAYNAKID, 'DOK-', '') AS doktor_id
-        FROM randevu r
-        LEFT JOIN kartdoktor d ON REPLACE(r.KAYNAKID, 'DOK-', '') = d.CARI_ID
-        LEFT JOIN subeler s ON r.SUBE_ID = s.CARI_ID
-        WHERE r.SILINDI = :silindi
-          AND r.TARIH >= :start_date
-          AND r.TARIH < :end_date
-        """
+        # Aralık ve rol filtreleri hem olay hem de parmak izi sorgularında ortak
+        kosul = "r.SILINDI = :silindi AND r.TARIH >= :start_date AND r.TARIH < :end_date"
 
         # Rol bazlı filtreleme
         if session.get("role") == "doktor":
-            base_query += " AND REPLACE(r.KAYNAKID, 'DOK-', '') = :doktor_id"
-            params["doktor_id"] = session.get("doktor_id")
+            kosul += " AND " + kaynak_kosulu("doktor", [session.get("doktor_id")], params)
             
         elif session.get("role") == "user":
             sube_id = request.args.get("sube_id")
@@ -228,70 +280,72 @@ def get_events():
                 # Kullanıcı filtreleme yaptıysa
                 doktor_ids_list = [did.strip() for did in doktor_ids_param.split(',') if did.strip()]
                 if doktor_ids_list:
-                    placeholders = ','.join([f':doktor_{i}' for i in range(len(doktor_ids_list))])
-                    base_query += f" AND r.SUBE_ID = :sube_id AND REPLACE(r.KAYNAKID, 'DOK-', '') IN ({placeholders})"
+                    kosul += " AND r.SUBE_ID = :sube_id AND " + kaynak_kosulu("doktor", doktor_ids_list, params)
                     params["sube_id"] = sube_id
-                    for i, did in enumerate(doktor_ids_list):
-                        params[f"doktor_{i}"] = did
             else:
                 # Kullanıcının atamalarına göre
                 if hekimler:
                     conditions = []
                     for i, h in enumerate(hekimler):
-                        condition = f"(r.SUBE_ID = :user_sube_{i} AND REPLACE(r.KAYNAKID, 'DOK-', '') = :user_doktor_{i})"
+                        condition = f"(r.SUBE_ID = :user_sube_{i} AND {kaynak_kosulu(f'user_doktor_{i}', [h['doktor_id']], params)})"
                         conditions.append(condition)
                         params[f"user_sube_{i}"] = h['sube_id']
-                        params[f"user_doktor_{i}"] = h['doktor_id']
                     
                     if conditions:
-                        base_query += " AND (" + " OR ".join(conditions) + ")"
+                        kosul += " AND (" + " OR ".join(conditions) + ")"
 
         else:  # Admin
             sube_id = request.args.get("sube_id")
             doktor_ids_param = request.args.get("doktor_id")
             
             if sube_id:
-                base_query += " AND r.SUBE_ID = :admin_sube_id"
+                kosul += " AND r.SUBE_ID = :admin_sube_id"
                 params["admin_sube_id"] = sube_id
                 
             if doktor_ids_param:
                 doktor_ids_list = [did.strip() for did in doktor_ids_param.split(',') if did.strip()]
                 if doktor_ids_list:
-                    placeholders = ','.join([f':admin_doktor_{i}' for i in range(len(doktor_ids_list))])
-                    base_query += f" AND REPLACE(r.KAYNAKID, 'DOK-', '') IN ({placeholders})"
-                    for i, did in enumerate(doktor_ids_list):
-                        params[f"admin_doktor_{i}"] = did
-
-        df = execute_query(base_query, params)
-
-        if df.empty:
-            return jsonify([])
-
-        # Tarih ve saat işleme
-        df["start"] = pd.to_datetime(
-            df["TARIH"].astype(str).str.strip() + " " + df["SAATSTART"].astype(str).str.strip(),
-            format="%Y-%m-%d %H:%M",
-            errors="coerce"
-        )
-        
-        df["DAKKA"] = pd.to_numeric(df["DAKKA"], errors="coerce").fillna(30)
-        df["end"] = df["start"] + pd.to_timedelta(df["DAKKA"], unit="m")
-
-        # FullCalendar formatına çevir
-        events = df.copy()
-        events["id"] = events["ROWNO"]
-        events["title"] = events["hasta_adi"]
-        events["start"] = events["start"].dt.strftime("%Y-%m-%dT%H:%M:%S")
-        events["end"] = events["end"].dt.strftime("%Y-%m-%dT%H:%M:%S")
-        events["extendedProps"] = events.apply(
-            lambda x: {
-                "doktor": x["doktor_adi"] or "Belirtilmemiş",
-                "sube": x["sube_adi"] or "Belirtilmemiş"
-            }, axis=1
-        )
-
-        logger.info(f"API çıktısı kayıt sayısı: {len(events)}")
-        return jsonify(events[["id", "title", "start", "end", "extendedProps"]].to_dict("records"))
+                    kosul += " AND " + kaynak_kosulu("admin_doktor", doktor_ids_list, params)
+
+        filtre_anahtari = "|".join([
+            str(session.get("username")), str(start_date), str(end_date),
+            request.args.get("sube_id", ""), request.args.get("doktor_id", "")
+        ])
+
+        # Delta modu: since= token'ından bu yana değişen/silinen randevular
+        since = request.args.get("since")
+        if since:
+            delta = takvim_deltasi(since, filtre_anahtari, kosul, params)
+            if delta is None:
+                return jsonify({"tam_yenileme": True})
+            yanit = Response(json_kodla(delta), mimetype="application/json")
+            yanit.headers["X-Takvim-Token"] = delta["token"]
+            return yanit
+
+        # Koşullu istek: aralık değişmediyse yalnızca tek satırlık parmak izi sorgusu çalışır
+        if request.if_none_match:
+            etag = parmak_izi_etag(filtre_anahtari, kosul, params)
+            if request.if_none_match.contains_weak(etag):
+                yanit = Response(status=304)
+                yanit.set_etag(etag, weak=True)
+                yanit.headers["Cache-Control"] = "private, no-cache"
+                return yanit
+
+        df = execute_query(OLAY_SORGUSU.format(kosul=kosul), params)
+
+        if not df.empty:
+            df["doktor_adi"] = doktor_adlarini_esle(df["KAYNAKID"])
+
+        # FullCalendar formatına çevir (kolon bazlı, apply/kopya olmadan)
+        govde, olay_sayisi = takvim_olaylari_json(df)
+        etag = df_etag(filtre_anahtari, df)
+
+        logger.info(f"API çıktısı kayıt sayısı: {olay_sayisi}")
+        yanit = Response(govde, mimetype="application/json")
+        yanit.set_etag(etag, weak=True)
+        yanit.headers["Cache-Control"] = "private, no-cache"
+        yanit.headers["X-Takvim-Token"] = token_kaydet(filtre_anahtari, etag, df)
+        return yanit
 
     except Exception as e:
         logger.error(f"Randevu API hatası: {e}")
@@ -544,9 +598,7 @@ def primler():
     """Prim yönetimi ana sayfası"""
     try:
         # Şubeleri getir
-        query = "SELECT CARI_ID AS id, UNVANI AS name FROM subeler WHERE SILINDI = :silindi ORDER BY UNVANI"
-        df = execute_query(query, {"silindi": "false"})
-        branches = df.to_dict("records")
+        branches = subeleri_getir()
         
         # Ayarları getir
         ayarlar = prim_db.ayarlar_getir()
@@ -572,19 +624,11 @@ def prim_tahsilat_getir():
         if not valid:
             return jsonify({"error": error_msg}), 400
         
-        mysql_config = {
-            'host': MYSQL_HOST,
-            'user': MYSQL_USER,
-            'password': MYSQL_PASSWORD,
-            'db': MYSQL_DB
-        }
-        
         # Tahsilat verilerini getir
         tahsilat_verileri = get_hekim_tahsilat_verileri(
             data["doktor_id"],
             data["baslangic_tarihi"],
-            data["bitis_tarihi"],
-            mysql_config
+            data["bitis_tarihi"]
         )
         
         if not tahsilat_verileri:
@@ -621,25 +665,14 @@ def prim_hesapla_api():
         giderler_listesi = data.get('giderler_listesi', [])
         prim_orani = float(data.get('prim_orani', 0))
         
-        # Her tahsilat için kesinti hesapla
-        processed_tahsilat = []
-        for tahsilat in tahsilat_listesi:
-            kesintiler = kesinti_hesapla(
-                tahsilat['odeme_sekli'],
-                float(tahsilat['brut_tutar']),
-                int(tahsilat.get('taksit_sayisi', 1)),
-                float(tahsilat.get('kdv_orani', 0)),
-                float(tahsilat.get('taksit_kesinti_orani', 0)),
-                tahsilat.get('fatura_kesildi', False),
-                float(tahsilat.get('pos_komisyon_orani', 0))  # YENİ ALAN
-            )
-            
-            tahsilat_processed = tahsilat.copy()
-            tahsilat_processed.update(kesintiler)
-            processed_tahsilat.append(tahsilat_processed)
+        # Tüm tahsilatların kesintileri tek geçişte hesaplanır
+        processed_tahsilat = tahsilat_kesintilerini_hesapla(tahsilat_listesi)
         
-        # Prim hesaplama
-        hesaplama_sonuc = prim_hesapla(processed_tahsilat, giderler_listesi, prim_orani)
+        # Prim hesaplama (kuruş çekirdeği; net ciro ve hak ediş eklemeleri dahil)
+        hesaplama_sonuc = prim_hesapla(
+            processed_tahsilat, giderler_listesi, prim_orani,
+            data.get('net_ciro_eklemeleri'), data.get('hakedis_eklemeleri')
+        )
         
         return jsonify({
             "success": True,
@@ -652,6 +685,169 @@ def prim_hesapla_api():
         return jsonify({"error": "Prim hesaplanırken hata oluştu"}), 500
 
 
+@app.route("/api/prim/toplu_hesapla", methods=["POST"])
+@admin_required
+def prim_toplu_hesapla_api():
+    """
+    Şube(ler)in tüm hekimleri için dönem primini tek seferde taslak olarak oluştur.
+    Kayıtlar 'toplu_taslak' durumunda, cari hareketi olmadan yazılır; /api/prim/toplu_kesinlestir
+    ile eşleştirilmiş carilere işlenir (veya /api/prim/sil ile silinir).
+    Aynı hekim/şube için dönemi çakışan kaydı olanlar atlanır ve raporlanır.
+    sadece_onizleme=true gönderilirse kayıt yapılmaz.
+    """
+    try:
+        data = request.get_json() or {}
+        
+        valid, error_msg = validate_required_fields(data, ["baslangic_tarihi", "bitis_tarihi"])
+        if not valid:
+            return jsonify({"error": error_msg}), 400
+        
+        baslangic = data["baslangic_tarihi"]
+        bitis = data["bitis_tarihi"]
+        sube_ids = data.get("sube_ids") or ([data["sube_id"]] if data.get("sube_id") else None)
+        
+        taslaklar = toplu_prim_taslaklari_hazirla(baslangic, bitis, _taksit_oranlari(), sube_ids,
+                                                  session.get("username"))
+        if not taslaklar:
+            return jsonify({"error": "Bu kriterlere uygun tahsilat bulunamadı"}), 404
+        
+        # Mevcut kayıtlarla dönem çakışmaları
+        cakismalar = prim_db.donem_cakismalari_bul(
+            [(prim_data['doktor_id'], baslangic, bitis, prim_data['sube_id']) for prim_data, _ in taslaklar]
+        )
+        cakisan_ciftler = {(str(c['doktor_id']), str(c['sube_id'])) for c in cakismalar}
+        kaydedilecekler = [
+            (prim_data, detaylar) for prim_data, detaylar in taslaklar
+            if (prim_data['doktor_id'], prim_data['sube_id']) not in cakisan_ciftler
+        ]
+        
+        prim_idleri = []
+        if kaydedilecekler and not data.get("sadece_onizleme"):
+            prim_idleri = prim_db.toplu_prim_kaydet(kaydedilecekler)
+        
+        olusturulanlar = [
+            {
+                "prim_id": prim_idleri[i] if prim_idleri else None,
+                "doktor_id": prim_data['doktor_id'],
+                "doktor_adi": prim_data['doktor_adi'],
+                "sube_id": prim_data['sube_id'],
+                "sube_adi": prim_data['sube_adi'],
+                "tahsilat_sayisi": len(detaylar),
+                "brut_tahsilat": prim_data['brut_tahsilat'],
+                "net_tahsilat": prim_data['net_tahsilat'],
+                "hesaplanan_prim": prim_data['hesaplanan_prim']
+            }
+            for i, (prim_data, detaylar) in enumerate(kaydedilecekler)
+        ]
+        
+        logger.info(f"Toplu prim: {len(prim_idleri)} kayıt oluşturuldu, {len(cakismalar)} çakışma")
+        
+        return jsonify({
+            "success": True,
+            "kaydedildi": bool(prim_idleri),
+            "durum": prim_db.TOPLU_TASLAK_DURUMU,
+            "cari_islendi": False,
+            "olusturulanlar": olusturulanlar,
+            "cakismalar": cakismalar,
+            "ozet": {
+                "hekim_sayisi": len(taslaklar),
+                "olusturulan": len(olusturulanlar),
+                "atlanan": len(taslaklar) - len(kaydedilecekler),
+                "toplam_prim": sum(p['hesaplanan_prim'] for p in olusturulanlar)
+            }
+        })
+        
+    except Exception as e:
+        logger.error(f"Toplu prim hesaplama hatası: {e}")
+        return jsonify({"error": "Toplu prim hesaplanırken hata oluştu"}), 500
+
+
+@app.route("/api/prim/toplu_kesinlestir", methods=["POST"])
+@admin_required
+def prim_toplu_kesinlestir_api():
+    """
+    Toplu hesaplamayla oluşturulan prim taslaklarını (prim_ids) hekim-şube eşleştirmesindeki
+    cariye ALACAK olarak işle ve kesinleştir. Eşleştirmesi olmayanlar atlanır ve raporlanır.
+    """
+    try:
+        data = request.get_json() or {}
+        prim_ids = data.get("prim_ids")
+        if not prim_ids or not isinstance(prim_ids, list):
+            return jsonify({"error": "prim_ids listesi gerekli"}), 400
+        
+        sonuc = prim_db.toplu_taslaklari_kesinlestir(prim_ids, session.get("username"))
+        return jsonify({"success": True, **sonuc})
+        
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Geçersiz prim ID: {e}"}), 400
+    except Exception as e:
+        logger.error(f"Toplu prim kesinleştirme hatası: {e}")
+        return jsonify({"error": "Toplu primler kesinleştirilirken hata oluştu"}), 500
+
+
+@app.route("/api/prim/simulasyon", methods=["POST"])
+@admin_required
+def prim_simulasyon_api():
+    """
+    Kayıtlı primleri varsayımsal ayarlarla yeniden hesapla ve hekim bazında farkları döndür.
+    Seçim: prim_ids veya baslangic_tarihi/bitis_tarihi (+ sube_id).
+    ayarlar: prim_orani, prim_oranlari {doktor_id: oran}, taksit_oranlari
+             [{taksit_sayisi, kesinti_orani}], pos_orani, banka_orani (banka/havale kesintisi).
+    KDV bu prim modelinde matrahı etkilemez (kesinti yalnızca ödeme şekli ve taksitten
+    gelir), bu yüzden simüle edilecek bir KDV ayarı yoktur; kdv_orani gönderilirse 400 döner.
+    Hiçbir kayıt değiştirilmez.
+    """
+    try:
+        data = request.get_json() or {}
+        ayarlar = data.get("ayarlar") or {}
+        
+        prim_ids = data.get("prim_ids")
+        baslangic = data.get("baslangic_tarihi")
+        bitis = data.get("bitis_tarihi")
+        if not prim_ids and not (baslangic and bitis):
+            return jsonify({"error": "prim_ids veya baslangic_tarihi/bitis_tarihi gerekli"}), 400
+        
+        veriler = prim_db.simulasyon_verilerini_getir(prim_ids, baslangic, bitis, data.get("sube_id"))
+        if not veriler['primler']:
+            return jsonify({"error": "Bu kriterlere uygun kayıtlı prim bulunamadı"}), 404
+        
+        if "kdv_orani" in ayarlar:
+            return jsonify({
+                "error": "kdv_orani primi etkilemez; banka/havale kesintisi için banka_orani kullanın"
+            }), 400
+        
+        # Verilmeyen ayarlar için mevcut prim ayarları kullanılır
+        if "taksit_oranlari" in ayarlar:
+            taksit_oranlari = {
+                int(oran['taksit_sayisi']): float(oran['kesinti_orani'])
+                for oran in ayarlar["taksit_oranlari"]
+            }
+        else:
+            taksit_oranlari = _taksit_oranlari()
+        
+        sonuc = prim_simulasyonu(
+            veriler,
+            taksit_oranlari,
+            prim_orani=ayarlar.get("prim_orani"),
+            prim_oranlari=ayarlar.get("prim_oranlari"),
+            pos_orani=float(ayarlar.get("pos_orani", VARSAYILAN_POS_KESINTISI)),
+            banka_orani=float(ayarlar.get("banka_orani", BANKA_KESINTISI))
+        )
+        
+        logger.info(
+            f"Prim simülasyonu: {sonuc['toplam']['prim_sayisi']} prim, "
+            f"{sonuc['toplam']['tahsilat_sayisi']} tahsilat, fark {sonuc['toplam']['fark']}"
+        )
+        
+        return jsonify({"success": True, **sonuc})
+        
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Geçersiz simülasyon ayarı: {e}"}), 400
+    except Exception as e:
+        logger.error(f"Prim simülasyonu hatası: {e}")
+        return jsonify({"error": "Prim simülasyonu yapılırken hata oluştu"}), 500
+
+
 @app.route("/api/prim/liste")
 @login_required
 def prim_liste_api():
@@ -661,29 +857,34 @@ def prim_liste_api():
         sube_id = request.args.get("sube_id")  # EKLE
         baslangic = request.args.get("baslangic")
         bitis = request.args.get("bitis")
-        page = int(request.args.get("page", 1))
+        page = max(int(request.args.get("page", 1)), 1)
+        imlec = request.args.get("imlec")
         per_page = 20
         
-        # SQLite veritabanından primleri getir
-        primler = prim_db.prim_listele(doktor_id, baslangic, bitis)
-        
-        # Şube filtrelemesi ekle
-        if sube_id:
-            primler = [p for p in primler if str(p.get('sube_id')) == str(sube_id)]
-        
-        # Rol bazlı filtreleme
+        # Rol bazlı kısıtlar da sorguya eklenir; filtreleme, sayfalama ve toplamlar SQLite'ta
+        izinli_hekimler = None
         if session.get("role") == "doktor":
-            session_doktor_id = session.get("doktor_id")
-            primler = [p for p in primler if str(p.get('doktor_id')) == str(session_doktor_id)]
+            session_doktor_id = str(session.get("doktor_id") or "")
+            if not session_doktor_id or (doktor_id and str(doktor_id) != session_doktor_id):
+                # Hekim yalnızca kendi primlerini görür
+                izinli_hekimler = []
+            doktor_id = session_doktor_id
         elif session.get("role") == "user":
             hekimler = session.get("hekimler", [])
-            allowed_combinations = [(h['sube_id'], h['doktor_id']) for h in hekimler]
-            primler = [p for p in primler if (str(p.get('sube_id')), str(p.get('doktor_id'))) in allowed_combinations]
+            izinli_hekimler = [(h['sube_id'], h['doktor_id']) for h in hekimler]
         
-        # Sayfalama
-        total_records = len(primler)
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
+        sayfa = prim_db.prim_sayfasi_getir(
+            doktor_id=doktor_id,
+            sube_id=sube_id,
+            baslangic=baslangic,
+            bitis=bitis,
+            izinli_hekimler=izinli_hekimler,
+            sayfa=page,
+            sayfa_boyutu=per_page,
+            imlec=imlec
+        )
+        primler = sayfa['kayitlar']
+        total_records = sayfa['toplam_kayit']
         
         # Admin silme yetkisi
         is_admin = session.get("role") == "admin"
@@ -692,16 +893,17 @@ def prim_liste_api():
         
         return jsonify({
             "success": True,
-            "data": primler[start_idx:end_idx],
+            "data": primler,
             "pagination": {
                 "current_page": page,
                 "total_pages": (total_records + per_page - 1) // per_page,
                 "total_records": total_records,
-                "per_page": per_page
+                "per_page": per_page,
+                "next_cursor": sayfa['sonraki_imlec']
             },
             "summary": {
                 "total_records": total_records,
-                "total_amount": sum(float(p.get("hesaplanan_prim", 0)) for p in primler)
+                "total_amount": float(sayfa['toplam_tutar'])
             }
         })
         
@@ -714,12 +916,12 @@ def prim_liste_api():
 def prim_detay_api(prim_id):
     """Prim detayını getir"""
     try:
-        # Yetki kontrolü - SQLite için basitleştirilmiş
+        # Detay önbellekli tek çağrıyla okunur, yetki kontrolü aynı nesne üzerinden yapılır
+        detay = prim_db.prim_detay_getir(prim_id)
+        if not detay:
+            return jsonify({"error": "Prim kaydı bulunamadı"}), 404
+        
         if session.get("role") != "admin":
-            detay = prim_db.prim_detay_getir(prim_id)
-            if not detay:
-                return jsonify({"error": "Prim kaydı bulunamadı"}), 404
-                
             prim_data = detay['prim_data']
             user_role = session.get("role")
             
@@ -736,11 +938,6 @@ def prim_detay_api(prim_id):
                         break
                 if not allowed:
                     return jsonify({"error": "Bu prime erişim yetkiniz yok"}), 403
-        else:
-            detay = prim_db.prim_detay_getir(prim_id)
-        
-        if not detay:
-            return jsonify({"error": "Prim kaydı bulunamadı"}), 404
         
         return jsonify({
             "success": True,
@@ -776,54 +973,11 @@ def prim_sil():
         if USERS[current_user]["password"] != admin_sifre:
             return jsonify({"error": "Hatalı admin şifresi"}), 403
         
-        # Prim kaydının var olup olmadığını kontrol et (SQLite)
-        detay = prim_db.prim_detay_getir(prim_id)
-        if not detay:
-            return jsonify({"error": "Prim kaydı bulunamadı"}), 404
-        
-        # Cari Hareketleri ve Prim Kayıtlarını silme işlemi (SQLite)
+        # Cari hareketler, prim detayları, ana kayıt ve cari bakiyesi tek transaction içinde
         try:
-            import sqlite3
-            conn_prim = sqlite3.connect(prim_db.db_path)
-            cursor = conn_prim.cursor()
-            
-            # 1. Cari Hareketi Silme (İlişkili hareket varsa)
-            # prim_id'si ile eşleşen hareketi bul
-            cursor.execute("SELECT cari_id FROM cari_hareketler WHERE prim_id = ?", (prim_id,))
-            cari_kaydi = cursor.fetchone()
-
-            if cari_kaydi:
-                cari_id = cari_kaydi[0]
-                
-                # Cari hareketi sil
-                cursor.execute("DELETE FROM cari_hareketler WHERE prim_id = ?", (prim_id,))
-                
-                # Prim veritabanındaki değişiklikleri kaydet
-                conn_prim.commit() 
-                conn_prim.close()
-
-                # Cari Database üzerinden bakiyeyi yeniden hesapla (Farklı bir bağlantı gerektirir)
-                success, message = cari_db._recalculate_bakiye(cari_id, sqlite3.connect(cari_db.db_path))
-                if not success:
-                     logger.error(f"Prim silindi ancak cari bakiye güncellenemedi: Cari ID {cari_id}. Hata: {message}")
-                     return jsonify({
-                        "success": True, 
-                        "message": "Prim başarıyla silindi ancak cari bakiyesi manuel düzeltme gerektirebilir.",
-                        "cari_warning": True
-                    })
-                
-                conn_prim = sqlite3.connect(prim_db.db_path) # Yeni bağlantı aç
-                cursor = conn_prim.cursor()
-            
-            # 2. Prim Detaylarını Sil
-            cursor.execute("DELETE FROM prim_giderler WHERE prim_id = ?", (prim_id,))
-            cursor.execute("DELETE FROM prim_tahsilat_detaylari WHERE prim_id = ?", (prim_id,))
-            
-            # 3. Ana Prim Kaydını Sil
-            cursor.execute("DELETE FROM prim_hesaplamalari WHERE id = ?", (prim_id,))
-            
-            conn_prim.commit()
-            conn_prim.close()
+            cari_idler = prim_db.prim_sil(prim_id)
+            if cari_idler is None:
+                return jsonify({"error": "Prim kaydı bulunamadı"}), 404
             
             logger.info(f"Prim kaydı ve ilişkili cari hareket silindi: ID={prim_id}, Admin={current_user}")
             return jsonify({
@@ -903,9 +1057,7 @@ def prim_listesi():
     """Prim listesi sayfası"""
     try:
         # Şubeleri getir
-        query = "SELECT CARI_ID AS id, UNVANI AS name FROM subeler WHERE SILINDI = :silindi ORDER BY UNVANI"
-        df = execute_query(query, {"silindi": "false"})
-        branches = df.to_dict("records")
+        branches = subeleri_getir()
         
         return render_template("prim_listesi.html", branches=branches)
         
@@ -914,55 +1066,99 @@ def prim_listesi():
         flash("Sayfa yüklenirken bir hata oluştu.", "danger")
         return redirect(url_for("home"))
 
+OZET_SABLONU = "prim_ozet_yazdir.html"
+
+
+def _ozet_sablon_surumu():
+    """Özet şablonunun içerik özeti; şablon değişince kayıtlı belgeler yeniden oluşturulur"""
+    kaynak, _, _ = app.jinja_env.loader.get_source(app.jinja_env, OZET_SABLONU)
+    return hashlib.sha1(kaynak.encode("utf-8")).hexdigest()[:12]
+
+
+def _prim_ozet_html(prim_id):
+    """Prim özetini şablondan oluştur"""
+    detay = prim_db.prim_detay_getir(prim_id)
+    
+    # Template için veri yapısını DOĞRU şekilde düzenle
+    detay_for_template = {
+        'prim': detay.get('prim_data'),
+        'tahsilat': detay.get('tahsilat_detaylari'),
+        'laboratuvar_giderleri': detay.get('laboratuvar_giderleri', []),
+        'implant_giderleri': detay.get('implant_giderleri', []),
+        'diger_giderler': detay.get('diger_giderler', []),
+        'net_ciro_eklemeleri': detay.get('net_ciro_eklemeleri', []),  # YENİ
+        'hakedis_eklemeleri': detay.get('hakedis_eklemeleri', [])      # YENİ
+    }
+    
+    logger.debug(
+        f"Yazdırma için veri hazırlandı - Prim ID: {prim_id}, "
+        f"lab: {len(detay_for_template['laboratuvar_giderleri'])}, "
+        f"implant: {len(detay_for_template['implant_giderleri'])}, "
+        f"diğer: {len(detay_for_template['diger_giderler'])}, "
+        f"net ciro: {len(detay_for_template['net_ciro_eklemeleri'])}, "
+        f"hak ediş: {len(detay_for_template['hakedis_eklemeleri'])}"
+    )
+    
+    return render_template(OZET_SABLONU, detay=detay_for_template)
+
+
 @app.route("/api/prim/ozet_yazdir/<int:prim_id>")
 @login_required
 def prim_ozet_yazdir(prim_id):
-    """Prim özeti yazdırma sayfası"""
+    """
+    Prim özeti yazdırma sayfası. Oluşturulan HTML prim kaydıyla birlikte saklanır;
+    prim veya şablon değişmedikçe yeniden oluşturulmaz, ETag ile 304 döner.
+    """
     try:
-        # Detayları çek
-        detay = prim_db.prim_detay_getir(prim_id)
+        bilgi = prim_db.ozet_belgesi_bilgisi(prim_id)
         
-        if not detay:
+        if not bilgi:
             return "Prim kaydı bulunamadı", 404
             
         # Yetki kontrolü
         if session.get("role") != "admin":
-            prim_data = detay['prim_data']
             user_role = session.get("role")
             
             if user_role == "doktor":
-                if str(prim_data.get('doktor_id')) != str(session.get("doktor_id")):
+                if str(bilgi.get('doktor_id')) != str(session.get("doktor_id")):
                     return "Bu prime erişim yetkiniz yok", 403
             elif user_role == "user":
                 hekimler = session.get("hekimler", [])
                 allowed = False
                 for h in hekimler:
-                    if (str(h['sube_id']) == str(prim_data.get('sube_id')) and 
-                        str(h['doktor_id']) == str(prim_data.get('doktor_id'))):
+                    if (str(h['sube_id']) == str(bilgi.get('sube_id')) and 
+                        str(h['doktor_id']) == str(bilgi.get('doktor_id'))):
                         allowed = True
                         break
                 if not allowed:
                     return "Bu prime erişim yetkiniz yok", 403
         
-        # Template için veri yapısını DOĞRU şekilde düzenle
-        detay_for_template = {
-            'prim': detay.get('prim_data'),
-            'tahsilat': detay.get('tahsilat_detaylari'),
-            'laboratuvar_giderleri': detay.get('laboratuvar_giderleri', []),
-            'implant_giderleri': detay.get('implant_giderleri', []),
-            'diger_giderler': detay.get('diger_giderler', []),
-            'net_ciro_eklemeleri': detay.get('net_ciro_eklemeleri', []),  # YENİ
-            'hakedis_eklemeleri': detay.get('hakedis_eklemeleri', [])      # YENİ
-        }
+        surum = f"{bilgi['guncelleme_tarihi']}|{_ozet_sablon_surumu()}"
+        etag = hashlib.sha1(f"{prim_id}|{surum}".encode("utf-8")).hexdigest()[:20]
         
-        logger.info(f"Yazdırma için veri hazırlandı - Prim ID: {prim_id}")
-        logger.info(f"Lab gider sayısı: {len(detay_for_template['laboratuvar_giderleri'])}")
-        logger.info(f"İmplant gider sayısı: {len(detay_for_template['implant_giderleri'])}")
-        logger.info(f"Diğer gider sayısı: {len(detay_for_template['diger_giderler'])}")
-        logger.info(f"Net Ciro sayısı: {len(detay_for_template['net_ciro_eklemeleri'])}")  # YENİ
-        logger.info(f"Hak Ediş sayısı: {len(detay_for_template['hakedis_eklemeleri'])}")    # YENİ
+        if request.if_none_match.contains(etag):
+            yanit = Response(status=304)
+        else:
+            html = None
+            if bilgi['belge_surumu'] == surum:
+                html = prim_db.ozet_belgesi_getir(prim_id, surum)
+            
+            if html is None:
+                html = _prim_ozet_html(prim_id)
+                prim_db.ozet_belgesi_kaydet(prim_id, surum, html)
+                olusturma = datetime.now(timezone.utc)
+                logger.info(f"Prim özeti oluşturuldu - Prim ID: {prim_id}")
+            else:
+                # SQLite CURRENT_TIMESTAMP UTC olarak saklanır
+                olusturma = datetime.strptime(bilgi['belge_tarihi'], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+            
+            yanit = Response(html, mimetype="text/html")
+            yanit.last_modified = olusturma
         
-        return render_template("prim_ozet_yazdir.html", detay=detay_for_template)
+        yanit.set_etag(etag)
+        # Silme/yetki değişikliği hemen yansısın diye tarayıcı her seferinde doğrular
+        yanit.headers["Cache-Control"] = "private, no-cache"
+        return yanit
         
     except Exception as e:
         logger.error(f"Prim özet yazdırma hatası: {e}")
@@ -974,11 +1170,8 @@ def prim_ozet_yazdir(prim_id):
 @login_required
 def tahsilatlar():
     try:
-        engine = get_database_connection()
         # Şubeleri getir
-        branches_query = "SELECT CARI_ID, UNVANI FROM subeler WHERE SILINDI='false' ORDER BY UNVANI"
-        branches_df = pd.read_sql(branches_query, engine)
-        branches = branches_df.to_dict('records')
+        branches = subeleri_getir_cari()
         
         return render_template("tahsilatlar.html", 
                              branches=branches,
@@ -1022,111 +1215,26 @@ def check_existing_prim():
                 'error': 'Eksik parametreler'
             }), 400
         
-        # *** DÜZELTİLMİŞ: Doğru veritabanı yolu ve tablo adı ***
-        import sqlite3
-        import os
-        
-        # Veritabanı yolunu kontrol et
-        db_paths = [
-            'data/prim_hesaplamalari.db',  # database.py'deki yol
-            'prim_data.db',                # app.py'deki yol
-            'prim_hesaplamalari.db'        # alternatif
-        ]
-        
-        db_path = None
-        for path in db_paths:
-            if os.path.exists(path):
-                db_path = path
-                print(f"Veritabanı bulundu: {path}")
-                break
-        
-        if not db_path:
-            print("Hiçbir veritabanı dosyası bulunamadı")
-            return jsonify({
-                'success': True,
-                'exists': False,
-                'count': 0,
-                'conflicting_prims': [],
-                'message': 'Veritabanı bulunamadı - çakışma kontrolü yapılamadı'
-            })
-        
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Önce tabloları listele
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        print(f"Mevcut tablolar: {[table[0] for table in tables]}")
-        
-        # Doğru tablo adını bul
-        table_name = None
-        possible_tables = ['prim_hesaplamalari', 'primler', 'prim_kayitlari']
-        
-        for table in possible_tables:
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
-            if cursor.fetchone():
-                table_name = table
-                print(f"Prim tablosu bulundu: {table}")
-                break
-        
-        if not table_name:
-            conn.close()
-            print("Prim tablosu bulunamadı")
-            return jsonify({
-                'success': True,
-                'exists': False,
-                'count': 0,
-                'conflicting_prims': [],
-                'message': 'Prim tablosu bulunamadı'
-            })
-        
-        # Çakışan primleri bul
-        query = f"""
-        SELECT 
-            id,
-            doktor_adi,
-            donem_baslangic,
-            donem_bitis,
-            hesaplanan_prim,
-            olusturma_tarihi
-        FROM {table_name}
-        WHERE doktor_id = ? 
-        AND (
-            -- Çakışma durumları
-            (? BETWEEN donem_baslangic AND donem_bitis) OR  -- Yeni başlangıç mevcut aralıkta
-            (? BETWEEN donem_baslangic AND donem_bitis) OR  -- Yeni bitiş mevcut aralıkta
-            (donem_baslangic BETWEEN ? AND ?) OR           -- Mevcut başlangıç yeni aralıkta
-            (donem_bitis BETWEEN ? AND ?)                  -- Mevcut bitiş yeni aralıkta
-        )
-        ORDER BY donem_baslangic DESC
-        """
-        
-        cursor.execute(query, (
-            doktor_id,
-            baslangic_tarihi, bitis_tarihi,  # Yeni tarihler
-            baslangic_tarihi, bitis_tarihi,  # Yeni tarihler tekrar
-            baslangic_tarihi, bitis_tarihi   # Yeni tarihler tekrar
-        ))
-        
-        conflicting_prims = cursor.fetchall()
-        conn.close()
-        
-        print(f"Sorgu sonucu: {len(conflicting_prims)} çakışan prim bulundu")
-        
-        # Sonuçları formatla
-        if conflicting_prims:
-            conflicts = []
-            for prim in conflicting_prims:
-                conflicts.append({
-                    'id': prim[0],
-                    'doktor_adi': prim[1],
-                    'donem_baslangic': prim[2],
-                    'donem_bitis': prim[3],
-                    'hesaplanan_prim': float(prim[4]) if prim[4] else 0,
-                    'olusturma_tarihi': prim[5]
-                })
-            
-            print(f"Çakışan prim bulundu: {len(conflicts)} adet")
+        # (doktor_id, donem_baslangic, donem_bitis) indeksli tek çakışma sorgusu
+        cakismalar = prim_db.donem_cakismalari_bul([(doktor_id, baslangic_tarihi, bitis_tarihi)])
+        
+        if cakismalar:
+            conflicts = [
+                {
+                    'id': c['id'],
+                    'doktor_adi': c['doktor_adi'],
+                    'donem_baslangic': c['donem_baslangic'],
+                    'donem_bitis': c['donem_bitis'],
+                    'hesaplanan_prim': float(c['hesaplanan_prim']) if c['hesaplanan_prim'] else 0,
+                    'olusturma_tarihi': c['olusturma_tarihi'],
+                    'cakisma_baslangic': c['cakisma_baslangic'],
+                    'cakisma_bitis': c['cakisma_bitis'],
+                    'cakisan_gun': c['cakisan_gun']
+                }
+                for c in cakismalar
+            ]
+            
+            logger.info(f"Prim çakışma kontrolü: Hekim={doktor_id}, {len(conflicts)} çakışan prim")
             
             return jsonify({
                 'success': True,
@@ -1136,8 +1244,6 @@ def check_existing_prim():
                 'message': f'{len(conflicts)} adet çakışan prim hesaplaması bulundu'
             })
         else:
-            print("Çakışan prim bulunamadı")
-            
             return jsonify({
                 'success': True,
                 'exists': False,
@@ -1167,35 +1273,10 @@ def prim_conflict_analysis():
         baslangic_tarihi = data.get('baslangic_tarihi')
         bitis_tarihi = data.get('bitis_tarihi')
         
-        # Çakışan primleri bul (yukardaki fonksiyonun aynısı)
-        conn = sqlite3.connect('prim_data.db')
-        cursor = conn.cursor()
-        
-        query = """
-        SELECT 
-            id, doktor_adi, donem_baslangic, donem_bitis, 
-            hesaplanan_prim, brut_tahsilat, toplam_gider
-        FROM primler 
-        WHERE doktor_id = ? 
-        AND (
-            (? BETWEEN donem_baslangic AND donem_bitis) OR
-            (? BETWEEN donem_baslangic AND donem_bitis) OR
-            (donem_baslangic BETWEEN ? AND ?) OR
-            (donem_bitis BETWEEN ? AND ?)
-        )
-        """
-        
-        cursor.execute(query, (
-            doktor_id,
-            baslangic_tarihi, bitis_tarihi,
-            baslangic_tarihi, bitis_tarihi,
-            baslangic_tarihi, bitis_tarihi
-        ))
-        
-        conflicting_prims = cursor.fetchall()
-        conn.close()
+        # Çakışan primler ve çakışan gün sayıları aynı servis sorgusundan gelir
+        cakismalar = prim_db.donem_cakismalari_bul([(doktor_id, baslangic_tarihi, bitis_tarihi)])
         
-        if not conflicting_prims:
+        if not cakismalar:
             return jsonify({
                 'success': True,
                 'has_conflicts': False,
@@ -1204,32 +1285,21 @@ def prim_conflict_analysis():
         
         # Detaylı analiz
         analysis = {
-            'total_conflicting_prims': len(conflicting_prims),
-            'total_amount': sum(float(p[4]) for p in conflicting_prims if p[4]),
+            'total_conflicting_prims': len(cakismalar),
+            'total_amount': sum(float(c['hesaplanan_prim']) for c in cakismalar if c['hesaplanan_prim']),
             'date_range_requested': f"{baslangic_tarihi} - {bitis_tarihi}",
-            'conflicts': []
+            'conflicts': [
+                {
+                    'prim_id': c['id'],
+                    'existing_period': f"{c['donem_baslangic']} - {c['donem_bitis']}",
+                    'overlap_period': f"{c['cakisma_baslangic']} - {c['cakisma_bitis']}",
+                    'overlap_days': c['cakisan_gun'],
+                    'amount': float(c['hesaplanan_prim']) if c['hesaplanan_prim'] else 0
+                }
+                for c in cakismalar
+            ]
         }
         
-        for prim in conflicting_prims:
-            # Çakışan günleri hesapla
-            existing_start = datetime.strptime(prim[2], '%Y-%m-%d').date()
-            existing_end = datetime.strptime(prim[3], '%Y-%m-%d').date()
-            new_start = datetime.strptime(baslangic_tarihi, '%Y-%m-%d').date()
-            new_end = datetime.strptime(bitis_tarihi, '%Y-%m-%d').date()
-            
-            # Çakışan aralığı bul
-            overlap_start = max(existing_start, new_start)
-            overlap_end = min(existing_end, new_end)
-            overlap_days = (overlap_end - overlap_start).days + 1
-            
-            analysis['conflicts'].append({
-                'prim_id': prim[0],
-                'existing_period': f"{prim[2]} - {prim[3]}",
-                'overlap_period': f"{overlap_start} - {overlap_end}",
-                'overlap_days': overlap_days,
-                'amount': float(prim[4]) if prim[4] else 0
-            })
-        
         return jsonify({
             'success': True,
             'has_conflicts': True,
@@ -1251,22 +1321,7 @@ def get_doctors_by_branches():
         if not branch_ids:
             return jsonify({"error": "Şube ID'leri gerekli"})
         
-        engine = get_database_connection()
-        
-        # Güvenli parametreli sorgu
-        placeholders = ','.join([':branch_' + str(i) for i in range(len(branch_ids))])
-        query = f"""
-            SELECT CARI_ID, CONCAT(ADI, ' ', SOYADI) AS HEKIM_ADI, SUBE_ID
-            FROM kartdoktor 
-            WHERE SILINDI='false' AND SUBE_ID IN ({placeholders})
-            ORDER BY ADI, SOYADI
-        """
-        
-        params = {}
-        for i, bid in enumerate(branch_ids):
-            params[f'branch_{i}'] = bid
-        
-        df = pd.read_sql(text(query), engine, params=params)
+        df = doktorlari_getir(branch_ids)[["CARI_ID", "HEKIM_ADI", "SUBE_ID"]]
         return jsonify(df.to_dict('records'))
         
     except Exception as e:
@@ -1293,292 +1348,28 @@ def analyze_tahsilatlar():
             flash("Tarih formatı hatalı.", "danger")
             return redirect(url_for("tahsilatlar"))
 
-        engine = get_database_connection()
-
-        # Ödeme kesinti oranları
-        KESINTI_ORANLARI = {
-            'nakit': 0,
-            'pos': 0.10,
-            'banka': 0.10,
-            'çek': 0.10,
-            'senet': 0,
-            'senet tahsilatı': 0
-        }
-
-        # Ana Tahsilat Sorgusu (Güvenli parametreli versiyon)
-        branch_placeholders = ','.join([':branch_' + str(i) for i in range(len(selected_branches))])
-        
-        params = {
-            'start_date': start_date,
-            'end_date': end_date
-        }
-        
-        # Branch parametrelerini ekle
-        for i, branch in enumerate(selected_branches):
-            params[f'branch_{i}'] = branch
-        
-        tahsilat_query = f"""
-        SELECT
-            T1.TARIH,
-            T1.ALACAK AS TUTAR,
-            T1.HEDEF_ILGILI_DOKTOR_ID AS DOKTOR_ID,
-            CONCAT(IFNULL(DR.ADI,''),' ',IFNULL(DR.SOYADI,'')) AS HEKIM_ADI,
-            IFNULL(DR.PRIMYUZDE,0) AS PRIMYUZDE,
-            CONCAT(IFNULL(H.ADI,''),' ',IFNULL(H.SOYADI,'')) AS HASTA_ADI,
-            H.HASTA_ID,
-            LOWER(IFNULL(OS.ADI,'bilinmeyen')) AS ODEME_SEKLI,
-            IFNULL(SB.UNVANI,'Bilinmeyen') AS SUBE_ADI,
-            T1.HAREKETTYPE
-        FROM carihareket AS T1
-        LEFT JOIN kartdoktor AS DR ON T1.HEDEF_ILGILI_DOKTOR_ID = DR.CARI_ID
-        LEFT JOIN odeme_sekilleri AS OS ON T1.ISLEM_TIPI_ID = OS.ROWNO
-        LEFT JOIN subeler AS SB ON T1.SUBE_ID = SB.CARI_ID
-        LEFT JOIN karthasta AS H ON T1.KAYNAK_CARI_ID = H.HASTA_ID
-        WHERE T1.SILINDI='False'
-          AND T1.ALACAK > 0
-          AND T1.HAREKETTYPE IN ('T','ST','CT')
-          AND T1.TARIH BETWEEN :start_date AND :end_date
-          AND T1.SUBE_ID IN ({branch_placeholders})
-        """
-        
-        if selected_doctors:
-            doctor_placeholders = ','.join([':doctor_' + str(i) for i in range(len(selected_doctors))])
-            tahsilat_query += f" AND T1.HEDEF_ILGILI_DOKTOR_ID IN ({doctor_placeholders})"
-            for i, doctor in enumerate(selected_doctors):
-                params[f'doctor_{i}'] = doctor
-
-        df = pd.read_sql(text(tahsilat_query), engine, params=params)
+        analiz = tahsilat_analizi_yap(start_date, end_date, selected_branches, selected_doctors)
+        df = analiz["df"]
         
         if df.empty:
-            engine = get_database_connection()
-            branches_query = "SELECT CARI_ID, UNVANI FROM subeler WHERE SILINDI='false' ORDER BY UNVANI"
-            branches_df = pd.read_sql(branches_query, engine)
-            branches = branches_df.to_dict('records')
+            branches = subeleri_getir_cari()
             return render_template("tahsilatlar.html", 
                                  branches=branches,
                                  error_date="Bu kriterlere uygun tahsilat bulunamadı.")
 
-        # Kesinti & Prim Hesaplama
-        df["ODEME_SEKLI"] = df["ODEME_SEKLI"].str.strip().str.lower()
-        df["KESINTI_ORANI"] = df["ODEME_SEKLI"].map(KESINTI_ORANLARI).fillna(0)
-        df["KESINTI"] = df["TUTAR"] * df["KESINTI_ORANI"]
-        df["NET_TAHSILAT"] = df["TUTAR"] - df["KESINTI"]
-        df["PRIM_YUZDE"] = df["PRIMYUZDE"] / 100
-        df["HESAPLANAN_PRIM"] = df["NET_TAHSILAT"] * df["PRIM_YUZDE"]
-
-        # ÖNCEKİ TÜM VERİ İLE ÇOKLU HEKİM TESPİTİ YAP (filtre uygulamadan)
-        # GÜNCELLENMİŞ TEDAVİ SORGUSU - HEM SILINDI HEM ISDELETED KONTROLLÜ
-        tum_tedavi_query = """
-        SELECT
-            T1.HASTA_ID,
-            T1.DOKTOR_ID,
-            COALESCE(CONCAT(DR.ADI,' ',DR.SOYADI), '') AS HEKIM_ADI,
-            SUM(COALESCE(T1.TUTAR, T1.LISTETUTAR, 0)) AS TEDAVI_TOPLAM,
-            COUNT(*) AS TEDAVI_SAYISI,
-            MIN(T1.TARIH) AS ILK_TEDAVI,
-            MAX(T1.TARIH) AS SON_TEDAVI,
-            DR.SUBE_ID
-        FROM tedavi AS T1
-        LEFT JOIN kartdoktor AS DR ON T1.DOKTOR_ID = DR.CARI_ID
-        WHERE (T1.SILINDI IS NULL OR T1.SILINDI != 'True')
-          AND (T1.ISDELETED IS NULL OR T1.ISDELETED != 'True')
-        GROUP BY T1.HASTA_ID, T1.DOKTOR_ID, HEKIM_ADI, DR.SUBE_ID
-        """
-        tum_tedavi_df = pd.read_sql(tum_tedavi_query, engine)
+        # Excel indirme aynı sonuçları tekrar sorgulamasın diye snapshot olarak sakla
+        snapshot_id = snapshot_kaydet(session.get("username"), start_date, end_date,
+                                      selected_branches, selected_doctors, analiz)
 
-        # TÜM VERİDEN ÇOKLU HEKİM HASTALARINI BUL
-        tum_multi_patients = set(
-            tum_tedavi_df.groupby("HASTA_ID")["DOKTOR_ID"].nunique()
-            .loc[lambda x: x > 1].index.astype(str).tolist()
+        # Çoklu hekim detayları (isteğe bağlı sayfalama; varsayılan tüm hastalar)
+        multi_doctor_issues, coklu_sayfalama = coklu_hekim_sorunlarini_olustur(
+            analiz,
+            selected_doctors,
+            sayfa=request.form.get("coklu_sayfa", type=int),
+            sayfa_boyutu=request.form.get("coklu_sayfa_boyutu", type=int)
         )
 
-        # FİLTRE 1: Ana analizde görünen hastalarla sınırla
-        ana_analiz_hastalari = set(df["HASTA_ID"].astype(str).tolist())
-        multi_patients = tum_multi_patients.intersection(ana_analiz_hastalari)
-        
-        # FİLTRE 2: Seçilen hekimlerle ilgili çoklu hekim durumlarını bul
-        if selected_doctors:
-            # Seçilen hekimlerden en az birinden tedavi gören çoklu hekim hastalarını al
-            selected_doctor_patients = set(
-                tum_tedavi_df[tum_tedavi_df["DOKTOR_ID"].isin(selected_doctors)]["HASTA_ID"].astype(str).tolist()
-            )
-            multi_patients = multi_patients.intersection(selected_doctor_patients)
-
-        # FİLTRE 3: Seçilen şubelerle ilgili çoklu hekim durumlarını bul
-        selected_branch_patients = set(
-            tum_tedavi_df[tum_tedavi_df["SUBE_ID"].isin(selected_branches)]["HASTA_ID"].astype(str).tolist()
-        )
-        multi_patients = multi_patients.intersection(selected_branch_patients)
-
-        logger.info(f"Toplam çoklu hekim hasta sayısı: {len(tum_multi_patients)}")
-        logger.info(f"Ana analizde bulunan çoklu hekim hasta sayısı: {len(tum_multi_patients.intersection(ana_analiz_hastalari))}")
-        logger.info(f"Filtreler uygulandıktan sonra: {len(multi_patients)}")
-
-        # PERFORMANS İYİLEŞTİRMESİ: Eğer çoklu hekim hasta sayısı çok fazlaysa sınırla
-        if len(multi_patients) > 50:
-            logger.warning(f"Çok fazla çoklu hekim hastası bulundu ({len(multi_patients)}). İlk 50 tanesi gösterilecek.")
-            multi_patients = set(list(multi_patients)[:50])
-
-        # Ana analiz için sadece ilgili verileri al
-        tedavi_df = tum_tedavi_df[tum_tedavi_df["HASTA_ID"].astype(str).isin(multi_patients)]
-
-        # TÜM ZAMANLARI KAPSAYAN TAHSİLAT SORGUSU (Çoklu hekim hastalarına odaklı)
-        if multi_patients:
-            hasta_ids_list = list(multi_patients)
-            hasta_placeholders = ','.join([':hasta_' + str(i) for i in range(len(hasta_ids_list))])
-            
-            tum_tahsilat_params = {}
-            for i, pid in enumerate(hasta_ids_list):
-                tum_tahsilat_params[f'hasta_{i}'] = pid
-                
-            tum_tahsilat_query = f"""
-            SELECT
-                T1.HEDEF_ILGILI_DOKTOR_ID AS DOKTOR_ID,
-                H.HASTA_ID,
-                SUM(T1.ALACAK) AS TOPLAM_TUTAR,
-                COUNT(*) AS TAHSILAT_SAYISI,
-                MAX(T1.TARIH) AS SON_TAHSILAT_TARIHI
-            FROM carihareket AS T1
-            LEFT JOIN karthasta AS H ON T1.KAYNAK_CARI_ID = H.HASTA_ID
-            WHERE T1.SILINDI='False'
-              AND T1.ALACAK > 0
-              AND T1.HAREKETTYPE IN ('T','ST','CT')
-              AND H.HASTA_ID IN ({hasta_placeholders})
-            GROUP BY T1.HEDEF_ILGILI_DOKTOR_ID, H.HASTA_ID
-            """
-            tum_tahsilat_df = pd.read_sql(text(tum_tahsilat_query), engine, params=tum_tahsilat_params)
-        else:
-            tum_tahsilat_df = pd.DataFrame()
-
-        # Çoklu hekim işareti ekle (sadece filtrelenmiş veride)
-        df["IS_MULTI_DOCTOR"] = df["HASTA_ID"].astype(str).isin(multi_patients)
-
-        # PERFORMANS İYİLEŞTİRMESİ: Hasta ve hekim adlarını toplu olarak çek
-        hasta_adlari_dict = {}
-        hekim_adlari_dict = {}
-        
-        if multi_patients:
-            # Tüm hasta adlarını tek sorguda çek
-            hasta_ids_list = list(multi_patients)
-            hasta_placeholders = ','.join([':hasta_name_' + str(i) for i in range(len(hasta_ids_list))])
-            hasta_name_params = {}
-            for i, pid in enumerate(hasta_ids_list):
-                hasta_name_params[f'hasta_name_{i}'] = pid
-                
-            tum_hasta_adlari_query = f"""
-            SELECT HASTA_ID, CONCAT(IFNULL(ADI,''), ' ', IFNULL(SOYADI,'')) AS HASTA_ADI 
-            FROM karthasta 
-            WHERE HASTA_ID IN ({hasta_placeholders})
-            """
-            hasta_adlari_df = pd.read_sql(text(tum_hasta_adlari_query), engine, params=hasta_name_params)
-            hasta_adlari_dict = dict(zip(hasta_adlari_df["HASTA_ID"].astype(str), hasta_adlari_df["HASTA_ADI"]))
-
-            # Sadece çoklu hekim hastalarının hekim adlarını çek
-            filtered_tahsilat = tum_tahsilat_df[tum_tahsilat_df["HASTA_ID"].astype(str).isin(multi_patients)]
-            filtered_tedavi = tedavi_df[tedavi_df["HASTA_ID"].astype(str).isin(multi_patients)]
-            
-            tahsilat_hekim_ids = set(filtered_tahsilat["DOKTOR_ID"].tolist())
-            tedavi_hekim_ids = set(filtered_tedavi["DOKTOR_ID"].tolist())
-            tum_hekim_ids = tahsilat_hekim_ids.union(tedavi_hekim_ids)
-            
-            if tum_hekim_ids:
-                hekim_ids_list = list(tum_hekim_ids)
-                hekim_placeholders = ','.join([':hekim_' + str(i) for i in range(len(hekim_ids_list))])
-                hekim_params = {}
-                for i, hid in enumerate(hekim_ids_list):
-                    hekim_params[f'hekim_{i}'] = hid
-                    
-                tum_hekim_adlari_query = f"""
-                SELECT CARI_ID, CONCAT(IFNULL(ADI,''), ' ', IFNULL(SOYADI,'')) AS HEKIM_ADI 
-                FROM kartdoktor 
-                WHERE CARI_ID IN ({hekim_placeholders})
-                """
-                hekim_adlari_df = pd.read_sql(text(tum_hekim_adlari_query), engine, params=hekim_params)
-                hekim_adlari_dict = dict(zip(hekim_adlari_df["CARI_ID"], hekim_adlari_df["HEKIM_ADI"]))
-
-        # Çoklu hekim detayları (Optimize edilmiş versiyon)
-        multi_doctor_issues = []
-        if multi_patients:
-            for hasta_id in multi_patients:
-                hasta_tedavi = tedavi_df[tedavi_df["HASTA_ID"].astype(str) == str(hasta_id)]
-                hasta_tahsilat = df[df["HASTA_ID"].astype(str) == str(hasta_id)]
-                
-                # Hasta adını bul (önce df'den, sonra dict'ten)
-                if not hasta_tahsilat.empty:
-                    hasta_adi = hasta_tahsilat.iloc[0]["HASTA_ADI"]
-                else:
-                    hasta_adi = hasta_adlari_dict.get(str(hasta_id), f"Hasta ID: {hasta_id}")
-
-                if hasta_adi and (not hasta_tahsilat.empty or not hasta_tedavi.empty):
-                    issue = {
-                        "hasta_id": hasta_id,
-                        "hasta_adi": hasta_adi,
-                        "hekim_sayisi": 0,
-                        "toplam_tedavi": float(hasta_tedavi["TEDAVI_TOPLAM"].sum()),
-                        "toplam_tahsilat": 0,
-                        "toplam_fark": 0,
-                        "sorun_tipi": "Normal",
-                        "hekimler": []
-                    }
-                    
-                    # Bu hastaya ait TÜM tahsilatları al
-                    hasta_tum_tahsilat = tum_tahsilat_df[tum_tahsilat_df["HASTA_ID"].astype(str) == str(hasta_id)]
-                    
-                    # Tüm hekimleri topla
-                    tedavi_hekimler = set(hasta_tedavi["DOKTOR_ID"].tolist())
-                    tahsilat_hekimler = set(hasta_tum_tahsilat["DOKTOR_ID"].tolist())
-                    tum_hekimler = tedavi_hekimler.union(tahsilat_hekimler)
-                    
-                    toplam_tahsilat_all = 0
-                    
-                    for hekim_id in tum_hekimler:
-                        # Tedavi bilgileri
-                        hekim_tedavi = hasta_tedavi[hasta_tedavi["DOKTOR_ID"] == hekim_id]
-                        tedavi_tutari = float(hekim_tedavi["TEDAVI_TOPLAM"].iloc[0]) if not hekim_tedavi.empty else 0.0
-                        tedavi_sayisi = int(hekim_tedavi["TEDAVI_SAYISI"].iloc[0]) if not hekim_tedavi.empty else 0
-                        ilk_tedavi = str(hekim_tedavi["ILK_TEDAVI"].iloc[0]) if not hekim_tedavi.empty else "Tedavi Yok"
-                        son_tedavi = str(hekim_tedavi["SON_TEDAVI"].iloc[0]) if not hekim_tedavi.empty else "Tedavi Yok"
-                        
-                        # Tahsilat bilgileri
-                        hekim_tahsilat = hasta_tum_tahsilat[hasta_tum_tahsilat["DOKTOR_ID"] == hekim_id]
-                        tahsilat_tutari = float(hekim_tahsilat["TOPLAM_TUTAR"].iloc[0]) if not hekim_tahsilat.empty else 0.0
-                        tahsilat_sayisi = int(hekim_tahsilat["TAHSILAT_SAYISI"].iloc[0]) if not hekim_tahsilat.empty else 0
-                        son_tahsilat_tarihi = str(hekim_tahsilat["SON_TAHSILAT_TARIHI"].iloc[0]) if not hekim_tahsilat.empty else "Tahsilat Yok"
-                        
-                        # Hekim adını önceden çekilmiş dict'ten al
-                        if not hekim_tedavi.empty:
-                            hekim_adi = hekim_tedavi["HEKIM_ADI"].iloc[0]
-                        else:
-                            hekim_adi = hekim_adlari_dict.get(hekim_id, f"Hekim ID: {hekim_id}")
-                        
-                        toplam_tahsilat_all += tahsilat_tutari
-                        
-                        # Sıfır olmayan tutarları göster
-                        if tedavi_tutari > 0 or tahsilat_tutari > 0:
-                            # Bu hekim seçilen hekimler arasında mı kontrol et
-                            is_selected_doctor = str(hekim_id) in [str(d) for d in selected_doctors] if selected_doctors else False
-                            
-                            issue["hekimler"].append({
-                                "hekim_adi": hekim_adi,
-                                "hekim_id": hekim_id,
-                                "is_selected": is_selected_doctor,
-                                "tedavi_tutari": tedavi_tutari,
-                                "tedavi_sayisi": tedavi_sayisi,
-                                "tahsilat_tutari": tahsilat_tutari,
-                                "tahsilat_sayisi": tahsilat_sayisi,
-                                "son_tahsilat_tarihi": son_tahsilat_tarihi,
-                                "fark": tahsilat_tutari - tedavi_tutari,
-                                "ilk_tedavi": ilk_tedavi,
-                                "son_tedavi": son_tedavi
-                            })
-                    
-                    issue["hekim_sayisi"] = len(issue["hekimler"])
-                    issue["toplam_tahsilat"] = toplam_tahsilat_all
-                    issue["toplam_fark"] = toplam_tahsilat_all - issue["toplam_tedavi"]
-                    
-                    multi_doctor_issues.append(issue)
-
-        logger.info(f"Tahsilat kayıt sayısı: {len(df)} | Çoklu hekim hasta sayısı: {len(multi_patients)}")
+        logger.info(f"Tahsilat kayıt sayısı: {len(df)} | Çoklu hekim hasta sayısı: {coklu_sayfalama['toplam_hasta']}")
 
         # Özet hesaplamalar
         summary = {
@@ -1590,9 +1381,7 @@ def analyze_tahsilatlar():
         }
 
         # Şubeleri tekrar getir (template için)
-        branches_query = "SELECT CARI_ID, UNVANI FROM subeler WHERE SILINDI='false' ORDER BY UNVANI"
-        branches_df = pd.read_sql(branches_query, engine)
-        branches = branches_df.to_dict('records')
+        branches = subeleri_getir_cari()
 
         return render_template("tahsilatlar.html",
                              branches=branches,
@@ -1603,14 +1392,13 @@ def analyze_tahsilatlar():
                              end_date=end_date,
                              selected_branches=selected_branches,
                              selected_doctors=selected_doctors,
+                             snapshot_id=snapshot_id,
+                             coklu_sayfalama=coklu_sayfalama,
                              error_date=None)
 
     except Exception as e:
         logger.error(f"Tahsilatlar analizi hatası: {e}")
-        engine = get_database_connection()
-        branches_query = "SELECT CARI_ID, UNVANI FROM subeler WHERE SILINDI='false' ORDER BY UNVANI"
-        branches_df = pd.read_sql(branches_query, engine)
-        branches = branches_df.to_dict('records')
+        branches = subeleri_getir_cari()
         flash("Analiz sırasında bir hata oluştu.", "danger")
         return render_template("tahsilatlar.html", 
                              branches=branches,
@@ -1775,6 +1563,167 @@ def implant_gider_ekle():
         logger.error(f"İmplant gider ekleme hatası: {e}")
         return jsonify({"error": "Gider eklenirken hata oluştu"}), 500
 
+def _taksit_oranlari():
+    """Prim ayarlarındaki taksit sayısı -> kesinti oranı eşlemesi"""
+    return {
+        int(oran['taksit_sayisi']): float(oran['kesinti_orani'])
+        for oran in prim_db.ayarlar_getir()['taksit_oranlari']
+    }
+
+
+@app.route("/api/prim/taslak", methods=["POST"])
+@login_required
+def prim_taslak_olustur_api():
+    """Hekimin dönem tahsilatlarını sunucu tarafı taslağa al"""
+    try:
+        data = request.get_json() or {}
+        
+        valid, error_msg = validate_required_fields(data, ["doktor_id", "baslangic_tarihi", "bitis_tarihi"])
+        if not valid:
+            return jsonify({"error": error_msg}), 400
+        
+        tahsilat_verileri = get_hekim_tahsilat_verileri(
+            data["doktor_id"],
+            data["baslangic_tarihi"],
+            data["bitis_tarihi"]
+        )
+        
+        if not tahsilat_verileri:
+            return jsonify({"error": "Bu kriterlere uygun tahsilat bulunamadı"}), 404
+        
+        taslak = taslak_olustur(tahsilat_verileri, data["doktor_id"], data["baslangic_tarihi"],
+                                data["bitis_tarihi"], _taksit_oranlari())
+        taslak_id = uuid.uuid4().hex
+        son_kullanma = prim_taslak_db.taslak_kaydet(taslak_id, session.get("username"), taslak, PRIM_TASLAK_SURESI)
+        
+        return jsonify({
+            "success": True,
+            "taslak_id": taslak_id,
+            "son_kullanma": datetime.fromtimestamp(son_kullanma).isoformat(timespec="seconds"),
+            "data": taslak["tahsilatlar"],
+            "doktor_bilgisi": {
+                "doktor_id": taslak["doktor_id"],
+                "doktor_adi": taslak["doktor_adi"],
+                "sube_id": taslak["sube_id"],
+                "sube_adi": taslak["sube_adi"],
+                "prim_orani": taslak["prim_orani"]
+            },
+            "hesaplama": hesaplama_ozeti(taslak_hesapla(taslak))
+        })
+        
+    except Exception as e:
+        logger.error(f"Prim taslağı oluşturma hatası: {e}")
+        return jsonify({"error": "Tahsilat verileri alınırken hata oluştu"}), 500
+
+
+def _taslak_oran_ve_giderlerini_uygula(taslak, data):
+    """İstekte gelen prim oranını ve gider/ekleme listelerini taslağa yaz"""
+    if data.get("prim_orani") is not None:
+        taslak["prim_orani"] = float(data["prim_orani"])
+    for alan in TASLAK_GIDER_ALANLARI:
+        if alan in data:
+            taslak[alan] = data[alan] or []
+
+
+@app.route("/api/prim/taslak/<taslak_id>/guncelle", methods=["POST"])
+@login_required
+def prim_taslak_guncelle_api(taslak_id):
+    """
+    Taslağa satır düzenlemelerini (duzenlemeler: [{index, fatura_kesildi, taksit_sayisi}]),
+    prim oranını ve gider/ekleme listelerini uygula; güncel hesaplamayı döndür
+    """
+    try:
+        data = request.get_json() or {}
+        
+        taslak = prim_taslak_db.taslak_getir(taslak_id, session.get("username"))
+        if taslak is None:
+            return jsonify({"error": "Taslak bulunamadı veya süresi doldu"}), 404
+        
+        try:
+            degisen_satirlar = taslak_duzenle(taslak, data.get("duzenlemeler"), _taksit_oranlari())
+        except (KeyError, ValueError, TypeError) as e:
+            return jsonify({"error": f"Geçersiz düzenleme: {e}"}), 400
+        
+        _taslak_oran_ve_giderlerini_uygula(taslak, data)
+        prim_taslak_db.taslak_kaydet(taslak_id, session.get("username"), taslak, PRIM_TASLAK_SURESI)
+        
+        return jsonify({
+            "success": True,
+            "satirlar": degisen_satirlar,
+            "hesaplama": hesaplama_ozeti(taslak_hesapla(taslak))
+        })
+        
+    except Exception as e:
+        logger.error(f"Prim taslağı güncelleme hatası: {e}")
+        return jsonify({"error": "Taslak güncellenirken hata oluştu"}), 500
+
+
+@app.route("/api/prim/taslak/<taslak_id>/kaydet", methods=["POST"])
+@login_required
+def prim_taslak_kaydet_api(taslak_id):
+    """
+    Taslaktan primi hesaplayıp kaydet; tahsilat listesi istemciden tekrar alınmaz.
+    Ekranda son "Hesapla"dan sonra değişmiş olabilecek prim oranı ve gider/ekleme
+    listeleri kayıt isteğiyle gelir ve hesaplamadan önce taslağa uygulanır.
+    """
+    try:
+        data = request.get_json() or {}
+        
+        taslak = prim_taslak_db.taslak_getir(taslak_id, session.get("username"))
+        if taslak is None:
+            return jsonify({"error": "Taslak bulunamadı veya süresi doldu"}), 404
+        
+        _taslak_oran_ve_giderlerini_uygula(taslak, data)
+        sonuc = taslak_hesapla(taslak)
+        tahsilat_detaylari = taslak_tahsilat_detaylari(taslak)
+        
+        prim_data = {
+            **sonuc.sozluk(),
+            'doktor_id': taslak['doktor_id'],
+            'doktor_adi': data.get('doktor_adi') or taslak['doktor_adi'],
+            'sube_id': data.get('sube_id') or taslak['sube_id'],
+            'sube_adi': data.get('sube_adi') or taslak['sube_adi'],
+            'donem_baslangic': taslak['donem_baslangic'],
+            'donem_bitis': taslak['donem_bitis'],
+            'prim_orani': sonuc.prim_orani,
+            'olusturan_kullanici': session.get("username"),
+            'notlar': data.get('notlar', '')
+        }
+        
+        errors = validate_prim_data(prim_data, tahsilat_detaylari, taslak['diger_giderler'])
+        if errors:
+            return jsonify({"error": ", ".join(errors)}), 400
+        
+        # Prim, cari hareketi ve eşleştirme tek transaction içinde yazılır
+        cari_id = data.get('cari_id')
+        prim_id, satir_sayilari = prim_db.prim_hesaplama_kaydet(
+            prim_data,
+            tahsilat_detaylari,
+            taslak['diger_giderler'],
+            taslak['laboratuvar_giderleri'],
+            taslak['implant_giderleri'],
+            taslak['net_ciro_eklemeleri'],
+            taslak['hakedis_eklemeleri'],
+            sayilari_getir=True,
+            cari_id=cari_id,
+            cari_eslestir=data.get('cari_eslestir', False)
+        )
+        prim_taslak_db.taslak_sil(taslak_id)
+        
+        return jsonify({
+            "success": True,
+            "message": "Prim hesaplaması başarıyla kaydedildi",
+            "prim_id": prim_id,
+            "cari_islendi": bool(cari_id),
+            "satir_sayilari": satir_sayilari,
+            "hesaplama": hesaplama_ozeti(sonuc)
+        })
+        
+    except Exception as e:
+        logger.error(f"Prim taslağı kaydetme hatası: {e}")
+        return jsonify({"error": "Prim kaydedilirken hata oluştu"}), 500
+
+
 @app.route("/api/prim/kaydet", methods=["POST"])
 @login_required
 def prim_kaydet_api():
@@ -1796,12 +1745,11 @@ def prim_kaydet_api():
         cari_id = data.get('cari_id')
         cari_eslestir = data.get('cari_eslestir', False)
         
-        # Toplam gideri hesapla
-        toplam_diger = sum(float(g.get('tutar', 0)) for g in diger_giderler)
-        toplam_lab = sum(float(g.get('tutar', 0)) for g in laboratuvar_giderleri)
-        toplam_implant = sum(float(g.get('tutar', 0)) for g in implant_giderleri)
-        
-        prim_data['toplam_gider'] = toplam_diger + toplam_lab + toplam_implant
+        # Toplam gideri kuruş cinsinden hesapla
+        prim_data['toplam_gider'] = tl_degeri(
+            kurus_toplami(diger_giderler) + kurus_toplami(laboratuvar_giderleri) +
+            kurus_toplami(implant_giderleri)
+        )
         
         # Veri doğrulama
         errors = validate_prim_data(prim_data, tahsilat_detaylari, diger_giderler)
@@ -1811,53 +1759,28 @@ def prim_kaydet_api():
         # Kullanıcı bilgisini ekle
         prim_data["olusturan_kullanici"] = session.get("username")
         
-        # PRİMİ KAYDET (GÜNCELLENMİŞ - yeni parametreler eklendi)
-        prim_id = prim_db.prim_hesaplama_kaydet(
+        # PRİMİ KAYDET - cari hareketi ve eşleştirme aynı transaction içinde
+        prim_id, satir_sayilari = prim_db.prim_hesaplama_kaydet(
             prim_data, 
             tahsilat_detaylari, 
             diger_giderler,
             laboratuvar_giderleri,
             implant_giderleri,
             net_ciro_eklemeleri,  # YENİ
-            hakedis_eklemeleri    # YENİ
+            hakedis_eklemeleri,   # YENİ
+            sayilari_getir=True,
+            cari_id=cari_id,
+            cari_eslestir=cari_eslestir
         )
         
-        # CARİ İŞLEMLERİ
-        if cari_id:
-            # Cari hesaba ALACAK kaydı ekle
-            hareket_data = {
-                'cari_id': cari_id,
-                'hareket_tipi': 'prim_alacak',
-                'prim_id': prim_id,
-                'tarih': datetime.now().strftime('%Y-%m-%d'),
-                'aciklama': f"Prim #{prim_id} - {prim_data['doktor_adi']} - {prim_data['sube_adi']} ({prim_data['donem_baslangic']} / {prim_data['donem_bitis']})",
-                'alacak': prim_data['hesaplanan_prim'],
-                'borc': 0,
-                'olusturan_kullanici': session.get('username')
-            }
-            
-            success, new_bakiye = cari_db.cari_hareket_ekle(hareket_data)
-            
-            if not success:
-                logger.warning(f"Cari hareketi eklenemedi, ama prim kaydedildi: {prim_id}")
-            
-            # Eşleştirmeyi kaydet (checkbox işaretliyse)
-            if cari_eslestir:
-                cari_db.hekim_cari_eslestir(
-                    cari_id,
-                    prim_data['doktor_id'],
-                    prim_data['doktor_adi'],
-                    prim_data['sube_id'],
-                    prim_data['sube_adi']
-                )
-        
         return jsonify({
             "success": True,
             "message": "Prim hesaplaması başarıyla kaydedildi",
             "prim_id": prim_id,
             "cari_islendi": bool(cari_id),
             "net_ciro_sayisi": len(net_ciro_eklemeleri),
-            "hakedis_sayisi": len(hakedis_eklemeleri)
+            "hakedis_sayisi": len(hakedis_eklemeleri),
+            "satir_sayilari": satir_sayilari
         })
         
     except Exception as e:
@@ -1875,9 +1798,7 @@ def cari_yonetimi():
     
     try:
         # Şubeleri getir (Hekim eşleştirmede kullanılacak)
-        query = "SELECT CARI_ID AS id, UNVANI AS name FROM subeler WHERE SILINDI = :silindi ORDER BY UNVANI"
-        df = execute_query(query, {"silindi": "false"})
-        branches = df.to_dict("records")
+        branches = subeleri_getir()
         
         return render_template("cari_yonetimi.html", branches=branches)
         
@@ -2190,17 +2111,17 @@ def cari_hareket_ekle_api():
         
         data['olusturan_kullanici'] = session.get('username')
         
-        success, new_bakiye = cari_db.cari_hareket_ekle(data)
+        new_bakiye = cari_db.cari_hareket_ekle(data)
         
-        if success:
-            return jsonify({
-                "success": True,
-                "message": "Hareket kaydedildi",
-                "yeni_bakiye": new_bakiye
-            })
-        else:
-            return jsonify({"error": "Hareket eklenemedi"}), 500
+        return jsonify({
+            "success": True,
+            "message": "Hareket kaydedildi",
+            "yeni_bakiye": new_bakiye
+        })
         
+    except FutureTimeoutError:
+        logger.error("Hareket ekleme hatası: yazma zaman aşımı")
+        return jsonify({"error": "Veritabanı meşgul, hareket kaydedilemedi. Lütfen tekrar deneyin."}), 503
     except Exception as e:
         logger.error(f"Hareket ekleme hatası: {e}")
         return jsonify({"error": str(e)}), 500
@@ -2220,9 +2141,7 @@ def personel():
     
     try:
         # Şubeleri getir
-        query = "SELECT CARI_ID AS id, UNVANI AS name FROM subeler WHERE SILINDI = :silindi ORDER BY UNVANI"
-        df = execute_query(query, {"silindi": "false"})
-        branches = df.to_dict("records")
+        branches = subeleri_getir()
         
         return render_template("personel.html", branches=branches)
         
@@ -2295,8 +2214,7 @@ def personel_ekle_api():
             return jsonify({"error": "TC Kimlik 11 haneli sayı olmalıdır"}), 400
         
         # TC kimlik tekrar kontrolü
-        import sqlite3
-        conn = sqlite3.connect(personel_db.db_path)
+        conn = sqlite_baglantilari.baglanti(personel_db.db_path)
         cursor = conn.cursor()
         cursor.execute("SELECT id, ad, soyad, calisma_durumu FROM personel WHERE tc_kimlik = ?", (data['tc_kimlik'],))
         existing = cursor.fetchone()
@@ -2495,10 +2413,8 @@ def personel_maas_kaydet():
         data = request.get_json() or {}
         data['olusturan_kullanici'] = session.get('username')
         
-        # 1. Maaş hesaplamasını kaydet
-        maas_id = personel_db.maas_odeme_kaydet(data)
-        
-        # 2. Cari hesaba ALACAK olarak işle
+        # Cari hesaba ALACAK kaydı, maaş kaydıyla aynı işte yazılır
+        cari_hareket = None
         if data.get('cari_id'):
             cari_hareket = {
                 'cari_id': data['cari_id'],
@@ -2509,11 +2425,8 @@ def personel_maas_kaydet():
                 'borc': 0,
                 'olusturan_kullanici': session.get('username')
             }
-            
-            success, new_bakiye = cari_db.cari_hareket_ekle(cari_hareket)
-            
-            if not success:
-                logger.warning(f"Maaş kaydedildi ama cari işlenemedi: Maaş ID {maas_id}")
+        
+        maas_id = personel_db.maas_odeme_kaydet(data, cari_hareketi=cari_hareket)
         
         return jsonify({
             "success": True,
@@ -2563,7 +2476,7 @@ def personel_izin_ekle():
     try:
         data = request.get_json() or {}
         
-        conn = sqlite3.connect(personel_db.db_path)
+        conn = sqlite_baglantilari.baglanti(personel_db.db_path)
         cursor = conn.cursor()
         
         # Gün sayısını hesapla
@@ -2606,7 +2519,7 @@ def personel_izin_ekle():
 def personel_izin_liste(personel_id):
     """Personel izinlerini listele"""
     try:
-        conn = sqlite3.connect(personel_db.db_path)
+        conn = sqlite_baglantilari.baglanti(personel_db.db_path)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -2637,7 +2550,7 @@ def personel_dokuman_ekle():
     try:
         data = request.get_json() or {}
         
-        conn = sqlite3.connect(personel_db.db_path)
+        conn = sqlite_baglantilari.baglanti(personel_db.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -2707,8 +2620,7 @@ def personel_fotograf_yukle():
         fotograf_data = file.read()
         
         # Veritabanına kaydet
-        import sqlite3
-        conn = sqlite3.connect(personel_db.db_path)
+        conn = sqlite_baglantilari.baglanti(personel_db.db_path)
         cursor = conn.cursor()
         cursor.execute("UPDATE personel SET fotograf = ? WHERE id = ?", (fotograf_data, personel_id))
         conn.commit()
@@ -2737,8 +2649,7 @@ def personel_guncelle_api():
         # TC Kimlik kontrolü (güncelleme sırasında)
         tc_kimlik = data.get('tc_kimlik')
         if tc_kimlik:
-            import sqlite3
-            conn = sqlite3.connect(personel_db.db_path)
+            conn = sqlite_baglantilari.baglanti(personel_db.db_path)
             cursor = conn.cursor()
             cursor.execute("SELECT id FROM personel WHERE tc_kimlik = ? AND id != ?", (tc_kimlik, personel_id))
             existing = cursor.fetchone()
@@ -2794,68 +2705,14 @@ def personel_maas_odeme_yap():
         if not maas_id or not odeme_yontemi:
             return jsonify({"error": "Maaş ID ve ödeme yöntemi gerekli"}), 400
         
-        # 1. Maaş kaydını getir
-        import sqlite3
-        conn = sqlite3.connect(personel_db.db_path, timeout=30.0)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM maas_odeme WHERE id = ?", (maas_id,))
-        maas = cursor.fetchone()
+        # Ödendi işareti ve cari borç kaydı tek işte yazılır; biri olmadan diğeri kalmaz
+        sonuc = personel_db.maas_odemesi_yap(maas_id, odeme_yontemi, odeme_tarihi, session.get('username'))
         
-        if not maas:
-            conn.close()
+        if sonuc == 'bulunamadi':
             return jsonify({"error": "Maaş kaydı bulunamadı"}), 404
-        
-        # Sütun indeksleri
-        cari_id_idx = 2
-        donem_ay_idx = 3
-        donem_yil_idx = 4
-        odenecek_tutar_idx = 12
-        odeme_durumu_idx = 15
-        
-        if maas[odeme_durumu_idx] == 'odendi':
-            conn.close()
+        if sonuc == 'zaten_odenmis':
             return jsonify({"error": "Bu maaş zaten ödenmiş"}), 400
         
-        cari_id = maas[cari_id_idx]
-        odenecek_tutar = maas[odenecek_tutar_idx]
-        
-        # 2. Maaş durumunu güncelle
-        cursor.execute("""
-            UPDATE maas_odeme 
-            SET odeme_durumu = 'odendi', 
-                odeme_tarihi = ?,
-                odeme_yontemi = ?
-            WHERE id = ?
-        """, (odeme_tarihi, odeme_yontemi, maas_id))
-        
-        conn.commit()
-        conn.close()
-        
-        # 3. Cari hesaba BORÇ ekle (ayrı bir connection ile)
-        if cari_id:
-            import time
-            time.sleep(0.1)  # Kısa bir bekleme ekle
-            
-            cari_hareket = {
-                'cari_id': cari_id,
-                'hareket_tipi': 'maas_odeme',
-                'tarih': odeme_tarihi,
-                'aciklama': f"Maaş Ödemesi ({odeme_yontemi}) - {maas[donem_ay_idx]}/{maas[donem_yil_idx]}",
-                'alacak': 0,
-                'borc': odenecek_tutar,
-                'olusturan_kullanici': session.get('username')
-            }
-            
-            success, new_bakiye = cari_db.cari_hareket_ekle(cari_hareket)
-            
-            if not success:
-                logger.warning(f"Maaş ödendi olarak işaretlendi ama cari güncellenemedi")
-                return jsonify({
-                    "success": True,
-                    "message": "Maaş ödendi olarak işaretlendi, ancak cari güncelleme başarısız. Lütfen manuel kontrol edin.",
-                    "warning": True
-                })
-        
         return jsonify({
             "success": True,
             "message": "Maaş ödemesi tamamlandı"
@@ -2871,309 +2728,81 @@ def personel_maas_odeme_yap():
 def download_tahsilatlar():
     """Tahsilat analizini Excel olarak indir"""
     try:
-        import io
-        import openpyxl
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-        
         data = request.get_json() or {}
         
-        start_date_raw = data.get("start_date")
-        end_date_raw = data.get("end_date")
-        selected_branches = data.get("selected_branches", [])
-        selected_doctors = data.get("selected_doctors", [])
-        
-        # Tarih kontrolü
-        start_date = datetime.strptime(start_date_raw, "%Y-%m-%d").date()
-        end_date = datetime.strptime(end_date_raw, "%Y-%m-%d").date()
-        
-        engine = get_database_connection()
-        
-        # Tahsilat verilerini çek (analyze_tahsilatlar ile aynı sorgu)
-        branch_placeholders = ','.join([':branch_' + str(i) for i in range(len(selected_branches))])
-        
-        params = {
-            'start_date': start_date,
-            'end_date': end_date
-        }
-        
-        for i, branch in enumerate(selected_branches):
-            params[f'branch_{i}'] = branch
-        
-        tahsilat_query = f"""
-        SELECT
-            T1.TARIH,
-            T1.ALACAK AS TUTAR,
-            T1.HEDEF_ILGILI_DOKTOR_ID AS DOKTOR_ID,
-            CONCAT(IFNULL(DR.ADI,''),' ',IFNULL(DR.SOYADI,'')) AS HEKIM_ADI,
-            IFNULL(DR.PRIMYUZDE,0) AS PRIMYUZDE,
-            CONCAT(IFNULL(H.ADI,''),' ',IFNULL(H.SOYADI,'')) AS HASTA_ADI,
-            H.HASTA_ID,
-            LOWER(IFNULL(OS.ADI,'bilinmeyen')) AS ODEME_SEKLI,
-            IFNULL(SB.UNVANI,'Bilinmeyen') AS SUBE_ADI,
-            T1.HAREKETTYPE
-        FROM carihareket AS T1
-        LEFT JOIN kartdoktor AS DR ON T1.HEDEF_ILGILI_DOKTOR_ID = DR.CARI_ID
-        LEFT JOIN odeme_sekilleri AS OS ON T1.ISLEM_TIPI_ID = OS.ROWNO
-        LEFT JOIN subeler AS SB ON T1.SUBE_ID = SB.CARI_ID
-        LEFT JOIN karthasta AS H ON T1.KAYNAK_CARI_ID = H.HASTA_ID
-        WHERE T1.SILINDI='False'
-          AND T1.ALACAK > 0
-          AND T1.HAREKETTYPE IN ('T','ST','CT')
-          AND T1.TARIH BETWEEN :start_date AND :end_date
-          AND T1.SUBE_ID IN ({branch_placeholders})
-        """
-        
-        if selected_doctors:
-            doctor_placeholders = ','.join([':doctor_' + str(i) for i in range(len(selected_doctors))])
-            tahsilat_query += f" AND T1.HEDEF_ILGILI_DOKTOR_ID IN ({doctor_placeholders})"
-            for i, doctor in enumerate(selected_doctors):
-                params[f'doctor_{i}'] = doctor
-        
-        df = pd.read_sql(text(tahsilat_query), engine, params=params)
-        
-        # Kesinti hesaplamaları
-        KESINTI_ORANLARI = {
-            'nakit': 0,
-            'pos': 0.10,
-            'banka': 0.10,
-            'çek': 0.10,
-            'senet': 0,
-            'senet tahsilatı': 0
-        }
+        # Önce analiz sırasında saklanan snapshot'ı dene (aynı sorgular tekrar çalışmasın)
+        analiz = snapshot_getir(data.get("snapshot_id"), session.get("username"))
+        if analiz:
+            start_date = analiz["start_date"]
+            end_date = analiz["end_date"]
+            logger.info(f"Tahsilat Excel'i snapshot'tan oluşturuluyor: {data.get('snapshot_id')}")
+        else:
+            start_date_raw = data.get("start_date")
+            end_date_raw = data.get("end_date")
+            selected_branches = data.get("selected_branches", [])
+            selected_doctors = data.get("selected_doctors", [])
+            
+            # Tarih kontrolü
+            start_date = datetime.strptime(start_date_raw, "%Y-%m-%d").date()
+            end_date = datetime.strptime(end_date_raw, "%Y-%m-%d").date()
+            
+            # Snapshot yok veya süresi dolmuş; analizi yeniden çalıştır
+            analiz = tahsilat_analizi_yap(start_date, end_date, selected_branches, selected_doctors)
         
-        df["ODEME_SEKLI"] = df["ODEME_SEKLI"].str.strip().str.lower()
-        df["KESINTI_ORANI"] = df["ODEME_SEKLI"].map(KESINTI_ORANLARI).fillna(0)
-        df["KESINTI"] = df["TUTAR"] * df["KESINTI_ORANI"]
-        df["NET_TAHSILAT"] = df["TUTAR"] - df["KESINTI"]
-        df["PRIM_YUZDE"] = df["PRIMYUZDE"] / 100
-        df["HESAPLANAN_PRIM"] = df["NET_TAHSILAT"] * df["PRIM_YUZDE"]
+        df = analiz["df"]
         
-        # Excel dosyası oluştur
-        wb = openpyxl.Workbook()
+        rapor = ExcelRaporu()
         
         # 1. Sayfa: Tahsilat Detayları
-        ws1 = wb.active
-        ws1.title = "Tahsilat Detayları"
-        
-        # Başlıklar
-        headers = ["HASTA ADI", "HEKİM ADI", "ÖDEME YÖNTEMİ", "ŞUBE ADI", "TARİH", 
-                  "TUTAR", "KESİNTİ", "NET TAHSİLAT", "PRİM %", "HESAPLANAN PRİM"]
-        
-        # Başlık stili
-        header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF")
-        border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-        
-        for col_num, header in enumerate(headers, 1):
-            cell = ws1.cell(row=1, column=col_num, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-            cell.border = border
-        
-        # Veri satırları
-        for row_num, row_data in enumerate(df.itertuples(index=False), 2):
-            ws1.cell(row=row_num, column=1, value=row_data.HASTA_ADI).border = border
-            ws1.cell(row=row_num, column=2, value=row_data.HEKIM_ADI).border = border
-            ws1.cell(row=row_num, column=3, value=row_data.ODEME_SEKLI).border = border
-            ws1.cell(row=row_num, column=4, value=row_data.SUBE_ADI).border = border
-            ws1.cell(row=row_num, column=5, value=str(row_data.TARIH)).border = border
-            ws1.cell(row=row_num, column=6, value=float(row_data.TUTAR)).number_format = '#,##0.00'
-            ws1.cell(row=row_num, column=6).border = border
-            ws1.cell(row=row_num, column=7, value=float(row_data.KESINTI)).number_format = '#,##0.00'
-            ws1.cell(row=row_num, column=7).border = border
-            ws1.cell(row=row_num, column=8, value=float(row_data.NET_TAHSILAT)).number_format = '#,##0.00'
-            ws1.cell(row=row_num, column=8).border = border
-            ws1.cell(row=row_num, column=9, value=float(row_data.PRIMYUZDE)).number_format = '0.00%'
-            ws1.cell(row=row_num, column=9).border = border
-            ws1.cell(row=row_num, column=10, value=float(row_data.HESAPLANAN_PRIM)).number_format = '#,##0.00'
-            ws1.cell(row=row_num, column=10).border = border
-        
-        # Özet satırı ekle
-        last_row = len(df) + 2
-        ws1.cell(row=last_row, column=1, value="TOPLAM:").font = Font(bold=True)
-        ws1.cell(row=last_row, column=6, value=float(df['TUTAR'].sum())).number_format = '#,##0.00'
-        ws1.cell(row=last_row, column=6).font = Font(bold=True)
-        ws1.cell(row=last_row, column=7, value=float(df['KESINTI'].sum())).number_format = '#,##0.00'
-        ws1.cell(row=last_row, column=7).font = Font(bold=True)
-        ws1.cell(row=last_row, column=8, value=float(df['NET_TAHSILAT'].sum())).number_format = '#,##0.00'
-        ws1.cell(row=last_row, column=8).font = Font(bold=True)
-        ws1.cell(row=last_row, column=10, value=float(df['HESAPLANAN_PRIM'].sum())).number_format = '#,##0.00'
-        ws1.cell(row=last_row, column=10).font = Font(bold=True)
-        
-        # Sütun genişliklerini ayarla
-        ws1.column_dimensions['A'].width = 25
-        ws1.column_dimensions['B'].width = 25
-        ws1.column_dimensions['C'].width = 15
-        ws1.column_dimensions['D'].width = 20
-        ws1.column_dimensions['E'].width = 12
-        ws1.column_dimensions['F'].width = 12
-        ws1.column_dimensions['G'].width = 12
-        ws1.column_dimensions['H'].width = 15
-        ws1.column_dimensions['I'].width = 10
-        ws1.column_dimensions['J'].width = 15
-        
-        # 2. Sayfa: Çoklu Hekim Uyarıları
-        # Çoklu hekim hastalarını tespit et (analyze_tahsilatlar ile aynı mantık)
-        tum_tedavi_query = """
-        SELECT
-            T1.HASTA_ID,
-            T1.DOKTOR_ID,
-            COALESCE(CONCAT(DR.ADI,' ',DR.SOYADI), '') AS HEKIM_ADI,
-            SUM(COALESCE(T1.TUTAR, T1.LISTETUTAR, 0)) AS TEDAVI_TOPLAM,
-            COUNT(*) AS TEDAVI_SAYISI,
-            MIN(T1.TARIH) AS ILK_TEDAVI,
-            MAX(T1.TARIH) AS SON_TEDAVI,
-            DR.SUBE_ID
-        FROM tedavi AS T1
-        LEFT JOIN kartdoktor AS DR ON T1.DOKTOR_ID = DR.CARI_ID
-        WHERE (T1.SILINDI IS NULL OR T1.SILINDI != 'True')
-          AND (T1.ISDELETED IS NULL OR T1.ISDELETED != 'True')
-        GROUP BY T1.HASTA_ID, T1.DOKTOR_ID, HEKIM_ADI, DR.SUBE_ID
-        """
-        tum_tedavi_df = pd.read_sql(tum_tedavi_query, engine)
-        
-        tum_multi_patients = set(
-            tum_tedavi_df.groupby("HASTA_ID")["DOKTOR_ID"].nunique()
-            .loc[lambda x: x > 1].index.astype(str).tolist()
+        tahsilat_sutunlari = [
+            ("HASTA ADI", 25, 'metin'), ("HEKİM ADI", 25, 'metin'), ("ÖDEME YÖNTEMİ", 15, 'metin'),
+            ("ŞUBE ADI", 20, 'metin'), ("TARİH", 12, 'metin'), ("TUTAR", 12, 'para'),
+            ("KESİNTİ", 12, 'para'), ("NET TAHSİLAT", 15, 'para'), ("PRİM %", 10, 'yuzde'),
+            ("HESAPLANAN PRİM", 15, 'para')
+        ]
+        excel_df = pd.DataFrame({
+            "HASTA_ADI": df["HASTA_ADI"],
+            "HEKIM_ADI": df["HEKIM_ADI"],
+            "ODEME_SEKLI": df["ODEME_SEKLI"],
+            "SUBE_ADI": df["SUBE_ADI"],
+            "TARIH": df["TARIH"].astype(str),
+            "TUTAR": df["TUTAR"].astype(float),
+            "KESINTI": df["KESINTI"].astype(float),
+            "NET_TAHSILAT": df["NET_TAHSILAT"].astype(float),
+            "PRIMYUZDE": df["PRIMYUZDE"].astype(float),
+            "HESAPLANAN_PRIM": df["HESAPLANAN_PRIM"].astype(float)
+        })
+        rapor.sayfa_yaz(
+            "Tahsilat Detayları",
+            tahsilat_sutunlari,
+            excel_df.itertuples(index=False, name=None),
+            toplam_satiri={
+                0: "TOPLAM:",
+                5: float(df['TUTAR'].sum()),
+                6: float(df['KESINTI'].sum()),
+                7: float(df['NET_TAHSILAT'].sum()),
+                9: float(df['HESAPLANAN_PRIM'].sum())
+            }
         )
         
-        ana_analiz_hastalari = set(df["HASTA_ID"].astype(str).tolist())
-        multi_patients = tum_multi_patients.intersection(ana_analiz_hastalari)
-        
-        if selected_doctors:
-            selected_doctor_patients = set(
-                tum_tedavi_df[tum_tedavi_df["DOKTOR_ID"].isin(selected_doctors)]["HASTA_ID"].astype(str).tolist()
+        # 2. Sayfa: Çoklu Hekim Uyarıları (ekrandaki çoklu hekim listesiyle aynı hesaplama)
+        if analiz["multi_patients"]:
+            multi_doctor_issues, _ = coklu_hekim_sorunlarini_olustur(analiz, analiz.get("selected_doctors"))
+            
+            coklu_sutunlar = [
+                ("HASTA ADI", 25, 'metin'), ("HASTA ID", 12, 'metin'), ("HEKİM ADI", 25, 'metin'),
+                ("DOKTOR ID", 12, 'metin'), ("TEDAVİ TUTARI", 15, 'para'), ("TAHSİLAT TUTARI", 15, 'para'),
+                ("FARK", 15, fark_stili), ("SON TAHSİLAT TARİHİ", 15, 'metin')
+            ]
+            coklu_satirlar = (
+                (issue["hasta_adi"], issue["hasta_id"], hekim["hekim_adi"], hekim["hekim_id"],
+                 hekim["tedavi_tutari"], hekim["tahsilat_tutari"], hekim["fark"], hekim["son_tahsilat_tarihi"])
+                for issue in multi_doctor_issues
+                for hekim in issue["hekimler"]
             )
-            multi_patients = multi_patients.intersection(selected_doctor_patients)
+            rapor.sayfa_yaz("Çoklu Hekim Uyarıları", coklu_sutunlar, coklu_satirlar, baslik_stili='baslik_uyari')
         
-        selected_branch_patients = set(
-            tum_tedavi_df[tum_tedavi_df["SUBE_ID"].isin(selected_branches)]["HASTA_ID"].astype(str).tolist()
-        )
-        multi_patients = multi_patients.intersection(selected_branch_patients)
-        
-        if multi_patients:
-            ws2 = wb.create_sheet(title="Çoklu Hekim Uyarıları")
-            
-            # Başlıklar
-            multi_headers = ["HASTA ADI", "HASTA ID", "HEKİM ADI", "DOKTOR ID", 
-                           "TEDAVİ TUTARI", "TAHSİLAT TUTARI", "FARK", "SON TAHSİLAT TARİHİ"]
-            
-            for col_num, header in enumerate(multi_headers, 1):
-                cell = ws2.cell(row=1, column=col_num, value=header)
-                cell.fill = PatternFill(start_color="FFC000", end_color="FFC000", fill_type="solid")
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal='center', vertical='center')
-                cell.border = border
-            
-            # Hasta detayları için veri topla
-            tedavi_df = tum_tedavi_df[tum_tedavi_df["HASTA_ID"].astype(str).isin(multi_patients)]
-            
-            # Tüm tahsilatları al
-            hasta_ids_list = list(multi_patients)
-            hasta_placeholders = ','.join([':hasta_' + str(i) for i in range(len(hasta_ids_list))])
-            
-            tum_tahsilat_params = {}
-            for i, pid in enumerate(hasta_ids_list):
-                tum_tahsilat_params[f'hasta_{i}'] = pid
-                
-            tum_tahsilat_query = f"""
-            SELECT
-                T1.HEDEF_ILGILI_DOKTOR_ID AS DOKTOR_ID,
-                H.HASTA_ID,
-                SUM(T1.ALACAK) AS TOPLAM_TUTAR,
-                COUNT(*) AS TAHSILAT_SAYISI,
-                MAX(T1.TARIH) AS SON_TAHSILAT_TARIHI
-            FROM carihareket AS T1
-            LEFT JOIN karthasta AS H ON T1.KAYNAK_CARI_ID = H.HASTA_ID
-            WHERE T1.SILINDI='False'
-              AND T1.ALACAK > 0
-              AND T1.HAREKETTYPE IN ('T','ST','CT')
-              AND H.HASTA_ID IN ({hasta_placeholders})
-            GROUP BY T1.HEDEF_ILGILI_DOKTOR_ID, H.HASTA_ID
-            """
-            tum_tahsilat_df = pd.read_sql(text(tum_tahsilat_query), engine, params=tum_tahsilat_params)
-            
-            # Hasta adlarını toplu çek
-            tum_hasta_adlari_query = f"""
-            SELECT HASTA_ID, CONCAT(IFNULL(ADI,''), ' ', IFNULL(SOYADI,'')) AS HASTA_ADI 
-            FROM karthasta 
-            WHERE HASTA_ID IN ({hasta_placeholders})
-            """
-            hasta_adlari_df = pd.read_sql(text(tum_hasta_adlari_query), engine, params=tum_tahsilat_params)
-            hasta_adlari_dict = dict(zip(hasta_adlari_df["HASTA_ID"].astype(str), hasta_adlari_df["HASTA_ADI"]))
-            
-            # Her hasta için satır ekle
-            current_row = 2
-            for hasta_id in multi_patients:
-                hasta_tedavi = tedavi_df[tedavi_df["HASTA_ID"].astype(str) == str(hasta_id)]
-                hasta_tahsilat = tum_tahsilat_df[tum_tahsilat_df["HASTA_ID"].astype(str) == str(hasta_id)]
-                
-                hasta_adi = hasta_adlari_dict.get(str(hasta_id), f"Hasta ID: {hasta_id}")
-                
-                tedavi_hekimler = set(hasta_tedavi["DOKTOR_ID"].tolist())
-                tahsilat_hekimler = set(hasta_tahsilat["DOKTOR_ID"].tolist())
-                tum_hekimler = tedavi_hekimler.union(tahsilat_hekimler)
-                
-                for hekim_id in tum_hekimler:
-                    hekim_tedavi = hasta_tedavi[hasta_tedavi["DOKTOR_ID"] == hekim_id]
-                    tedavi_tutari = float(hekim_tedavi["TEDAVI_TOPLAM"].iloc[0]) if not hekim_tedavi.empty else 0.0
-                    
-                    hekim_tahsilat = hasta_tahsilat[hasta_tahsilat["DOKTOR_ID"] == hekim_id]
-                    tahsilat_tutari = float(hekim_tahsilat["TOPLAM_TUTAR"].iloc[0]) if not hekim_tahsilat.empty else 0.0
-                    son_tahsilat = str(hekim_tahsilat["SON_TAHSILAT_TARIHI"].iloc[0]) if not hekim_tahsilat.empty else "Yok"
-                    
-                    hekim_adi = hekim_tedavi["HEKIM_ADI"].iloc[0] if not hekim_tedavi.empty else f"Hekim ID: {hekim_id}"
-                    
-                    fark = tahsilat_tutari - tedavi_tutari
-                    
-                    if tedavi_tutari > 0 or tahsilat_tutari > 0:
-                        ws2.cell(row=current_row, column=1, value=hasta_adi).border = border
-                        ws2.cell(row=current_row, column=2, value=hasta_id).border = border
-                        ws2.cell(row=current_row, column=3, value=hekim_adi).border = border
-                        ws2.cell(row=current_row, column=4, value=hekim_id).border = border
-                        ws2.cell(row=current_row, column=5, value=tedavi_tutari).number_format = '#,##0.00'
-                        ws2.cell(row=current_row, column=5).border = border
-                        ws2.cell(row=current_row, column=6, value=tahsilat_tutari).number_format = '#,##0.00'
-                        ws2.cell(row=current_row, column=6).border = border
-                        ws2.cell(row=current_row, column=7, value=fark).number_format = '#,##0.00'
-                        ws2.cell(row=current_row, column=7).border = border
-                        
-                        # Fark negatifse kırmızı renk
-                        if fark < 0:
-                            ws2.cell(row=current_row, column=7).font = Font(color="FF0000")
-                        elif fark > 0:
-                            ws2.cell(row=current_row, column=7).font = Font(color="008000")
-                        
-                        ws2.cell(row=current_row, column=8, value=son_tahsilat).border = border
-                        current_row += 1
-            
-            # Sütun genişliklerini ayarla
-            ws2.column_dimensions['A'].width = 25
-            ws2.column_dimensions['B'].width = 12
-            ws2.column_dimensions['C'].width = 25
-            ws2.column_dimensions['D'].width = 12
-            ws2.column_dimensions['E'].width = 15
-            ws2.column_dimensions['F'].width = 15
-            ws2.column_dimensions['G'].width = 15
-            ws2.column_dimensions['H'].width = 15
-        
-        # Excel dosyasını kaydet
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'tahsilat_raporu_{start_date}_{end_date}.xlsx'
-        )
+        return rapor.yanit(f'tahsilat_raporu_{start_date}_{end_date}.xlsx')
         
     except Exception as e:
         logger.error(f"Excel indirme hatası: {e}")
@@ -3231,8 +2860,7 @@ def personel_maas_sil():
             return jsonify({"error": "Hatalı admin şifresi"}), 403
         
         # Maaş kaydını getir
-        import sqlite3
-        conn = sqlite3.connect(personel_db.db_path)
+        conn = sqlite_baglantilari.baglanti(personel_db.db_path)
         cursor = conn.cursor()
         
         cursor.execute("SELECT cari_id, personel_id, donem_ay, donem_yil FROM maas_odeme WHERE id = ?", (maas_id,))
@@ -3345,12 +2973,10 @@ def analyze_tedaviler():
 
         base_query += " ORDER BY T.TARIH, T.SUBE_ID, T.DOKTOR_ID"
 
-        df = pd.read_sql(text(base_query), engine, params=params)
+        df = pd.read_sql(sqlalchemy.text(base_query), engine, params=params)
 
         if df.empty:
-            branches_query = "SELECT CARI_ID, UNVANI FROM subeler WHERE SILINDI='false' ORDER BY UNVANI"
-            branches_df = pd.read_sql(branches_query, engine)
-            branches = branches_df.to_dict('records')
+            branches = subeleri_getir_cari()
             
             return render_template("tedaviler.html",
                                  branches=branches,
@@ -3372,9 +2998,7 @@ def analyze_tedaviler():
         toplam_liste = df['LISTETUTAR'].sum()
         toplam_indirim = toplam_liste - toplam_tutar
 
-        branches_query = "SELECT CARI_ID, UNVANI FROM subeler WHERE SILINDI='false' ORDER BY UNVANI"
-        branches_df = pd.read_sql(branches_query, engine)
-        branches = branches_df.to_dict('records')
+        branches = subeleri_getir_cari()
 
         return render_template("tedaviler.html",
                              branches=branches,
@@ -3394,10 +3018,7 @@ def analyze_tedaviler():
         import traceback
         logger.error(traceback.format_exc())
         
-        engine = get_database_connection()
-        branches_query = "SELECT CARI_ID, UNVANI FROM subeler WHERE SILINDI='false' ORDER BY UNVANI"
-        branches_df = pd.read_sql(branches_query, engine)
-        branches = branches_df.to_dict('records')
+        branches = subeleri_getir_cari()
         
         flash("Analiz sırasında bir hata oluştu.", "danger")
         return render_template("tedaviler.html", 
@@ -3409,120 +3030,44 @@ def analyze_tedaviler():
 def download_tedaviler():
     """Tedavi analizini Excel olarak indir"""
     try:
-        import io
-        import openpyxl
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-        
         data = request.get_json() or {}
         
         ozet_data = data.get("ozet_data", [])
         hasta_data = data.get("hasta_data", [])
         
-        # Excel dosyası oluştur
-        wb = openpyxl.Workbook()
-        
-        # Border stili
-        border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
+        rapor = ExcelRaporu()
         
         # 1. Sayfa: Tedavi Türü Özeti
-        ws1 = wb.active
-        ws1.title = "Tedavi Türü Özeti"
-        
-        # Başlıklar
-        headers_ozet = ["HEKİM ADI", "ŞUBE ADI", "TEDAVİ TÜRÜ", "TEDAVİ ADI", 
-                       "ADET", "TOPLAM TUTAR", "LİSTE TUTARI", "İNDİRİM"]
-        
-        header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF")
-        
-        for col_num, header in enumerate(headers_ozet, 1):
-            cell = ws1.cell(row=1, column=col_num, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-            cell.border = border
-        
-        # Veri satırları
-        for row_num, row_data in enumerate(ozet_data, 2):
-            indirim = float(row_data['TOPLAM_LISTE']) - float(row_data['TOPLAM_TUTAR'])
-            
-            ws1.cell(row=row_num, column=1, value=row_data['HEKIM_ADI']).border = border
-            ws1.cell(row=row_num, column=2, value=row_data['SUBE_ADI']).border = border
-            ws1.cell(row=row_num, column=3, value=row_data['ISLEM']).border = border
-            ws1.cell(row=row_num, column=4, value=row_data['TEDAVIADI']).border = border
-            ws1.cell(row=row_num, column=5, value=int(row_data['ADET'])).border = border
-            ws1.cell(row=row_num, column=6, value=float(row_data['TOPLAM_TUTAR'])).number_format = '#,##0.00'
-            ws1.cell(row=row_num, column=6).border = border
-            ws1.cell(row=row_num, column=7, value=float(row_data['TOPLAM_LISTE'])).number_format = '#,##0.00'
-            ws1.cell(row=row_num, column=7).border = border
-            ws1.cell(row=row_num, column=8, value=indirim).number_format = '#,##0.00'
-            ws1.cell(row=row_num, column=8).border = border
-        
-        # Sütun genişlikleri
-        ws1.column_dimensions['A'].width = 25
-        ws1.column_dimensions['B'].width = 20
-        ws1.column_dimensions['C'].width = 20
-        ws1.column_dimensions['D'].width = 35
-        ws1.column_dimensions['E'].width = 10
-        ws1.column_dimensions['F'].width = 15
-        ws1.column_dimensions['G'].width = 15
-        ws1.column_dimensions['H'].width = 15
+        ozet_sutunlari = [
+            ("HEKİM ADI", 25, 'metin'), ("ŞUBE ADI", 20, 'metin'), ("TEDAVİ TÜRÜ", 20, 'metin'),
+            ("TEDAVİ ADI", 35, 'metin'), ("ADET", 10, 'metin'), ("TOPLAM TUTAR", 15, 'para'),
+            ("LİSTE TUTARI", 15, 'para'), ("İNDİRİM", 15, 'para')
+        ]
+        ozet_satirlari = (
+            (row['HEKIM_ADI'], row['SUBE_ADI'], row['ISLEM'], row['TEDAVIADI'], int(row['ADET']),
+             float(row['TOPLAM_TUTAR']), float(row['TOPLAM_LISTE']),
+             float(row['TOPLAM_LISTE']) - float(row['TOPLAM_TUTAR']))
+            for row in ozet_data
+        )
+        rapor.sayfa_yaz("Tedavi Türü Özeti", ozet_sutunlari, ozet_satirlari)
         
         # 2. Sayfa: Hasta Detayları
-        ws2 = wb.create_sheet(title="Hasta Detayları")
-        
-        headers_hasta = ["DOSYA NO", "HASTA ADI", "HEKİM ADI", "ŞUBE ADI", 
-                        "TARİH", "TEDAVİ ADI", "TUTAR", "LİSTE FİYATI"]
-        
-        for col_num, header in enumerate(headers_hasta, 1):
-            cell = ws2.cell(row=1, column=col_num, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-            cell.border = border
-        
-        # Veri satırları
-        for row_num, row_data in enumerate(hasta_data, 2):
-            ws2.cell(row=row_num, column=1, value=row_data.get('DOSYA_NO', '')).border = border
-            ws2.cell(row=row_num, column=2, value=row_data['HASTA_ADI']).border = border
-            ws2.cell(row=row_num, column=3, value=row_data['HEKIM_ADI']).border = border
-            ws2.cell(row=row_num, column=4, value=row_data['SUBE_ADI']).border = border
-            ws2.cell(row=row_num, column=5, value=str(row_data['TARIH'])).border = border
-            ws2.cell(row=row_num, column=6, value=row_data['TEDAVIADI']).border = border
-            ws2.cell(row=row_num, column=7, value=float(row_data['TUTAR'])).number_format = '#,##0.00'
-            ws2.cell(row=row_num, column=7).border = border
-            ws2.cell(row=row_num, column=8, value=float(row_data['LISTETUTAR'])).number_format = '#,##0.00'
-            ws2.cell(row=row_num, column=8).border = border
-        
-        # Sütun genişlikleri
-        ws2.column_dimensions['A'].width = 15
-        ws2.column_dimensions['B'].width = 25
-        ws2.column_dimensions['C'].width = 25
-        ws2.column_dimensions['D'].width = 20
-        ws2.column_dimensions['E'].width = 12
-        ws2.column_dimensions['F'].width = 35
-        ws2.column_dimensions['G'].width = 15
-        ws2.column_dimensions['H'].width = 15
-        
-        # Excel dosyasını kaydet
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
+        hasta_sutunlari = [
+            ("DOSYA NO", 15, 'metin'), ("HASTA ADI", 25, 'metin'), ("HEKİM ADI", 25, 'metin'),
+            ("ŞUBE ADI", 20, 'metin'), ("TARİH", 12, 'metin'), ("TEDAVİ ADI", 35, 'metin'),
+            ("TUTAR", 15, 'para'), ("LİSTE FİYATI", 15, 'para')
+        ]
+        hasta_satirlari = (
+            (row.get('DOSYA_NO', ''), row['HASTA_ADI'], row['HEKIM_ADI'], row['SUBE_ADI'],
+             str(row['TARIH']), row['TEDAVIADI'], float(row['TUTAR']), float(row['LISTETUTAR']))
+            for row in hasta_data
+        )
+        rapor.sayfa_yaz("Hasta Detayları", hasta_sutunlari, hasta_satirlari)
         
         start_date = data.get('start_date', 'baslangic')
         end_date = data.get('end_date', 'bitis')
         
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'tedavi_raporu_{start_date}_{end_date}.xlsx'
-        )
+        return rapor.yanit(f'tedavi_raporu_{start_date}_{end_date}.xlsx')
         
     except Exception as e:
         logger.error(f"Excel indirme hatası: {e}")
@@ -3535,12 +3080,8 @@ def download_tedaviler():
 def tedaviler():
     """Tedaviler analizi ana sayfası"""
     try:
-        engine = get_database_connection()
-        
         # Şubeleri getir
-        branches_query = "SELECT CARI_ID, UNVANI FROM subeler WHERE SILINDI='false' ORDER BY UNVANI"
-        branches_df = pd.read_sql(branches_query, engine)
-        branches = branches_df.to_dict('records')
+        branches = subeleri_getir_cari()
         
         return render_template("tedaviler.html",
                              branches=branches,
@@ -3572,9 +3113,7 @@ def izin_yonetimi():
     
     try:
         # Şubeleri getir
-        query = "SELECT CARI_ID AS id, UNVANI AS name FROM subeler WHERE SILINDI = :silindi ORDER BY UNVANI"
-        df = execute_query(query, {"silindi": "false"})
-        branches = df.to_dict("records")
+        branches = subeleri_getir()
         
         # Aktif personelleri getir
         personeller = personel_db.personel_listele(sadece_aktif=True)
@@ -3740,9 +3279,6 @@ def izin_ozet_rapor_api():
 def izin_excel_export():
     """İzin raporunu Excel olarak indir"""
     try:
-        import io
-        from datetime import datetime
-        
         donem_yil = request.args.get("donem_yil", datetime.now().year)
         
         rapor = personel_db.izin_ozet_rapor(donem_yil=donem_yil)
@@ -3768,26 +3304,32 @@ def izin_excel_export():
         })
         
         # Excel dosyası oluştur
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='İzin Raporu', index=False)
-        
-        output.seek(0)
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'izin_raporu_{donem_yil}.xlsx'
+        rapor = ExcelRaporu()
+        rapor.sayfa_yaz(
+            'İzin Raporu',
+            [(str(kolon), 15, None) for kolon in df.columns],
+            df.itertuples(index=False, name=None)
         )
         
+        return rapor.yanit(f'izin_raporu_{donem_yil}.xlsx')
+        
     except Exception as e:
         logger.error(f"Excel export hatası: {e}")
         flash("Excel dosyası oluşturulamadı", "danger")
         return redirect(url_for("izin_yonetimi"))        
 
-if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)        
+# --- Uygulama fabrikası ---
+def create_app():
+    """
+    WSGI giriş noktası (gunicorn "app:create_app()", flask --app "app:create_app()").
+    Veritabanı nesneleri, MySQL engine'i ve pandas/openpyxl ilk kullanımda yüklenir.
+    ACILISTA_ONCEDEN_YUKLE açıksa kütüphaneler burada yüklenir (gunicorn --preload ile
+    worker'lar fork öncesi yüklenen modülleri paylaşır); bağlantılar yine worker'da açılır.
+    """
+    if getattr(config, 'ACILISTA_ONCEDEN_YUKLE', False):
+        sureli_ice_aktar('numpy', 'pandas', 'sqlalchemy', 'openpyxl')
+    acilis_raporunu_logla()
+    return app
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
+    create_app().run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
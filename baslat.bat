@@ -1,2 +1,2 @@
-set FLASK_APP=app.py
+set FLASK_APP=app:create_app()
 flask run
\ No newline at end of file
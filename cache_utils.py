@@ -0,0 +1,181 @@
+# cache_utils.py - Süreç içi önbellek yardımcıları
+import sys
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ReferansCache:
+    """
+    Nadiren değişen referans verileri (şubeler, hekimler, ödeme şekilleri) için
+    TTL'li süreç içi önbellek. Her anahtar kendi yükleyici fonksiyonuyla doldurulur.
+    """
+
+    def __init__(self, ttl=600):
+        self.ttl = ttl
+        self._veriler = {}
+        self._lock = threading.Lock()
+        self._yukleme_kilitleri = {}
+        self.hit = 0
+        self.miss = 0
+
+    def getir(self, anahtar, yukleyici):
+        """Anahtar geçerliyse önbellekten döndür, değilse yükleyiciyi çağırıp sakla"""
+        simdi = time.monotonic()
+        with self._lock:
+            kayit = self._veriler.get(anahtar)
+            if kayit and kayit[0] > simdi:
+                self.hit += 1
+                return kayit[1]
+            yukleme_kilidi = self._yukleme_kilitleri.setdefault(anahtar, threading.Lock())
+
+        # Aynı anahtar için eşzamanlı isteklerde sorgu yalnızca bir kez çalışsın
+        with yukleme_kilidi:
+            with self._lock:
+                kayit = self._veriler.get(anahtar)
+                if kayit and kayit[0] > time.monotonic():
+                    self.hit += 1
+                    return kayit[1]
+                self.miss += 1
+
+            deger = yukleyici()
+
+            with self._lock:
+                self._veriler[anahtar] = (time.monotonic() + self.ttl, deger)
+            logger.info(f"Referans önbelleği yenilendi: {anahtar}")
+            return deger
+
+    def temizle(self, anahtar=None):
+        """Tek bir anahtarı ya da tüm önbelleği geçersiz kıl"""
+        with self._lock:
+            if anahtar is None:
+                silinen = len(self._veriler)
+                self._veriler.clear()
+            else:
+                silinen = 1 if self._veriler.pop(anahtar, None) is not None else 0
+        logger.info(f"Referans önbelleği temizlendi: {anahtar or 'tümü'} ({silinen} kayıt)")
+        return silinen
+
+    def istatistikler(self):
+        """Hit/miss sayaçları ve anahtar bazlı kalan süreler"""
+        simdi = time.monotonic()
+        with self._lock:
+            toplam = self.hit + self.miss
+            return {
+                "ttl": self.ttl,
+                "hit": self.hit,
+                "miss": self.miss,
+                "hit_orani": round(self.hit / toplam, 4) if toplam else 0,
+                "anahtarlar": {
+                    anahtar: {
+                        "kalan_sure": max(0, round(kayit[0] - simdi, 1)),
+                        "kayit_sayisi": len(kayit[1]) if hasattr(kayit[1], '__len__') else None
+                    }
+                    for anahtar, kayit in self._veriler.items()
+                }
+            }
+
+
+def _boyut_tahmini(deger):
+    """Bellek kullanımı için kaba bayt tahmini (DataFrame'ler için pandas ölçümü)"""
+    if hasattr(deger, 'memory_usage'):
+        try:
+            return int(deger.memory_usage(index=True, deep=True).sum())
+        except TypeError:
+            return int(deger.memory_usage(index=True, deep=True))
+    if isinstance(deger, dict):
+        return sys.getsizeof(deger) + sum(_boyut_tahmini(k) + _boyut_tahmini(v) for k, v in deger.items())
+    if isinstance(deger, (list, tuple, set, frozenset)):
+        return sys.getsizeof(deger) + sum(_boyut_tahmini(v) for v in deger)
+    return sys.getsizeof(deger)
+
+
+class LRUStore:
+    """
+    Kayıt sayısı ve toplam boyutla sınırlı, süreli (TTL) LRU deposu.
+    Analiz sonuçlarını (snapshot) sonraki istekler için sunucu tarafında tutar.
+    """
+
+    def __init__(self, max_kayit=50, max_bayt=256 * 1024 * 1024, ttl=1800):
+        self.max_kayit = max_kayit
+        self.max_bayt = max_bayt
+        self.ttl = ttl
+        self._kayitlar = OrderedDict()  # anahtar -> (bitis_zamani, boyut, deger)
+        self._toplam_bayt = 0
+        self._lock = threading.Lock()
+        self.hit = 0
+        self.miss = 0
+        self.cikarilan = 0
+
+    def _sil(self, anahtar):
+        kayit = self._kayitlar.pop(anahtar, None)
+        if kayit:
+            self._toplam_bayt -= kayit[1]
+        return kayit
+
+    def _suresi_dolanlari_temizle(self, simdi):
+        for anahtar in [a for a, k in self._kayitlar.items() if k[0] <= simdi]:
+            self._sil(anahtar)
+
+    def koy(self, anahtar, deger):
+        """Değeri sakla; sınırlar aşılırsa en az kullanılanlar çıkarılır"""
+        boyut = _boyut_tahmini(deger)
+        if boyut > self.max_bayt:
+            logger.warning(f"Snapshot depolanamayacak kadar büyük ({boyut} bayt), atlandı: {anahtar}")
+            return False
+
+        simdi = time.monotonic()
+        with self._lock:
+            self._sil(anahtar)
+            self._suresi_dolanlari_temizle(simdi)
+            self._kayitlar[anahtar] = (simdi + self.ttl, boyut, deger)
+            self._toplam_bayt += boyut
+
+            while len(self._kayitlar) > self.max_kayit or self._toplam_bayt > self.max_bayt:
+                eski_anahtar = next(iter(self._kayitlar))
+                self._sil(eski_anahtar)
+                self.cikarilan += 1
+        return True
+
+    def al(self, anahtar):
+        """Değeri döndür (yoksa veya süresi dolduysa None)"""
+        simdi = time.monotonic()
+        with self._lock:
+            kayit = self._kayitlar.get(anahtar)
+            if not kayit or kayit[0] <= simdi:
+                if kayit:
+                    self._sil(anahtar)
+                self.miss += 1
+                return None
+            self._kayitlar.move_to_end(anahtar)
+            self.hit += 1
+            return kayit[2]
+
+    def sil(self, anahtar):
+        with self._lock:
+            return self._sil(anahtar) is not None
+
+    def temizle(self):
+        """Tüm kayıtları düşür"""
+        with self._lock:
+            silinen = len(self._kayitlar)
+            self._kayitlar.clear()
+            self._toplam_bayt = 0
+        return silinen
+
+    def istatistikler(self):
+        with self._lock:
+            self._suresi_dolanlari_temizle(time.monotonic())
+            return {
+                "kayit_sayisi": len(self._kayitlar),
+                "toplam_bayt": self._toplam_bayt,
+                "max_kayit": self.max_kayit,
+                "max_bayt": self.max_bayt,
+                "ttl": self.ttl,
+                "hit": self.hit,
+                "miss": self.miss,
+                "cikarilan": self.cikarilan
+            }
@@ -7,6 +7,40 @@ MYSQL_USER = 'YOUR_DB_USERNAME_HERE'     #
 MYSQL_PASSWORD = 'YOUR_DB_PASSWORD_HERE' # 
 MYSQL_DB = 'YOUR_DB_NAME_HERE'           #
 
+# MySQL Bağlantı Havuzu Ayarları (tanımlanmazsa varsayılanlar kullanılır)
+MYSQL_POOL_SIZE = 10          # Havuzda sürekli açık tutulacak bağlantı sayısı
+MYSQL_POOL_MAX_OVERFLOW = 10  # Yoğunlukta açılabilecek ek bağlantı sayısı
+MYSQL_POOL_TIMEOUT = 30       # Boş bağlantı beklenecek süre (saniye)
+MYSQL_POOL_RECYCLE = 1800     # Bağlantıların yenilenme süresi (saniye), MySQL wait_timeout'tan küçük olmalı
+MYSQL_POOL_PRE_PING = True    # Kullanmadan önce bağlantı canlılık kontrolü
+
+# Şube/hekim/ödeme şekli gibi referans verilerin önbellekte tutulma süresi (saniye)
+REFERANS_CACHE_TTL = 600
+
+# Tahsilat analizi snapshot'ları (Excel indirme analizi tekrar sorgulamadan kullanır)
+SNAPSHOT_MAX_KAYIT = 50   # Bellekte tutulacak en fazla analiz sayısı
+SNAPSHOT_MAX_MB = 256     # Snapshot'ların toplam bellek sınırı (MB)
+SNAPSHOT_TTL = 1800       # Snapshot geçerlilik süresi (saniye)
+
+# Hasta x hekim tedavi matrisi (data/tedavi_matrisi.db) senkron ayarları
+TEDAVI_MATRIS_SENKRON_ARALIGI = 60             # Yeni tedavilerin en sık kontrol edilme aralığı (saniye)
+TEDAVI_MATRIS_TAM_YENILEME_ARALIGI = 6 * 3600  # Silinen/düzeltilen eski tedaviler için arka planda tam yenileme aralığı (saniye)
+
+# Tahsilat analizinde paralel çalışan sorgu sayısı (MYSQL_POOL_SIZE'dan küçük olmalı)
+ANALIZ_IS_PARCACIGI = 4
+
+# Sunucu tarafı prim taslaklarının geçerlilik süresi (saniye)
+PRIM_TASLAK_SURESI = 4 * 3600
+
+# Takvim delta senkronu (/api/events?since=<token>)
+TAKVIM_TOKEN_MAX_KAYIT = 500  # Sunucuda tutulacak en fazla takvim token'ı
+TAKVIM_TOKEN_MAX_MB = 64      # Token'ların toplam bellek sınırı (MB)
+TAKVIM_TOKEN_TTL = 900        # Token geçerlilik süresi (saniye)
+
+# pandas/numpy/SQLAlchemy/openpyxl ilk kullanımda yüklenir. gunicorn --preload ile
+# çalışırken True yapılırsa create_app() içinde yüklenir ve worker'lar paylaşır.
+ACILISTA_ONCEDEN_YUKLE = False
+
 # Kullanıcılar ve Varsayılan Ayarlar
 # Dikkat: Gerçek projelerde bu şekilde sabit şifre tutmak yerine
 # veritabanı kullanılması ve şifrelerin hashlenmesi önerilir!
@@ -1,199 +1,601 @@
 # database.py - Prim veritabanı yönetimi - YENİ GİDER SİSTEMİ
 import sqlite3
 import os
+import json
+import time
+import threading
+import queue
+import atexit
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime
 import logging
 
+from cache_utils import LRUStore
+from yukleme_utils import TembelOrnek
+
 logger = logging.getLogger(__name__)
 
-class PrimDatabase:
-    def __init__(self, db_path="data/prim_hesaplamalari.db"):
-        self.db_path = db_path
-        self.init_database()
-    
-    def init_database(self):
-        """Veritabanını ve tabloları oluştur"""
+
+class SQLiteBaglantisi:
+    """
+    Bağlantı yöneticisinin verdiği bağlantı. sqlite3 bağlantısı gibi kullanılır;
+    close() gerçek bağlantıyı kapatmaz, açık transaction'ı geri alıp bağlantıyı
+    iş parçacığının önbelleğine bırakır. close() unutulursa nesne silinirken bırakılır.
+    """
+    __slots__ = ('_conn', '_birak')
+
+    def __init__(self, conn, birak):
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_birak', birak)
+
+    def __getattr__(self, ad):
+        return getattr(self._conn, ad)
+
+    def __setattr__(self, ad, deger):
+        setattr(self._conn, ad, deger)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *hata):
+        return self._conn.__exit__(*hata)
+
+    def close(self):
+        conn = self._conn
+        if conn is None:
+            return
+        object.__setattr__(self, '_conn', None)
+        self._birak(conn)
+
+    def __del__(self):
         try:
-            # data klasörünü oluştur (eğer yoksa)
-            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-            
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Ana prim hesaplaması tablosu
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS prim_hesaplamalari (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    doktor_id TEXT NOT NULL,
-                    doktor_adi TEXT NOT NULL,
-                    sube_id TEXT NOT NULL,
-                    sube_adi TEXT NOT NULL,
-                    donem_baslangic DATE NOT NULL,
-                    donem_bitis DATE NOT NULL,
-                    
-                    brut_tahsilat REAL DEFAULT 0,
-                    toplam_kesinti REAL DEFAULT 0,
-                    net_tahsilat REAL DEFAULT 0,
-                    toplam_gider REAL DEFAULT 0,
-                    prim_matrah REAL DEFAULT 0,
-                    prim_orani REAL DEFAULT 0,
-                    hesaplanan_prim REAL DEFAULT 0,
-                    
-                    olusturan_kullanici TEXT,
-                    olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    guncelleme_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    durum TEXT DEFAULT 'taslak',
-                    notlar TEXT
-                )
-            ''')
-            
-            # Tahsilat detayları tablosu
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS prim_tahsilat_detaylari (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    prim_id INTEGER NOT NULL,
-                    tahsilat_id TEXT,
-                    hasta_adi TEXT NOT NULL,
-                    hasta_id TEXT,
-                    tarih DATE,
-                    brut_tutar REAL NOT NULL,
-                    odeme_sekli TEXT,
-                    kdv_orani REAL DEFAULT 0,
-                    kdv_tutari REAL DEFAULT 0,
-                    taksit_sayisi INTEGER DEFAULT 1,
-                    taksit_kesinti_orani REAL DEFAULT 0,
-                    taksit_kesinti_tutari REAL DEFAULT 0,
-                    net_tutar REAL NOT NULL,
-                    
-                    FOREIGN KEY (prim_id) REFERENCES prim_hesaplamalari(id)
-                )
-            ''')
-            
-            # Laboratuvar giderleri tablosu
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS prim_laboratuvar_giderleri (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    prim_id INTEGER NOT NULL,
-                    tarih DATE NOT NULL,
-                    hasta_adi TEXT NOT NULL,
-                    hasta_id TEXT,
-                    islem TEXT NOT NULL,
-                    tutar REAL NOT NULL,
-                    olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    
-                    FOREIGN KEY (prim_id) REFERENCES prim_hesaplamalari(id)
-                )
-            ''')
-            
-            # İmplant giderleri tablosu
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS prim_implant_giderleri (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    prim_id INTEGER NOT NULL,
-                    tarih DATE NOT NULL,
-                    hasta_adi TEXT NOT NULL,
-                    hasta_id TEXT,
-                    implant_markasi TEXT NOT NULL,
-                    boy TEXT NOT NULL,
-                    cap TEXT NOT NULL,
-                    birim TEXT NOT NULL,
-                    adet INTEGER NOT NULL,
-                    tutar REAL NOT NULL,
-                    olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    
-                    FOREIGN KEY (prim_id) REFERENCES prim_hesaplamalari(id)
-                )
-            ''')
-            
-            # Diğer giderler tablosu
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS prim_giderler (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    prim_id INTEGER NOT NULL,
-                    hasta_adi TEXT NOT NULL,
-                    hasta_id TEXT,
-                    kategori TEXT NOT NULL,
-                    tutar REAL NOT NULL,
-                    aciklama TEXT,
-                    olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    
-                    FOREIGN KEY (prim_id) REFERENCES prim_hesaplamalari(id)
-                )
-            ''')
-            
-            # YENİ TABLOLAR - Net Ciro ve Hak Ediş Eklemeleri
-            
-            # Doğrudan net ciro eklemeleri için
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS prim_net_ciro_eklemeleri (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    prim_id INTEGER NOT NULL,
-                    tarih DATE NOT NULL,
-                    hasta_adi TEXT,
-                    hasta_id TEXT,
-                    aciklama TEXT NOT NULL,
-                    tutar REAL NOT NULL,
-                    kategori TEXT DEFAULT 'diger',
-                    olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    
-                    FOREIGN KEY (prim_id) REFERENCES prim_hesaplamalari(id)
-                )
-            ''')
-            
-            # Doğrudan hak ediş (prim) eklemeleri için
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS prim_hakedis_eklemeleri (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    prim_id INTEGER NOT NULL,
-                    tarih DATE NOT NULL,
-                    aciklama TEXT NOT NULL,
-                    tutar REAL NOT NULL,
-                    kategori TEXT DEFAULT 'bonus',
-                    olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    
-                    FOREIGN KEY (prim_id) REFERENCES prim_hesaplamalari(id)
-                )
-            ''')
-            
-            # Ayarlar tabloları
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS taksit_oranlari (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    taksit_sayisi INTEGER NOT NULL UNIQUE,
-                    kesinti_orani REAL NOT NULL,
-                    aktif BOOLEAN DEFAULT 1
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS gider_kategorileri (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    kategori TEXT NOT NULL UNIQUE,
-                    aktif BOOLEAN DEFAULT 1
-                )
-            ''')
-            
-            # İndeksler
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_prim_doktor_tarih ON prim_hesaplamalari(doktor_id, donem_baslangic)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_tahsilat_prim ON prim_tahsilat_detaylari(prim_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_gider_prim ON prim_giderler(prim_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_lab_prim ON prim_laboratuvar_giderleri(prim_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_implant_prim ON prim_implant_giderleri(prim_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_net_ciro_prim ON prim_net_ciro_eklemeleri(prim_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_hakedis_prim ON prim_hakedis_eklemeleri(prim_id)')
-            
-            # Varsayılan ayarları ekle
-            self._init_default_settings(cursor)
-            
+            self.close()
+        except Exception:
+            pass
+
+
+class SQLiteBaglantiYoneticisi:
+    """
+    SQLite bağlantılarını iş parçacığı ve veritabanı dosyası başına bir kez açıp
+    yeniden kullanır. Tüm bağlantılar WAL, NORMAL senkron, ortak meşgul bekleme süresi
+    ve ayarlı sayfa önbelleği/mmap ile açılır. Aynı iş parçacığında bağlantı kullanımdayken
+    istenen ikinci bağlantı (iç içe çağrı) ayrı açılır ve close() ile gerçekten kapanır.
+    """
+    # "database is locked" hatası vermeden önce yazma kilidi için beklenecek süre (saniye)
+    MESGUL_BEKLEME_SURESI = 30
+    # Bağlantı başına sayfa önbelleği (KiB) ve bellek eşlemeli okuma boyutu (bayt)
+    ONBELLEK_KB = 8192
+    MMAP_BOYUTU = 128 * 1024 * 1024
+
+    def __init__(self):
+        self._yerel = threading.local()
+        self._yazicilar = {}
+        self._yazici_kilidi = threading.Lock()
+
+    def _ac(self, db_path):
+        conn = sqlite3.connect(db_path, timeout=self.MESGUL_BEKLEME_SURESI)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{self.ONBELLEK_KB}")
+        conn.execute(f"PRAGMA mmap_size={self.MMAP_BOYUTU}")
+        return conn
+
+    def _durum(self):
+        durum = getattr(self._yerel, 'durum', None)
+        if durum is None:
+            durum = self._yerel.durum = {'baglantilar': {}, 'kullanimda': set()}
+        return durum
+
+    def baglanti(self, db_path):
+        """Veritabanı için bu iş parçacığının bağlantısını ver (close() ile bırakılır)"""
+        durum = self._durum()
+
+        if db_path in durum['kullanimda']:
+            # İç içe kullanım: dıştaki transaction'a karışmaması için ayrı bağlantı
+            return SQLiteBaglantisi(self._ac(db_path), lambda conn: conn.close())
+
+        conn = durum['baglantilar'].get(db_path)
+        if conn is None:
+            conn = durum['baglantilar'][db_path] = self._ac(db_path)
+        durum['kullanimda'].add(db_path)
+
+        def birak(conn):
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.row_factory = None
+            finally:
+                durum['kullanimda'].discard(db_path)
+
+        return SQLiteBaglantisi(conn, birak)
+
+    @contextmanager
+    def transaction(self, db_path, yazma=True):
+        """
+        Bağlantıyı transaction içinde ver; blok hatasız biterse commit, hata olursa rollback.
+        yazma=True ise yazma kilidi baştan alınır (BEGIN IMMEDIATE), okumalar için
+        yazma=False tüm sorguların aynı anlık görüntüyü görmesini sağlar.
+        """
+        conn = self.baglanti(db_path)
+        try:
+            conn.execute("BEGIN IMMEDIATE" if yazma else "BEGIN")
+            yield conn
             conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
             conn.close()
-            logger.info("Prim veritabanı başarıyla oluşturuldu")
-            
+
+    def yazici(self, db_path):
+        """Veritabanı dosyasının tek yazıcı iş parçacığını ver (ilk çağrıda oluşturulur)"""
+        yazici = self._yazicilar.get(db_path)
+        if yazici is None:
+            with self._yazici_kilidi:
+                yazici = self._yazicilar.get(db_path)
+                if yazici is None:
+                    yazici = self._yazicilar[db_path] = SQLiteYazici(db_path, self._ac)
+        return yazici
+
+    def yazici_durumu(self):
+        """Yazıcı kuyruklarının derinlik ve commit süresi istatistikleri (izleme için)"""
+        return {db_path: yazici.istatistikler() for db_path, yazici in list(self._yazicilar.items())}
+
+
+class SQLiteYazici:
+    """
+    Bir veritabanı dosyasına yazma işlerini tek bir iş parçacığında çalıştırır.
+    İşler fonksiyon(cursor) -> sonuç biçimindedir. Yazıcı kuyrukta biriken işleri
+    tek transaction'da yazar (grup commit). Her iş kendi SAVEPOINT'inde çalışır, hata
+    veren iş yalnızca kendi değişikliklerini geri alır. Sonuç, commit tamamlandıktan
+    sonra Future ile döner. Yazıcı kilidi tek elde tutulduğu için istekler arasında
+    "database is locked" beklemesi ve bakiye gibi oku-hesapla-yaz yarışları oluşmaz.
+    """
+    # Tek commit'te yazılacak en fazla iş
+    GRUP_EN_FAZLA_IS = 100
+    # Kapanışta kuyruktaki işlerin yazılması için beklenecek süre (saniye)
+    KAPANIS_BEKLEME_SURESI = 10
+    # yaz() çağrısının commit için varsayılan en uzun bekleme süresi (saniye)
+    YAZMA_ZAMAN_ASIMI = 60
+
+    _DUR = object()
+
+    def __init__(self, db_path, baglanti_ac):
+        self.db_path = db_path
+        self._baglanti_ac = baglanti_ac
+        self._kuyruk = queue.Queue()
+        self._is_parcacigi = None
+        self._kilit = threading.Lock()
+        self._is_sayisi = 0
+        self._hata_sayisi = 0
+        self._commit_sayisi = 0
+        self._commit_hatasi = 0
+        self._toplam_commit_suresi = 0.0
+        self._en_uzun_commit = 0.0
+        self._son_commit = 0.0
+        self._toplam_bekleme = 0.0
+        self._en_buyuk_grup = 0
+        self._yeniden_baslatma = 0
+
+    def _baslat(self):
+        is_parcacigi = self._is_parcacigi
+        if is_parcacigi is None or not is_parcacigi.is_alive():
+            with self._kilit:
+                onceki = self._is_parcacigi
+                if onceki is None or not onceki.is_alive():
+                    if onceki is not None:
+                        # Beklenmeyen bir hatayla durmuş yazıcı yeniden başlatılır; kuyruktaki işler korunur
+                        logger.warning(f"SQLite yazıcı iş parçacığı yeniden başlatılıyor: {self.db_path}")
+                        self._yeniden_baslatma += 1
+                    else:
+                        atexit.register(self.durdur)
+                    is_parcacigi = threading.Thread(
+                        target=self._calis, name=f"sqlite_yazici:{os.path.basename(self.db_path)}", daemon=True
+                    )
+                    is_parcacigi.start()
+                    self._is_parcacigi = is_parcacigi
+
+    def gonder(self, is_):
+        """İşi kuyruğa ekle; commit sonrası sonucu (veya hatayı) taşıyan Future döner"""
+        future = Future()
+        self._baslat()
+        self._kuyruk.put((is_, future, time.perf_counter()))
+        return future
+
+    def yaz(self, is_, zaman_asimi=None):
+        """
+        İşi kuyruğa ekle ve commit edilene kadar bekle; işin sonucunu döndür.
+        zaman_asimi verilmezse YAZMA_ZAMAN_ASIMI kullanılır; süre dolarsa TimeoutError.
+        """
+        if threading.current_thread() is self._is_parcacigi:
+            # Yazıcı kendi kuyruğunu bekleyemez; iç işler aynı cursor'la çağrılmalı
+            raise RuntimeError("Yazıcı işi içinden yeni yazma işi beklenemez")
+        return self.gonder(is_).result(self.YAZMA_ZAMAN_ASIMI if zaman_asimi is None else zaman_asimi)
+
+    def durdur(self):
+        """Kuyruktaki işleri yazıp iş parçacığını durdur"""
+        is_parcacigi = self._is_parcacigi
+        if is_parcacigi is not None and is_parcacigi.is_alive():
+            self._kuyruk.put(self._DUR)
+            is_parcacigi.join(self.KAPANIS_BEKLEME_SURESI)
+
+    def _calis(self):
+        conn = self._baglanti_ac(self.db_path)
+        # Transaction'ları yazıcı yönetir (BEGIN/SAVEPOINT/COMMIT açıkça verilir)
+        conn.isolation_level = None
+        try:
+            while True:
+                isler = [self._kuyruk.get()]
+                # Önceki commit sürerken biriken işler aynı commit'e alınır
+                while len(isler) < self.GRUP_EN_FAZLA_IS and isler[-1] is not self._DUR:
+                    try:
+                        isler.append(self._kuyruk.get_nowait())
+                    except queue.Empty:
+                        break
+                durdur = isler[-1] is self._DUR
+                if durdur:
+                    isler.pop()
+                if isler:
+                    try:
+                        self._grubu_yaz(conn, isler)
+                    except Exception as e:
+                        # Beklenmeyen hata iş parçacığını durdurmaz; yanıtsız kalan işler hatayla döner
+                        logger.exception(f"SQLite yazıcı hatası ({self.db_path}): {e}")
+                        for _, future, _ in isler:
+                            if not future.done():
+                                future.set_exception(e)
+                if durdur:
+                    return
+        finally:
+            conn.close()
+
+    def _grubu_yaz(self, conn, isler):
+        baslangic = time.perf_counter()
+        tamamlanan = []
+        hatali = 0
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for is_, future, _ in isler:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                cursor = conn.cursor()
+                conn.execute("SAVEPOINT yazici_isi")
+                try:
+                    sonuc = is_(cursor)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO yazici_isi")
+                    conn.execute("RELEASE yazici_isi")
+                    future.set_exception(e)
+                    hatali += 1
+                else:
+                    conn.execute("RELEASE yazici_isi")
+                    tamamlanan.append((future, sonuc))
+                finally:
+                    cursor.close()
+            conn.execute("COMMIT")
         except Exception as e:
-            logger.error(f"Veritabanı oluşturma hatası: {e}")
-            raise
+            try:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            except sqlite3.Error as geri_alma_hatasi:
+                logger.error(f"SQLite grup geri alma hatası ({self.db_path}): {geri_alma_hatasi}")
+            logger.error(f"SQLite grup commit hatası ({self.db_path}, {len(isler)} iş): {e}")
+            # Başarılı işlerin Future'ları da henüz sonuçlanmadı; commit olmadığı için hepsi hatayla döner
+            for _, future, _ in isler:
+                if not future.done():
+                    future.set_exception(e)
+            with self._kilit:
+                self._commit_hatasi += 1
+                self._hata_sayisi += hatali + len(tamamlanan)
+            return
+
+        bitis = time.perf_counter()
+        for future, sonuc in tamamlanan:
+            future.set_result(sonuc)
+
+        sure = bitis - baslangic
+        with self._kilit:
+            self._is_sayisi += len(isler)
+            self._hata_sayisi += hatali
+            self._commit_sayisi += 1
+            self._son_commit = sure
+            self._toplam_commit_suresi += sure
+            self._en_uzun_commit = max(self._en_uzun_commit, sure)
+            self._toplam_bekleme += sum(baslangic - eklenme for _, _, eklenme in isler)
+            self._en_buyuk_grup = max(self._en_buyuk_grup, len(isler))
+
+    def istatistikler(self):
+        with self._kilit:
+            commit = self._commit_sayisi
+            return {
+                "calisiyor": self._is_parcacigi is not None and self._is_parcacigi.is_alive(),
+                "kuyruk_derinligi": self._kuyruk.qsize(),
+                "is_sayisi": self._is_sayisi,
+                "hatali_is": self._hata_sayisi,
+                "commit_sayisi": commit,
+                "commit_hatasi": self._commit_hatasi,
+                "yeniden_baslatma": self._yeniden_baslatma,
+                "ortalama_grup": round(self._is_sayisi / commit, 2) if commit else 0,
+                "en_buyuk_grup": self._en_buyuk_grup,
+                "son_commit_ms": round(self._son_commit * 1000, 2),
+                "ortalama_commit_ms": round(self._toplam_commit_suresi / commit * 1000, 2) if commit else 0,
+                "en_uzun_commit_ms": round(self._en_uzun_commit * 1000, 2),
+                "ortalama_kuyruk_bekleme_ms": round(self._toplam_bekleme / self._is_sayisi * 1000, 2)
+                                              if self._is_sayisi else 0,
+            }
+
+
+sqlite_baglantilari = SQLiteBaglantiYoneticisi()
+
+
+def sema_gocleri_uygula(db_path, gocler):
+    """
+    Numaralı şema göçlerini veritabanı dosyasına bir kez uygula.
+    gocler: (sürüm, açıklama, fonksiyon(cursor)) demetleri, sürüme göre artan sırada.
+    Uygulanan son sürüm PRAGMA user_version'da tutulur; güncel bir veritabanında
+    açılış maliyeti tek bir tamsayı okumasıdır. Göçler BEGIN IMMEDIATE içinde çalışır,
+    aynı anda açılan worker'lardan yalnızca biri uygular, hata olursa hiçbiri kalıcı olmaz.
+    """
+    hedef_surum = gocler[-1][0]
+
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    conn = sqlite_baglantilari.baglanti(db_path)
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= hedef_surum:
+            return
+    finally:
+        conn.close()
+
+    try:
+        with sqlite_baglantilari.transaction(db_path) as conn:
+            # Kilit beklenirken başka bir worker göçleri uygulamış olabilir
+            mevcut_surum = conn.execute("PRAGMA user_version").fetchone()[0]
+            cursor = conn.cursor()
+            for surum, aciklama, goc in gocler:
+                if surum > mevcut_surum:
+                    goc(cursor)
+                    logger.info(f"Şema göçü uygulandı: {db_path} v{surum} ({aciklama})")
+            if hedef_surum > mevcut_surum:
+                cursor.execute(f"PRAGMA user_version = {int(hedef_surum)}")
+    except Exception as e:
+        logger.error(f"Şema göçü hatası ({db_path}): {e}")
+        raise
+
+
+def _kolonlari_ekle(cursor, tablo, kolonlar):
+    """
+    Eksik kolonları ekle (kolon adı -> tanım). Göç öncesi sürümü izlenmeyen
+    veritabanlarında kolonlar zaten bulunabileceği için yalnızca eksikler eklenir.
+    """
+    cursor.execute(f"PRAGMA table_info({tablo})")
+    mevcut = {kolon[1] for kolon in cursor.fetchall()}
+    for ad, tanim in kolonlar.items():
+        if ad not in mevcut:
+            cursor.execute(f"ALTER TABLE {tablo} ADD COLUMN {ad} {tanim}")
+            logger.info(f"{tablo} tablosuna {ad} kolonu eklendi")
+
+class PrimDatabase:
+    # Kaydedilmiş prim detay önbelleği (detay ekranı ve yazdırma aynı nesneyi kullanır)
+    DETAY_ONBELLEK_KAYIT = 200
+    DETAY_ONBELLEK_SURESI = 600
+    
+    # Toplu hesaplamayla oluşturulan, henüz cariye işlenmemiş primlerin durumu. Kesinleştirilince
+    # elle kaydedilen primlerin varsayılan durumuna ('taslak') geçer ve cari hareketi yazılır.
+    TOPLU_TASLAK_DURUMU = 'toplu_taslak'
+    KAYITLI_DURUM = 'taslak'
+    
+    # Detayla birlikte okunan alt tablolar: dönüş anahtarı -> tablo
+    DETAY_TABLOLARI = (
+        ('tahsilat_detaylari', 'prim_tahsilat_detaylari'),
+        ('diger_giderler', 'prim_giderler'),
+        ('laboratuvar_giderleri', 'prim_laboratuvar_giderleri'),
+        ('implant_giderleri', 'prim_implant_giderleri'),
+        ('net_ciro_eklemeleri', 'prim_net_ciro_eklemeleri'),
+        ('hakedis_eklemeleri', 'prim_hakedis_eklemeleri'),
+    )
+    
+    def __init__(self, db_path="data/prim_hesaplamalari.db"):
+        self.db_path = db_path
+        self._detay_onbellegi = LRUStore(
+            max_kayit=self.DETAY_ONBELLEK_KAYIT,
+            max_bayt=64 * 1024 * 1024,
+            ttl=self.DETAY_ONBELLEK_SURESI
+        )
+        sema_gocleri_uygula(self.db_path, ANA_VERITABANI_GOCLERI)
+    
+    @staticmethod
+    def _tablolari_olustur(cursor):
+        """Prim tablolarını ve varsayılan ayarları oluştur"""
+        # Ana prim hesaplaması tablosu
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS prim_hesaplamalari (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                doktor_id TEXT NOT NULL,
+                doktor_adi TEXT NOT NULL,
+                sube_id TEXT NOT NULL,
+                sube_adi TEXT NOT NULL,
+                donem_baslangic DATE NOT NULL,
+                donem_bitis DATE NOT NULL,
+                
+                brut_tahsilat REAL DEFAULT 0,
+                toplam_kesinti REAL DEFAULT 0,
+                net_tahsilat REAL DEFAULT 0,
+                toplam_gider REAL DEFAULT 0,
+                prim_matrah REAL DEFAULT 0,
+                prim_orani REAL DEFAULT 0,
+                hesaplanan_prim REAL DEFAULT 0,
+                
+                olusturan_kullanici TEXT,
+                olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                guncelleme_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                durum TEXT DEFAULT 'taslak',
+                notlar TEXT
+            )
+        ''')
+        
+        # Tahsilat detayları tablosu
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS prim_tahsilat_detaylari (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                prim_id INTEGER NOT NULL,
+                tahsilat_id TEXT,
+                hasta_adi TEXT NOT NULL,
+                hasta_id TEXT,
+                tarih DATE,
+                brut_tutar REAL NOT NULL,
+                odeme_sekli TEXT,
+                kdv_orani REAL DEFAULT 0,
+                kdv_tutari REAL DEFAULT 0,
+                taksit_sayisi INTEGER DEFAULT 1,
+                taksit_kesinti_orani REAL DEFAULT 0,
+                taksit_kesinti_tutari REAL DEFAULT 0,
+                net_tutar REAL NOT NULL,
+                
+                FOREIGN KEY (prim_id) REFERENCES prim_hesaplamalari(id)
+            )
+        ''')
+        
+        # Laboratuvar giderleri tablosu
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS prim_laboratuvar_giderleri (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                prim_id INTEGER NOT NULL,
+                tarih DATE NOT NULL,
+                hasta_adi TEXT NOT NULL,
+                hasta_id TEXT,
+                islem TEXT NOT NULL,
+                tutar REAL NOT NULL,
+                olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                
+                FOREIGN KEY (prim_id) REFERENCES prim_hesaplamalari(id)
+            )
+        ''')
+        
+        # İmplant giderleri tablosu
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS prim_implant_giderleri (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                prim_id INTEGER NOT NULL,
+                tarih DATE NOT NULL,
+                hasta_adi TEXT NOT NULL,
+                hasta_id TEXT,
+                implant_markasi TEXT NOT NULL,
+                boy TEXT NOT NULL,
+                cap TEXT NOT NULL,
+                birim TEXT NOT NULL,
+                adet INTEGER NOT NULL,
+                tutar REAL NOT NULL,
+                olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                
+                FOREIGN KEY (prim_id) REFERENCES prim_hesaplamalari(id)
+            )
+        ''')
+        
+        # Diğer giderler tablosu
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS prim_giderler (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                prim_id INTEGER NOT NULL,
+                hasta_adi TEXT NOT NULL,
+                hasta_id TEXT,
+                kategori TEXT NOT NULL,
+                tutar REAL NOT NULL,
+                aciklama TEXT,
+                olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                
+                FOREIGN KEY (prim_id) REFERENCES prim_hesaplamalari(id)
+            )
+        ''')
+        
+        # YENİ TABLOLAR - Net Ciro ve Hak Ediş Eklemeleri
+        
+        # Doğrudan net ciro eklemeleri için
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS prim_net_ciro_eklemeleri (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                prim_id INTEGER NOT NULL,
+                tarih DATE NOT NULL,
+                hasta_adi TEXT,
+                hasta_id TEXT,
+                aciklama TEXT NOT NULL,
+                tutar REAL NOT NULL,
+                kategori TEXT DEFAULT 'diger',
+                olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                
+                FOREIGN KEY (prim_id) REFERENCES prim_hesaplamalari(id)
+            )
+        ''')
+        
+        # Doğrudan hak ediş (prim) eklemeleri için
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS prim_hakedis_eklemeleri (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                prim_id INTEGER NOT NULL,
+                tarih DATE NOT NULL,
+                aciklama TEXT NOT NULL,
+                tutar REAL NOT NULL,
+                kategori TEXT DEFAULT 'bonus',
+                olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                
+                FOREIGN KEY (prim_id) REFERENCES prim_hesaplamalari(id)
+            )
+        ''')
+        
+        # Yazdırma için oluşturulmuş prim özeti HTML'i; surum prim güncelleme
+        # tarihi + şablon özetidir, farklıysa belge yeniden oluşturulur
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS prim_ozet_belgeleri (
+                prim_id INTEGER PRIMARY KEY,
+                surum TEXT NOT NULL,
+                html TEXT NOT NULL,
+                olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                
+                FOREIGN KEY (prim_id) REFERENCES prim_hesaplamalari(id)
+            )
+        ''')
+        
+        # Ayarlar tabloları
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS taksit_oranlari (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                taksit_sayisi INTEGER NOT NULL UNIQUE,
+                kesinti_orani REAL NOT NULL,
+                aktif BOOLEAN DEFAULT 1
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS gider_kategorileri (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kategori TEXT NOT NULL UNIQUE,
+                aktif BOOLEAN DEFAULT 1
+            )
+        ''')
+        
+        # İndeksler
+        # Dönem çakışması (baslangic <= yeni_bitis AND bitis >= yeni_baslangic) indeksten
+        # çözülsün diye bitiş de indekste; eski (doktor_id, donem_baslangic) indeksini kapsar
+        cursor.execute('DROP INDEX IF EXISTS idx_prim_doktor_tarih')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_prim_doktor_donem ON prim_hesaplamalari(doktor_id, donem_baslangic, donem_bitis)')
+        # Prim listesi sıralaması (olusturma_tarihi DESC, id DESC) için; id rowid olduğundan
+        # indekste zaten bulunur, sıralama ve keyset koşulu ek sort yapılmadan indeksten okunur
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_prim_olusturma ON prim_hesaplamalari(olusturma_tarihi)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_prim_sube_olusturma ON prim_hesaplamalari(sube_id, olusturma_tarihi)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_prim_doktor_sube_olusturma ON prim_hesaplamalari(doktor_id, sube_id, olusturma_tarihi)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tahsilat_prim ON prim_tahsilat_detaylari(prim_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_gider_prim ON prim_giderler(prim_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_lab_prim ON prim_laboratuvar_giderleri(prim_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_implant_prim ON prim_implant_giderleri(prim_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_net_ciro_prim ON prim_net_ciro_eklemeleri(prim_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_hakedis_prim ON prim_hakedis_eklemeleri(prim_id)')
+        
+        # Varsayılan ayarları ekle
+        PrimDatabase._init_default_settings(cursor)
     
-    def _init_default_settings(self, cursor):
+    @staticmethod
+    def _init_default_settings(cursor):
         """Varsayılan ayarları ekle"""
         try:
             # Varsayılan taksit oranları
@@ -233,167 +635,393 @@ class PrimDatabase:
         except Exception as e:
             logger.warning(f"Varsayılan ayarlar eklenemedi: {e}")
     
+    def _prim_ekle(self, cursor, prim_data, tahsilat_detaylari, diger_giderler,
+                   laboratuvar_giderleri=None, implant_giderleri=None,
+                   net_ciro_eklemeleri=None, hakedis_eklemeleri=None):
+        """
+        Prim kaydını ve detaylarını verilen cursor üzerinden ekle (commit çağırana aittir).
+        Her detay tablosu tek executemany ile yazılır.
+        
+        Returns: (prim_id, tablo bazında eklenen satır sayıları)
+        """
+        # Ana prim kaydını ekle
+        cursor.execute('''
+            INSERT INTO prim_hesaplamalari 
+            (doktor_id, doktor_adi, sube_id, sube_adi, donem_baslangic, donem_bitis,
+             brut_tahsilat, toplam_kesinti, net_tahsilat, toplam_gider, prim_matrah,
+             prim_orani, hesaplanan_prim, olusturan_kullanici, notlar)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            prim_data['doktor_id'],
+            prim_data['doktor_adi'],
+            prim_data['sube_id'],
+            prim_data['sube_adi'],
+            prim_data['donem_baslangic'],
+            prim_data['donem_bitis'],
+            prim_data['brut_tahsilat'],
+            prim_data['toplam_kesinti'],
+            prim_data['net_tahsilat'],
+            prim_data['toplam_gider'],
+            prim_data['prim_matrah'],
+            prim_data['prim_orani'],
+            prim_data['hesaplanan_prim'],
+            prim_data['olusturan_kullanici'],
+            prim_data.get('notlar', '')
+        ))
+        
+        prim_id = cursor.lastrowid
+        
+        detay_tablolari = [
+            # Tahsilat detayları
+            ('tahsilatlar', '''
+                INSERT INTO prim_tahsilat_detaylari 
+                (prim_id, tahsilat_id, hasta_adi, hasta_id, tarih, brut_tutar, odeme_sekli,
+                 kdv_orani, kdv_tutari, taksit_sayisi, taksit_kesinti_orani, 
+                 taksit_kesinti_tutari, net_tutar)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(
+                prim_id,
+                detay.get('tahsilat_id'),
+                detay['hasta_adi'],
+                detay.get('hasta_id'),
+                detay.get('tarih'),
+                detay['brut_tutar'],
+                detay['odeme_sekli'],
+                detay['kdv_orani'],
+                detay['kdv_tutari'],
+                detay['taksit_sayisi'],
+                detay['taksit_kesinti_orani'],
+                detay['taksit_kesinti_tutari'],
+                detay['net_tutar']
+            ) for detay in tahsilat_detaylari or []]),
+            
+            # Diğer giderler
+            ('diger_giderler', '''
+                INSERT INTO prim_giderler 
+                (prim_id, hasta_adi, hasta_id, kategori, tutar, aciklama)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(
+                prim_id,
+                gider['hasta_adi'],
+                gider.get('hasta_id', ''),
+                gider['kategori'],
+                gider['tutar'],
+                gider.get('aciklama', '')
+            ) for gider in diger_giderler or []]),
+            
+            # Laboratuvar giderleri
+            ('laboratuvar_giderleri', '''
+                INSERT INTO prim_laboratuvar_giderleri 
+                (prim_id, tarih, hasta_adi, hasta_id, islem, tutar)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(
+                prim_id,
+                gider['tarih'],
+                gider['hasta_adi'],
+                gider.get('hasta_id', ''),
+                gider['islem'],
+                gider['tutar']
+            ) for gider in laboratuvar_giderleri or []]),
+            
+            # İmplant giderleri
+            ('implant_giderleri', '''
+                INSERT INTO prim_implant_giderleri 
+                (prim_id, tarih, hasta_adi, hasta_id, implant_markasi, boy, cap, birim, adet, tutar)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(
+                prim_id,
+                gider['tarih'],
+                gider['hasta_adi'],
+                gider.get('hasta_id', ''),
+                gider['implant_markasi'],
+                gider['boy'],
+                gider['cap'],
+                gider['birim'],
+                gider['adet'],
+                gider['tutar']
+            ) for gider in implant_giderleri or []]),
+            
+            # Net ciro eklemeleri
+            ('net_ciro_eklemeleri', '''
+                INSERT INTO prim_net_ciro_eklemeleri 
+                (prim_id, tarih, hasta_adi, hasta_id, aciklama, tutar, kategori)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(
+                prim_id,
+                ekleme['tarih'],
+                ekleme.get('hasta_adi', ''),
+                ekleme.get('hasta_id', ''),
+                ekleme['aciklama'],
+                ekleme['tutar'],
+                ekleme['kategori']
+            ) for ekleme in net_ciro_eklemeleri or []]),
+            
+            # Hak ediş eklemeleri
+            ('hakedis_eklemeleri', '''
+                INSERT INTO prim_hakedis_eklemeleri 
+                (prim_id, tarih, aciklama, tutar, kategori)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(
+                prim_id,
+                ekleme['tarih'],
+                ekleme['aciklama'],
+                ekleme['tutar'],
+                ekleme['kategori']
+            ) for ekleme in hakedis_eklemeleri or []]),
+        ]
+        
+        satir_sayilari = {}
+        for ad, sorgu, satirlar in detay_tablolari:
+            if satirlar:
+                cursor.executemany(sorgu, satirlar)
+            satir_sayilari[ad] = len(satirlar)
+        
+        return prim_id, satir_sayilari
+    
+    @staticmethod
+    def _prim_alacak_hareketi(prim_id, prim_data, cari_id, kullanici):
+        """Primin cari hesaba işlenecek ALACAK hareketi"""
+        return {
+            'cari_id': cari_id,
+            'hareket_tipi': 'prim_alacak',
+            'prim_id': prim_id,
+            'tarih': datetime.now().strftime('%Y-%m-%d'),
+            'aciklama': f"Prim #{prim_id} - {prim_data['doktor_adi']} - {prim_data['sube_adi']} "
+                        f"({prim_data['donem_baslangic']} / {prim_data['donem_bitis']})",
+            'alacak': prim_data['hesaplanan_prim'],
+            'borc': 0,
+            'olusturan_kullanici': kullanici or ''
+        }
+    
     def prim_hesaplama_kaydet(self, prim_data, tahsilat_detaylari, diger_giderler, 
                               laboratuvar_giderleri=None, implant_giderleri=None,
-                              net_ciro_eklemeleri=None, hakedis_eklemeleri=None):
-        """Prim hesaplamasını tüm detaylarıyla kaydet - GÜNCELLENMİŞ"""
-        conn = None
+                              net_ciro_eklemeleri=None, hakedis_eklemeleri=None,
+                              sayilari_getir=False, cari_id=None, cari_eslestir=False):
+        """
+        Prim hesaplamasını tüm detaylarıyla tek transaction içinde kaydet.
+        cari_id verilirse prim aynı işte cari hesaba ALACAK olarak işlenir, cari_eslestir=True ise
+        hekim-şube de cariye bağlanır; biri hata verirse hiçbiri yazılmaz.
+        sayilari_getir=True ise (prim_id, tablo bazında satır sayıları) döner.
+        """
+        def kaydet(cursor):
+            prim_id, satir_sayilari = self._prim_ekle(cursor, prim_data, tahsilat_detaylari,
+                                                      diger_giderler, laboratuvar_giderleri,
+                                                      implant_giderleri, net_ciro_eklemeleri,
+                                                      hakedis_eklemeleri)
+            if cari_id:
+                CariDatabase._hareket_yaz(cursor, self._prim_alacak_hareketi(
+                    prim_id, prim_data, cari_id, prim_data.get('olusturan_kullanici', '')
+                ))
+                if cari_eslestir:
+                    # Başka cariye bağlı hekim-şube eşleştirmesi değiştirilmez; prim yine kaydedilir
+                    basarili, mesaj = CariDatabase._eslestirme_yaz(
+                        cursor, cari_id, prim_data['doktor_id'], prim_data['doktor_adi'],
+                        prim_data['sube_id'], prim_data['sube_adi']
+                    )
+                    if not basarili:
+                        logger.warning(f"Prim #{prim_id} için eşleştirme yapılmadı: {mesaj}")
+            return prim_id, satir_sayilari
+        
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            # Yazıcı iş parçacığında, kuyruktaki diğer yazmalarla aynı commit'te yazılır
+            prim_id, satir_sayilari = sqlite_baglantilari.yazici(self.db_path).yaz(kaydet)
             
-            # Ana prim kaydını ekle
-            cursor.execute('''
-                INSERT INTO prim_hesaplamalari 
-                (doktor_id, doktor_adi, sube_id, sube_adi, donem_baslangic, donem_bitis,
-                 brut_tahsilat, toplam_kesinti, net_tahsilat, toplam_gider, prim_matrah,
-                 prim_orani, hesaplanan_prim, olusturan_kullanici, notlar)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                prim_data['doktor_id'],
-                prim_data['doktor_adi'],
-                prim_data['sube_id'],
-                prim_data['sube_adi'],
-                prim_data['donem_baslangic'],
-                prim_data['donem_bitis'],
-                prim_data['brut_tahsilat'],
-                prim_data['toplam_kesinti'],
-                prim_data['net_tahsilat'],
-                prim_data['toplam_gider'],
-                prim_data['prim_matrah'],
-                prim_data['prim_orani'],
-                prim_data['hesaplanan_prim'],
-                prim_data['olusturan_kullanici'],
-                prim_data.get('notlar', '')
-            ))
+            logger.info(f"Prim hesaplaması kaydedildi: ID {prim_id} {satir_sayilari}"
+                        + (f", Cari {cari_id}" if cari_id else ""))
+            return (prim_id, satir_sayilari) if sayilari_getir else prim_id
             
-            prim_id = cursor.lastrowid
+        except Exception as e:
+            logger.error(f"Prim kaydetme hatası: {e}")
+            raise
+    
+    def prim_sil(self, prim_id):
+        """
+        Primi detayları, özet belgesi ve ilişkili cari hareketleriyle tek işte sil; etkilenen
+        carilerin bakiyesi aynı transaction içinde yeniden hesaplanır.
+        Dönüş: bakiyesi yeniden hesaplanan cari id listesi, prim yoksa None
+        """
+        prim_id = int(prim_id)
+        
+        def sil(cursor):
+            cursor.execute("SELECT 1 FROM prim_hesaplamalari WHERE id = ?", (prim_id,))
+            if not cursor.fetchone():
+                return None
             
-            # Tahsilat detaylarını kaydet
-            for detay in tahsilat_detaylari:
-                cursor.execute('''
-                    INSERT INTO prim_tahsilat_detaylari 
-                    (prim_id, tahsilat_id, hasta_adi, hasta_id, tarih, brut_tutar, odeme_sekli,
-                     kdv_orani, kdv_tutari, taksit_sayisi, taksit_kesinti_orani, 
-                     taksit_kesinti_tutari, net_tutar)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    prim_id,
-                    detay.get('tahsilat_id'),
-                    detay['hasta_adi'],
-                    detay.get('hasta_id'),
-                    detay.get('tarih'),
-                    detay['brut_tutar'],
-                    detay['odeme_sekli'],
-                    detay['kdv_orani'],
-                    detay['kdv_tutari'],
-                    detay['taksit_sayisi'],
-                    detay['taksit_kesinti_orani'],
-                    detay['taksit_kesinti_tutari'],
-                    detay['net_tutar']
-                ))
+            cursor.execute("SELECT DISTINCT cari_id FROM cari_hareketler WHERE prim_id = ?", (prim_id,))
+            cari_idler = [satir[0] for satir in cursor.fetchall()]
+            cursor.execute("DELETE FROM cari_hareketler WHERE prim_id = ?", (prim_id,))
             
-            # Diğer giderleri kaydet
-            if diger_giderler:
-                for gider in diger_giderler:
-                    cursor.execute('''
-                        INSERT INTO prim_giderler 
-                        (prim_id, hasta_adi, hasta_id, kategori, tutar, aciklama)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (
-                        prim_id,
-                        gider['hasta_adi'],
-                        gider.get('hasta_id', ''),
-                        gider['kategori'],
-                        gider['tutar'],
-                        gider.get('aciklama', '')
-                    ))
+            for _, tablo in self.DETAY_TABLOLARI:
+                cursor.execute(f"DELETE FROM {tablo} WHERE prim_id = ?", (prim_id,))
+            cursor.execute("DELETE FROM prim_ozet_belgeleri WHERE prim_id = ?", (prim_id,))
+            cursor.execute("DELETE FROM prim_hesaplamalari WHERE id = ?", (prim_id,))
             
-            # Laboratuvar giderlerini kaydet
-            if laboratuvar_giderleri:
-                for gider in laboratuvar_giderleri:
-                    cursor.execute('''
-                        INSERT INTO prim_laboratuvar_giderleri 
-                        (prim_id, tarih, hasta_adi, hasta_id, islem, tutar)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (
-                        prim_id,
-                        gider['tarih'],
-                        gider['hasta_adi'],
-                        gider.get('hasta_id', ''),
-                        gider['islem'],
-                        gider['tutar']
-                    ))
+            for cari_id in cari_idler:
+                CariDatabase._bakiyeyi_yeniden_hesapla(cursor, cari_id)
+            return cari_idler
+        
+        try:
+            cari_idler = sqlite_baglantilari.yazici(self.db_path).yaz(sil)
+            if cari_idler is not None:
+                self.detay_onbellegini_temizle(prim_id)
+                logger.info(f"Prim silindi: ID {prim_id}, bakiyesi güncellenen cariler: {cari_idler}")
+            return cari_idler
             
-            # İmplant giderlerini kaydet
-            if implant_giderleri:
-                for gider in implant_giderleri:
-                    cursor.execute('''
-                        INSERT INTO prim_implant_giderleri 
-                        (prim_id, tarih, hasta_adi, hasta_id, implant_markasi, boy, cap, birim, adet, tutar)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        prim_id,
-                        gider['tarih'],
-                        gider['hasta_adi'],
-                        gider.get('hasta_id', ''),
-                        gider['implant_markasi'],
-                        gider['boy'],
-                        gider['cap'],
-                        gider['birim'],
-                        gider['adet'],
-                        gider['tutar']
-                    ))
+        except Exception as e:
+            logger.error(f"Prim silme hatası: {e}")
+            raise
+    
+    # Tek sorguda gönderilecek en fazla dönem (her dönem 5 parametre)
+    CAKISMA_PARCA_BOYUTU = 500
+    
+    def donem_cakismalari_bul(self, donemler):
+        """
+        Birden fazla hekim/dönem için mevcut prim kayıtlarıyla çakışmaları tek sorguda bul.
+        
+        donemler: (doktor_id, baslangic, bitis) veya (doktor_id, baslangic, bitis, sube_id)
+                  demetleri; sube_id verilirse yalnızca aynı şubedeki kayıtlar çakışır
+        
+        Dönüş: her çakışma için kayıt bilgileri, istenen dönemin listedeki sırası ('sira'),
+               çakışan aralık ve gün sayısı ('cakisma_baslangic', 'cakisma_bitis', 'cakisan_gun')
+        """
+        istenenler = []
+        for sira, donem in enumerate(donemler):
+            doktor_id, baslangic, bitis = donem[:3]
+            sube_id = donem[3] if len(donem) > 3 else None
+            istenenler.append((sira, str(doktor_id), str(sube_id) if sube_id else None, baslangic, bitis))
+        
+        if not istenenler:
+            return []
+        
+        try:
+            conn = sqlite_baglantilari.baglanti(self.db_path)
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
             
-            # YENİ: Net Ciro Eklemelerini kaydet
-            if net_ciro_eklemeleri:
-                for ekleme in net_ciro_eklemeleri:
-                    cursor.execute('''
-                        INSERT INTO prim_net_ciro_eklemeleri 
-                        (prim_id, tarih, hasta_adi, hasta_id, aciklama, tutar, kategori)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        prim_id,
-                        ekleme['tarih'],
-                        ekleme.get('hasta_adi', ''),
-                        ekleme.get('hasta_id', ''),
-                        ekleme['aciklama'],
-                        ekleme['tutar'],
-                        ekleme['kategori']
-                    ))
+            sonuclar = []
+            for i in range(0, len(istenenler), self.CAKISMA_PARCA_BOYUTU):
+                parca = istenenler[i:i + self.CAKISMA_PARCA_BOYUTU]
+                cursor.execute(f"""
+                    WITH istenen(sira, doktor_id, sube_id, baslangic, bitis) AS (
+                        VALUES {', '.join(['(?, ?, ?, ?, ?)'] * len(parca))}
+                    )
+                    SELECT
+                        i.sira, p.id, p.doktor_id, p.doktor_adi, p.sube_id, p.sube_adi,
+                        p.donem_baslangic, p.donem_bitis, p.hesaplanan_prim, p.brut_tahsilat,
+                        p.toplam_gider, p.durum, p.olusturma_tarihi,
+                        MAX(p.donem_baslangic, i.baslangic) AS cakisma_baslangic,
+                        MIN(p.donem_bitis, i.bitis) AS cakisma_bitis,
+                        CAST(julianday(MIN(p.donem_bitis, i.bitis))
+                             - julianday(MAX(p.donem_baslangic, i.baslangic)) AS INTEGER) + 1 AS cakisan_gun
+                    FROM istenen i
+                    JOIN prim_hesaplamalari p
+                      ON p.doktor_id = i.doktor_id
+                     AND p.donem_baslangic <= i.bitis
+                     AND p.donem_bitis >= i.baslangic
+                     AND (i.sube_id IS NULL OR p.sube_id = i.sube_id)
+                    ORDER BY i.sira, p.donem_baslangic DESC
+                """, [deger for satir in parca for deger in satir])
+                sonuclar.extend(dict(row) for row in cursor.fetchall())
             
-            # YENİ: Hak Ediş Eklemelerini kaydet
-            if hakedis_eklemeleri:
-                for ekleme in hakedis_eklemeleri:
-                    cursor.execute('''
-                        INSERT INTO prim_hakedis_eklemeleri 
-                        (prim_id, tarih, aciklama, tutar, kategori)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (
-                        prim_id,
-                        ekleme['tarih'],
-                        ekleme['aciklama'],
-                        ekleme['tutar'],
-                        ekleme['kategori']
-                    ))
+            conn.close()
+            return sonuclar
             
-            conn.commit()
-            logger.info(f"Prim hesaplaması kaydedildi: ID {prim_id}")
-            return prim_id
+        except Exception as e:
+            logger.error(f"Dönem çakışması sorgulama hatası: {e}")
+            raise
+    
+    def toplu_prim_kaydet(self, kayitlar):
+        """
+        Birden fazla prim kaydını TOPLU_TASLAK_DURUMU ile tek transaction içinde ekle; cari
+        hareketi yazılmaz (toplu_taslaklari_kesinlestir ile işlenir).
+        kayitlar: (prim_data, tahsilat_detaylari) demetleri; biri hata verirse hiçbiri yazılmaz.
+        """
+        def kaydet(cursor):
+            prim_idleri = [
+                self._prim_ekle(cursor, prim_data, tahsilat_detaylari, [])[0]
+                for prim_data, tahsilat_detaylari in kayitlar
+            ]
+            cursor.executemany(
+                "UPDATE prim_hesaplamalari SET durum = ? WHERE id = ?",
+                [(self.TOPLU_TASLAK_DURUMU, prim_id) for prim_id in prim_idleri]
+            )
+            return prim_idleri
+        
+        try:
+            prim_idleri = sqlite_baglantilari.yazici(self.db_path).yaz(kaydet)
+            
+            logger.info(f"Toplu prim kaydı: {len(prim_idleri)} taslak oluşturuldu")
+            return prim_idleri
             
         except Exception as e:
-            logger.error(f"Prim kaydetme hatası: {e}")
-            if conn:
-                conn.rollback()
+            logger.error(f"Toplu prim kaydetme hatası: {e}")
+            raise
+    
+    def toplu_taslaklari_kesinlestir(self, prim_ids, kullanici=None):
+        """
+        Toplu prim taslaklarını hekim-şube eşleştirmesindeki cariye ALACAK olarak işle ve
+        KAYITLI_DURUM'a geçir (tek işte). Eşleştirmesi olmayan, bulunamayan veya toplu taslak
+        olmayan primler atlanır.
+        Dönüş: {'kesinlesenler': [{prim_id, cari_id, bakiye}], 'atlananlar': [{prim_id, neden}]}
+        """
+        def kesinlestir(cursor):
+            kesinlesenler, atlananlar = [], []
+            for prim_id in prim_ids:
+                cursor.execute('''
+                    SELECT id, doktor_id, doktor_adi, sube_id, sube_adi, donem_baslangic,
+                           donem_bitis, hesaplanan_prim, durum
+                    FROM prim_hesaplamalari WHERE id = ?
+                ''', (prim_id,))
+                satir = cursor.fetchone()
+                if not satir:
+                    atlananlar.append({'prim_id': prim_id, 'neden': 'Prim bulunamadı'})
+                    continue
+                prim_data = dict(zip(
+                    ('id', 'doktor_id', 'doktor_adi', 'sube_id', 'sube_adi', 'donem_baslangic',
+                     'donem_bitis', 'hesaplanan_prim', 'durum'), satir
+                ))
+                if prim_data['durum'] != self.TOPLU_TASLAK_DURUMU:
+                    atlananlar.append({'prim_id': prim_id, 'neden': 'Toplu prim taslağı değil'})
+                    continue
+                
+                cursor.execute('''
+                    SELECT cari_id FROM hekim_cari_eslestirme
+                    WHERE doktor_id = ? AND sube_id = ? AND aktif = 1
+                ''', (prim_data['doktor_id'], prim_data['sube_id']))
+                eslestirme = cursor.fetchone()
+                if not eslestirme:
+                    atlananlar.append({'prim_id': prim_id, 'neden': 'Hekim-şube cari eşleştirmesi yok'})
+                    continue
+                
+                cari_id = eslestirme[0]
+                bakiye = CariDatabase._hareket_yaz(
+                    cursor, self._prim_alacak_hareketi(prim_data['id'], prim_data, cari_id, kullanici)
+                )
+                cursor.execute(
+                    "UPDATE prim_hesaplamalari SET durum = ?, guncelleme_tarihi = CURRENT_TIMESTAMP WHERE id = ?",
+                    (self.KAYITLI_DURUM, prim_data['id'])
+                )
+                kesinlesenler.append({'prim_id': prim_data['id'], 'cari_id': cari_id, 'bakiye': bakiye})
+            return {'kesinlesenler': kesinlesenler, 'atlananlar': atlananlar}
+        
+        try:
+            prim_ids = [int(prim_id) for prim_id in prim_ids]
+            sonuc = sqlite_baglantilari.yazici(self.db_path).yaz(kesinlestir)
+            for kayit in sonuc['kesinlesenler']:
+                self.detay_onbellegini_temizle(kayit['prim_id'])
+            
+            logger.info(f"Toplu prim kesinleştirme: {len(sonuc['kesinlesenler'])} işlendi, "
+                        f"{len(sonuc['atlananlar'])} atlandı")
+            return sonuc
+            
+        except Exception as e:
+            logger.error(f"Toplu prim kesinleştirme hatası: {e}")
             raise
-        finally:
-            if conn:
-                conn.close()
     
     def prim_listele(self, doktor_id=None, baslangic=None, bitis=None):
         """Prim hesaplamalarını listele"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -424,64 +1052,311 @@ class PrimDatabase:
             logger.error(f"Prim listeleme hatası: {e}")
             raise
     
-    def prim_detay_getir(self, prim_id):
-        """Prim hesaplama detayını getir - GÜNCELLENMİŞ"""
+    # Liste ekranında gösterilen kolonlar (notlar vb. uzun alanlar detayda okunur)
+    LISTE_KOLONLARI = (
+        "id, doktor_id, doktor_adi, sube_id, sube_adi, donem_baslangic, donem_bitis, "
+        "brut_tahsilat, toplam_kesinti, net_tahsilat, toplam_gider, prim_matrah, "
+        "prim_orani, hesaplanan_prim, olusturan_kullanici, olusturma_tarihi, durum"
+    )
+    
+    @staticmethod
+    def _imleci_coz(imlec):
+        """'olusturma_tarihi|id' biçimindeki sayfa imlecini çöz (geçersizse None)"""
+        if not imlec:
+            return None
+        tarih, _, prim_id = str(imlec).rpartition('|')
+        if not tarih or not prim_id.isdigit():
+            return None
+        return tarih, int(prim_id)
+    
+    def prim_sayfasi_getir(self, doktor_id=None, sube_id=None, baslangic=None, bitis=None,
+                           izinli_hekimler=None, sayfa=1, sayfa_boyutu=20, imlec=None):
+        """
+        Prim listesini filtre, sıralama, sayfalama ve toplamlarla birlikte SQLite'ta hesapla.
+        
+        izinli_hekimler: kullanıcının görebileceği (sube_id, doktor_id) çiftleri;
+                         None kısıt yok, boş liste hiçbir kayıt anlamına gelir
+        imlec: önceki sayfanın sonraki_imlec değeri; verilirse OFFSET yerine
+               (olusturma_tarihi, id) üzerinden keyset sayfalama yapılır
+        
+        Dönüş: {'kayitlar', 'toplam_kayit', 'toplam_tutar', 'sonraki_imlec'}
+        """
+        if izinli_hekimler is not None and not izinli_hekimler:
+            return {'kayitlar': [], 'toplam_kayit': 0, 'toplam_tutar': 0, 'sonraki_imlec': None}
+        
+        kosullar = []
+        params = []
+        
+        if doktor_id:
+            kosullar.append("doktor_id = ?")
+            params.append(str(doktor_id))
+        
+        if sube_id:
+            kosullar.append("sube_id = ?")
+            params.append(str(sube_id))
+        
+        if baslangic:
+            kosullar.append("donem_baslangic >= ?")
+            params.append(baslangic)
+        
+        if bitis:
+            kosullar.append("donem_bitis <= ?")
+            params.append(bitis)
+        
+        if izinli_hekimler is not None:
+            ciftler = sorted({(str(s), str(d)) for s, d in izinli_hekimler})
+            kosullar.append(f"(sube_id, doktor_id) IN (VALUES {', '.join(['(?, ?)'] * len(ciftler))})")
+            for cift in ciftler:
+                params.extend(cift)
+        
+        where = f" WHERE {' AND '.join(kosullar)}" if kosullar else ""
+        
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
-            # Ana prim bilgisi
-            cursor.execute("SELECT * FROM prim_hesaplamalari WHERE id = ?", (prim_id,))
-            prim_data = cursor.fetchone()
-            
-            if not prim_data:
-                conn.close()
-                return None
-            
-            # Tahsilat detayları
-            cursor.execute("SELECT * FROM prim_tahsilat_detaylari WHERE prim_id = ?", (prim_id,))
-            tahsilat_detaylari = cursor.fetchall()
+            cursor.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(hesaplanan_prim), 0) FROM prim_hesaplamalari{where}",
+                params
+            )
+            toplam_kayit, toplam_tutar = cursor.fetchone()
+            
+            sayfa_params = list(params)
+            anahtar = self._imleci_coz(imlec)
+            if anahtar:
+                sayfa_kosulu = "(olusturma_tarihi, id) < (?, ?)"
+                sayfa_where = f"{where} AND {sayfa_kosulu}" if where else f" WHERE {sayfa_kosulu}"
+                sayfa_params.extend(anahtar)
+                atla = 0
+            else:
+                sayfa_where = where
+                atla = max(int(sayfa) - 1, 0) * sayfa_boyutu
+            
+            cursor.execute(f"""
+                SELECT {self.LISTE_KOLONLARI}
+                FROM prim_hesaplamalari{sayfa_where}
+                ORDER BY olusturma_tarihi DESC, id DESC
+                LIMIT ? OFFSET ?
+            """, sayfa_params + [sayfa_boyutu, atla])
+            kayitlar = [dict(row) for row in cursor.fetchall()]
+            conn.close()
             
-            # Diğer giderler
-            cursor.execute("SELECT * FROM prim_giderler WHERE prim_id = ?", (prim_id,))
-            diger_giderler = cursor.fetchall()
+            sonraki_imlec = None
+            if len(kayitlar) == sayfa_boyutu:
+                son = kayitlar[-1]
+                sonraki_imlec = f"{son['olusturma_tarihi']}|{son['id']}"
             
-            # Laboratuvar giderleri
-            cursor.execute("SELECT * FROM prim_laboratuvar_giderleri WHERE prim_id = ?", (prim_id,))
-            laboratuvar_giderleri = cursor.fetchall()
+            return {
+                'kayitlar': kayitlar,
+                'toplam_kayit': toplam_kayit,
+                'toplam_tutar': toplam_tutar,
+                'sonraki_imlec': sonraki_imlec
+            }
             
-            # İmplant giderleri
-            cursor.execute("SELECT * FROM prim_implant_giderleri WHERE prim_id = ?", (prim_id,))
-            implant_giderleri = cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Prim sayfası getirme hatası: {e}")
+            raise
+    
+    def simulasyon_verilerini_getir(self, prim_ids=None, baslangic=None, bitis=None, sube_id=None):
+        """
+        Prim simülasyonu için kayıtlı primleri ve tahsilat satırlarını kolon listeleri
+        halinde, gider/ekleme toplamlarını prim bazında kuruş olarak getir.
+        Primler ID listesiyle ya da dönem (ve şube) filtresiyle seçilir.
+        """
+        kosullar = []
+        params = []
+        
+        if prim_ids:
+            kosullar.append(f"id IN ({','.join('?' * len(prim_ids))})")
+            params.extend(int(prim_id) for prim_id in prim_ids)
+        if baslangic:
+            kosullar.append("donem_baslangic >= ?")
+            params.append(baslangic)
+        if bitis:
+            kosullar.append("donem_bitis <= ?")
+            params.append(bitis)
+        if sube_id:
+            kosullar.append("sube_id = ?")
+            params.append(str(sube_id))
+        
+        where = f" WHERE {' AND '.join(kosullar)}" if kosullar else ""
+        secili = f"SELECT id FROM prim_hesaplamalari{where}"
+        
+        def kurus_toplamlari(cursor, tablolar):
+            birlesik = " UNION ALL ".join(
+                f"SELECT prim_id, tutar FROM {tablo} WHERE prim_id IN ({secili})" for tablo in tablolar
+            )
+            cursor.execute(
+                f"SELECT prim_id, SUM(CAST(ROUND(tutar * 100) AS INTEGER)) FROM ({birlesik}) GROUP BY prim_id",
+                params * len(tablolar)
+            )
+            return dict(cursor.fetchall())
+        
+        try:
+            conn = sqlite_baglantilari.baglanti(self.db_path)
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            # Tüm okumalar aynı anlık görüntüden yapılsın
+            cursor.execute("BEGIN")
+            
+            cursor.execute(f"""
+                SELECT id, doktor_id, doktor_adi, sube_id, sube_adi, donem_baslangic, donem_bitis,
+                       prim_orani, net_tahsilat, hesaplanan_prim
+                FROM prim_hesaplamalari{where}
+                ORDER BY doktor_id, donem_baslangic
+            """, params)
+            primler = [dict(row) for row in cursor.fetchall()]
+            
+            cursor.execute(f"""
+                SELECT prim_id, brut_tutar, odeme_sekli, taksit_sayisi
+                FROM prim_tahsilat_detaylari
+                WHERE prim_id IN ({secili})
+            """, params)
+            satirlar = cursor.fetchall()
+            kolonlar = ('prim_id', 'brut_tutar', 'odeme_sekli', 'taksit_sayisi')
+            tahsilatlar = {kolon: [] for kolon in kolonlar}
+            if satirlar:
+                for kolon, degerler in zip(kolonlar, zip(*satirlar)):
+                    tahsilatlar[kolon] = list(degerler)
+            tahsilatlar['odeme_sekli'] = [o or '' for o in tahsilatlar['odeme_sekli']]
+            tahsilatlar['taksit_sayisi'] = [t or 1 for t in tahsilatlar['taksit_sayisi']]
+            
+            cursor.row_factory = None
+            veriler = {
+                'primler': primler,
+                'tahsilatlar': tahsilatlar,
+                'giderler': kurus_toplamlari(cursor, (
+                    'prim_laboratuvar_giderleri', 'prim_implant_giderleri', 'prim_giderler'
+                )),
+                'net_ciro': kurus_toplamlari(cursor, ('prim_net_ciro_eklemeleri',)),
+                'hakedis': kurus_toplamlari(cursor, ('prim_hakedis_eklemeleri',))
+            }
+            conn.close()
+            return veriler
             
-            # YENİ: Net Ciro Eklemeleri
-            cursor.execute("SELECT * FROM prim_net_ciro_eklemeleri WHERE prim_id = ?", (prim_id,))
-            net_ciro_eklemeleri = cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Simülasyon verisi getirme hatası: {e}")
+            raise
+    
+    def prim_detay_getir(self, prim_id):
+        """
+        Prim hesaplama detayını getir. Ana kayıt ve tüm alt tablolar tek bağlantıda,
+        tek okuma transaction'ı içinde okunur ve önbelleğe alınır.
+        
+        Önbellekteki kayıt, ana satırın guncelleme_tarihi tek bir PK sorgusuyla
+        doğrulanarak kullanılır; böylece başka bir süreçte silinen/güncellenen prim
+        eski haliyle gösterilmez. Dönen nesne paylaşılır, değiştirilmemelidir.
+        """
+        try:
+            prim_id = int(prim_id)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
+            conn.row_factory = sqlite3.Row
+            try:
+                # Doğrulama sorgusu ve alt tablo okumaları aynı anlık görüntüyü görsün
+                conn.execute("BEGIN")
+                satir = conn.execute(
+                    "SELECT guncelleme_tarihi FROM prim_hesaplamalari WHERE id = ?", (prim_id,)
+                ).fetchone()
+                
+                if not satir:
+                    self._detay_onbellegi.sil(prim_id)
+                    return None
+                
+                kayit = self._detay_onbellegi.al(prim_id)
+                if kayit and kayit['surum'] == satir['guncelleme_tarihi']:
+                    return kayit['detay']
+                
+                detay = self._prim_detayini_oku(conn, prim_id)
+                self._detay_onbellegi.koy(prim_id, {'surum': satir['guncelleme_tarihi'], 'detay': detay})
+                return detay
+            finally:
+                conn.close()
             
-            # YENİ: Hak Ediş Eklemeleri
-            cursor.execute("SELECT * FROM prim_hakedis_eklemeleri WHERE prim_id = ?", (prim_id,))
-            hakedis_eklemeleri = cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Prim detay getirme hatası: {e}")
+            raise
+    
+    def _prim_detayini_oku(self, conn, prim_id):
+        """Ana prim kaydını ve alt tablolarını verilen bağlantıdan oku"""
+        prim_data = conn.execute("SELECT * FROM prim_hesaplamalari WHERE id = ?", (prim_id,)).fetchone()
+        
+        detay = {'prim_data': dict(prim_data)}
+        for anahtar, tablo in self.DETAY_TABLOLARI:
+            detay[anahtar] = [
+                dict(row) for row in conn.execute(f"SELECT * FROM {tablo} WHERE prim_id = ?", (prim_id,))
+            ]
+        return detay
+    
+    def ozet_belgesi_bilgisi(self, prim_id):
+        """
+        Yazdırma isteği için primin yetki/sürüm alanlarını ve kayıtlı özet belgesinin
+        sürümünü getir (HTML okunmaz). Prim yoksa None.
+        """
+        try:
+            conn = sqlite_baglantilari.baglanti(self.db_path)
+            conn.row_factory = sqlite3.Row
+            satir = conn.execute("""
+                SELECT p.id, p.doktor_id, p.sube_id, p.guncelleme_tarihi,
+                       b.surum AS belge_surumu, b.olusturma_tarihi AS belge_tarihi
+                FROM prim_hesaplamalari p
+                LEFT JOIN prim_ozet_belgeleri b ON b.prim_id = p.id
+                WHERE p.id = ?
+            """, (int(prim_id),)).fetchone()
+            conn.close()
+            return dict(satir) if satir else None
             
+        except Exception as e:
+            logger.error(f"Özet belgesi bilgisi getirme hatası: {e}")
+            raise
+    
+    def ozet_belgesi_getir(self, prim_id, surum):
+        """Verilen sürümdeki kayıtlı özet HTML'ini getir (yoksa veya sürüm farklıysa None)"""
+        try:
+            conn = sqlite_baglantilari.baglanti(self.db_path)
+            satir = conn.execute(
+                "SELECT html FROM prim_ozet_belgeleri WHERE prim_id = ? AND surum = ?",
+                (int(prim_id), surum)
+            ).fetchone()
             conn.close()
+            return satir[0] if satir else None
             
-            return {
-                'prim_data': dict(prim_data),
-                'tahsilat_detaylari': [dict(row) for row in tahsilat_detaylari],
-                'diger_giderler': [dict(row) for row in diger_giderler],
-                'laboratuvar_giderleri': [dict(row) for row in laboratuvar_giderleri],
-                'implant_giderleri': [dict(row) for row in implant_giderleri],
-                'net_ciro_eklemeleri': [dict(row) for row in net_ciro_eklemeleri],  # YENİ
-                'hakedis_eklemeleri': [dict(row) for row in hakedis_eklemeleri]    # YENİ
-            }
+        except Exception as e:
+            logger.error(f"Özet belgesi getirme hatası: {e}")
+            raise
+    
+    def ozet_belgesi_kaydet(self, prim_id, surum, html):
+        """
+        Oluşturulan özet HTML'ini sakla; aynı prim için önceki sürümün yerine geçer.
+        Prim bu arada silindiyse yazılmaz. Dönüş: kaydedildi mi
+        """
+        prim_id = int(prim_id)
+        
+        def kaydet(cursor):
+            cursor.execute('''
+                INSERT OR REPLACE INTO prim_ozet_belgeleri (prim_id, surum, html)
+                SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM prim_hesaplamalari WHERE id = ?)
+            ''', (prim_id, surum, html, prim_id))
+            return cursor.rowcount > 0
+        
+        try:
+            return sqlite_baglantilari.yazici(self.db_path).yaz(kaydet)
             
         except Exception as e:
-            logger.error(f"Prim detay getirme hatası: {e}")
-            raise    
+            logger.error(f"Özet belgesi kaydetme hatası: {e}")
+            raise
+    
+    def detay_onbellegini_temizle(self, prim_id=None):
+        """Silinen/güncellenen primin (veya tümünün) önbellekteki detayını düşür"""
+        if prim_id is None:
+            self._detay_onbellegi.temizle()
+        else:
+            self._detay_onbellegi.sil(int(prim_id))
+    
     def ayarlar_getir(self):
         """Taksit oranları ve gider kategorilerini getir"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -505,7 +1380,7 @@ class PrimDatabase:
     def ayarlar_guncelle(self, taksit_oranlari, gider_kategorileri):
         """Taksit oranları ve gider kategorilerini güncelle"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute("DELETE FROM taksit_oranlari")
@@ -536,14 +1411,14 @@ class PrimDatabase:
 class CariDatabase:
     def __init__(self, db_path="data/prim_hesaplamalari.db"):
         self.db_path = db_path
-        self.init_cari_tables()
+        sema_gocleri_uygula(self.db_path, ANA_VERITABANI_GOCLERI)
     def cari_sil_gelismis(self, cari_id):
         """
         Gelişmiş cari silme - İlişkili tüm kayıtları kontrol eder ve detaylı bilgi verir
         """
         conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             cursor = conn.cursor()
             
             # 1. Cari bilgisini al
@@ -622,118 +1497,109 @@ class CariDatabase:
         finally:
             if conn:
                 conn.close()    
-
-    def hekim_cari_eslestir(self, cari_id, doktor_id, doktor_adi, sube_id, sube_adi):
-        """Hekim-şube kombinasyonunu cariye bağla"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Önce aynı hekim-şube kombinasyonu başka bir cariye bağlı mı kontrol et
-            cursor.execute('''
-                SELECT cari_id FROM hekim_cari_eslestirme 
-                WHERE doktor_id = ? AND sube_id = ? AND aktif = 1
-            ''', (doktor_id, sube_id))
-            
-            existing = cursor.fetchone()
-            if existing and existing[0] != cari_id:
-                conn.close()
-                return False, "Bu hekim-şube kombinasyonu başka bir cariye bağlı"
-            
-            # Eşleştirmeyi ekle veya güncelle (INSERT OR REPLACE kullanılır)
-            # DÜZELTME: Sorguda 5 yerine 6 parametre bekleniyor (cari_id, doktor_id, doktor_adi, sube_id, sube_adi, aktif)
-            cursor.execute('''
-                INSERT OR REPLACE INTO hekim_cari_eslestirme 
-                (cari_id, doktor_id, doktor_adi, sube_id, sube_adi, aktif)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (cari_id, doktor_id, doktor_adi, sube_id, sube_adi, 1)) # 6 PARAMETRE
-            
-            conn.commit()
-            conn.close()
+
+    @staticmethod
+    def _eslestirme_yaz(cursor, cari_id, doktor_id, doktor_adi, sube_id, sube_adi):
+        """Hekim-şube kombinasyonunu cariye bağla (yazıcı işi içinde); (başarılı mı, mesaj) döner"""
+        # Önce aynı hekim-şube kombinasyonu başka bir cariye bağlı mı kontrol et
+        cursor.execute('''
+            SELECT cari_id FROM hekim_cari_eslestirme 
+            WHERE doktor_id = ? AND sube_id = ? AND aktif = 1
+        ''', (doktor_id, sube_id))
+        
+        existing = cursor.fetchone()
+        if existing and existing[0] != cari_id:
+            return False, "Bu hekim-şube kombinasyonu başka bir cariye bağlı"
+        
+        # Eşleştirmeyi ekle veya güncelle (INSERT OR REPLACE kullanılır)
+        cursor.execute('''
+            INSERT OR REPLACE INTO hekim_cari_eslestirme 
+            (cari_id, doktor_id, doktor_adi, sube_id, sube_adi, aktif)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (cari_id, doktor_id, doktor_adi, sube_id, sube_adi, 1))
+        return True, "Eşleştirme başarılı"
+
+    def hekim_cari_eslestir(self, cari_id, doktor_id, doktor_adi, sube_id, sube_adi):
+        """Hekim-şube kombinasyonunu cariye bağla"""
+        try:
+            basarili, mesaj = sqlite_baglantilari.yazici(self.db_path).yaz(
+                lambda cursor: self._eslestirme_yaz(cursor, cari_id, doktor_id, doktor_adi, sube_id, sube_adi)
+            )
             
-            logger.info(f"Hekim-cari eşleştirme: Cari {cari_id} - Hekim {doktor_id} - Şube {sube_id}")
-            return True, "Eşleştirme başarılı"
+            if basarili:
+                logger.info(f"Hekim-cari eşleştirme: Cari {cari_id} - Hekim {doktor_id} - Şube {sube_id}")
+            return basarili, mesaj
             
         except Exception as e:
             logger.error(f"Eşleştirme hatası: {e}")
             return False, str(e)
-    def init_cari_tables(self):
+
+    @staticmethod
+    def _tablolari_olustur(cursor):
         """Cari hesap tablolarını oluştur"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Cari hesaplar tablosu
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS cari_hesaplar (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    cari_kodu TEXT UNIQUE NOT NULL,
-                    cari_adi TEXT NOT NULL,
-                    telefon TEXT,
-                    email TEXT,
-                    adres TEXT,
-                    notlar TEXT,
-                    durum TEXT DEFAULT 'aktif',
-                    bakiye REAL DEFAULT 0,
-                    olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    guncelleme_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Hekim-Cari eşleştirme tablosu
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS hekim_cari_eslestirme (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    cari_id INTEGER NOT NULL,
-                    doktor_id TEXT NOT NULL,
-                    doktor_adi TEXT NOT NULL,
-                    sube_id TEXT NOT NULL,
-                    sube_adi TEXT NOT NULL,
-                    aktif BOOLEAN DEFAULT 1,
-                    olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    
-                    FOREIGN KEY (cari_id) REFERENCES cari_hesaplar(id),
-                    UNIQUE(doktor_id, sube_id)
-                )
-            ''')
-            
-            # Cari hareketler tablosu
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS cari_hareketler (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    cari_id INTEGER NOT NULL,
-                    hareket_tipi TEXT NOT NULL,
-                    prim_id INTEGER,
-                    tarih DATE NOT NULL,
-                    aciklama TEXT,
-                    alacak REAL DEFAULT 0,
-                    borc REAL DEFAULT 0,
-                    bakiye REAL DEFAULT 0,
-                    olusturan_kullanici TEXT,
-                    olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    
-                    FOREIGN KEY (cari_id) REFERENCES cari_hesaplar(id),
-                    FOREIGN KEY (prim_id) REFERENCES prim_hesaplamalari(id)
-                )
-            ''')
-            
-            # İndeksler
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_cari_durum ON cari_hesaplar(durum)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_eslestirme_doktor ON hekim_cari_eslestirme(doktor_id, sube_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_hareketler_cari ON cari_hareketler(cari_id)')
-            
-            conn.commit()
-            conn.close()
-            logger.info("Cari hesap tabloları oluşturuldu")
-            
-        except Exception as e:
-            logger.error(f"Cari tablo oluşturma hatası: {e}")
-            raise
+        # Cari hesaplar tablosu
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cari_hesaplar (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                cari_kodu TEXT UNIQUE NOT NULL,
+                cari_adi TEXT NOT NULL,
+                telefon TEXT,
+                email TEXT,
+                adres TEXT,
+                notlar TEXT,
+                durum TEXT DEFAULT 'aktif',
+                bakiye REAL DEFAULT 0,
+                olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                guncelleme_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Hekim-Cari eşleştirme tablosu
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS hekim_cari_eslestirme (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                cari_id INTEGER NOT NULL,
+                doktor_id TEXT NOT NULL,
+                doktor_adi TEXT NOT NULL,
+                sube_id TEXT NOT NULL,
+                sube_adi TEXT NOT NULL,
+                aktif BOOLEAN DEFAULT 1,
+                olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                
+                FOREIGN KEY (cari_id) REFERENCES cari_hesaplar(id),
+                UNIQUE(doktor_id, sube_id)
+            )
+        ''')
+        
+        # Cari hareketler tablosu
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cari_hareketler (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                cari_id INTEGER NOT NULL,
+                hareket_tipi TEXT NOT NULL,
+                prim_id INTEGER,
+                tarih DATE NOT NULL,
+                aciklama TEXT,
+                alacak REAL DEFAULT 0,
+                borc REAL DEFAULT 0,
+                bakiye REAL DEFAULT 0,
+                olusturan_kullanici TEXT,
+                olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                
+                FOREIGN KEY (cari_id) REFERENCES cari_hesaplar(id),
+                FOREIGN KEY (prim_id) REFERENCES prim_hesaplamalari(id)
+            )
+        ''')
+        
+        # İndeksler
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_cari_durum ON cari_hesaplar(durum)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_eslestirme_doktor ON hekim_cari_eslestirme(doktor_id, sube_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_hareketler_cari ON cari_hareketler(cari_id)')
     
     def cari_detay_getir(self, cari_id):
         """ID ile cari hesap detaylarını getir"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -748,10 +1614,7 @@ class CariDatabase:
             return None
     def cari_ekle(self, cari_data):
         """Yeni cari hesap ekle"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
+        def ekle(cursor):
             cursor.execute('''
                 INSERT INTO cari_hesaplar (cari_kodu, cari_adi, telefon, email, adres, notlar)
                 VALUES (?, ?, ?, ?, ?, ?)
@@ -763,10 +1626,10 @@ class CariDatabase:
                 cari_data.get('adres', ''),
                 cari_data.get('notlar', '')
             ))
-            
-            cari_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
+            return cursor.lastrowid
+        
+        try:
+            cari_id = sqlite_baglantilari.yazici(self.db_path).yaz(ekle)
             
             logger.info(f"Yeni cari oluşturuldu: {cari_id}")
             return cari_id
@@ -776,17 +1639,12 @@ class CariDatabase:
             raise
 
     def cari_hareket_duzelt(self, hareket_id, cari_id, tarih, aciklama, alacak, borc):
-        """Mevcut cari hareketi siler ve bakiyeyi yeniden hesaplar"""
-        conn = None
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
+        """Mevcut cari hareketi siler ve bakiyeyi yeniden hesaplar (tek yazıcı işi)"""
+        def duzelt(cursor):
             # 1. Eski hareketi sil (basitçe silmek en kolayı, sonra yeniden hesaplama)
             cursor.execute("DELETE FROM cari_hareketler WHERE id = ? AND cari_id = ?", (hareket_id, cari_id))
             
             if cursor.rowcount == 0:
-                conn.close()
                 return False, "Hareket bulunamadı veya silinemedi."
                 
             # 2. Güncellenmiş hareketi ekle (yeni bir kayıt olarak, aynı ID'yi kullanamayız)
@@ -805,82 +1663,66 @@ class CariDatabase:
             ))
             
             # 3. Bakiyeyi yeniden hesapla (En önemli kısım)
-            return self._recalculate_bakiye(cari_id, conn)
+            self._bakiyeyi_yeniden_hesapla(cursor, cari_id)
+            return True, "Bakiye başarıyla yeniden hesaplandı."
+        
+        try:
+            return sqlite_baglantilari.yazici(self.db_path).yaz(duzelt)
 
         except Exception as e:
             logger.error(f"Cari hareket düzeltme/silme hatası: {e}")
-            if conn:
-                conn.rollback()
             return False, str(e)
-        finally:
-            if conn:
-                conn.close()
 
     # YENİ: Cari Hareket Silme (Düzeltme fonksiyonunu kullanacağız)
     def cari_hareket_sil(self, hareket_id, cari_id):
-        """Cari hareketi siler ve bakiyeyi yeniden hesaplar"""
-        conn = None
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
+        """Cari hareketi siler ve bakiyeyi yeniden hesaplar (tek yazıcı işi)"""
+        def sil(cursor):
             # 1. Hareketi sil
             cursor.execute("DELETE FROM cari_hareketler WHERE id = ? AND cari_id = ?", (hareket_id, cari_id))
             
             if cursor.rowcount == 0:
-                conn.close()
                 return False, "Hareket bulunamadı veya silinemedi."
                 
             # 2. Bakiyeyi yeniden hesapla
-            return self._recalculate_bakiye(cari_id, conn)
+            self._bakiyeyi_yeniden_hesapla(cursor, cari_id)
+            return True, "Bakiye başarıyla yeniden hesaplandı."
+        
+        try:
+            return sqlite_baglantilari.yazici(self.db_path).yaz(sil)
 
         except Exception as e:
             logger.error(f"Cari hareket silme hatası: {e}")
-            if conn:
-                conn.rollback()
             return False, str(e)
-        finally:
-            if conn:
-                conn.close()
 
-    # YENİ YARDIMCI FONKSİYON: Bakiyeyi tüm hareketler üzerinden yeniden hesaplama
-    def _recalculate_bakiye(self, cari_id, conn):
-        """Belirli bir cari hesabın bakiyesini tüm hareketleri sırayla işleyerek yeniden hesaplar."""
-        try:
-            cursor = conn.cursor()
-            
-            # 1. Tüm hareketleri tarihe göre çek (ID ile de sırlamayı unutmayalım)
-            cursor.execute('''
-                SELECT id, alacak, borc 
-                FROM cari_hareketler 
-                WHERE cari_id = ? 
-                ORDER BY tarih ASC, olusturma_tarihi ASC
-            ''', (cari_id,))
-            hareketler = cursor.fetchall()
-            
-            current_bakiye = 0
-            
-            # 2. Hareketleri sırayla işleyip BAKIYE sütununu güncelle
-            for hid, alacak, borc in hareketler:
-                current_bakiye += alacak - borc
-                cursor.execute("UPDATE cari_hareketler SET bakiye = ? WHERE id = ?", (current_bakiye, hid))
-            
-            # 3. Ana cari hesabın bakiyesini güncelle
-            cursor.execute("UPDATE cari_hesaplar SET bakiye = ? WHERE id = ?", (current_bakiye, cari_id))
-            
-            conn.commit()
-            return True, "Bakiye başarıyla yeniden hesaplandı."
-            
-        except Exception as e:
-            logger.error(f"Bakiye yeniden hesaplama hatası: {e}")
-            conn.rollback()
-            raise
+    @staticmethod
+    def _bakiyeyi_yeniden_hesapla(cursor, cari_id):
+        """Cari bakiyesini tüm hareketleri sırayla işleyerek verilen cursor üzerinde yeniden hesapla (commit etmez)"""
+        # 1. Tüm hareketleri tarihe göre çek (ID ile de sırlamayı unutmayalım)
+        cursor.execute('''
+            SELECT id, alacak, borc 
+            FROM cari_hareketler 
+            WHERE cari_id = ? 
+            ORDER BY tarih ASC, olusturma_tarihi ASC
+        ''', (cari_id,))
+        hareketler = cursor.fetchall()
+        
+        current_bakiye = 0
+        
+        # 2. Hareketleri sırayla işleyip BAKIYE sütununu güncelle
+        for hid, alacak, borc in hareketler:
+            current_bakiye += alacak - borc
+            cursor.execute("UPDATE cari_hareketler SET bakiye = ? WHERE id = ?", (current_bakiye, hid))
+        
+        # 3. Ana cari hesabın bakiyesini güncelle
+        cursor.execute("UPDATE cari_hesaplar SET bakiye = ? WHERE id = ?", (current_bakiye, cari_id))
+        return current_bakiye
+
     # database.py - CariDatabase sınıfı içine eklenecek
 
     def cari_hareket_kontrol(self, cari_id):
         """Cari hesaba ait hareket olup olmadığını kontrol eder."""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute("SELECT COUNT(id) FROM cari_hareketler WHERE cari_id = ?", (cari_id,))
@@ -897,7 +1739,7 @@ class CariDatabase:
         """Cari hesabı siler (Önceden hareket kontrolü yapılmalıdır!)"""
         conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             cursor = conn.cursor()
             
             # 1. İlişkili Hekim Eşleştirmelerini sil
@@ -921,7 +1763,7 @@ class CariDatabase:
     def cari_hareket_detay_getir(self, hareket_id):
         """Tek bir cari hareketin detaylarını getirir"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -939,7 +1781,7 @@ class CariDatabase:
     def cari_bul_hekim_sube(self, doktor_id, sube_id):
         """Hekim-şube kombinasyonu için cari bul"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -962,7 +1804,7 @@ class CariDatabase:
     def cari_listele(self, cari_turu=None, alt_turu=None):
         """Tüm aktif carileri listele (opsiyonel: cari_turu, alt_turu)"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
 
@@ -994,7 +1836,7 @@ class CariDatabase:
     def cari_turleri_getir(self):
         """Veritabanındaki mevcut cari_turu ve alt_turu değerlerini getir"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
 
@@ -1011,71 +1853,59 @@ class CariDatabase:
             logger.error(f"Cari türleri getirme hatası: {e}")
             return {"turler": [], "alt_turler": []}
 
+    @staticmethod
+    def _hareket_yaz(cursor, hareket_data):
+        """Hareketi ekle ve cari bakiyesini güncelle (yazıcı işi içinde); yeni bakiyeyi döndürür"""
+        alacak = float(hareket_data.get('alacak', 0))
+        borc = float(hareket_data.get('borc', 0))
+        
+        # Bakiye, yazma kilidi altında okunup güncellendiği için eşzamanlı hareketler birbirini ezmez
+        cursor.execute('SELECT bakiye FROM cari_hesaplar WHERE id = ?', (hareket_data['cari_id'],))
+        result = cursor.fetchone()
+        current_bakiye = result[0] if result else 0
+        new_bakiye = current_bakiye + alacak - borc
+        
+        cursor.execute('''
+            INSERT INTO cari_hareketler 
+            (cari_id, hareket_tipi, prim_id, tarih, aciklama, alacak, borc, bakiye, olusturan_kullanici)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            hareket_data['cari_id'],
+            hareket_data['hareket_tipi'],
+            hareket_data.get('prim_id'),
+            hareket_data['tarih'],
+            hareket_data.get('aciklama', ''),
+            alacak,
+            borc,
+            new_bakiye,
+            hareket_data.get('olusturan_kullanici', '')
+        ))
+        
+        cursor.execute('UPDATE cari_hesaplar SET bakiye = ?, guncelleme_tarihi = CURRENT_TIMESTAMP WHERE id = ?', 
+                      (new_bakiye, hareket_data['cari_id']))
+        return new_bakiye
+    
     def cari_hareket_ekle(self, hareket_data):
-        """Cari hesaba hareket ekle ve bakiyeyi güncelle"""
-        conn = None
+        """
+        Cari hesaba hareket ekle ve yeni bakiyeyi döndür.
+        Hatalar (yazıcı zaman aşımında concurrent.futures.TimeoutError dahil) çağırana iletilir.
+        """
         try:
-            conn = sqlite3.connect(self.db_path, timeout=30.0)  # TIMEOUT EKLE
-            cursor = conn.cursor()
-            
-            # Mevcut bakiyeyi al
-            cursor.execute('SELECT bakiye FROM cari_hesaplar WHERE id = ?', (hareket_data['cari_id'],))
-            result = cursor.fetchone()
-            current_bakiye = result[0] if result else 0
-            
-            # Yeni bakiyeyi hesapla
-            alacak = float(hareket_data.get('alacak', 0))
-            borc = float(hareket_data.get('borc', 0))
-            new_bakiye = current_bakiye + alacak - borc
-            
-            # Hareketi ekle
-            cursor.execute('''
-                INSERT INTO cari_hareketler 
-                (cari_id, hareket_tipi, prim_id, tarih, aciklama, alacak, borc, bakiye, olusturan_kullanici)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                hareket_data['cari_id'],
-                hareket_data['hareket_tipi'],
-                hareket_data.get('prim_id'),
-                hareket_data['tarih'],
-                hareket_data.get('aciklama', ''),
-                alacak,
-                borc,
-                new_bakiye,
-                hareket_data.get('olusturan_kullanici', '')
-            ))
-            
-            # Cari bakiyesini güncelle
-            cursor.execute('UPDATE cari_hesaplar SET bakiye = ?, guncelleme_tarihi = CURRENT_TIMESTAMP WHERE id = ?', 
-                          (new_bakiye, hareket_data['cari_id']))
-            
-            conn.commit()
+            new_bakiye = sqlite_baglantilari.yazici(self.db_path).yaz(
+                lambda cursor: self._hareket_yaz(cursor, hareket_data)
+            )
             
             logger.info(f"Cari hareket eklendi: Cari {hareket_data['cari_id']}, Yeni bakiye: {new_bakiye}")
-            return True, new_bakiye
-            
-        except sqlite3.OperationalError as e:
-            if "locked" in str(e):
-                logger.error(f"Database locked hatası: {e}")
-                if conn:
-                    conn.rollback()
-                return False, 0
-            raise
+            return new_bakiye
             
         except Exception as e:
             logger.error(f"Cari hareket ekleme hatası: {e}")
-            if conn:
-                conn.rollback()
-            return False, 0
-            
-        finally:
-            if conn:
-                conn.close()
+            raise
     
     def cari_guncelle(self, cari_id, cari_data):
         """Mevcut cari hesabı güncelle"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -1105,7 +1935,7 @@ class CariDatabase:
     def eslestirme_listele(self, cari_id):
         """Bir cariye ait tüm hekim eşleştirmelerini listele"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -1127,7 +1957,7 @@ class CariDatabase:
     def eslestirme_sil(self, eslestirme_id):
         """Hekim-cari eşleştirmesini sil (aktif=0 yap)"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             cursor = conn.cursor()
             
             # Bu, aktif durumunu pasife çeker, kaydı silmek yerine
@@ -1152,7 +1982,7 @@ class CariDatabase:
     def cari_hareket_listele(self, cari_id):
         """Bir cariye ait tüm hareketleri listele (en eski en üstte)"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -1175,15 +2005,13 @@ class CariDatabase:
 class PersonelDatabase:
     def __init__(self, db_path="data/prim_hesaplamalari.db"):
         self.db_path = db_path
-        self.init_personel_tables()
-        self.upgrade_cari_table()
-        self.upgrade_personel_tables()
-        self.upgrade_personel_tables_izin()        
+        sema_gocleri_uygula(self.db_path, ANA_VERITABANI_GOCLERI)
+        
     def maas_sil(self, maas_id):
         """Maaş kaydını ve ilişkili cari hareketini sil"""
         conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             cursor = conn.cursor()
             
             # 1. Maaş kaydını getir
@@ -1227,7 +2055,7 @@ class PersonelDatabase:
                         logger.warning(f"Cari hareketi silinemedi: {msg}")
                     
                     # Yeni connection aç
-                    conn = sqlite3.connect(self.db_path)
+                    conn = sqlite_baglantilari.baglanti(self.db_path)
                     cursor = conn.cursor()
             
             # 3. Maaş kaydını sil
@@ -1247,51 +2075,23 @@ class PersonelDatabase:
                 conn.close()  
 
 
-    def upgrade_personel_tables_izin(self):
-        """Personel tablosuna izin takip alanları ekle"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Personel tablosuna yıllık izin alanları ekle
-            cursor.execute("PRAGMA table_info(personel)")
-            existing_cols = {col[1] for col in cursor.fetchall()}
-            
-            new_columns = {
-                'yillik_izin_hak_edis': "ALTER TABLE personel ADD COLUMN yillik_izin_hak_edis INTEGER DEFAULT 14",
-                'yillik_izin_devir': "ALTER TABLE personel ADD COLUMN yillik_izin_devir INTEGER DEFAULT 0",
-                'yillik_izin_donemi': "ALTER TABLE personel ADD COLUMN yillik_izin_donemi INTEGER"
-            }
-            
-            for col_name, query in new_columns.items():
-                if col_name not in existing_cols:
-                    cursor.execute(query)
-                    logger.info(f"Personel tablosuna {col_name} eklendi")
-            
-            # personel_izin tablosuna yeni alanlar ekle
-            cursor.execute("PRAGMA table_info(personel_izin)")
-            existing_izin_cols = {col[1] for col in cursor.fetchall()}
-            
-            izin_columns = {
-                'ucretli_mi': "ALTER TABLE personel_izin ADD COLUMN ucretli_mi BOOLEAN DEFAULT 1",
-                'yillik_izin_kullanimi': "ALTER TABLE personel_izin ADD COLUMN yillik_izin_kullanimi BOOLEAN DEFAULT 0"
-            }
-            
-            for col_name, query in izin_columns.items():
-                if col_name not in existing_izin_cols:
-                    cursor.execute(query)
-                    logger.info(f"personel_izin tablosuna {col_name} eklendi")
-            
-            conn.commit()
-            conn.close()
-            logger.info("İzin sistemi alanları başarıyla eklendi")
-            
-        except Exception as e:
-            logger.warning(f"İzin alanları güncellenemedi: {e}")
+    @staticmethod
+    def _izin_alanlari(cursor):
+        """Personel ve izin tablolarına yıllık izin takip alanlarını ekle"""
+        _kolonlari_ekle(cursor, 'personel', {
+            'yillik_izin_hak_edis': "INTEGER DEFAULT 14",
+            'yillik_izin_devir': "INTEGER DEFAULT 0",
+            'yillik_izin_donemi': "INTEGER",
+        })
+        _kolonlari_ekle(cursor, 'personel_izin', {
+            'ucretli_mi': "BOOLEAN DEFAULT 1",
+            'yillik_izin_kullanimi': "BOOLEAN DEFAULT 0",
+        })
+    
     def upgrade_maas_odeme_table(self):
         """maas_odeme tablosuna yardım alanlarını ekle"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             cursor = conn.cursor()
             
             # maas_odeme tablosu kolonlarını kontrol et
@@ -1324,7 +2124,7 @@ class PersonelDatabase:
         """Yeni izin kaydı ekle - Yıllık izin kotası kontrolü ile"""
         conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             cursor = conn.cursor()
             
             personel_id = izin_data['personel_id']
@@ -1398,7 +2198,7 @@ class PersonelDatabase:
     def izin_listele(self, personel_id=None, baslangic=None, bitis=None, izin_tipi=None):
         """İzinleri listele"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -1445,7 +2245,7 @@ class PersonelDatabase:
     def izin_sil(self, izin_id):
         """İzin kaydını sil"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute("DELETE FROM personel_izin WHERE id = ?", (izin_id,))
@@ -1463,7 +2263,7 @@ class PersonelDatabase:
     def yillik_izin_durumu(self, personel_id):
         """Personelin yıllık izin durumunu getir"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -1515,7 +2315,7 @@ class PersonelDatabase:
     def aylik_kesintili_izin_hesapla(self, personel_id, donem_ay, donem_yil):
         """Belirli ay için kesintili izin günlerini hesapla"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             cursor = conn.cursor()
             
             # O ayın başı ve sonu
@@ -1576,7 +2376,7 @@ class PersonelDatabase:
     def izin_ozet_rapor(self, personel_id=None, donem_yil=None):
         """İzin özet raporu - Tüm personel veya tek personel"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -1641,7 +2441,7 @@ class PersonelDatabase:
         """Personel kaydını sil - Cari'yi de siler (hareket yoksa)"""
         conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             cursor = conn.cursor()
             
             # 1. Personel bilgisini getir
@@ -1677,324 +2477,268 @@ class PersonelDatabase:
 
     Toplam: {toplam_kayit} kayıt
 
-    Silmek için önce bu kayıtları silmelisiniz."""
-                return False, detay
-            
-            # 3. Cari hesabı kontrol et (ÖNEMLİ KONTROL)
-            if cari_id:
-                cursor.execute("SELECT COUNT(*) FROM cari_hareketler WHERE cari_id = ?", (cari_id,))
-                hareket_count = cursor.fetchone()[0]
-                
-                if hareket_count > 0:
-                    return False, f"""Bu personelin cari hesabında {hareket_count} adet hareket bulunmaktadır.
-
-    Önce cari hareketlerini silmelisiniz:
-    1. Cari Yönetimi sayfasına gidin
-    2. {ad} {soyad} isimli cari'yi bulun
-    3. Hareketlerini görüntüleyin ve silin
-    4. Sonra personeli silebilirsiniz"""
-            
-            # 4. Personeli sil
-            cursor.execute("DELETE FROM personel WHERE id = ?", (personel_id,))
-            
-            # 5. Cari hesabı ve eşleştirmelerini sil (hareket yoksa)
-            if cari_id:
-                cursor.execute("DELETE FROM hekim_cari_eslestirme WHERE cari_id = ?", (cari_id,))
-                cursor.execute("DELETE FROM cari_hesaplar WHERE id = ?", (cari_id,))
-                logger.info(f"Cari hesap da silindi: Cari ID {cari_id}")
-            
-            conn.commit()
-            
-            logger.info(f"Personel ve cari silindi: {ad} {soyad} (Personel ID: {personel_id}, Cari ID: {cari_id})")
-            return True, f"{ad} {soyad} ve ilişkili cari hesap başarıyla silindi"
-            
-        except Exception as e:
-            if conn:
-                conn.rollback()
-            logger.error(f"Personel silme hatası: {e}")
-            return False, f"Silme işlemi başarısız: {str(e)}"
-        finally:
-            if conn:
-                conn.close()
-    
-    def upgrade_cari_table(self):
-        """Mevcut cari_hesaplar tablosuna yeni alanlar ekle"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Tablonun mevcut sütunlarını kontrol et
-            cursor.execute("PRAGMA table_info(cari_hesaplar)")
-            columns = [column[1] for column in cursor.fetchall()]
-            
-            # cari_turu alanı yoksa ekle
-            if 'cari_turu' not in columns:
-                cursor.execute("ALTER TABLE cari_hesaplar ADD COLUMN cari_turu TEXT DEFAULT 'hekim'")
-                logger.info("cari_turu alanı eklendi")
-            
-            # alt_turu alanı yoksa ekle
-            if 'alt_turu' not in columns:
-                cursor.execute("ALTER TABLE cari_hesaplar ADD COLUMN alt_turu TEXT")
-                logger.info("alt_turu alanı eklendi")
-            
-            conn.commit()
-            conn.close()
-            
-        except Exception as e:
-            logger.warning(f"Cari tablo güncelleme hatası (muhtemelen zaten güncel): {e}")
-    
-    def init_personel_tables(self):
-        """Personel yönetim tablolarını oluştur"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 1. PERSONEL ANA TABLO
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS personel (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    cari_id INTEGER,
-                    tc_kimlik TEXT UNIQUE NOT NULL,
-                    ad TEXT NOT NULL,
-                    soyad TEXT NOT NULL,
-                    dogum_tarihi DATE,
-                    cinsiyet TEXT,
-                    adres TEXT,
-                    telefon TEXT,
-                    email TEXT,
-                    
-                    acil_durum_kisi TEXT,
-                    acil_durum_telefon TEXT,
-                    acil_durum_yakinlik TEXT,
-                    
-                    sube_id TEXT,
-                    departman TEXT,
-                    pozisyon TEXT,
-                    ise_baslama_tarihi DATE NOT NULL,
-                    ise_baslangic_egitim_veren TEXT,
-                    ise_baslangic_egitim_tarihi DATE,
-                    tecrube_durumu TEXT DEFAULT 'yeni',
-                    deneme_suresi_gun INTEGER DEFAULT 0,
-                    
-                    calisma_durumu TEXT DEFAULT 'aktif',
-                    ayrilis_tarihi DATE,
-                    ayrilis_nedeni TEXT,
-                    
-                    fotograf BLOB,
-                    
-                    olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    guncelleme_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    
-                    FOREIGN KEY (cari_id) REFERENCES cari_hesaplar(id)
-                )
-            ''')
-            
-            # 2. EĞİTİM BİLGİLERİ
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS personel_egitim (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    personel_id INTEGER NOT NULL,
-                    egitim_turu TEXT NOT NULL,
-                    okul_adi TEXT NOT NULL,
-                    bolum TEXT,
-                    mezuniyet_yili INTEGER,
-                    sertifika_adi TEXT,
-                    belge_no TEXT,
-                    olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    
-                    FOREIGN KEY (personel_id) REFERENCES personel(id) ON DELETE CASCADE
-                )
-            ''')
-            
-            # 3. DOKÜMAN TAKİP
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS personel_dokuman (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    personel_id INTEGER NOT NULL,
-                    dokuman_tipi TEXT NOT NULL,
-                    dosya_adi TEXT,
-                    dosya_yolu TEXT,
-                    onay_tarihi DATE,
-                    gecerlilik_tarihi DATE,
-                    notlar TEXT,
-                    olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    
-                    FOREIGN KEY (personel_id) REFERENCES personel(id) ON DELETE CASCADE
-                )
-            ''')
-            
-            # 4. MAAŞ BİLGİLERİ
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS personel_maas_bilgileri (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    personel_id INTEGER NOT NULL,
-                    brut_maas REAL NOT NULL,
-                    net_maas REAL NOT NULL,
-                    prim REAL DEFAULT 0,
-                    yemek_yardimi REAL DEFAULT 0,
-                    yol_yardimi REAL DEFAULT 0,
-                    diger_odemeler REAL DEFAULT 0,
-                    baslangic_tarihi DATE NOT NULL,
-                    bitis_tarihi DATE,
-                    aktif BOOLEAN DEFAULT 1,
-                    olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    
-                    FOREIGN KEY (personel_id) REFERENCES personel(id) ON DELETE CASCADE
-                )
-            ''')
-            
-            # 5. MAAŞ ÖDEME KAYITLARI
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS maas_odeme (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    personel_id INTEGER NOT NULL,
-                    cari_id INTEGER,
-                    donem_ay INTEGER NOT NULL,
-                    donem_yil INTEGER NOT NULL,
-                    
-                    brut_maas REAL NOT NULL,
-                    net_maas REAL NOT NULL,
-                    
-                    ucretsiz_izin_gun INTEGER DEFAULT 0,
-                    ucretsiz_izin_kesinti REAL DEFAULT 0,
-                    
-                    fazla_mesai_saat REAL DEFAULT 0,
-                    fazla_mesai_ucret REAL DEFAULT 0,
-                    
-                    prim REAL DEFAULT 0,
-                    bonus REAL DEFAULT 0,
-                    
-                    odenecek_tutar REAL NOT NULL,
-                    odeme_tarihi DATE,
-                    odeme_yontemi TEXT,
-                    odeme_durumu TEXT DEFAULT 'beklemede',
-                    
-                    notlar TEXT,
-                    olusturan_kullanici TEXT,
-                    olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    
-                    FOREIGN KEY (personel_id) REFERENCES personel(id) ON DELETE CASCADE,
-                    FOREIGN KEY (cari_id) REFERENCES cari_hesaplar(id),
-                    UNIQUE(personel_id, donem_ay, donem_yil)
-                )
-            ''')
-            
-            # 6. İZİN KAYITLARI
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS personel_izin (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    personel_id INTEGER NOT NULL,
-                    izin_tipi TEXT NOT NULL,
-                    baslangic_tarihi DATE NOT NULL,
-                    bitis_tarihi DATE NOT NULL,
-                    gun_sayisi INTEGER NOT NULL,
-                    aciklama TEXT,
-                    onay_durumu TEXT DEFAULT 'beklemede',
-                    onaylayan TEXT,
-                    olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    
-                    FOREIGN KEY (personel_id) REFERENCES personel(id) ON DELETE CASCADE
-                )
-            ''')
-            
-            # İndeksler
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_personel_tc ON personel(tc_kimlik)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_personel_durum ON personel(calisma_durumu)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_personel_cari ON personel(cari_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_maas_donem ON maas_odeme(donem_yil, donem_ay)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_izin_tarih ON personel_izin(baslangic_tarihi, bitis_tarihi)')
-            
-            conn.commit()
-            conn.close()
-            logger.info("Personel tabloları başarıyla oluşturuldu")
-            
-        except Exception as e:
-            logger.error(f"Personel tablo oluşturma hatası: {e}")
-            raise
-    def upgrade_personel_tables(self):
-        """Personel tablolarına yeni alanlar ekle"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Mevcut personel kolonlarını kontrol et
-            cursor.execute("PRAGMA table_info(personel)")
-            existing_cols = {col[1] for col in cursor.fetchall()}
-            
-            # Yeni kolonlar ekle (eğer yoksa)
-            new_columns = {
-                'hesap_numarasi': "ALTER TABLE personel ADD COLUMN hesap_numarasi TEXT",
-                'hekim_mi': "ALTER TABLE personel ADD COLUMN hekim_mi BOOLEAN DEFAULT 0",
-                'sgk_sicil_no': "ALTER TABLE personel ADD COLUMN sgk_sicil_no TEXT",
-                'sgk_baslangic_tarihi': "ALTER TABLE personel ADD COLUMN sgk_baslangic_tarihi DATE",
-            }
-            
-            for col_name, query in new_columns.items():
-                if col_name not in existing_cols:
-                    cursor.execute(query)
-                    logger.info(f"Personel tablosuna {col_name} kolonu eklendi")
-            
-            # Maaş tablosu güncellemeleri
-            cursor.execute("PRAGMA table_info(personel_maas_bilgileri)")
-            existing_maas_cols = {col[1] for col in cursor.fetchall()}
+    Silmek için önce bu kayıtları silmelisiniz."""
+                return False, detay
             
-            maas_columns = {
-                'cocuk_yardimi': "ALTER TABLE personel_maas_bilgileri ADD COLUMN cocuk_yardimi REAL DEFAULT 0",
-                'diger_odenekler': "ALTER TABLE personel_maas_bilgileri ADD COLUMN diger_odenekler REAL DEFAULT 0",
-            }
+            # 3. Cari hesabı kontrol et (ÖNEMLİ KONTROL)
+            if cari_id:
+                cursor.execute("SELECT COUNT(*) FROM cari_hareketler WHERE cari_id = ?", (cari_id,))
+                hareket_count = cursor.fetchone()[0]
+                
+                if hareket_count > 0:
+                    return False, f"""Bu personelin cari hesabında {hareket_count} adet hareket bulunmaktadır.
+
+    Önce cari hareketlerini silmelisiniz:
+    1. Cari Yönetimi sayfasına gidin
+    2. {ad} {soyad} isimli cari'yi bulun
+    3. Hareketlerini görüntüleyin ve silin
+    4. Sonra personeli silebilirsiniz"""
             
-            for col_name, query in maas_columns.items():
-                if col_name not in existing_maas_cols:
-                    cursor.execute(query)
-                    logger.info(f"Maaş tablosuna {col_name} kolonu eklendi")
+            # 4. Personeli sil
+            cursor.execute("DELETE FROM personel WHERE id = ?", (personel_id,))
             
-            # İş başvuru tablosu oluştur
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS is_basvurulari (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    tc_kimlik TEXT NOT NULL,
-                    ad TEXT NOT NULL,
-                    soyad TEXT NOT NULL,
-                    dogum_tarihi DATE,
-                    cinsiyet TEXT,
-                    telefon TEXT NOT NULL,
-                    email TEXT,
-                    adres TEXT,
-                    acil_kisi TEXT,
-                    acil_telefon TEXT,
-                    egitim_durumu TEXT,
-                    mezun_okul TEXT,
-                    bolum TEXT,
-                    mezuniyet_yili INTEGER,
-                    onceki_is_yeri TEXT,
-                    onceki_pozisyon TEXT,
-                    calisma_suresi TEXT,
-                    basvuru_pozisyon TEXT,
-                    tercih_sube TEXT,
-                    basvuru_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    gorusme_tarihi DATETIME,
-                    referans_kisi TEXT,
-                    referans_telefon TEXT,
-                    ehliyet_var BOOLEAN DEFAULT 0,
-                    ehliyet_sinif TEXT,
-                    kronik_hastalik TEXT,
-                    notlar TEXT,
-                    durum TEXT DEFAULT 'beklemede',
-                    personel_id INTEGER,
-                    degerlendiren_kullanici TEXT,
-                    degerlendirme_notu TEXT,
-                    olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    
-                    FOREIGN KEY (personel_id) REFERENCES personel(id)
-                )
-            ''')
+            # 5. Cari hesabı ve eşleştirmelerini sil (hareket yoksa)
+            if cari_id:
+                cursor.execute("DELETE FROM hekim_cari_eslestirme WHERE cari_id = ?", (cari_id,))
+                cursor.execute("DELETE FROM cari_hesaplar WHERE id = ?", (cari_id,))
+                logger.info(f"Cari hesap da silindi: Cari ID {cari_id}")
             
             conn.commit()
-            conn.close()
-            logger.info("Personel tabloları başarıyla güncellendi")
+            
+            logger.info(f"Personel ve cari silindi: {ad} {soyad} (Personel ID: {personel_id}, Cari ID: {cari_id})")
+            return True, f"{ad} {soyad} ve ilişkili cari hesap başarıyla silindi"
             
         except Exception as e:
-            logger.warning(f"Tablo güncelleme hatası: {e}")        
+            if conn:
+                conn.rollback()
+            logger.error(f"Personel silme hatası: {e}")
+            return False, f"Silme işlemi başarısız: {str(e)}"
+        finally:
+            if conn:
+                conn.close()
+    
+    @staticmethod
+    def _cari_turu_alanlari(cursor):
+        """cari_hesaplar tablosuna cari türü alanlarını ekle"""
+        _kolonlari_ekle(cursor, 'cari_hesaplar', {
+            'cari_turu': "TEXT DEFAULT 'hekim'",
+            'alt_turu': "TEXT",
+        })
+    
+    @staticmethod
+    def _tablolari_olustur(cursor):
+        """Personel yönetim tablolarını oluştur"""
+        # 1. PERSONEL ANA TABLO
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS personel (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                cari_id INTEGER,
+                tc_kimlik TEXT UNIQUE NOT NULL,
+                ad TEXT NOT NULL,
+                soyad TEXT NOT NULL,
+                dogum_tarihi DATE,
+                cinsiyet TEXT,
+                adres TEXT,
+                telefon TEXT,
+                email TEXT,
+                
+                acil_durum_kisi TEXT,
+                acil_durum_telefon TEXT,
+                acil_durum_yakinlik TEXT,
+                
+                sube_id TEXT,
+                departman TEXT,
+                pozisyon TEXT,
+                ise_baslama_tarihi DATE NOT NULL,
+                ise_baslangic_egitim_veren TEXT,
+                ise_baslangic_egitim_tarihi DATE,
+                tecrube_durumu TEXT DEFAULT 'yeni',
+                deneme_suresi_gun INTEGER DEFAULT 0,
+                
+                calisma_durumu TEXT DEFAULT 'aktif',
+                ayrilis_tarihi DATE,
+                ayrilis_nedeni TEXT,
+                
+                fotograf BLOB,
+                
+                olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                guncelleme_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                
+                FOREIGN KEY (cari_id) REFERENCES cari_hesaplar(id)
+            )
+        ''')
+        
+        # 2. EĞİTİM BİLGİLERİ
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS personel_egitim (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                personel_id INTEGER NOT NULL,
+                egitim_turu TEXT NOT NULL,
+                okul_adi TEXT NOT NULL,
+                bolum TEXT,
+                mezuniyet_yili INTEGER,
+                sertifika_adi TEXT,
+                belge_no TEXT,
+                olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                
+                FOREIGN KEY (personel_id) REFERENCES personel(id) ON DELETE CASCADE
+            )
+        ''')
+        
+        # 3. DOKÜMAN TAKİP
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS personel_dokuman (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                personel_id INTEGER NOT NULL,
+                dokuman_tipi TEXT NOT NULL,
+                dosya_adi TEXT,
+                dosya_yolu TEXT,
+                onay_tarihi DATE,
+                gecerlilik_tarihi DATE,
+                notlar TEXT,
+                olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                
+                FOREIGN KEY (personel_id) REFERENCES personel(id) ON DELETE CASCADE
+            )
+        ''')
+        
+        # 4. MAAŞ BİLGİLERİ
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS personel_maas_bilgileri (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                personel_id INTEGER NOT NULL,
+                brut_maas REAL NOT NULL,
+                net_maas REAL NOT NULL,
+                prim REAL DEFAULT 0,
+                yemek_yardimi REAL DEFAULT 0,
+                yol_yardimi REAL DEFAULT 0,
+                diger_odemeler REAL DEFAULT 0,
+                baslangic_tarihi DATE NOT NULL,
+                bitis_tarihi DATE,
+                aktif BOOLEAN DEFAULT 1,
+                olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                
+                FOREIGN KEY (personel_id) REFERENCES personel(id) ON DELETE CASCADE
+            )
+        ''')
+        
+        # 5. MAAŞ ÖDEME KAYITLARI
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS maas_odeme (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                personel_id INTEGER NOT NULL,
+                cari_id INTEGER,
+                donem_ay INTEGER NOT NULL,
+                donem_yil INTEGER NOT NULL,
+                
+                brut_maas REAL NOT NULL,
+                net_maas REAL NOT NULL,
+                
+                ucretsiz_izin_gun INTEGER DEFAULT 0,
+                ucretsiz_izin_kesinti REAL DEFAULT 0,
+                
+                fazla_mesai_saat REAL DEFAULT 0,
+                fazla_mesai_ucret REAL DEFAULT 0,
+                
+                prim REAL DEFAULT 0,
+                bonus REAL DEFAULT 0,
+                
+                odenecek_tutar REAL NOT NULL,
+                odeme_tarihi DATE,
+                odeme_yontemi TEXT,
+                odeme_durumu TEXT DEFAULT 'beklemede',
+                
+                notlar TEXT,
+                olusturan_kullanici TEXT,
+                olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                
+                FOREIGN KEY (personel_id) REFERENCES personel(id) ON DELETE CASCADE,
+                FOREIGN KEY (cari_id) REFERENCES cari_hesaplar(id),
+                UNIQUE(personel_id, donem_ay, donem_yil)
+            )
+        ''')
+        
+        # 6. İZİN KAYITLARI
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS personel_izin (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                personel_id INTEGER NOT NULL,
+                izin_tipi TEXT NOT NULL,
+                baslangic_tarihi DATE NOT NULL,
+                bitis_tarihi DATE NOT NULL,
+                gun_sayisi INTEGER NOT NULL,
+                aciklama TEXT,
+                onay_durumu TEXT DEFAULT 'beklemede',
+                onaylayan TEXT,
+                olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                
+                FOREIGN KEY (personel_id) REFERENCES personel(id) ON DELETE CASCADE
+            )
+        ''')
+        
+        # İndeksler
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_personel_tc ON personel(tc_kimlik)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_personel_durum ON personel(calisma_durumu)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_personel_cari ON personel(cari_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_maas_donem ON maas_odeme(donem_yil, donem_ay)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_izin_tarih ON personel_izin(baslangic_tarihi, bitis_tarihi)')
+    
+    @staticmethod
+    def _personel_ek_alanlari(cursor):
+        """Personel/maaş tablolarına yeni alanlar ve iş başvuruları tablosu"""
+        _kolonlari_ekle(cursor, 'personel', {
+            'hesap_numarasi': "TEXT",
+            'hekim_mi': "BOOLEAN DEFAULT 0",
+            'sgk_sicil_no': "TEXT",
+            'sgk_baslangic_tarihi': "DATE",
+        })
+        
+        # Maaş tablosu güncellemeleri
+        _kolonlari_ekle(cursor, 'personel_maas_bilgileri', {
+            'cocuk_yardimi': "REAL DEFAULT 0",
+            'diger_odenekler': "REAL DEFAULT 0",
+        })
+        
+        # İş başvuru tablosu oluştur
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS is_basvurulari (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tc_kimlik TEXT NOT NULL,
+                ad TEXT NOT NULL,
+                soyad TEXT NOT NULL,
+                dogum_tarihi DATE,
+                cinsiyet TEXT,
+                telefon TEXT NOT NULL,
+                email TEXT,
+                adres TEXT,
+                acil_kisi TEXT,
+                acil_telefon TEXT,
+                egitim_durumu TEXT,
+                mezun_okul TEXT,
+                bolum TEXT,
+                mezuniyet_yili INTEGER,
+                onceki_is_yeri TEXT,
+                onceki_pozisyon TEXT,
+                calisma_suresi TEXT,
+                basvuru_pozisyon TEXT,
+                tercih_sube TEXT,
+                basvuru_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                gorusme_tarihi DATETIME,
+                referans_kisi TEXT,
+                referans_telefon TEXT,
+                ehliyet_var BOOLEAN DEFAULT 0,
+                ehliyet_sinif TEXT,
+                kronik_hastalik TEXT,
+                notlar TEXT,
+                durum TEXT DEFAULT 'beklemede',
+                personel_id INTEGER,
+                degerlendiren_kullanici TEXT,
+                degerlendirme_notu TEXT,
+                olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                
+                FOREIGN KEY (personel_id) REFERENCES personel(id)
+            )
+        ''')
     
     # ==================== PERSONEL CRUD ====================
     
@@ -2002,7 +2746,7 @@ class PersonelDatabase:
         """Yeni personel ekle ve isteğe bağlı cari hesap oluştur"""
         conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             cursor = conn.cursor()
             
             cari_id = None
@@ -2087,7 +2831,7 @@ class PersonelDatabase:
     def personel_listele(self, sadece_aktif=True, sube_id=None):
         """Personel listesini getir"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -2116,7 +2860,7 @@ class PersonelDatabase:
     def personel_detay_getir(self, personel_id):
         """Personel detaylarını getir"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -2155,7 +2899,7 @@ class PersonelDatabase:
     def personel_guncelle(self, personel_id, personel_data):
         """Personel bilgilerini güncelle"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -2196,7 +2940,7 @@ class PersonelDatabase:
     def maas_bilgisi_tanimla(self, personel_id, maas_data):
         """Personel için maaş bilgisi tanımla"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             cursor = conn.cursor()
             
             # Önceki maaş tanımını pasife al
@@ -2235,13 +2979,12 @@ class PersonelDatabase:
 # maas_odeme_kaydet() fonksiyonunu BUL ve DEĞİŞTİR
 # Yaklaşık satır 850 civarında
 
-    def maas_odeme_kaydet(self, data):
-        """Maaş ödemesi kaydet - Yardımlar dahil (SADECE hesaplama, ödeme değil)"""
-        conn = None
-        try:
-            conn = sqlite3.connect(self.db_path, timeout=30.0)
-            cursor = conn.cursor()
-            
+    def maas_odeme_kaydet(self, data, cari_hareketi=None):
+        """
+        Maaş ödemesi kaydet - Yardımlar dahil (SADECE hesaplama, ödeme değil).
+        cari_hareketi verilirse maaş kaydıyla aynı işte cari hesaba işlenir.
+        """
+        def kaydet(cursor):
             # Maaş kaydı oluştur - DURUM: beklemede
             cursor.execute('''
                 INSERT INTO maas_odeme
@@ -2272,49 +3015,75 @@ class PersonelDatabase:
                 data.get('notlar'),
                 data.get('olusturan_kullanici')
             ))
-            
+
             maas_id = cursor.lastrowid
-            conn.commit()
+            if cari_hareketi:
+                CariDatabase._hareket_yaz(cursor, cari_hareketi)
+            return maas_id
+        
+        try:
+            maas_id = sqlite_baglantilari.yazici(self.db_path).yaz(kaydet)
             
             logger.info(f"Maaş hesaplaması kaydedildi: ID {maas_id}, Durum: beklemede")
             return maas_id
             
-        except sqlite3.OperationalError as e:
-            if "locked" in str(e):
-                logger.error(f"Database locked hatası: {e}")
-                if conn:
-                    conn.rollback()
-                raise Exception("Veritabanı meşgul, lütfen tekrar deneyin")
-            raise
-            
         except Exception as e:
-            if conn:
-                conn.rollback()
             logger.error(f"Maaş kaydetme hatası: {e}")
             raise
-            
-        finally:
-            if conn:
-                conn.close()
 
-            # NOT: Eğer maas_odeme tablosuna yardım kolonları eklenmediyse, aşağıdaki SQL'i çalıştırın:
+    def maas_odemesi_yap(self, maas_id, odeme_yontemi, odeme_tarihi, kullanici=None):
+        """
+        Bekleyen maaşı ödendi olarak işaretle ve cari hesaptan borç düş (tek işte).
+        Dönüş: 'odendi', 'bulunamadi' veya 'zaten_odenmis'
+        """
+        def ode(cursor):
+            cursor.execute("""
+                SELECT cari_id, donem_ay, donem_yil, odenecek_tutar, odeme_durumu
+                FROM maas_odeme WHERE id = ?
+            """, (maas_id,))
+            maas = cursor.fetchone()
+            if not maas:
+                return 'bulunamadi'
 
-            """
-            -- SQLite veritabanında manuel olarak çalıştırılacak (sadece gerekirse):
+            cari_id, donem_ay, donem_yil, odenecek_tutar, odeme_durumu = maas
+            if odeme_durumu == 'odendi':
+                return 'zaten_odenmis'
+
+            cursor.execute("""
+                UPDATE maas_odeme
+                SET odeme_durumu = 'odendi',
+                    odeme_tarihi = ?,
+                    odeme_yontemi = ?
+                WHERE id = ?
+            """, (odeme_tarihi, odeme_yontemi, maas_id))
 
-            ALTER TABLE maas_odeme ADD COLUMN yol_yardimi REAL DEFAULT 0;
-            ALTER TABLE maas_odeme ADD COLUMN yemek_yardimi REAL DEFAULT 0;
-            ALTER TABLE maas_odeme ADD COLUMN cocuk_yardimi REAL DEFAULT 0;
-            ALTER TABLE maas_odeme ADD COLUMN diger_odenekler REAL DEFAULT 0;
+            if cari_id:
+                CariDatabase._hareket_yaz(cursor, {
+                    'cari_id': cari_id,
+                    'hareket_tipi': 'maas_odeme',
+                    'tarih': odeme_tarihi,
+                    'aciklama': f"Maaş Ödemesi ({odeme_yontemi}) - {donem_ay}/{donem_yil}",
+                    'alacak': 0,
+                    'borc': odenecek_tutar,
+                    'olusturan_kullanici': kullanici
+                })
+            return 'odendi'
 
-            -- Veya init_personel_tables() fonksiyonunda tabloya bu kolonları ekleyin
-            """
+        try:
+            sonuc = sqlite_baglantilari.yazici(self.db_path).yaz(ode)
+            if sonuc == 'odendi':
+                logger.info(f"Maaş ödendi: ID {maas_id} ({odeme_yontemi})")
+            return sonuc
+
+        except Exception as e:
+            logger.error(f"Maaş ödeme hatası: {e}")
+            raise
 
     
     def maas_listele(self, donem_ay=None, donem_yil=None, personel_id=None, cari_turu=None, alt_turu=None):
         """Maaş ödemelerini listele (cari_turu ve alt_turu filtreli)"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -2360,55 +3129,13 @@ class PersonelDatabase:
             return []
    
 
-    def upgrade_personel_tables_izin(self):
-        """Personel tablosuna izin takip alanları ekle"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Personel tablosuna yıllık izin alanları ekle
-            cursor.execute("PRAGMA table_info(personel)")
-            existing_cols = {col[1] for col in cursor.fetchall()}
-            
-            new_columns = {
-                'yillik_izin_hak_edis': "ALTER TABLE personel ADD COLUMN yillik_izin_hak_edis INTEGER DEFAULT 14",
-                'yillik_izin_devir': "ALTER TABLE personel ADD COLUMN yillik_izin_devir INTEGER DEFAULT 0",
-                'yillik_izin_donemi': "ALTER TABLE personel ADD COLUMN yillik_izin_donemi INTEGER"
-            }
-            
-            for col_name, query in new_columns.items():
-                if col_name not in existing_cols:
-                    cursor.execute(query)
-                    logger.info(f"Personel tablosuna {col_name} eklendi")
-            
-            # personel_izin tablosuna yeni alanlar ekle
-            cursor.execute("PRAGMA table_info(personel_izin)")
-            existing_izin_cols = {col[1] for col in cursor.fetchall()}
-            
-            izin_columns = {
-                'ucretli_mi': "ALTER TABLE personel_izin ADD COLUMN ucretli_mi BOOLEAN DEFAULT 1",
-                'yillik_izin_kullanimi': "ALTER TABLE personel_izin ADD COLUMN yillik_izin_kullanimi BOOLEAN DEFAULT 0"
-            }
-            
-            for col_name, query in izin_columns.items():
-                if col_name not in existing_izin_cols:
-                    cursor.execute(query)
-                    logger.info(f"personel_izin tablosuna {col_name} eklendi")
-            
-            conn.commit()
-            conn.close()
-            logger.info("İzin sistemi alanları başarıyla eklendi")
-            
-        except Exception as e:
-            logger.warning(f"İzin alanları güncellenemedi: {e}")
-
     # ==================== İZİN YÖNETİMİ ====================
     
     def izin_ekle(self, izin_data):
         """Yeni izin kaydı ekle - Yıllık izin kotası kontrolü ile"""
         conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             cursor = conn.cursor()
             
             personel_id = izin_data['personel_id']
@@ -2482,7 +3209,7 @@ class PersonelDatabase:
     def izin_listele(self, personel_id=None, baslangic=None, bitis=None, izin_tipi=None):
         """İzinleri listele"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -2529,7 +3256,7 @@ class PersonelDatabase:
     def izin_sil(self, izin_id):
         """İzin kaydını sil"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute("DELETE FROM personel_izin WHERE id = ?", (izin_id,))
@@ -2547,7 +3274,7 @@ class PersonelDatabase:
     def yillik_izin_durumu(self, personel_id):
         """Personelin yıllık izin durumunu getir"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -2599,7 +3326,7 @@ class PersonelDatabase:
     def aylik_kesintili_izin_hesapla(self, personel_id, donem_ay, donem_yil):
         """Belirli ay için kesintili izin günlerini hesapla"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             cursor = conn.cursor()
             
             # O ayın başı ve sonu
@@ -2660,7 +3387,7 @@ class PersonelDatabase:
     def izin_ozet_rapor(self, personel_id=None, donem_yil=None):
         """İzin özet raporu - Tüm personel veya tek personel"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_baglantilari.baglanti(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -2723,11 +3450,363 @@ class PersonelDatabase:
        
 
 
+class TedaviMatrisDatabase:
+    """
+    MySQL tedavi tablosunun hasta x hekim bazında özetinin yerel kopyası.
+    Her istekte tüm tedavi tablosunu gruplamak yerine ROWNO watermark'ı ile
+    yalnızca yeni satırlar birleştirilir; çoklu hekim hastaları ayrıca tutulur.
+    """
+    # SQLite parametre sınırının altında kalmak için IN listesi parça boyutu
+    PARCA_BOYUTU = 900
+
+    def __init__(self, db_path="data/tedavi_matrisi.db"):
+        self.db_path = db_path
+        sema_gocleri_uygula(self.db_path, TEDAVI_MATRISI_GOCLERI)
+
+    @staticmethod
+    def _tablolari_olustur(cursor):
+        """Matris tablolarını oluştur"""
+        # doktor_id NULL olamaz (PRIMARY KEY çakışması için), bilinmeyen hekim '' tutulur
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tedavi_matrisi (
+                hasta_id TEXT NOT NULL,
+                doktor_id TEXT NOT NULL DEFAULT '',
+                tedavi_toplam REAL DEFAULT 0,
+                tedavi_sayisi INTEGER DEFAULT 0,
+                ilk_tedavi TEXT,
+                son_tedavi TEXT,
+                PRIMARY KEY (hasta_id, doktor_id)
+            ) WITHOUT ROWID
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS coklu_hekim_hastalari (
+                hasta_id TEXT PRIMARY KEY,
+                hekim_sayisi INTEGER NOT NULL
+            ) WITHOUT ROWID
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tedavi_matrisi_durum (
+                anahtar TEXT PRIMARY KEY,
+                deger TEXT
+            )
+        ''')
+
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tedavi_matrisi_doktor ON tedavi_matrisi(doktor_id)")
+
+    def durum_getir(self):
+        """Watermark ve son senkron zamanlarını getir"""
+        try:
+            conn = sqlite_baglantilari.baglanti(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute("SELECT anahtar, deger FROM tedavi_matrisi_durum")
+            durum = dict(cursor.fetchall())
+            cursor.execute("SELECT COUNT(*), IFNULL(SUM(tedavi_sayisi), 0) FROM tedavi_matrisi")
+            durum['satir_sayisi'], durum['tedavi_sayisi'] = cursor.fetchone()
+            cursor.execute("SELECT COUNT(*) FROM coklu_hekim_hastalari")
+            durum['coklu_hekim_hasta_sayisi'] = cursor.fetchone()[0]
+            conn.close()
+
+            durum['watermark'] = int(durum.get('watermark') or 0)
+            return durum
+
+        except Exception as e:
+            logger.error(f"Tedavi matrisi durum hatası: {e}")
+            raise
+
+    def _durum_yaz(self, cursor, anahtar, deger):
+        cursor.execute(
+            "INSERT OR REPLACE INTO tedavi_matrisi_durum (anahtar, deger) VALUES (?, ?)",
+            (anahtar, str(deger))
+        )
+
+    def _coklu_hekim_yenile(self, cursor, hasta_ids=None):
+        """Çoklu hekim hasta kümesini (tamamen ya da verilen hastalar için) yeniden hesapla"""
+        sorgu = '''
+            INSERT INTO coklu_hekim_hastalari (hasta_id, hekim_sayisi)
+            SELECT hasta_id, COUNT(DISTINCT doktor_id)
+            FROM tedavi_matrisi
+            WHERE doktor_id != '' {filtre}
+            GROUP BY hasta_id
+            HAVING COUNT(DISTINCT doktor_id) > 1
+        '''
+        if hasta_ids is None:
+            cursor.execute("DELETE FROM coklu_hekim_hastalari")
+            cursor.execute(sorgu.format(filtre=""))
+            return
+
+        hasta_ids = list(hasta_ids)
+        for i in range(0, len(hasta_ids), self.PARCA_BOYUTU):
+            parca = hasta_ids[i:i + self.PARCA_BOYUTU]
+            placeholders = ','.join('?' * len(parca))
+            cursor.execute(f"DELETE FROM coklu_hekim_hastalari WHERE hasta_id IN ({placeholders})", parca)
+            cursor.execute(sorgu.format(filtre=f"AND hasta_id IN ({placeholders})"), parca)
+
+    def matris_birlestir(self, satirlar, watermark):
+        """
+        Yeni tedavi özetlerini mevcut matrise ekle.
+        satirlar: (hasta_id, doktor_id, toplam, sayi, ilk_tarih, son_tarih) demetleri
+        """
+        conn = None
+        try:
+            conn = sqlite_baglantilari.baglanti(self.db_path)
+            cursor = conn.cursor()
+
+            cursor.executemany('''
+                INSERT INTO tedavi_matrisi
+                (hasta_id, doktor_id, tedavi_toplam, tedavi_sayisi, ilk_tedavi, son_tedavi)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(hasta_id, doktor_id) DO UPDATE SET
+                    tedavi_toplam = tedavi_toplam + excluded.tedavi_toplam,
+                    tedavi_sayisi = tedavi_sayisi + excluded.tedavi_sayisi,
+                    ilk_tedavi = MIN(IFNULL(ilk_tedavi, excluded.ilk_tedavi), IFNULL(excluded.ilk_tedavi, ilk_tedavi)),
+                    son_tedavi = MAX(IFNULL(son_tedavi, excluded.son_tedavi), IFNULL(excluded.son_tedavi, son_tedavi))
+            ''', satirlar)
+
+            self._coklu_hekim_yenile(cursor, {satir[0] for satir in satirlar})
+            self._durum_yaz(cursor, 'watermark', watermark)
+            self._durum_yaz(cursor, 'son_senkron', datetime.now().isoformat(timespec='seconds'))
+
+            conn.commit()
+            logger.info(f"Tedavi matrisine {len(satirlar)} satır birleştirildi (watermark={watermark})")
+            return True
+
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            logger.error(f"Tedavi matrisi birleştirme hatası: {e}")
+            raise
+        finally:
+            if conn:
+                conn.close()
+
+    def matris_yeniden_olustur(self, satir_parcalari, watermark):
+        """
+        Matrisi sıfırdan doldur (silinen/düzeltilen eski tedavileri yakalamak için).
+        satir_parcalari: satır listelerinden oluşan yineleyici (parça parça okuma)
+        """
+        conn = None
+        try:
+            conn = sqlite_baglantilari.baglanti(self.db_path)
+            cursor = conn.cursor()
+
+            cursor.execute("DELETE FROM tedavi_matrisi")
+            toplam = 0
+            for satirlar in satir_parcalari:
+                cursor.executemany('''
+                    INSERT INTO tedavi_matrisi
+                    (hasta_id, doktor_id, tedavi_toplam, tedavi_sayisi, ilk_tedavi, son_tedavi)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', satirlar)
+                toplam += len(satirlar)
+
+            self._coklu_hekim_yenile(cursor)
+            simdi = datetime.now().isoformat(timespec='seconds')
+            self._durum_yaz(cursor, 'watermark', watermark)
+            self._durum_yaz(cursor, 'son_senkron', simdi)
+            self._durum_yaz(cursor, 'son_tam_yenileme', simdi)
+
+            conn.commit()
+            logger.info(f"Tedavi matrisi yeniden oluşturuldu: {toplam} satır (watermark={watermark})")
+            return toplam
+
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            logger.error(f"Tedavi matrisi yeniden oluşturma hatası: {e}")
+            raise
+        finally:
+            if conn:
+                conn.close()
+
+    def coklu_hekim_hastalari_getir(self, hasta_ids=None):
+        """Çoklu hekim hastalarının ID kümesi (hasta_ids verilirse onlarla sınırlı)"""
+        try:
+            conn = sqlite_baglantilari.baglanti(self.db_path)
+            cursor = conn.cursor()
+
+            if hasta_ids is None:
+                cursor.execute("SELECT hasta_id FROM coklu_hekim_hastalari")
+                sonuc = {row[0] for row in cursor.fetchall()}
+            else:
+                hasta_ids = [str(h) for h in hasta_ids]
+                sonuc = set()
+                for i in range(0, len(hasta_ids), self.PARCA_BOYUTU):
+                    parca = hasta_ids[i:i + self.PARCA_BOYUTU]
+                    placeholders = ','.join('?' * len(parca))
+                    cursor.execute(
+                        f"SELECT hasta_id FROM coklu_hekim_hastalari WHERE hasta_id IN ({placeholders})", parca
+                    )
+                    sonuc.update(row[0] for row in cursor.fetchall())
+
+            conn.close()
+            return sonuc
+
+        except Exception as e:
+            logger.error(f"Çoklu hekim hastaları getirme hatası: {e}")
+            raise
+
+    def matris_getir(self, hasta_ids):
+        """Verilen hastaların hasta x hekim tedavi özetleri"""
+        try:
+            conn = sqlite_baglantilari.baglanti(self.db_path)
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+
+            hasta_ids = [str(h) for h in hasta_ids]
+            satirlar = []
+            for i in range(0, len(hasta_ids), self.PARCA_BOYUTU):
+                parca = hasta_ids[i:i + self.PARCA_BOYUTU]
+                placeholders = ','.join('?' * len(parca))
+                cursor.execute(f'''
+                    SELECT hasta_id, NULLIF(doktor_id, '') AS doktor_id, tedavi_toplam,
+                           tedavi_sayisi, ilk_tedavi, son_tedavi
+                    FROM tedavi_matrisi
+                    WHERE hasta_id IN ({placeholders})
+                ''', parca)
+                satirlar.extend(dict(row) for row in cursor.fetchall())
+
+            conn.close()
+            return satirlar
+
+        except Exception as e:
+            logger.error(f"Tedavi matrisi getirme hatası: {e}")
+            raise
+
+
+
+class PrimTaslakDatabase:
+    """
+    Sunucu tarafı prim taslakları. Hekimin dönem tahsilatları ve giderleri tek bir
+    JSON belge olarak taslak ID'si altında, son kullanma zamanıyla saklanır;
+    istemci yalnızca satır düzenlemelerini gönderir.
+    """
+
+    def __init__(self, db_path="data/prim_taslaklari.db"):
+        self.db_path = db_path
+        sema_gocleri_uygula(self.db_path, PRIM_TASLAK_GOCLERI)
+
+    @staticmethod
+    def _tablolari_olustur(cursor):
+        """Taslak tablosunu oluştur"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS prim_taslaklari (
+                taslak_id TEXT PRIMARY KEY,
+                kullanici TEXT,
+                doktor_id TEXT,
+                donem_baslangic DATE,
+                donem_bitis DATE,
+                veri TEXT NOT NULL,
+                olusturma_tarihi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                son_kullanma REAL NOT NULL
+            )
+        ''')
+
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_prim_taslak_son_kullanma ON prim_taslaklari(son_kullanma)")
+
+    def taslak_kaydet(self, taslak_id, kullanici, veri, sure):
+        """Taslağı ekle ya da güncelle; son kullanma süresi her kayıtta yenilenir"""
+        try:
+            conn = sqlite_baglantilari.baglanti(self.db_path)
+            cursor = conn.cursor()
+
+            simdi = time.time()
+            cursor.execute("DELETE FROM prim_taslaklari WHERE son_kullanma <= ?", (simdi,))
+            cursor.execute('''
+                INSERT INTO prim_taslaklari
+                (taslak_id, kullanici, doktor_id, donem_baslangic, donem_bitis, veri, son_kullanma)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(taslak_id) DO UPDATE SET
+                    veri = excluded.veri,
+                    son_kullanma = excluded.son_kullanma
+            ''', (
+                taslak_id,
+                kullanici,
+                veri.get('doktor_id'),
+                veri.get('donem_baslangic'),
+                veri.get('donem_bitis'),
+                json.dumps(veri, ensure_ascii=False, default=str),
+                simdi + sure
+            ))
+
+            conn.commit()
+            conn.close()
+            return simdi + sure
+
+        except Exception as e:
+            logger.error(f"Prim taslağı kaydetme hatası: {e}")
+            raise
+
+    def taslak_getir(self, taslak_id, kullanici):
+        """Kullanıcıya ait, süresi dolmamış taslağı getir (yoksa None)"""
+        try:
+            conn = sqlite_baglantilari.baglanti(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT veri FROM prim_taslaklari WHERE taslak_id = ? AND kullanici = ? AND son_kullanma > ?",
+                (taslak_id, kullanici, time.time())
+            )
+            satir = cursor.fetchone()
+            conn.close()
+
+            return json.loads(satir[0]) if satir else None
+
+        except Exception as e:
+            logger.error(f"Prim taslağı getirme hatası: {e}")
+            raise
+
+    def taslak_sil(self, taslak_id):
+        try:
+            conn = sqlite_baglantilari.baglanti(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM prim_taslaklari WHERE taslak_id = ?", (taslak_id,))
+            silindi = cursor.rowcount > 0
+            conn.commit()
+            conn.close()
+            return silindi
+
+        except Exception as e:
+            logger.error(f"Prim taslağı silme hatası: {e}")
+            raise
+
+# ==================== ŞEMA GÖÇLERİ ====================
+# Yeni şema değişikliği listenin sonuna bir sonraki sürüm numarasıyla eklenir; uygulanmış
+# göçler değiştirilmez. Sürümü izlenmeden oluşmuş veritabanlarında (user_version = 0)
+# ilk göçler de çalıştığı için bunlar mevcut tablo/kolonlarla uyumludur.
+
+# Prim, cari ve personel tabloları aynı dosyada; user_version dosya başına tutulduğu için
+# göçleri tek listede
+ANA_VERITABANI_GOCLERI = [
+    (1, "prim tabloları ve varsayılan ayarlar", PrimDatabase._tablolari_olustur),
+    (2, "cari hesap tabloları", CariDatabase._tablolari_olustur),
+    (3, "personel tabloları", PersonelDatabase._tablolari_olustur),
+    (4, "cari türü alanları", PersonelDatabase._cari_turu_alanlari),
+    (5, "personel ek alanları ve iş başvuruları", PersonelDatabase._personel_ek_alanlari),
+    (6, "yıllık izin alanları", PersonelDatabase._izin_alanlari),
+]
+
+TEDAVI_MATRISI_GOCLERI = [
+    (1, "tedavi matrisi tabloları", TedaviMatrisDatabase._tablolari_olustur),
+]
+
+PRIM_TASLAK_GOCLERI = [
+    (1, "prim taslakları tablosu", PrimTaslakDatabase._tablolari_olustur),
+]
+
+# Global örnekler ilk kullanımda oluşturulur; modülü içe aktarmak dosya açmaz, göç çalıştırmaz
+
 # Global instance
-personel_db = PersonelDatabase()            
+personel_db = TembelOrnek(PersonelDatabase)
 
 # Global instance
-cari_db = CariDatabase()            
+cari_db = TembelOrnek(CariDatabase)
 
 # Global prim database instance
-prim_db = PrimDatabase()
\ No newline at end of file
+prim_db = TembelOrnek(PrimDatabase)
+
+# Global tedavi matrisi instance
+tedavi_matris_db = TembelOrnek(TedaviMatrisDatabase)
+
+# Global prim taslak instance
+prim_taslak_db = TembelOrnek(PrimTaslakDatabase)
@@ -0,0 +1,131 @@
+# excel_utils.py - Akışlı (write-only) Excel rapor yazıcı
+import logging
+import tempfile
+
+from flask import send_file
+
+from yukleme_utils import TembelModul
+
+logger = logging.getLogger(__name__)
+
+# openpyxl ilk Excel raporunda yüklenir
+openpyxl = TembelModul('openpyxl')
+stiller = TembelModul('openpyxl.styles')
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Bellekte tutulacak en büyük dosya boyutu; üstü geçici dosyaya taşınır
+BELLEK_SINIRI = 8 * 1024 * 1024
+
+PARA_FORMATI = '#,##0.00'
+YUZDE_FORMATI = '0.00%'
+
+
+def _stil(ad, **ozellikler):
+    stil = stiller.NamedStyle(name=ad)
+    for anahtar, deger in ozellikler.items():
+        setattr(stil, anahtar, deger)
+    return stil
+
+
+def _stilleri_olustur():
+    """Raporlarda kullanılan ortak adlandırılmış stiller (her hücreye ayrı nesne yerine)"""
+    Font, PatternFill = stiller.Font, stiller.PatternFill
+    ince = stiller.Side(style='thin')
+    kenarlik = stiller.Border(left=ince, right=ince, top=ince, bottom=ince)
+    ortali = stiller.Alignment(horizontal='center', vertical='center')
+    return [
+        _stil('baslik', font=Font(bold=True, color="FFFFFF"), alignment=ortali, border=kenarlik,
+              fill=PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")),
+        _stil('baslik_uyari', font=Font(bold=True), alignment=ortali, border=kenarlik,
+              fill=PatternFill(start_color="FFC000", end_color="FFC000", fill_type="solid")),
+        _stil('metin', border=kenarlik),
+        _stil('tamsayi', border=kenarlik, number_format='0'),
+        _stil('para', border=kenarlik, number_format=PARA_FORMATI),
+        _stil('para_negatif', border=kenarlik, number_format=PARA_FORMATI, font=Font(color="FF0000")),
+        _stil('para_pozitif', border=kenarlik, number_format=PARA_FORMATI, font=Font(color="008000")),
+        _stil('yuzde', border=kenarlik, number_format=YUZDE_FORMATI),
+        _stil('toplam_metin', font=Font(bold=True)),
+        _stil('toplam_para', font=Font(bold=True), number_format=PARA_FORMATI),
+    ]
+
+
+def fark_stili(deger):
+    """Farkı işaretine göre renklendir (negatif kırmızı, pozitif yeşil)"""
+    if deger < 0:
+        return 'para_negatif'
+    if deger > 0:
+        return 'para_pozitif'
+    return 'para'
+
+
+class ExcelRaporu:
+    """
+    Sabit bellekli Excel raporu. Satırlar write-only modda sayfalara akıtılır,
+    stiller adlandırılmış stil olarak bir kez tanımlanıp tüm hücrelerde paylaşılır.
+
+    Kullanım:
+        rapor = ExcelRaporu()
+        rapor.sayfa_yaz("Sayfa", [("BAŞLIK", 20, 'metin'), ("TUTAR", 12, 'para')], satirlar)
+        return rapor.yanit("rapor.xlsx")
+    """
+
+    def __init__(self):
+        self.wb = openpyxl.Workbook(write_only=True)
+        for stil in _stilleri_olustur():
+            self.wb.add_named_style(stil)
+
+    def _hucre(self, ws, deger, stil):
+        hucre = openpyxl.cell.WriteOnlyCell(ws, value=deger)
+        if stil:
+            hucre.style = stil
+        return hucre
+
+    def sayfa_yaz(self, baslik, sutunlar, satirlar, baslik_stili='baslik', toplam_satiri=None):
+        """
+        sutunlar: (başlık, genişlik, stil) demetleri; stil bir ad ya da
+                  değere göre stil adı döndüren fonksiyon olabilir
+        satirlar: her biri sütun sırasında değerler içeren yineleyici (generator olabilir)
+        toplam_satiri: sütun indeksi (0'dan) -> değer sözlüğü; metinlere 'toplam_metin',
+                       sayılara 'toplam_para' stili uygulanır
+        """
+        ws = self.wb.create_sheet(title=baslik)
+
+        # Sütun genişlikleri write-only modda satırlardan önce ayarlanmalı
+        for indeks, (_, genislik, _) in enumerate(sutunlar, 1):
+            if genislik:
+                ws.column_dimensions[openpyxl.utils.get_column_letter(indeks)].width = genislik
+
+        ws.append([self._hucre(ws, sutun[0], baslik_stili) for sutun in sutunlar])
+
+        stiller = [sutun[2] for sutun in sutunlar]
+        satir_sayisi = 0
+        for satir in satirlar:
+            ws.append([
+                self._hucre(ws, deger, stil(deger) if callable(stil) else stil)
+                for deger, stil in zip(satir, stiller)
+            ])
+            satir_sayisi += 1
+
+        if toplam_satiri:
+            son_sutun = max(toplam_satiri)
+            ws.append([
+                self._hucre(ws, toplam_satiri[i],
+                            'toplam_metin' if isinstance(toplam_satiri[i], str) else 'toplam_para')
+                if i in toplam_satiri else None
+                for i in range(son_sutun + 1)
+            ])
+
+        return satir_sayisi
+
+    def yanit(self, dosya_adi):
+        """Çalışma kitabını geçici dosyaya yaz ve parça parça gönderilen bir yanıt döndür"""
+        dosya = tempfile.SpooledTemporaryFile(max_size=BELLEK_SINIRI)
+        self.wb.save(dosya)
+        dosya.seek(0)
+        return send_file(
+            dosya,
+            mimetype=XLSX_MIMETYPE,
+            as_attachment=True,
+            download_name=dosya_adi
+        )
@@ -0,0 +1,176 @@
+# mysql_db.py - MySQL bağlantı havuzu ve sorgu yardımcıları
+import threading
+import logging
+
+import config
+from cache_utils import ReferansCache
+from yukleme_utils import TembelModul
+
+# pandas ve SQLAlchemy ilk sorguda yüklenir (modülü içe aktarmak ucuz kalsın)
+pd = TembelModul('pandas')
+sqlalchemy = TembelModul('sqlalchemy')
+
+logger = logging.getLogger(__name__)
+
+# Havuz ayarları (config.py içinde tanımlı değilse varsayılanlar kullanılır)
+POOL_SIZE = getattr(config, 'MYSQL_POOL_SIZE', 10)
+POOL_MAX_OVERFLOW = getattr(config, 'MYSQL_POOL_MAX_OVERFLOW', 10)
+POOL_TIMEOUT = getattr(config, 'MYSQL_POOL_TIMEOUT', 30)
+POOL_RECYCLE = getattr(config, 'MYSQL_POOL_RECYCLE', 1800)
+POOL_PRE_PING = getattr(config, 'MYSQL_POOL_PRE_PING', True)
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """
+    Süreç genelinde paylaşılan SQLAlchemy engine'i döndür.
+    İlk çağrıda oluşturulur, sonraki çağrılar aynı havuzu kullanır.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = sqlalchemy.create_engine(
+                    f"mysql+mysqlconnector://{config.MYSQL_USER}:{config.MYSQL_PASSWORD}@{config.MYSQL_HOST}/{config.MYSQL_DB}",
+                    poolclass=sqlalchemy.pool.QueuePool,
+                    pool_size=POOL_SIZE,
+                    max_overflow=POOL_MAX_OVERFLOW,
+                    pool_timeout=POOL_TIMEOUT,
+                    pool_recycle=POOL_RECYCLE,
+                    pool_pre_ping=POOL_PRE_PING
+                )
+                logger.info(
+                    f"MySQL bağlantı havuzu oluşturuldu: size={POOL_SIZE}, "
+                    f"overflow={POOL_MAX_OVERFLOW}, recycle={POOL_RECYCLE}s"
+                )
+    return _engine
+
+
+def execute_query(query, params=None):
+    """Güvenli parametreli sorgu çalıştırma (paylaşılan havuz üzerinden)"""
+    try:
+        if params:
+            return pd.read_sql(sqlalchemy.text(query), get_engine(), params=params)
+        return pd.read_sql(sqlalchemy.text(query), get_engine())
+    except Exception as e:
+        logger.error(f"Database query error: {e}")
+        raise
+
+
+def pool_durumu():
+    """Bağlantı havuzu istatistiklerini döndür (izleme için)"""
+    if _engine is None:
+        return {
+            "olusturuldu": False,
+            "pool_size": POOL_SIZE,
+            "max_overflow": POOL_MAX_OVERFLOW
+        }
+
+    pool = _engine.pool
+    return {
+        "olusturuldu": True,
+        "pool_size": pool.size(),
+        "max_overflow": POOL_MAX_OVERFLOW,
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "recycle": POOL_RECYCLE,
+        "pre_ping": POOL_PRE_PING,
+        "durum": pool.status()
+    }
+
+
+def dispose_engine():
+    """Havuzu kapat (süreç sonlanırken veya fork sonrası kullanılır)"""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+
+
+# ==================== REFERANS VERİ ÖNBELLEĞİ ====================
+# Şubeler, hekimler ve ödeme şekilleri ayda birkaç kez değişir ama günde binlerce
+# kez okunur; bu yüzden TTL'li süreç içi önbellekten servis edilir.
+
+REFERANS_CACHE_TTL = getattr(config, 'REFERANS_CACHE_TTL', 600)
+
+referans_cache = ReferansCache(ttl=REFERANS_CACHE_TTL)
+
+
+def _aktif_mi(seri):
+    """SILINDI kolonunu (varchar 'true'/'false') aktiflik maskesine çevir"""
+    return seri.astype(str).str.strip().str.lower() == 'false'
+
+
+def _subeler_df():
+    return referans_cache.getir('subeler', lambda: execute_query(
+        "SELECT CARI_ID, UNVANI FROM subeler WHERE SILINDI = :silindi ORDER BY UNVANI",
+        {"silindi": "false"}
+    ))
+
+
+def _doktorlar_df():
+    # Silinmiş hekimler de tutulur; isim eşleştirmelerinde eski kayıtlar gerekebiliyor
+    return referans_cache.getir('doktorlar', lambda: execute_query("""
+        SELECT CARI_ID, ADI, SOYADI,
+               CONCAT(IFNULL(ADI,''), ' ', IFNULL(SOYADI,'')) AS HEKIM_ADI,
+               SUBE_ID, IFNULL(PRIMYUZDE, 0) AS PRIMYUZDE, SILINDI
+        FROM kartdoktor
+        ORDER BY ADI, SOYADI
+    """))
+
+
+def _odeme_sekilleri_df():
+    return referans_cache.getir('odeme_sekilleri', lambda: execute_query(
+        "SELECT ROWNO, ADI FROM odeme_sekilleri"
+    ))
+
+
+def subeleri_getir():
+    """Aktif şubeler - [{id, name}] formatında"""
+    df = _subeler_df()
+    return [{"id": row.CARI_ID, "name": row.UNVANI} for row in df.itertuples(index=False)]
+
+
+def subeleri_getir_cari():
+    """Aktif şubeler - şablonların beklediği [{CARI_ID, UNVANI}] formatında"""
+    return _subeler_df().to_dict('records')
+
+
+def doktorlari_getir(sube_ids=None):
+    """
+    Aktif hekimleri DataFrame olarak döndür (önbellekteki kopyası).
+    sube_ids verilirse yalnızca o şubelerin hekimleri döner.
+    """
+    df = _doktorlar_df()
+    df = df[_aktif_mi(df['SILINDI'])]
+    if sube_ids:
+        sube_ids = {str(s) for s in sube_ids}
+        df = df[df['SUBE_ID'].astype(str).isin(sube_ids)]
+    df = df.copy()
+    df['PRIMYUZDE'] = df['PRIMYUZDE'].fillna(0)
+    return df
+
+
+def doktor_adlari_getir(doktor_ids=None):
+    """Hekim ID -> ad sözlüğü (silinmiş hekimler dahil)"""
+    df = _doktorlar_df()
+    if doktor_ids is not None:
+        doktor_ids = {str(d) for d in doktor_ids}
+        df = df[df['CARI_ID'].astype(str).isin(doktor_ids)]
+    return dict(zip(df['CARI_ID'].astype(str), df['HEKIM_ADI']))
+
+
+def doktor_bilgileri_getir():
+    """Tüm hekimlerin (silinmiş dahil) ID, ad ve şube bilgisi"""
+    return _doktorlar_df()[['CARI_ID', 'HEKIM_ADI', 'SUBE_ID']].copy()
+
+
+def odeme_sekilleri_getir():
+    """Ödeme şekli ROWNO -> küçük harfli ad sözlüğü"""
+    df = _odeme_sekilleri_df()
+    return {row.ROWNO: str(row.ADI or 'bilinmeyen').strip().lower()
+            for row in df.itertuples(index=False)}
@@ -0,0 +1,247 @@
+# prim_kayit_benchmark.py - Büyük prim kaydının kaydetme süresi ölçümü
+#
+# Kullanım: python prim_kayit_benchmark.py [--satir 5000] [--tekrar 5] [--yazici 4]
+#
+# Geçici bir klasörde boş prim veritabanı oluşturur; eski satır satır INSERT
+# yöntemi (varsayılan journal, her satır ayrı execute) ile PrimDatabase.prim_hesaplama_kaydet
+# (WAL + executemany + tek transaction) sürelerini karşılaştırır. Kayıt sırasında aynı
+# dosyayı okuyan bir iş parçacığının (cari ekranları gibi) en uzun bekleme süresi de ölçülür.
+#
+# Eşzamanlı yazıcı ölçümü: kayıtlar sürerken birkaç iş parçacığı aynı dosyaya sürekli cari
+# hareketi ekler. Eski tarafta değişiklik öncesi cari_hareket_ekle (kendi bağlantısı, ertelenmiş
+# transaction), yeni tarafta CariDatabase.cari_hareket_ekle (tek yazıcı iş parçacığı) kullanılır.
+# "database is locked" hataları, en uzun hareket süresi ve cari bakiyesinin hareket
+# toplamıyla tutarlılığı raporlanır.
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def ornek_prim(satir_sayisi):
+    prim_data = {
+        'doktor_id': '1001', 'doktor_adi': 'Test Hekim', 'sube_id': '1', 'sube_adi': 'Merkez',
+        'donem_baslangic': '2025-01-01', 'donem_bitis': '2025-01-31',
+        'brut_tahsilat': 0, 'toplam_kesinti': 0, 'net_tahsilat': 0, 'toplam_gider': 0,
+        'prim_matrah': 0, 'prim_orani': 30, 'hesaplanan_prim': 0,
+        'olusturan_kullanici': 'benchmark'
+    }
+    tahsilatlar = [
+        {
+            'tahsilat_id': str(i), 'hasta_adi': f'Hasta {i}', 'hasta_id': str(50000 + i),
+            'tarih': '2025-01-15', 'brut_tutar': 1500.0, 'odeme_sekli': 'pos',
+            'kdv_orani': 10, 'kdv_tutari': 150.0, 'taksit_sayisi': 1,
+            'taksit_kesinti_orani': 12, 'taksit_kesinti_tutari': 180.0, 'net_tutar': 1320.0
+        }
+        for i in range(satir_sayisi)
+    ]
+    giderler = [
+        {'hasta_adi': f'Hasta {i}', 'hasta_id': '', 'kategori': 'Malzeme', 'tutar': 100.0, 'aciklama': ''}
+        for i in range(satir_sayisi // 10)
+    ]
+    return prim_data, tahsilatlar, giderler
+
+
+def eski_yontemle_kaydet(db_path, prim_data, tahsilatlar, giderler):
+    """Değişiklik öncesi yöntem: varsayılan journal, her satır için ayrı INSERT"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO prim_hesaplamalari
+        (doktor_id, doktor_adi, sube_id, sube_adi, donem_baslangic, donem_bitis,
+         brut_tahsilat, toplam_kesinti, net_tahsilat, toplam_gider, prim_matrah,
+         prim_orani, hesaplanan_prim, olusturan_kullanici, notlar)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', tuple(prim_data[k] for k in (
+        'doktor_id', 'doktor_adi', 'sube_id', 'sube_adi', 'donem_baslangic', 'donem_bitis',
+        'brut_tahsilat', 'toplam_kesinti', 'net_tahsilat', 'toplam_gider', 'prim_matrah',
+        'prim_orani', 'hesaplanan_prim', 'olusturan_kullanici')) + ('',))
+    prim_id = cursor.lastrowid
+    for d in tahsilatlar:
+        cursor.execute('''
+            INSERT INTO prim_tahsilat_detaylari
+            (prim_id, tahsilat_id, hasta_adi, hasta_id, tarih, brut_tutar, odeme_sekli,
+             kdv_orani, kdv_tutari, taksit_sayisi, taksit_kesinti_orani,
+             taksit_kesinti_tutari, net_tutar)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (prim_id, d['tahsilat_id'], d['hasta_adi'], d['hasta_id'], d['tarih'], d['brut_tutar'],
+              d['odeme_sekli'], d['kdv_orani'], d['kdv_tutari'], d['taksit_sayisi'],
+              d['taksit_kesinti_orani'], d['taksit_kesinti_tutari'], d['net_tutar']))
+    for g in giderler:
+        cursor.execute('''
+            INSERT INTO prim_giderler (prim_id, hasta_adi, hasta_id, kategori, tutar, aciklama)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (prim_id, g['hasta_adi'], g['hasta_id'], g['kategori'], g['tutar'], g['aciklama']))
+    conn.commit()
+    conn.close()
+    return prim_id
+
+
+def eski_cari_hareket_ekle(db_path, cari_id, tutar):
+    """Değişiklik öncesi cari_hareket_ekle: oku-hesapla-yaz, ertelenmiş transaction, 30 sn bekleme"""
+    conn = sqlite3.connect(db_path, timeout=30.0)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT bakiye FROM cari_hesaplar WHERE id = ?', (cari_id,))
+        bakiye = cursor.fetchone()[0] + tutar
+        cursor.execute('''
+            INSERT INTO cari_hareketler
+            (cari_id, hareket_tipi, tarih, aciklama, alacak, borc, bakiye, olusturan_kullanici)
+            VALUES (?, 'benchmark', '2025-01-31', '', ?, 0, ?, 'benchmark')
+        ''', (cari_id, tutar, bakiye))
+        cursor.execute('UPDATE cari_hesaplar SET bakiye = ? WHERE id = ?', (bakiye, cari_id))
+        conn.commit()
+        return True
+    except sqlite3.OperationalError as e:
+        if "locked" in str(e):
+            conn.rollback()
+            return False
+        raise
+    finally:
+        conn.close()
+
+
+def cari_olustur(db_path):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.execute(
+        "INSERT INTO cari_hesaplar (cari_kodu, cari_adi, bakiye) VALUES ('BENCH', 'Benchmark', 0)"
+    )
+    conn.commit()
+    cari_id = cursor.lastrowid
+    conn.close()
+    return cari_id
+
+
+def yazicilarla_olc(kaydet, hareket_ekle, tekrar, yazici_sayisi, db_path, cari_id):
+    """
+    Kayıtlar sürerken yazici_sayisi iş parçacığı sürekli cari hareketi ekler.
+    Dönüş: kilit hatası sayısı, başarılı hareket sayısı, en uzun hareket süresi (sn),
+    bakiye hareket toplamıyla tutarlı mı
+    """
+    durdur = threading.Event()
+    kilit = threading.Lock()
+    sonuc = {'hata': 0, 'basarili': 0, 'en_uzun': 0.0}
+
+    def yazici():
+        while not durdur.is_set():
+            baslangic = time.perf_counter()
+            basarili = hareket_ekle(1.0)
+            sure = time.perf_counter() - baslangic
+            with kilit:
+                sonuc['basarili' if basarili else 'hata'] += 1
+                sonuc['en_uzun'] = max(sonuc['en_uzun'], sure)
+
+    is_parcaciklari = [threading.Thread(target=yazici) for _ in range(yazici_sayisi)]
+    for is_parcacigi in is_parcaciklari:
+        is_parcacigi.start()
+    try:
+        for _ in range(tekrar):
+            kaydet()
+    finally:
+        durdur.set()
+        for is_parcacigi in is_parcaciklari:
+            is_parcacigi.join()
+
+    conn = sqlite3.connect(db_path)
+    bakiye = conn.execute("SELECT bakiye FROM cari_hesaplar WHERE id = ?", (cari_id,)).fetchone()[0]
+    toplam = conn.execute("SELECT IFNULL(SUM(alacak - borc), 0) FROM cari_hareketler WHERE cari_id = ?",
+                          (cari_id,)).fetchone()[0]
+    conn.close()
+    sonuc['tutarli'] = abs(bakiye - toplam) < 1e-6
+    return sonuc
+
+
+def olc(fonksiyon, tekrar, db_path):
+    """Kaydetme sürelerini ve eşzamanlı okuyucunun en uzun bekleme süresini ölç"""
+    durdur = threading.Event()
+    okuma_sureleri = []
+
+    def okuyucu():
+        conn = sqlite3.connect(db_path, timeout=30)
+        while not durdur.is_set():
+            baslangic = time.perf_counter()
+            conn.execute("SELECT COUNT(*) FROM prim_hesaplamalari").fetchone()
+            okuma_sureleri.append(time.perf_counter() - baslangic)
+        conn.close()
+
+    is_parcacigi = threading.Thread(target=okuyucu)
+    is_parcacigi.start()
+    sureler = []
+    try:
+        for _ in range(tekrar):
+            baslangic = time.perf_counter()
+            fonksiyon()
+            sureler.append(time.perf_counter() - baslangic)
+    finally:
+        durdur.set()
+        is_parcacigi.join()
+    return statistics.median(sureler), min(sureler), max(okuma_sureleri, default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prim kaydetme benchmark'ı")
+    parser.add_argument('--satir', type=int, default=5000, help='Tahsilat satırı sayısı')
+    parser.add_argument('--tekrar', type=int, default=5, help='Ölçüm tekrarı')
+    parser.add_argument('--yazici', type=int, default=4, help='Eşzamanlı cari hareketi ekleyen iş parçacığı sayısı')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as klasor:
+        # database global örnekleri ilk kullanımda çalışma klasöründeki data/ altında oluşur
+        os.chdir(klasor)
+        os.makedirs('data')
+        from database import PrimDatabase, CariDatabase, sqlite_baglantilari
+
+        prim_data, tahsilatlar, giderler = ornek_prim(args.satir)
+
+        eski_db = os.path.join(klasor, 'eski', 'prim.db')
+        os.makedirs(os.path.dirname(eski_db))
+        PrimDatabase(eski_db)
+        # Dosyayı açık tutan tek bağlantı yöneticininki; journal modu onun üzerinden değiştirilir
+        conn = sqlite_baglantilari.baglanti(eski_db)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+
+        yeni = PrimDatabase(os.path.join(klasor, 'yeni', 'prim.db'))
+
+        yeni_db = os.path.join(klasor, 'yeni', 'prim.db')
+        eski_medyan, eski_min, eski_okuma = olc(
+            lambda: eski_yontemle_kaydet(eski_db, prim_data, tahsilatlar, giderler), args.tekrar, eski_db)
+        yeni_medyan, yeni_min, yeni_okuma = olc(
+            lambda: yeni.prim_hesaplama_kaydet(prim_data, tahsilatlar, giderler), args.tekrar, yeni_db)
+
+        print(f"{args.satir} tahsilat + {len(giderler)} gider satırı, {args.tekrar} tekrar")
+        print(f"  satır satır INSERT      : medyan {eski_medyan * 1000:8.1f} ms  (en iyi {eski_min * 1000:.1f} ms)"
+              f"  okuyucu en uzun bekleme {eski_okuma * 1000:.1f} ms")
+        print(f"  executemany + WAL (yeni): medyan {yeni_medyan * 1000:8.1f} ms  (en iyi {yeni_min * 1000:.1f} ms)"
+              f"  okuyucu en uzun bekleme {yeni_okuma * 1000:.1f} ms")
+        print(f"  hızlanma: {eski_medyan / yeni_medyan:.1f}x")
+
+        eski_cari = cari_olustur(eski_db)
+        yeni_cari = cari_olustur(yeni_db)
+        yeni_cari_db = CariDatabase(yeni_db)
+        eski_yazma = yazicilarla_olc(
+            lambda: eski_yontemle_kaydet(eski_db, prim_data, tahsilatlar, giderler),
+            lambda tutar: eski_cari_hareket_ekle(eski_db, eski_cari, tutar),
+            args.tekrar, args.yazici, eski_db, eski_cari)
+        yeni_yazma = yazicilarla_olc(
+            lambda: yeni.prim_hesaplama_kaydet(prim_data, tahsilatlar, giderler),
+            lambda tutar: yeni_cari_db.cari_hareket_ekle({
+                'cari_id': yeni_cari, 'hareket_tipi': 'benchmark', 'tarih': '2025-01-31',
+                'alacak': tutar, 'borc': 0, 'olusturan_kullanici': 'benchmark'}) is not None,
+            args.tekrar, args.yazici, yeni_db, yeni_cari)
+
+        print(f"Kayıt sırasında {args.yazici} eşzamanlı cari_hareket_ekle yazıcısı")
+        for ad, sonuc in (("eski (ayrı bağlantılar)", eski_yazma), ("yeni (tek yazıcı)     ", yeni_yazma)):
+            print(f"  {ad}: {sonuc['basarili']:6d} hareket, {sonuc['hata']:4d} 'database is locked',"
+                  f" en uzun {sonuc['en_uzun'] * 1000:8.1f} ms, bakiye {'tutarlı' if sonuc['tutarli'] else 'TUTARSIZ'}")
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,46 +1,58 @@
 # prim_utils.py - Prim hesaplama yardımcı fonksiyonları
+from dataclasses import dataclass
 from datetime import datetime
-import pandas as pd
-from sqlalchemy import create_engine, text
+import config
+from mysql_db import get_engine, subeleri_getir
+from yukleme_utils import TembelModul
 import logging
 
 logger = logging.getLogger(__name__)
 
-def get_hekim_tahsilat_verileri(doktor_id, baslangic_tarihi, bitis_tarihi, mysql_config):
+# numpy/pandas/SQLAlchemy ilk hesaplamada yüklenir
+np = TembelModul('numpy')
+pd = TembelModul('pandas')
+sqlalchemy = TembelModul('sqlalchemy')
+
+# Prim tahsilat sorgusu; {kosul} hekim ya da şube filtresiyle doldurulur
+HEKIM_TAHSILAT_SORGUSU = """
+SELECT
+    T1.ROWNO as tahsilat_id,
+    T1.TARIH,
+    T1.ALACAK AS TUTAR,
+    T1.HEDEF_ILGILI_DOKTOR_ID AS DOKTOR_ID,
+    CONCAT(IFNULL(DR.ADI,''),' ',IFNULL(DR.SOYADI,'')) AS HEKIM_ADI,
+    IFNULL(DR.PRIMYUZDE,0) AS PRIMYUZDE,
+    CONCAT(IFNULL(H.ADI,''),' ',IFNULL(H.SOYADI,'')) AS HASTA_ADI,
+    H.HASTA_ID,
+    LOWER(IFNULL(OS.ADI,'nakit')) AS ODEME_SEKLI,
+    IFNULL(SB.UNVANI,'') AS SUBE_ADI,
+    DR.SUBE_ID,
+    T1.HAREKETTYPE
+FROM carihareket AS T1
+LEFT JOIN kartdoktor AS DR ON T1.HEDEF_ILGILI_DOKTOR_ID = DR.CARI_ID
+LEFT JOIN odeme_sekilleri AS OS ON T1.ISLEM_TIPI_ID = OS.ROWNO
+LEFT JOIN subeler AS SB ON T1.SUBE_ID = SB.CARI_ID
+LEFT JOIN karthasta AS H ON T1.KAYNAK_CARI_ID = H.HASTA_ID
+WHERE T1.SILINDI = 'False'
+  AND T1.ALACAK > 0
+  AND T1.HAREKETTYPE IN ('T','ST','CT')
+  AND T1.TARIH BETWEEN :start_date AND :end_date
+  AND {kosul}
+ORDER BY {siralama}
+"""
+
+
+def get_hekim_tahsilat_verileri(doktor_id, baslangic_tarihi, bitis_tarihi, mysql_config=None):
     """
     Belirli hekim için tahsilat verilerini çek
+    (mysql_config geriye dönük uyumluluk için duruyor; paylaşılan havuz kullanılır)
     """
     try:
-        engine = create_engine(
-            f"mysql+mysqlconnector://{mysql_config['user']}:{mysql_config['password']}@{mysql_config['host']}/{mysql_config['db']}"
-        )
         
-        query = """
-        SELECT
-            T1.ROWNO as tahsilat_id,
-            T1.TARIH,
-            T1.ALACAK AS TUTAR,
-            T1.HEDEF_ILGILI_DOKTOR_ID AS DOKTOR_ID,
-            CONCAT(IFNULL(DR.ADI,''),' ',IFNULL(DR.SOYADI,'')) AS HEKIM_ADI,
-            IFNULL(DR.PRIMYUZDE,0) AS PRIMYUZDE,
-            CONCAT(IFNULL(H.ADI,''),' ',IFNULL(H.SOYADI,'')) AS HASTA_ADI,
-            H.HASTA_ID,
-            LOWER(IFNULL(OS.ADI,'nakit')) AS ODEME_SEKLI,
-            IFNULL(SB.UNVANI,'') AS SUBE_ADI,
-            DR.SUBE_ID,
-            T1.HAREKETTYPE
-        FROM carihareket AS T1
-        LEFT JOIN kartdoktor AS DR ON T1.HEDEF_ILGILI_DOKTOR_ID = DR.CARI_ID
-        LEFT JOIN odeme_sekilleri AS OS ON T1.ISLEM_TIPI_ID = OS.ROWNO
-        LEFT JOIN subeler AS SB ON T1.SUBE_ID = SB.CARI_ID
-        LEFT JOIN karthasta AS H ON T1.KAYNAK_CARI_ID = H.HASTA_ID
-        WHERE T1.SILINDI = 'False'
-          AND T1.ALACAK > 0
-          AND T1.HAREKETTYPE IN ('T','ST','CT')
-          AND T1.TARIH BETWEEN :start_date AND :end_date
-          AND T1.HEDEF_ILGILI_DOKTOR_ID = :doktor_id
-        ORDER BY T1.TARIH DESC
-        """
+        query = HEKIM_TAHSILAT_SORGUSU.format(
+            kosul="T1.HEDEF_ILGILI_DOKTOR_ID = :doktor_id",
+            siralama="T1.TARIH DESC"
+        )
         
         params = {
             'start_date': baslangic_tarihi,
@@ -48,8 +60,7 @@ def get_hekim_tahsilat_verileri(doktor_id, baslangic_tarihi, bitis_tarihi, mysql
             'doktor_id': doktor_id
         }
         
-        df = pd.read_sql(text(query), engine, params=params)
-        engine.dispose()
+        df = pd.read_sql(sqlalchemy.text(query), get_engine(), params=params)
         
         return df.to_dict('records') if not df.empty else []
         
@@ -57,81 +68,109 @@ def get_hekim_tahsilat_verileri(doktor_id, baslangic_tarihi, bitis_tarihi, mysql
         logger.error(f"Tahsilat verileri getirme hatası: {e}")
         raise
 
-def kesinti_hesapla(odeme_sekli, tutar, taksit_sayisi=1, kdv_orani=0,
-                    taksit_kesinti_orani=0, fatura_kesildi=False, pos_pesin_orani=2):
+
+def toplu_tahsilat_verilerini_getir(baslangic_tarihi, bitis_tarihi, sube_ids=None):
     """
-    Ödeme şekline göre kesinti hesapla
+    Dönemdeki tüm hekimlerin tahsilatlarını tek sorguda çek.
+    sube_ids verilirse hekimin bağlı olduğu şubeye (kartdoktor.SUBE_ID) göre süzülür.
     """
-    kesintiler = {
-        'kdv_tutari': 0,
-        'pos_komisyon_tutari': 0,
-        'taksit_kesinti_tutari': 0,
-        'toplam_kesinti': 0,
-        'net_tutar': tutar
-    }
+    kosul = "T1.HEDEF_ILGILI_DOKTOR_ID IS NOT NULL"
+    params = {'start_date': baslangic_tarihi, 'end_date': bitis_tarihi}
+    
+    if sube_ids:
+        placeholders = []
+        for i, sube_id in enumerate(sube_ids):
+            params[f'sube_{i}'] = sube_id
+            placeholders.append(f':sube_{i}')
+        kosul += f" AND DR.SUBE_ID IN ({','.join(placeholders)})"
+    
+    query = HEKIM_TAHSILAT_SORGUSU.format(kosul=kosul, siralama="T1.HEDEF_ILGILI_DOKTOR_ID, T1.TARIH DESC")
+    return pd.read_sql(sqlalchemy.text(query), get_engine(), params=params)
 
-    odeme_sekli = odeme_sekli.lower().strip()
+
+# KDV kesintisi uygulanan ödeme şekilleri (fatura kesildiyse tümüne uygulanır)
+KDV_ODEME_SEKILLERI = ['pos', 'banka', 'havale', 'eft']
+
+
+def _sayi_dizisi(degerler, adet, dtype=float):
+    """Skaler ya da liste değeri adet uzunluğunda NumPy dizisine çevir"""
+    return np.broadcast_to(np.asarray(degerler, dtype=dtype), (adet,))
+
+
+def kesinti_hesapla_toplu(odeme_sekilleri, tutarlar, taksit_sayilari=1, kdv_oranlari=0,
+                          taksit_kesinti_oranlari=0, fatura_kesildi=False, pos_pesin_oranlari=2):
+    """
+    Tahsilat listesinin kesintilerini kolonlar üzerinden tek NumPy geçişinde hesapla.
+    Oran/taksit/fatura parametreleri liste ya da tüm satırlar için tek değer olabilir.
+    Kurallar kesinti_hesapla ile aynıdır; sonuç aynı anahtarlarla dizi olarak döner.
+    """
+    odeme = np.char.strip(np.char.lower(np.asarray(odeme_sekilleri, dtype=str)))
+    adet = odeme.shape[0]
+    tutar = _sayi_dizisi(tutarlar, adet)
+    taksit = _sayi_dizisi(taksit_sayilari, adet, dtype=np.int64)
+    kdv_orani = _sayi_dizisi(kdv_oranlari, adet)
+    taksit_orani = _sayi_dizisi(taksit_kesinti_oranlari, adet)
+    pos_orani = _sayi_dizisi(pos_pesin_oranlari, adet)
+    if np.ndim(fatura_kesildi):
+        fatura = np.fromiter((bool(f) for f in fatura_kesildi), dtype=bool, count=adet)
+    else:
+        fatura = np.full(adet, bool(fatura_kesildi))
+
+    pos = odeme == 'pos'
 
     # KDV hesaplama (sadece pos ve banka/havale için, fatura kesildiyse de eklenir)
-    if fatura_kesildi or odeme_sekli in ['pos', 'banka', 'havale', 'eft']:
-        kesintiler['kdv_tutari'] = tutar * (kdv_orani / 100)
+    kdv = np.where(fatura | np.isin(odeme, KDV_ODEME_SEKILLERI), tutar * (kdv_orani / 100), 0.0)
 
-    # POS peşin (taksitsiz) için ek %2 komisyon
-    if odeme_sekli == 'pos' and taksit_sayisi == 1:
-        kesintiler['pos_komisyon_tutari'] = tutar * (pos_pesin_orani / 100)
+    # POS peşin (taksitsiz) için ek komisyon
+    pos_komisyon = np.where(pos & (taksit == 1), tutar * (pos_orani / 100), 0.0)
 
     # POS taksitli işlem → modalda verilen taksit oranı uygulanır
-    if odeme_sekli == 'pos' and taksit_sayisi > 1:
-        kalan_tutar = tutar - kesintiler['kdv_tutari']
-        kesintiler['taksit_kesinti_tutari'] = kalan_tutar * (taksit_kesinti_orani / 100)
-
-    # Toplam kesinti
-    kesintiler['toplam_kesinti'] = (
-        kesintiler['kdv_tutari'] +
-        kesintiler['pos_komisyon_tutari'] +
-        kesintiler['taksit_kesinti_tutari']
-    )
-    kesintiler['net_tutar'] = tutar - kesintiler['toplam_kesinti']
+    taksit_kesinti = np.where(pos & (taksit > 1), (tutar - kdv) * (taksit_orani / 100), 0.0)
 
-    return kesintiler
+    toplam = kdv + pos_komisyon + taksit_kesinti
+    return {
+        'kdv_tutari': kdv,
+        'pos_komisyon_tutari': pos_komisyon,
+        'taksit_kesinti_tutari': taksit_kesinti,
+        'toplam_kesinti': toplam,
+        'net_tutar': tutar - toplam
+    }
 
-def prim_hesapla(tahsilat_listesi, giderler_listesi, prim_orani):
+
+def kesinti_hesapla(odeme_sekli, tutar, taksit_sayisi=1, kdv_orani=0,
+                    taksit_kesinti_orani=0, fatura_kesildi=False, pos_pesin_orani=2):
     """
-    Toplam prim hesaplama
+    Ödeme şekline göre kesinti hesapla (tek tahsilat için kesinti_hesapla_toplu sarmalayıcısı)
     """
-    hesaplama = {
-        'brut_tahsilat': 0,
-        'toplam_kesinti': 0,
-        'net_tahsilat': 0,
-        'toplam_gider': 0,
-        'prim_matrah': 0,
-        'hesaplanan_prim': 0
-    }
-    
-    # Tahsilat hesaplamaları
-    for tahsilat in tahsilat_listesi:
-        hesaplama['brut_tahsilat'] += tahsilat['brut_tutar']
-        hesaplama['toplam_kesinti'] += (
-            tahsilat.get('kdv_tutari', 0) + 
-            tahsilat.get('pos_komisyon_tutari', 0) + 
-            tahsilat.get('taksit_kesinti_tutari', 0)
-        )
-        hesaplama['net_tahsilat'] += tahsilat['net_tutar']
-    
-    # Gider hesaplamaları
-    for gider in giderler_listesi:
-        hesaplama['toplam_gider'] += gider['tutar']
-    
-    # Prim matrahı
-    hesaplama['prim_matrah'] = hesaplama['net_tahsilat'] - hesaplama['toplam_gider']
-    
-    # Prim hesaplama
-    if hesaplama['prim_matrah'] > 0:
-        hesaplama['hesaplanan_prim'] = hesaplama['prim_matrah'] * (prim_orani / 100)
-    else:
-        hesaplama['hesaplanan_prim'] = 0
-    
-    return hesaplama
+    sonuc = kesinti_hesapla_toplu([odeme_sekli], [tutar], taksit_sayisi, kdv_orani,
+                                  taksit_kesinti_orani, fatura_kesildi, pos_pesin_orani)
+    return {anahtar: float(deger[0]) for anahtar, deger in sonuc.items()}
+
+
+def tahsilat_kesintilerini_hesapla(tahsilat_listesi):
+    """
+    /api/prim/hesapla'dan gelen tahsilat listesini kolonlara ayırıp kesintileri toplu hesapla.
+    Her tahsilat sözlüğü kesinti alanlarıyla birleştirilmiş yeni bir sözlük olarak döner.
+    """
+    if not tahsilat_listesi:
+        return []
+
+    sonuc = kesinti_hesapla_toplu(
+        [t['odeme_sekli'] for t in tahsilat_listesi],
+        [float(t['brut_tutar']) for t in tahsilat_listesi],
+        [int(t.get('taksit_sayisi', 1)) for t in tahsilat_listesi],
+        [float(t.get('kdv_orani', 0)) for t in tahsilat_listesi],
+        [float(t.get('taksit_kesinti_orani', 0)) for t in tahsilat_listesi],
+        [t.get('fatura_kesildi', False) for t in tahsilat_listesi],
+        [float(t.get('pos_komisyon_orani', 0)) for t in tahsilat_listesi]
+    )
+
+    anahtarlar = list(sonuc)
+    kolonlar = [sonuc[anahtar].tolist() for anahtar in anahtarlar]
+    return [
+        {**tahsilat, **dict(zip(anahtarlar, degerler))}
+        for tahsilat, degerler in zip(tahsilat_listesi, zip(*kolonlar))
+    ]
 
 def odeme_sekli_analiz(odeme_sekli):
     """
@@ -176,71 +215,528 @@ def odeme_sekli_analiz(odeme_sekli):
         ayarlar['varsayilan_taksit_kesinti_orani'] = 0
         
     return ayarlar
-def prim_hesapla(tahsilat_listesi, giderler_listesi, prim_orani, 
+
+
+# ==================== PRİM HESAPLAMA ÇEKİRDEĞİ (KURUŞ) ====================
+
+KURUS = 100
+# Prim oranı yüzde değerinin 100 katı tamsayı olarak tutulur (12.5% -> 1250)
+ORAN_CARPANI = 100
+
+
+def kurusa_cevir(tutarlar):
+    """TL tutarlarını (liste/dizi) en yakın kuruşa yuvarlanmış int64 dizisine çevir"""
+    return np.rint(np.asarray(tutarlar, dtype=float) * KURUS).astype(np.int64)
+
+
+def tl_degeri(kurus):
+    """Kuruş tamsayısını TL değerine çevir"""
+    return int(kurus) / KURUS
+
+
+def tutar_kolonu(kayitlar, alan='tutar'):
+    """Sözlük listesindeki tutar alanını kuruş dizisi olarak al (eksik/boş -> 0)"""
+    return kurusa_cevir([float(kayit.get(alan) or 0) for kayit in kayitlar or []])
+
+
+def kurus_toplami(kayitlar, alan='tutar'):
+    """Sözlük listesindeki tutar alanının kuruş toplamı"""
+    return int(tutar_kolonu(kayitlar, alan).sum())
+
+
+@dataclass(frozen=True, slots=True)
+class PrimSonucu:
+    """Prim hesaplama sonucu; tüm tutarlar kuruş cinsinden tamsayıdır"""
+    brut_tahsilat: int
+    toplam_kesinti: int
+    net_ciro_ek: int
+    net_tahsilat: int
+    toplam_gider: int
+    prim_matrah: int
+    prim_orani: float
+    hakedis_ek: int
+    hesaplanan_prim: int
+
+    def sozluk(self):
+        """API ve kayıt için eski alan adlarıyla TL değerleri"""
+        return {
+            'brut_tahsilat': tl_degeri(self.brut_tahsilat),
+            'toplam_kesinti': tl_degeri(self.toplam_kesinti),
+            'net_tahsilat': tl_degeri(self.net_tahsilat),
+            'net_ciro_ek': tl_degeri(self.net_ciro_ek),
+            'toplam_gider': tl_degeri(self.toplam_gider),
+            'prim_matrah': tl_degeri(self.prim_matrah),
+            'hesaplanan_prim': tl_degeri(self.hesaplanan_prim),
+            'hakedis_ek': tl_degeri(self.hakedis_ek)
+        }
+
+
+def prim_cekirdegi(brut_kurus, net_kurus, gider_kurus, prim_orani,
+                   net_ciro_kurus=None, hakedis_kurus=None):
+    """
+    Kuruş dizileri üzerinden prim hesapla.
+    brut_kurus/net_kurus: tahsilat başına brüt ve kesinti sonrası net tutarlar
+    gider_kurus: gider tutarları; net_ciro_kurus net tahsilata, hakedis_kurus
+    hesaplanan prime doğrudan eklenir.
+    """
+    brut = int(np.sum(brut_kurus, dtype=np.int64))
+    net = int(np.sum(net_kurus, dtype=np.int64))
+    net_ciro_ek = int(np.sum(net_ciro_kurus, dtype=np.int64)) if net_ciro_kurus is not None else 0
+    hakedis_ek = int(np.sum(hakedis_kurus, dtype=np.int64)) if hakedis_kurus is not None else 0
+    toplam_gider = int(np.sum(gider_kurus, dtype=np.int64))
+
+    net_tahsilat = net + net_ciro_ek
+    prim_matrah = net_tahsilat - toplam_gider
+
+    # Prim = matrah x oran, kuruşa yarım yukarı yuvarlanır (matrah pozitifse)
+    oran = int(round(float(prim_orani) * ORAN_CARPANI))
+    bolen = 100 * ORAN_CARPANI
+    prim = (prim_matrah * oran + bolen // 2) // bolen if prim_matrah > 0 else 0
+
+    return PrimSonucu(
+        brut_tahsilat=brut,
+        toplam_kesinti=brut - net,
+        net_ciro_ek=net_ciro_ek,
+        net_tahsilat=net_tahsilat,
+        toplam_gider=toplam_gider,
+        prim_matrah=prim_matrah,
+        prim_orani=float(prim_orani),
+        hakedis_ek=hakedis_ek,
+        hesaplanan_prim=prim + hakedis_ek
+    )
+
+
+def prim_sonucu_hesapla(tahsilat_listesi, giderler_listesi, prim_orani,
+                        net_ciro_eklemeleri=None, hakedis_eklemeleri=None):
+    """Tahsilat/gider sözlük listelerinden PrimSonucu üret"""
+    return prim_cekirdegi(
+        tutar_kolonu(tahsilat_listesi, 'brut_tutar'),
+        tutar_kolonu(tahsilat_listesi, 'net_tutar'),
+        tutar_kolonu(giderler_listesi),
+        prim_orani,
+        tutar_kolonu(net_ciro_eklemeleri),
+        tutar_kolonu(hakedis_eklemeleri)
+    )
+
+
+def prim_hesapla(tahsilat_listesi, giderler_listesi, prim_orani,
                  net_ciro_eklemeleri=None, hakedis_eklemeleri=None):
     """
-    Toplam prim hesaplama - GÜNCELLENMİŞ
+    Toplam prim hesaplama (kuruş çekirdeği üzerinden, sonuç TL sözlüğü)
     """
-    hesaplama = {
-        'brut_tahsilat': 0,
-        'toplam_kesinti': 0,
-        'net_tahsilat': 0,
-        'net_ciro_ek': 0,  # YENİ
-        'toplam_gider': 0,
-        'prim_matrah': 0,
-        'hesaplanan_prim': 0,
-        'hakedis_ek': 0  # YENİ
+    return prim_sonucu_hesapla(tahsilat_listesi, giderler_listesi, prim_orani,
+                               net_ciro_eklemeleri, hakedis_eklemeleri).sozluk()
+
+
+def toplu_prim_taslaklari_hazirla(baslangic_tarihi, bitis_tarihi, taksit_oranlari, sube_ids=None, olusturan=None):
+    """
+    Şube(ler)deki tüm hekimler için varsayılan kesintilerle prim taslakları üret.
+    Kesintiler prim ekranındaki kuralla (taslak_kesinti_orani, peşin taksit ve prim
+    ayarlarındaki taksit_oranlari) hesaplanır; aynı hekim ve dönem elle hesaplandığında
+    aynı prim çıkar. Tahsilatlar tek sorguda çekilir, kesintiler tek geçişte hesaplanır
+    ve hekim bazında kuruş çekirdeğiyle toplanır.
+
+    Returns: (prim_data, tahsilat_detaylari) demetleri listesi
+    """
+    df = toplu_tahsilat_verilerini_getir(baslangic_tarihi, bitis_tarihi, sube_ids)
+    if df.empty:
+        return []
+    
+    odeme = df['ODEME_SEKLI'].fillna('').astype(str)
+    oran = kesinti_oranlari_toplu(odeme.to_numpy(), np.ones(len(df), dtype=np.int64), taksit_oranlari)
+    brut_kurus = kurusa_cevir(df['TUTAR'].astype(float).to_numpy())
+    kesinti_kurus = np.rint(brut_kurus * oran / 100).astype(np.int64)
+    net_kurus = brut_kurus - kesinti_kurus
+    
+    # KDV bilgisi taslaktaki gibi yalnızca kayıt içindir (fatura kesilen ödeme şekilleri %10)
+    faturasiz = np.logical_or.reduce([
+        np.char.find(np.char.lower(odeme.to_numpy().astype(str)), sekil) >= 0
+        for sekil in FATURASIZ_ODEME_SEKILLERI
+    ])
+    kdv_orani = np.where(faturasiz, 0.0, 10.0)
+    kdv_kurus = np.rint(brut_kurus * kdv_orani / 100).astype(np.int64)
+    
+    hasta_ids = df['HASTA_ID'].astype(object)
+    detaylar = pd.DataFrame({
+        'tahsilat_id': df['tahsilat_id'].astype(str),
+        'hasta_adi': df['HASTA_ADI'].fillna('').str.strip(),
+        'hasta_id': hasta_ids.where(hasta_ids.notna(), None),
+        'tarih': df['TARIH'].astype(str),
+        'brut_tutar': brut_kurus / KURUS,
+        'odeme_sekli': odeme.to_numpy(),
+        'kdv_orani': kdv_orani,
+        'kdv_tutari': kdv_kurus / KURUS,
+        'taksit_sayisi': 1,
+        'taksit_kesinti_orani': oran,
+        'taksit_kesinti_tutari': kesinti_kurus / KURUS,
+        'net_tutar': net_kurus / KURUS
+    })
+    
+    sube_adlari = {str(sube['id']): sube['name'] for sube in subeleri_getir()}
+    bos_gider = np.zeros(0, dtype=np.int64)
+    
+    taslaklar = []
+    for doktor_id, satirlar in df.groupby('DOKTOR_ID', sort=False).indices.items():
+        ilk = df.iloc[satirlar[0]]
+        sube_id = '' if pd.isna(ilk['SUBE_ID']) else str(ilk['SUBE_ID'])
+        sonuc = prim_cekirdegi(brut_kurus[satirlar], net_kurus[satirlar], bos_gider, float(ilk['PRIMYUZDE']))
+        
+        prim_data = {
+            **sonuc.sozluk(),
+            'doktor_id': str(doktor_id),
+            'doktor_adi': str(ilk['HEKIM_ADI']).strip(),
+            'sube_id': sube_id,
+            'sube_adi': sube_adlari.get(sube_id, ilk['SUBE_ADI'] or ''),
+            'donem_baslangic': baslangic_tarihi,
+            'donem_bitis': bitis_tarihi,
+            'prim_orani': sonuc.prim_orani,
+            'olusturan_kullanici': olusturan,
+            'notlar': 'Toplu prim hesaplaması (varsayılan kesintiler)'
+        }
+        taslaklar.append((prim_data, detaylar.iloc[satirlar].to_dict('records')))
+    
+    logger.info(f"Toplu prim: {len(df)} tahsilat, {len(taslaklar)} hekim")
+    return taslaklar
+
+
+# ==================== SUNUCU TARAFI PRİM TASLAKLARI ====================
+
+# Taslakların geçerlilik süresi (saniye)
+PRIM_TASLAK_SURESI = getattr(config, 'PRIM_TASLAK_SURESI', 4 * 3600)
+
+# Taslakta tutulan gider/ekleme listeleri
+TASLAK_GIDER_ALANLARI = ('laboratuvar_giderleri', 'implant_giderleri', 'diger_giderler',
+                         'net_ciro_eklemeleri', 'hakedis_eklemeleri')
+
+FATURASIZ_ODEME_SEKILLERI = ('nakit', 'çek', 'senet')
+VARSAYILAN_POS_KESINTISI = 12
+BANKA_KESINTISI = 10.0
+
+
+def _kdv_durumu(fatura_var):
+    return {
+        'fatura_var': fatura_var,
+        'kdv_orani': 10 if fatura_var else 0,
+        'aciklama': 'Fatura kesildi - %10 KDV' if fatura_var else 'Fatura kesilmedi'
     }
+
+
+def taslak_kesinti_orani(odeme_sekli, taksit_sayisi, taksit_oranlari):
+    """
+    Tahsilat satırının toplam kesinti oranı (prim ekranındaki varsayılan kural).
+    taksit_oranlari: taksit sayısı -> kesinti oranı (prim ayarlarından)
+    """
+    odeme = (odeme_sekli or '').lower()
     
-    # Tahsilat hesaplamaları
-    for tahsilat in tahsilat_listesi:
-        hesaplama['brut_tahsilat'] += tahsilat['brut_tutar']
-        hesaplama['toplam_kesinti'] += (
-            tahsilat.get('kdv_tutari', 0) + 
-            tahsilat.get('pos_komisyon_tutari', 0) + 
-            tahsilat.get('taksit_kesinti_tutari', 0)
-        )
-        hesaplama['net_tahsilat'] += tahsilat['net_tutar']
+    if any(sekil in odeme for sekil in FATURASIZ_ODEME_SEKILLERI):
+        return 0
+    if 'pos' in odeme or 'kredi' in odeme:
+        return taksit_oranlari.get(int(taksit_sayisi), VARSAYILAN_POS_KESINTISI)
+    if 'banka' in odeme or 'havale' in odeme:
+        return BANKA_KESINTISI
+    return 0
+
+
+def kesinti_oranlari_toplu(odeme_sekilleri, taksit_sayilari, taksit_oranlari,
+                           pos_orani=VARSAYILAN_POS_KESINTISI, banka_orani=BANKA_KESINTISI):
+    """
+    taslak_kesinti_orani kuralının kolonlar üzerinden tek geçişte uygulanması.
+    pos_orani tabloda olmayan taksit sayıları, banka_orani banka/havale için kullanılır.
+    """
+    odeme = np.char.lower(np.asarray(odeme_sekilleri, dtype=str))
+    taksit = np.clip(np.asarray(taksit_sayilari, dtype=np.int64), 0, None)
     
-    # NET CİRO EKLEMELERİ - Doğrudan net ciroya eklenir
-    if net_ciro_eklemeleri:
-        for ekleme in net_ciro_eklemeleri:
-            hesaplama['net_ciro_ek'] += ekleme['tutar']
+    def iceren(*sekiller):
+        return np.logical_or.reduce([np.char.find(odeme, sekil) >= 0 for sekil in sekiller])
     
-    # Net tahsilatı güncelle
-    hesaplama['net_tahsilat'] += hesaplama['net_ciro_ek']
+    # Taksit sayısı -> oran tablosu (tabloda olmayanlar varsayılan POS oranı)
+    en_buyuk = int(max(taksit.max(initial=0), max(taksit_oranlari, default=0)))
+    tablo = np.full(en_buyuk + 1, float(pos_orani))
+    for taksit_sayisi, oran in taksit_oranlari.items():
+        if int(taksit_sayisi) >= 0:
+            tablo[int(taksit_sayisi)] = float(oran)
     
-    # Gider hesaplamaları
-    for gider in giderler_listesi:
-        hesaplama['toplam_gider'] += gider['tutar']
+    return np.select(
+        [iceren(*FATURASIZ_ODEME_SEKILLERI), iceren('pos', 'kredi'), iceren('banka', 'havale')],
+        [0.0, tablo[taksit], float(banka_orani)],
+        default=0.0
+    )
+
+
+def _json_degeri(deger):
+    return None if deger is None or pd.isna(deger) else deger
+
+
+def taslak_olustur(tahsilat_verileri, doktor_id, baslangic_tarihi, bitis_tarihi, taksit_oranlari):
+    """get_hekim_tahsilat_verileri kayıtlarından varsayılan ayarlı prim taslağı oluştur"""
+    satirlar = []
+    for index, tahsilat in enumerate(tahsilat_verileri):
+        odeme_sekli = tahsilat.get('ODEME_SEKLI') or ''
+        fatura_var = not any(sekil in odeme_sekli.lower() for sekil in FATURASIZ_ODEME_SEKILLERI)
+        tarih = _json_degeri(tahsilat.get('TARIH'))
+        
+        satirlar.append({
+            'index': index,
+            'tahsilat_id': _json_degeri(tahsilat.get('tahsilat_id')),
+            'TARIH': pd.Timestamp(tarih).strftime('%Y-%m-%d') if tarih is not None else None,
+            'HASTA_ADI': tahsilat.get('HASTA_ADI'),
+            'HASTA_ID': _json_degeri(tahsilat.get('HASTA_ID')),
+            'ODEME_SEKLI': odeme_sekli,
+            'TUTAR': float(tahsilat['TUTAR']),
+            'kdv_durumu': _kdv_durumu(fatura_var),
+            'fatura_kesildi': fatura_var,
+            'taksit_sayisi': 1,
+            'kesinti_orani': taslak_kesinti_orani(odeme_sekli, 1, taksit_oranlari)
+        })
     
-    # Prim matrahı
-    hesaplama['prim_matrah'] = hesaplama['net_tahsilat'] - hesaplama['toplam_gider']
+    ilk = tahsilat_verileri[0]
+    taslak = {
+        'doktor_id': str(doktor_id),
+        'doktor_adi': ilk['HEKIM_ADI'],
+        'sube_id': _json_degeri(ilk['SUBE_ID']),
+        'sube_adi': ilk['SUBE_ADI'],
+        'prim_orani': float(ilk['PRIMYUZDE'] or 0),
+        'donem_baslangic': baslangic_tarihi,
+        'donem_bitis': bitis_tarihi,
+        'tahsilatlar': satirlar
+    }
+    taslak.update({alan: [] for alan in TASLAK_GIDER_ALANLARI})
+    return taslak
+
+
+def taslak_duzenle(taslak, duzenlemeler, taksit_oranlari):
+    """
+    Satır düzenlemelerini (index + fatura_kesildi / taksit_sayisi) taslağa uygula.
+    Returns: değişen satırlar
+    """
+    satirlar = taslak['tahsilatlar']
+    degisenler = []
     
-    # Prim hesaplama
-    if hesaplama['prim_matrah'] > 0:
-        hesaplama['hesaplanan_prim'] = hesaplama['prim_matrah'] * (prim_orani / 100)
-    else:
-        hesaplama['hesaplanan_prim'] = 0
+    for duzenleme in duzenlemeler or []:
+        index = int(duzenleme['index'])
+        if not 0 <= index < len(satirlar):
+            raise ValueError(f"Geçersiz tahsilat satırı: {index}")
+        satir = satirlar[index]
+        
+        if 'fatura_kesildi' in duzenleme:
+            fatura_var = bool(duzenleme['fatura_kesildi'])
+            satir['kdv_durumu'] = _kdv_durumu(fatura_var)
+            satir['fatura_kesildi'] = fatura_var
+        if 'taksit_sayisi' in duzenleme:
+            satir['taksit_sayisi'] = max(int(duzenleme['taksit_sayisi']), 1)
+        
+        satir['kesinti_orani'] = taslak_kesinti_orani(satir['ODEME_SEKLI'], satir['taksit_sayisi'], taksit_oranlari)
+        degisenler.append(satir)
+    
+    return degisenler
+
+
+def _taslak_kesintileri(satirlar):
+    """Taslak satırlarının brüt ve kesinti tutarları (kuruş dizileri)"""
+    brut = tutar_kolonu(satirlar, 'TUTAR')
+    oran = np.asarray([satir['kesinti_orani'] for satir in satirlar], dtype=float)
+    kesinti = np.rint(brut * oran / 100).astype(np.int64)
+    return brut, kesinti
+
+
+def taslak_hesapla(taslak):
+    """Taslağın güncel prim sonucunu kuruş çekirdeğiyle hesapla"""
+    brut, kesinti = _taslak_kesintileri(taslak['tahsilatlar'])
+    giderler = taslak['laboratuvar_giderleri'] + taslak['implant_giderleri'] + taslak['diger_giderler']
+    return prim_cekirdegi(
+        brut,
+        brut - kesinti,
+        tutar_kolonu(giderler),
+        taslak['prim_orani'],
+        tutar_kolonu(taslak['net_ciro_eklemeleri']),
+        tutar_kolonu(taslak['hakedis_eklemeleri'])
+    )
+
+
+def hesaplama_ozeti(sonuc):
+    """PrimSonucu'nu primler.js'in beklediği alan adlarıyla döndür"""
+    ozet = sonuc.sozluk()
+    return {
+        'toplam_brut': ozet['brut_tahsilat'],
+        'toplam_kesinti': ozet['toplam_kesinti'],
+        'net_tahsilat': ozet['net_tahsilat'],
+        'net_ciro_ek': ozet['net_ciro_ek'],
+        'toplam_gider': ozet['toplam_gider'],
+        'prim_matrahi': ozet['prim_matrah'],
+        'prim_orani': sonuc.prim_orani,
+        'hesaplanan_prim': ozet['hesaplanan_prim'],
+        'hakedis_ek': ozet['hakedis_ek']
+    }
+
+
+def taslak_tahsilat_detaylari(taslak):
+    """Taslak satırlarını prim_tahsilat_detaylari kayıt biçimine çevir"""
+    satirlar = taslak['tahsilatlar']
+    brut, kesinti = _taslak_kesintileri(satirlar)
+    kdv_orani = np.asarray([satir['kdv_durumu']['kdv_orani'] for satir in satirlar], dtype=float)
+    kdv = np.rint(brut * kdv_orani / 100).astype(np.int64)
+    
+    return [
+        {
+            'tahsilat_id': satir.get('tahsilat_id') or f"taslak-{satir['index']}",
+            'hasta_adi': satir.get('HASTA_ADI') or '',
+            'hasta_id': satir.get('HASTA_ID'),
+            'tarih': satir.get('TARIH'),
+            'brut_tutar': tl_degeri(brut_tutar),
+            'odeme_sekli': satir.get('ODEME_SEKLI'),
+            'kdv_orani': satir['kdv_durumu']['kdv_orani'],
+            'kdv_tutari': tl_degeri(kdv_tutari),
+            'taksit_sayisi': satir.get('taksit_sayisi', 1),
+            'taksit_kesinti_orani': satir.get('kesinti_orani', 0),
+            'taksit_kesinti_tutari': tl_degeri(kesinti_tutari),
+            'net_tutar': tl_degeri(brut_tutar - kesinti_tutari)
+        }
+        for satir, brut_tutar, kdv_tutari, kesinti_tutari in zip(satirlar, brut, kdv, kesinti)
+    ]
+
+
+# ==================== PRİM SİMÜLASYONU ====================
+
+def _simulasyon_ozeti(sonuc):
+    ozet = sonuc.sozluk()
+    return {
+        'brut_tahsilat': ozet['brut_tahsilat'],
+        'toplam_kesinti': ozet['toplam_kesinti'],
+        'net_tahsilat': ozet['net_tahsilat'],
+        'toplam_gider': ozet['toplam_gider'],
+        'prim_matrah': ozet['prim_matrah'],
+        'prim_orani': sonuc.prim_orani,
+        'hesaplanan_prim': ozet['hesaplanan_prim']
+    }
+
+
+def prim_simulasyonu(veriler, taksit_oranlari, prim_orani=None, prim_oranlari=None,
+                     pos_orani=VARSAYILAN_POS_KESINTISI, banka_orani=BANKA_KESINTISI):
+    """
+    Kayıtlı primleri varsayımsal ayarlarla yeniden hesapla (hiçbir şey yazılmaz).
     
-    # HAK EDİŞ EKLEMELERİ - Doğrudan hesaplanan prime eklenir
-    if hakedis_eklemeleri:
-        for ekleme in hakedis_eklemeleri:
-            hesaplama['hakedis_ek'] += ekleme['tutar']
+    veriler: PrimDatabase.simulasyon_verilerini_getir çıktısı
+    prim_orani: tüm hekimler için oran; prim_oranlari: doktor_id -> oran (öncelikli)
     
-    # Toplam hak edişi güncelle
-    hesaplama['hesaplanan_prim'] += hesaplama['hakedis_ek']
+    Tüm tahsilat satırlarının kesintileri tek geçişte hesaplanır, prim bazında toplanır
+    ve her prim kuruş çekirdeğinden geçirilir. Dönüş: prim ve hekim bazında kayıtlı /
+    simüle değerler ile farklar.
+    """
+    primler = veriler['primler']
+    tahsilatlar = veriler['tahsilatlar']
+    prim_oranlari = {str(d): float(o) for d, o in (prim_oranlari or {}).items()}
+    
+    # Tahsilat satırlarını prim sırasına eşle ve kesintileri tek geçişte hesapla
+    sira = {prim['id']: i for i, prim in enumerate(primler)}
+    prim_indeksi = np.fromiter((sira[p] for p in tahsilatlar['prim_id']), dtype=np.int64,
+                               count=len(tahsilatlar['prim_id']))
+    brut = kurusa_cevir(tahsilatlar['brut_tutar'])
+    oran = kesinti_oranlari_toplu(tahsilatlar['odeme_sekli'], tahsilatlar['taksit_sayisi'],
+                                  taksit_oranlari, pos_orani, banka_orani)
+    kesinti = np.rint(brut * oran / 100).astype(np.int64)
+    
+    brut_toplam = np.zeros(len(primler), dtype=np.int64)
+    net_toplam = np.zeros(len(primler), dtype=np.int64)
+    np.add.at(brut_toplam, prim_indeksi, brut)
+    np.add.at(net_toplam, prim_indeksi, brut - kesinti)
     
-    return hesaplama    
+    prim_sonuclari = []
+    hekimler = {}
+    for i, prim in enumerate(primler):
+        doktor_id = str(prim['doktor_id'])
+        yeni_oran = prim_oranlari.get(doktor_id, prim_orani if prim_orani is not None else prim['prim_orani'])
+        sonuc = prim_cekirdegi(
+            brut_toplam[i:i + 1], net_toplam[i:i + 1],
+            [veriler['giderler'].get(prim['id'], 0)], yeni_oran,
+            [veriler['net_ciro'].get(prim['id'], 0)], [veriler['hakedis'].get(prim['id'], 0)]
+        )
+        simule = _simulasyon_ozeti(sonuc)
+        kayitli_prim = float(prim['hesaplanan_prim'] or 0)
+        fark = round(simule['hesaplanan_prim'] - kayitli_prim, 2)
+        
+        prim_sonuclari.append({
+            'prim_id': prim['id'],
+            'doktor_id': doktor_id,
+            'doktor_adi': prim['doktor_adi'],
+            'sube_id': prim['sube_id'],
+            'sube_adi': prim['sube_adi'],
+            'donem_baslangic': prim['donem_baslangic'],
+            'donem_bitis': prim['donem_bitis'],
+            'kayitli': {
+                'net_tahsilat': float(prim['net_tahsilat'] or 0),
+                'prim_orani': float(prim['prim_orani'] or 0),
+                'hesaplanan_prim': kayitli_prim
+            },
+            'simule': simule,
+            'fark': fark
+        })
+        
+        hekim = hekimler.setdefault(doktor_id, {
+            'doktor_id': doktor_id, 'doktor_adi': prim['doktor_adi'], 'prim_sayisi': 0,
+            'kayitli_prim': 0, 'simule_prim': 0, 'fark': 0
+        })
+        hekim['prim_sayisi'] += 1
+        hekim['kayitli_prim'] += kurusa_cevir(kayitli_prim).item()
+        hekim['simule_prim'] += sonuc.hesaplanan_prim
+    
+    hekim_sonuclari = []
+    for hekim in hekimler.values():
+        hekim['fark'] = tl_degeri(hekim['simule_prim'] - hekim['kayitli_prim'])
+        hekim['kayitli_prim'] = tl_degeri(hekim['kayitli_prim'])
+        hekim['simule_prim'] = tl_degeri(hekim['simule_prim'])
+        hekim_sonuclari.append(hekim)
+    hekim_sonuclari.sort(key=lambda h: h['fark'])
+    
+    kayitli = sum(h['kayitli_prim'] for h in hekim_sonuclari)
+    simule = sum(h['simule_prim'] for h in hekim_sonuclari)
+    return {
+        'primler': prim_sonuclari,
+        'hekimler': hekim_sonuclari,
+        'toplam': {
+            'prim_sayisi': len(primler),
+            'tahsilat_sayisi': len(brut),
+            'kayitli_prim': round(kayitli, 2),
+            'simule_prim': round(simule, 2),
+            'fark': round(simule - kayitli, 2)
+        }
+    }
+
+
+def _kurus_dagilimi(anahtarlar, kurus):
+    """Anahtar bazında adet ve TL toplamı ({anahtar: {'adet', 'tutar'}})"""
+    if not len(anahtarlar):
+        return {}
+    benzersiz, indeksler = np.unique(np.asarray(anahtarlar, dtype=str), return_inverse=True)
+    adetler = np.bincount(indeksler)
+    toplamlar = np.zeros(len(benzersiz), dtype=np.int64)
+    np.add.at(toplamlar, indeksler, kurus)
+    return {
+        anahtar: {'adet': int(adet), 'tutar': tl_degeri(toplam)}
+        for anahtar, adet, toplam in zip(benzersiz.tolist(), adetler, toplamlar)
+    }
 
 def prim_rapor_hazirla(prim_detay):
     """
-    Prim raporu için veri hazırla
+    Prim raporu için veri hazırla (özet ve dağılımlar kuruş çekirdeğiyle hesaplanır)
     """
     prim_data = prim_detay['prim_data']
     tahsilat_detaylari = prim_detay['tahsilat_detaylari']
-    giderler = prim_detay['giderler']
-    
+    giderler = prim_detay.get('giderler', prim_detay.get('diger_giderler', []))
+    tum_giderler = (list(giderler) + list(prim_detay.get('laboratuvar_giderleri', [])) +
+                    list(prim_detay.get('implant_giderleri', [])))
+
+    net_kurus = tutar_kolonu(tahsilat_detaylari, 'net_tutar')
+    gider_kurus = tutar_kolonu(giderler)
+    sonuc = prim_cekirdegi(
+        tutar_kolonu(tahsilat_detaylari, 'brut_tutar'),
+        net_kurus,
+        tutar_kolonu(tum_giderler),
+        prim_data['prim_orani'],
+        tutar_kolonu(prim_detay.get('net_ciro_eklemeleri')),
+        tutar_kolonu(prim_detay.get('hakedis_eklemeleri'))
+    )
+
+    ozet = sonuc.sozluk()
     rapor = {
         'baslik_bilgileri': {
             'doktor_adi': prim_data['doktor_adi'],
@@ -249,40 +745,21 @@ def prim_rapor_hazirla(prim_detay):
             'rapor_tarihi': datetime.now().strftime('%d.%m.%Y %H:%M')
         },
         'ozet_bilgiler': {
-            'brut_tahsilat': prim_data['brut_tahsilat'],
-            'toplam_kesinti': prim_data['toplam_kesinti'],
-            'net_tahsilat': prim_data['net_tahsilat'],
-            'toplam_gider': prim_data['toplam_gider'],
-            'prim_matrah': prim_data['prim_matrah'],
+            'brut_tahsilat': ozet['brut_tahsilat'],
+            'toplam_kesinti': ozet['toplam_kesinti'],
+            'net_tahsilat': ozet['net_tahsilat'],
+            'toplam_gider': ozet['toplam_gider'],
+            'prim_matrah': ozet['prim_matrah'],
             'prim_orani': prim_data['prim_orani'],
-            'hesaplanan_prim': prim_data['hesaplanan_prim']
+            'hesaplanan_prim': ozet['hesaplanan_prim']
         },
         'tahsilat_detaylari': tahsilat_detaylari,
         'giderler': giderler,
-        'odeme_sekli_dagilimi': {},
-        'gider_kategori_dagilimi': {}
+        # Ödeme şekli ve gider kategori dağılımları
+        'odeme_sekli_dagilimi': _kurus_dagilimi([t['odeme_sekli'] for t in tahsilat_detaylari], net_kurus),
+        'gider_kategori_dagilimi': _kurus_dagilimi([g['kategori'] for g in giderler], gider_kurus)
     }
-    
-    # Ödeme şekli dağılımı
-    odeme_sekilleri = {}
-    for tahsilat in tahsilat_detaylari:
-        sekil = tahsilat['odeme_sekli']
-        if sekil not in odeme_sekilleri:
-            odeme_sekilleri[sekil] = {'adet': 0, 'tutar': 0}
-        odeme_sekilleri[sekil]['adet'] += 1
-        odeme_sekilleri[sekil]['tutar'] += tahsilat['net_tutar']
-    rapor['odeme_sekli_dagilimi'] = odeme_sekilleri
-    
-    # Gider kategori dağılımı
-    gider_kategorileri = {}
-    for gider in giderler:
-        kategori = gider['kategori']
-        if kategori not in gider_kategorileri:
-            gider_kategorileri[kategori] = {'adet': 0, 'tutar': 0}
-        gider_kategorileri[kategori]['adet'] += 1
-        gider_kategorileri[kategori]['tutar'] += gider['tutar']
-    rapor['gider_kategori_dagilimi'] = gider_kategorileri
-    
+
     return rapor
 
 def validate_prim_data(prim_data, tahsilat_listesi, giderler_listesi):
@@ -311,13 +788,14 @@ def validate_prim_data(prim_data, tahsilat_listesi, giderler_listesi):
     if not tahsilat_listesi:
         errors.append("En az bir tahsilat kaydı gereklidir")
     
-    # Tutar kontrolü
-    for i, tahsilat in enumerate(tahsilat_listesi):
-        if tahsilat.get('brut_tutar', 0) <= 0:
+    # Tutar kontrolü (kuruş cinsinden; 0,004 TL gibi değerler de sıfır sayılır)
+    try:
+        for i in np.flatnonzero(tutar_kolonu(tahsilat_listesi, 'brut_tutar') <= 0):
             errors.append(f"Tahsilat {i+1} tutarı pozitif olmalıdır")
-    
-    for i, gider in enumerate(giderler_listesi):
-        if gider.get('tutar', 0) <= 0:
+        
+        for i in np.flatnonzero(tutar_kolonu(giderler_listesi) <= 0):
             errors.append(f"Gider {i+1} tutarı pozitif olmalıdır")
+    except (TypeError, ValueError):
+        errors.append("Tutar alanları sayısal olmalıdır")
     
     return errors
\ No newline at end of file
@@ -5,6 +5,8 @@ let currentPage = 1;
 let totalPages = 1;
 let currentPrimId = null;
 let filters = {};
+let nextCursor = null;  // Bir sonraki sayfa için keyset imleci (olusturma_tarihi|id)
+let pageCursor = null;
 
 document.addEventListener('DOMContentLoaded', function() {
     initializePage();
@@ -121,8 +123,10 @@ function loadPrimList() {
         doktor_id: document.getElementById('filterDoktor').value,
         baslangic: document.getElementById('filterBaslangic').value,
         bitis: document.getElementById('filterBitis').value,
-        page: currentPage
+        page: currentPage,
+        imlec: pageCursor
     };
+    pageCursor = null;
     
     const queryString = Object.keys(filters)
         .filter(key => filters[key])
@@ -254,6 +258,7 @@ function setupPagination(pagination) {
     ul.innerHTML = '';
     currentPage = pagination.current_page;
     totalPages = pagination.total_pages;
+    nextCursor = pagination.next_cursor || null;
     
     if (currentPage > 1) {
         ul.appendChild(createPageItem('«', 1));
@@ -286,6 +291,8 @@ function createPageItem(text, page, active = false) {
         a.onclick = (e) => {
             e.preventDefault();
             if (page !== currentPage) {
+                // Sonraki sayfaya geçişte OFFSET yerine imleç kullanılır
+                pageCursor = page === currentPage + 1 ? nextCursor : null;
                 currentPage = page;
                 loadPrimList();
             }
@@ -3,6 +3,7 @@ console.log('Primler.js yüklendi - Net Ciro ve Hak Ediş Desteği Aktif');
 
 // Global değişkenler
 let tahsilatVerileri = [];
+let taslakId = null; // Sunucu tarafı prim taslağı (tahsilat listesi sunucuda tutulur)
 let laboratuvarGiderleri = [];
 let implantGiderleri = [];
 let digerGiderler = [];
@@ -447,7 +448,7 @@ function proceedWithTahsilatLoading(hekimId, baslangic, bitis) {
     const loadingSpinner = document.getElementById('loadingSpinner');
     if (loadingSpinner) loadingSpinner.style.display = 'block';
     
-    fetch('/api/prim/tahsilat_getir', {
+    fetch('/api/prim/taslak', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -459,16 +460,10 @@ function proceedWithTahsilatLoading(hekimId, baslangic, bitis) {
     .then(response => response.json())
     .then(data => {
         if (data.success) {
+            // Varsayılan KDV/taksit/kesinti ayarları sunucuda uygulanmış olarak gelir
+            taslakId = data.taslak_id;
             tahsilatVerileri = data.data || [];
             
-            tahsilatVerileri.forEach((item, index) => {
-                item.index = index;
-                item.kdv_durumu = getDefaultKdvDurumu(item.ODEME_SEKLI);
-                item.taksit_sayisi = getDefaultTaksitSayisi(item.ODEME_SEKLI);
-                item.kesinti_orani = getDefaultKesinti(item.ODEME_SEKLI, item.taksit_sayisi);
-                item.fatura_kesildi = item.kdv_durumu.fatura_var;
-            });
-            
             displayTahsilatData();
             showTahsilatPanel();
         } else {
@@ -484,36 +479,27 @@ function proceedWithTahsilatLoading(hekimId, baslangic, bitis) {
     });
 }
 
-function getDefaultKdvDurumu(odemeSekli) {
-    const odeme = odemeSekli.toLowerCase();
-    
-    if (odeme.includes('nakit') || odeme.includes('çek') || odeme.includes('senet')) {
-        return { fatura_var: false, kdv_orani: 0, aciklama: 'Fatura kesilmedi' };
-    } else {
-        return { fatura_var: true, kdv_orani: 10, aciklama: 'Fatura kesildi - %10 KDV' };
-    }
-}
-
-function getDefaultTaksitSayisi(odemeSekli) {
-    return 1;
-}
-
-function getDefaultKesinti(odemeSekli, taksitSayisi) {
-    const odeme = odemeSekli.toLowerCase();
-    
-    if (odeme.includes('nakit')) return 0;
-    if (odeme.includes('çek') || odeme.includes('senet')) return 0;
-    
-    const posKesinti = parseFloat(document.querySelector(`#taksitSayisi option[value="${taksitSayisi}"]`)?.dataset.oran) || 12;
-    
-    if (odeme.includes('pos') || odeme.includes('kredi')) {
-        return posKesinti;
-    }
-    if (odeme.includes('banka') || odeme.includes('havale')) {
-        return 10.0; 
+// Taslağa yalnızca değişiklikleri gönder, güncel hesaplamayı al
+function taslakGuncelle(degisiklikler) {
+    if (!taslakId) {
+        return Promise.reject(new Error('Önce tahsilatları yükleyin'));
     }
     
-    return 0;
+    return fetch(`/api/prim/taslak/${taslakId}/guncelle`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(degisiklikler)
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            throw new Error(data.error || 'Bilinmeyen hata');
+        }
+        (data.satirlar || []).forEach(satir => {
+            tahsilatVerileri[satir.index] = satir;
+        });
+        return data;
+    });
 }
 
 function displayTahsilatData() {
@@ -611,25 +597,18 @@ function kdvDurumKaydet() {
     if (currentEditIndex >= 0 && currentEditIndex < tahsilatVerileri.length) {
         const faturaKesildi = document.getElementById('faturaEvet').checked;
         
-        tahsilatVerileri[currentEditIndex].kdv_durumu = {
-            fatura_var: faturaKesildi,
-            kdv_orani: faturaKesildi ? 10 : 0,
-            aciklama: faturaKesildi ? 'Fatura kesildi - %10 KDV' : 'Fatura kesilmedi'
-        };
-        
-        tahsilatVerileri[currentEditIndex].fatura_kesildi = faturaKesildi;
-        
-        tahsilatVerileri[currentEditIndex].kesinti_orani = getDefaultKesinti(
-            tahsilatVerileri[currentEditIndex].ODEME_SEKLI, 
-            tahsilatVerileri[currentEditIndex].taksit_sayisi
-        );
-        
-        displayTahsilatData();
-        
-        const kdvModal = bootstrap.Modal.getInstance(document.getElementById('kdvModal'));
-        kdvModal.hide();
-        
-        showAlert('KDV durumu güncellendi', 'success');
+        taslakGuncelle({
+            duzenlemeler: [{ index: currentEditIndex, fatura_kesildi: faturaKesildi }]
+        })
+        .then(() => {
+            displayTahsilatData();
+            
+            const kdvModal = bootstrap.Modal.getInstance(document.getElementById('kdvModal'));
+            kdvModal.hide();
+            
+            showAlert('KDV durumu güncellendi', 'success');
+        })
+        .catch(error => showAlert('KDV durumu güncellenemedi: ' + error.message, 'danger'));
     }
 }
 
@@ -673,18 +652,20 @@ function updateTaksitBilgi() {
 function taksitAyarlarKaydet() {
     if (currentEditIndex >= 0 && currentEditIndex < tahsilatVerileri.length) {
         const taksitSayisi = parseInt(document.getElementById('taksitSayisi').value);
-        const selectedOption = document.getElementById('taksitSayisi').selectedOptions[0];
-        const kesinti = parseFloat(selectedOption ? selectedOption.dataset.oran : 12);
         
-        tahsilatVerileri[currentEditIndex].taksit_sayisi = taksitSayisi;
-        tahsilatVerileri[currentEditIndex].kesinti_orani = kesinti;
-        
-        displayTahsilatData();
-        
-        const taksitModal = bootstrap.Modal.getInstance(document.getElementById('taksitModal'));
-        taksitModal.hide();
-        
-        showAlert('Taksit ayarları güncellendi', 'success');
+        // Kesinti oranı sunucuda prim ayarlarındaki taksit oranından belirlenir
+        taslakGuncelle({
+            duzenlemeler: [{ index: currentEditIndex, taksit_sayisi: taksitSayisi }]
+        })
+        .then(() => {
+            displayTahsilatData();
+            
+            const taksitModal = bootstrap.Modal.getInstance(document.getElementById('taksitModal'));
+            taksitModal.hide();
+            
+            showAlert('Taksit ayarları güncellendi', 'success');
+        })
+        .catch(error => showAlert('Taksit ayarları güncellenemedi: ' + error.message, 'danger'));
     }
 }
 
@@ -1215,49 +1196,60 @@ function hesaplaPrimler() {
         return;
     }
     
-    let toplamBrut = 0;
-    let toplamKesinti = 0;
-    
-    tahsilatVerileri.forEach(item => {
-        const tutar = parseFloat(item.TUTAR) || 0;
-        const kesinti = tutar * (item.kesinti_orani / 100);
-        
-        toplamBrut += tutar;
-        toplamKesinti += kesinti;
-    });
-    
-    let netTahsilat = toplamBrut - toplamKesinti;
-    
-    // YENİ: Net Ciro Eklemelerini ekle
-    const toplamNetCiro = netCiroEklemeleri.reduce((sum, e) => sum + e.tutar, 0);
-    netTahsilat += toplamNetCiro;
-    
-    const toplamGider = 
-        laboratuvarGiderleri.reduce((sum, g) => sum + g.tutar, 0) +
-        implantGiderleri.reduce((sum, g) => sum + g.tutar, 0) +
-        digerGiderler.reduce((sum, g) => sum + g.tutar, 0);
-    
-    const primMatrahi = netTahsilat - toplamGider;
-    let hesaplananPrim = primMatrahi * (primOrani / 100);
-    
-    // YENİ: Hak Ediş Eklemelerini ekle
-    const toplamHakedis = hakedisEklemeleri.reduce((sum, e) => sum + e.tutar, 0);
-    hesaplananPrim += toplamHakedis;
-    
-    const hesaplama = {
-        toplam_brut: toplamBrut,
-        toplam_kesinti: toplamKesinti,
-        net_tahsilat: netTahsilat,
-        net_ciro_ek: toplamNetCiro, // YENİ
-        toplam_gider: toplamGider,
-        prim_matrahi: primMatrahi,
+    // Tahsilat listesi sunucudaki taslakta; yalnızca oran ve gider listeleri gönderilir
+    taslakGuncelle({
         prim_orani: primOrani,
-        hesaplanan_prim: hesaplananPrim,
-        hakedis_ek: toplamHakedis // YENİ
+        ...giderListeleri()
+    })
+    .then(data => {
+        displayHesaplamaSonucu(data.hesaplama);
+        showHesaplamaSonucu();
+    })
+    .catch(error => showAlert('Prim hesaplanamadı: ' + error.message, 'danger'));
+}
+
+function giderListeleri() {
+    return {
+        laboratuvar_giderleri: laboratuvarGiderleri.map(g => ({
+            tarih: g.tarih,
+            hasta_adi: g.hasta_adi,
+            hasta_id: g.hasta_id || '',
+            islem: g.islem,
+            tutar: g.tutar
+        })),
+        implant_giderleri: implantGiderleri.map(g => ({
+            tarih: g.tarih,
+            hasta_adi: g.hasta_adi,
+            hasta_id: g.hasta_id || '',
+            implant_markasi: g.implant_markasi,
+            boy: g.boy,
+            cap: g.cap,
+            birim: g.birim,
+            adet: g.adet,
+            tutar: g.tutar
+        })),
+        diger_giderler: digerGiderler.map(g => ({
+            hasta_adi: g.hasta_adi,
+            hasta_id: g.hasta_id || '',
+            kategori: g.kategori,
+            tutar: g.tutar,
+            aciklama: g.aciklama || ''
+        })),
+        net_ciro_eklemeleri: netCiroEklemeleri.map(e => ({
+            tarih: e.tarih,
+            hasta_adi: e.hasta_adi,
+            hasta_id: e.hasta_id || '',
+            aciklama: e.aciklama,
+            tutar: e.tutar,
+            kategori: e.kategori
+        })),
+        hakedis_eklemeleri: hakedisEklemeleri.map(e => ({
+            tarih: e.tarih,
+            aciklama: e.aciklama,
+            tutar: e.tutar,
+            kategori: e.kategori
+        }))
     };
-    
-    displayHesaplamaSonucu(hesaplama);
-    showHesaplamaSonucu();
 }
 
 function displayHesaplamaSonucu(hesaplama) {
@@ -1348,6 +1340,12 @@ function kaydetPrimler(hesaplama) {
         return;
     }
     
+    const primOrani = parseFloat(document.getElementById('primOraniInput').value);
+    if (!primOrani || primOrani <= 0) {
+        showAlert('Geçerli bir prim oranı girin', 'warning');
+        return;
+    }
+    
     const kaydetBtn = document.getElementById('kaydetBtn');
     const originalText = kaydetBtn ? kaydetBtn.innerHTML : '';
     
@@ -1359,83 +1357,19 @@ function kaydetPrimler(hesaplama) {
     const cariEslestirCheckbox = document.getElementById('cariEslestirCheckbox');
     const cariEslestir = cariEslestirCheckbox ? cariEslestirCheckbox.checked : false;
     
+    // Tahsilatlar sunucudaki taslaktan kaydedilir; oran ve gider listeleri ekrandaki
+    // güncel halleriyle gönderilir (son "Hesapla"dan sonra değişmiş olabilirler)
     const requestData = {
-        prim_data: {
-            doktor_id: hekimBilgisi.id,
-            doktor_adi: hekimBilgisi.name,
-            sube_id: document.getElementById('subeSelect').value,
-            sube_adi: document.getElementById('subeSelect').selectedOptions[0]?.textContent,
-            donem_baslangic: document.getElementById('baslangicTarihi').value,
-            donem_bitis: document.getElementById('bitisTarihi').value,
-            
-            brut_tahsilat: hesaplama.toplam_brut,
-            toplam_kesinti: hesaplama.toplam_kesinti,
-            net_tahsilat: hesaplama.net_tahsilat,
-            toplam_gider: hesaplama.toplam_gider,
-            prim_matrah: hesaplama.prim_matrahi,
-            prim_orani: hesaplama.prim_orani,
-            hesaplanan_prim: hesaplama.hesaplanan_prim,
-            olusturan_kullanici: sessionStorage.getItem('userRole') || 'admin'
-        },
-        tahsilat_detaylari: tahsilatVerileri.map(item => ({
-            tahsilat_id: item.tahsilat_id || 'auto-' + Date.now(),
-            hasta_adi: item.HASTA_ADI,
-            hasta_id: item.HASTA_ID,
-            tarih: item.TARIH,
-            brut_tutar: parseFloat(item.TUTAR),
-            odeme_sekli: item.ODEME_SEKLI,
-            kdv_orani: item.kdv_durumu.kdv_orani,
-            kdv_tutari: parseFloat(item.TUTAR) * (item.kdv_durumu.kdv_orani / 100),
-            taksit_sayisi: item.taksit_sayisi || 1,
-            taksit_kesinti_orani: item.kesinti_orani || 0,
-            taksit_kesinti_tutari: parseFloat(item.TUTAR) * (item.kesinti_orani / 100),
-            net_tutar: parseFloat(item.TUTAR) * (1 - item.kesinti_orani / 100)
-        })),
-        laboratuvar_giderleri: laboratuvarGiderleri.map(g => ({
-            tarih: g.tarih,
-            hasta_adi: g.hasta_adi,
-            hasta_id: g.hasta_id || '',
-            islem: g.islem,
-            tutar: g.tutar
-        })),
-        implant_giderleri: implantGiderleri.map(g => ({
-            tarih: g.tarih,
-            hasta_adi: g.hasta_adi,
-            hasta_id: g.hasta_id || '',
-            implant_markasi: g.implant_markasi,
-            boy: g.boy,
-            cap: g.cap,
-            birim: g.birim,
-            adet: g.adet,
-            tutar: g.tutar
-        })),
-        diger_giderler: digerGiderler.map(g => ({
-            hasta_adi: g.hasta_adi,
-            hasta_id: g.hasta_id || '',
-            kategori: g.kategori,
-            tutar: g.tutar,
-            aciklama: g.aciklama || ''
-        })),
-        // YENİ: Net Ciro ve Hak Ediş Eklemeleri
-        net_ciro_eklemeleri: netCiroEklemeleri.map(e => ({
-            tarih: e.tarih,
-            hasta_adi: e.hasta_adi,
-            hasta_id: e.hasta_id || '',
-            aciklama: e.aciklama,
-            tutar: e.tutar,
-            kategori: e.kategori
-        })),
-        hakedis_eklemeleri: hakedisEklemeleri.map(e => ({
-            tarih: e.tarih,
-            aciklama: e.aciklama,
-            tutar: e.tutar,
-            kategori: e.kategori
-        })),
+        prim_orani: primOrani,
+        ...giderListeleri(),
+        doktor_adi: hekimBilgisi.name,
+        sube_id: document.getElementById('subeSelect').value,
+        sube_adi: document.getElementById('subeSelect').selectedOptions[0]?.textContent,
         cari_id: selectedCariId,
         cari_eslestir: cariEslestir
     };
     
-    fetch('/api/prim/kaydet', {
+    fetch(`/api/prim/taslak/${taslakId}/kaydet`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(requestData)
@@ -0,0 +1,623 @@
+# tahsilat_utils.py - Tahsilat analizi veri hazırlama ve analiz snapshot'ları
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import config
+from cache_utils import LRUStore
+from database import tedavi_matris_db
+from mysql_db import get_engine, doktor_bilgileri_getir, doktor_adlari_getir
+from yukleme_utils import TembelModul
+
+logger = logging.getLogger(__name__)
+
+# pandas/SQLAlchemy ilk analizde yüklenir
+pd = TembelModul('pandas')
+sqlalchemy = TembelModul('sqlalchemy')
+
+# Ödeme kesinti oranları
+KESINTI_ORANLARI = {
+    'nakit': 0,
+    'pos': 0.10,
+    'banka': 0.10,
+    'çek': 0.10,
+    'senet': 0,
+    'senet tahsilatı': 0
+}
+
+# Analiz snapshot deposu (download_tahsilatlar aynı sorguları tekrar çalıştırmasın diye)
+analiz_snapshotlari = LRUStore(
+    max_kayit=getattr(config, 'SNAPSHOT_MAX_KAYIT', 50),
+    max_bayt=getattr(config, 'SNAPSHOT_MAX_MB', 256) * 1024 * 1024,
+    ttl=getattr(config, 'SNAPSHOT_TTL', 1800)
+)
+
+# Tam tablo tedavi özeti (yalnızca tedavi matrisi kullanılamadığında yedek olarak)
+TUM_TEDAVI_SORGUSU = """
+SELECT
+    T1.HASTA_ID,
+    T1.DOKTOR_ID,
+    COALESCE(CONCAT(DR.ADI,' ',DR.SOYADI), '') AS HEKIM_ADI,
+    SUM(COALESCE(T1.TUTAR, T1.LISTETUTAR, 0)) AS TEDAVI_TOPLAM,
+    COUNT(*) AS TEDAVI_SAYISI,
+    MIN(T1.TARIH) AS ILK_TEDAVI,
+    MAX(T1.TARIH) AS SON_TEDAVI,
+    DR.SUBE_ID
+FROM tedavi AS T1
+LEFT JOIN kartdoktor AS DR ON T1.DOKTOR_ID = DR.CARI_ID
+WHERE (T1.SILINDI IS NULL OR T1.SILINDI != 'True')
+  AND (T1.ISDELETED IS NULL OR T1.ISDELETED != 'True')
+GROUP BY T1.HASTA_ID, T1.DOKTOR_ID, HEKIM_ADI, DR.SUBE_ID
+"""
+
+
+# Tedavi matrisi senkron aralıkları (saniye)
+TEDAVI_MATRIS_SENKRON_ARALIGI = getattr(config, 'TEDAVI_MATRIS_SENKRON_ARALIGI', 60)
+TEDAVI_MATRIS_TAM_YENILEME_ARALIGI = getattr(config, 'TEDAVI_MATRIS_TAM_YENILEME_ARALIGI', 6 * 3600)
+
+# Analizdeki bağımsız sorgular için sınırlı iş parçacığı havuzu; her iş ortak engine
+# havuzundan bir bağlantı kullanır, bu yüzden MYSQL_POOL_SIZE'dan küçük tutulmalı
+ANALIZ_IS_PARCACIGI = getattr(config, 'ANALIZ_IS_PARCACIGI', 4)
+_analiz_havuzu = ThreadPoolExecutor(max_workers=ANALIZ_IS_PARCACIGI, thread_name_prefix="tahsilat_analizi")
+
+# Matrisin ROWNO aralığıyla artımlı beslenmesi için özet sorgusu
+TEDAVI_OZET_SORGUSU = """
+SELECT
+    T1.HASTA_ID,
+    T1.DOKTOR_ID,
+    SUM(COALESCE(T1.TUTAR, T1.LISTETUTAR, 0)) AS TEDAVI_TOPLAM,
+    COUNT(*) AS TEDAVI_SAYISI,
+    MIN(T1.TARIH) AS ILK_TEDAVI,
+    MAX(T1.TARIH) AS SON_TEDAVI
+FROM tedavi AS T1
+WHERE (T1.SILINDI IS NULL OR T1.SILINDI != 'True')
+  AND (T1.ISDELETED IS NULL OR T1.ISDELETED != 'True')
+  AND T1.HASTA_ID IS NOT NULL
+  AND T1.ROWNO > :alt AND T1.ROWNO <= :ust
+GROUP BY T1.HASTA_ID, T1.DOKTOR_ID
+"""
+
+# Başarısız arka plan tam yenilemesinin en erken tekrar deneneceği süre (saniye)
+TAM_YENILEME_TEKRAR_DENEME = 900
+
+_matris_lock = threading.Lock()
+_son_matris_senkron = 0.0
+_matris_hazir = False
+
+# Arka plan tam yenileme iş parçacığı
+_tam_yenileme_kilidi = threading.Lock()
+_tam_yenileme_is_parcacigi = None
+_son_tam_yenileme_denemesi = None
+
+
+def _in_parametreleri(onek, degerler):
+    """IN (...) listesi için yer tutucu metni ve parametre sözlüğü üret"""
+    degerler = list(degerler)
+    placeholders = ','.join([f':{onek}_{i}' for i in range(len(degerler))])
+    params = {f'{onek}_{i}': deger for i, deger in enumerate(degerler)}
+    return placeholders, params
+
+
+def tahsilat_verilerini_getir(start_date, end_date, selected_branches, selected_doctors=None):
+    """Seçilen tarih/şube/hekim için tahsilatları çek ve kesinti/prim kolonlarını hesapla"""
+    branch_placeholders, params = _in_parametreleri('branch', selected_branches)
+    params.update({'start_date': start_date, 'end_date': end_date})
+
+    tahsilat_query = f"""
+    SELECT
+        T1.TARIH,
+        T1.ALACAK AS TUTAR,
+        T1.HEDEF_ILGILI_DOKTOR_ID AS DOKTOR_ID,
+        CONCAT(IFNULL(DR.ADI,''),' ',IFNULL(DR.SOYADI,'')) AS HEKIM_ADI,
+        IFNULL(DR.PRIMYUZDE,0) AS PRIMYUZDE,
+        CONCAT(IFNULL(H.ADI,''),' ',IFNULL(H.SOYADI,'')) AS HASTA_ADI,
+        H.HASTA_ID,
+        LOWER(IFNULL(OS.ADI,'bilinmeyen')) AS ODEME_SEKLI,
+        IFNULL(SB.UNVANI,'Bilinmeyen') AS SUBE_ADI,
+        T1.HAREKETTYPE
+    FROM carihareket AS T1
+    LEFT JOIN kartdoktor AS DR ON T1.HEDEF_ILGILI_DOKTOR_ID = DR.CARI_ID
+    LEFT JOIN odeme_sekilleri AS OS ON T1.ISLEM_TIPI_ID = OS.ROWNO
+    LEFT JOIN subeler AS SB ON T1.SUBE_ID = SB.CARI_ID
+    LEFT JOIN karthasta AS H ON T1.KAYNAK_CARI_ID = H.HASTA_ID
+    WHERE T1.SILINDI='False'
+      AND T1.ALACAK > 0
+      AND T1.HAREKETTYPE IN ('T','ST','CT')
+      AND T1.TARIH BETWEEN :start_date AND :end_date
+      AND T1.SUBE_ID IN ({branch_placeholders})
+    """
+
+    if selected_doctors:
+        doctor_placeholders, doctor_params = _in_parametreleri('doctor', selected_doctors)
+        tahsilat_query += f" AND T1.HEDEF_ILGILI_DOKTOR_ID IN ({doctor_placeholders})"
+        params.update(doctor_params)
+
+    df = pd.read_sql(sqlalchemy.text(tahsilat_query), get_engine(), params=params)
+
+    # Kesinti & Prim Hesaplama
+    df["ODEME_SEKLI"] = df["ODEME_SEKLI"].str.strip().str.lower()
+    df["KESINTI_ORANI"] = df["ODEME_SEKLI"].map(KESINTI_ORANLARI).fillna(0)
+    df["KESINTI"] = df["TUTAR"] * df["KESINTI_ORANI"]
+    df["NET_TAHSILAT"] = df["TUTAR"] - df["KESINTI"]
+    df["PRIM_YUZDE"] = df["PRIMYUZDE"] / 100
+    df["HESAPLANAN_PRIM"] = df["NET_TAHSILAT"] * df["PRIM_YUZDE"]
+    return df
+
+
+def coklu_hekim_hastalarini_bul(df, tum_tedavi_df, selected_branches, selected_doctors=None):
+    """
+    Tüm tedavi geçmişinden birden fazla hekimden tedavi gören hastaları bul ve
+    analizdeki hastalar, seçilen hekimler ve şubelerle sınırla
+    """
+    tum_multi_patients = set(
+        tum_tedavi_df.groupby("HASTA_ID")["DOKTOR_ID"].nunique()
+        .loc[lambda x: x > 1].index.astype(str).tolist()
+    )
+
+    # FİLTRE 1: Ana analizde görünen hastalarla sınırla
+    ana_analiz_hastalari = set(df["HASTA_ID"].astype(str).tolist())
+    multi_patients = tum_multi_patients.intersection(ana_analiz_hastalari)
+
+    # FİLTRE 2: Seçilen hekimlerden en az birinden tedavi gören hastalar
+    if selected_doctors:
+        selected_doctor_patients = set(
+            tum_tedavi_df[tum_tedavi_df["DOKTOR_ID"].isin(selected_doctors)]["HASTA_ID"].astype(str).tolist()
+        )
+        multi_patients = multi_patients.intersection(selected_doctor_patients)
+
+    # FİLTRE 3: Seçilen şubelerle ilgili çoklu hekim durumları
+    selected_branch_patients = set(
+        tum_tedavi_df[tum_tedavi_df["SUBE_ID"].isin(selected_branches)]["HASTA_ID"].astype(str).tolist()
+    )
+    multi_patients = multi_patients.intersection(selected_branch_patients)
+
+    logger.info(f"Toplam çoklu hekim hasta sayısı: {len(tum_multi_patients)}")
+    logger.info(f"Ana analizde bulunan çoklu hekim hasta sayısı: {len(tum_multi_patients.intersection(ana_analiz_hastalari))}")
+    logger.info(f"Filtreler uygulandıktan sonra: {len(multi_patients)}")
+    return multi_patients
+
+
+def hasta_tahsilat_ozetini_getir(hasta_ids):
+    """Hastaların tüm zamanlardaki tahsilatlarını hekim bazında topla"""
+    if not hasta_ids:
+        return pd.DataFrame(columns=["DOKTOR_ID", "HASTA_ID", "TOPLAM_TUTAR",
+                                     "TAHSILAT_SAYISI", "SON_TAHSILAT_TARIHI"])
+
+    hasta_placeholders, params = _in_parametreleri('hasta', hasta_ids)
+    query = f"""
+    SELECT
+        T1.HEDEF_ILGILI_DOKTOR_ID AS DOKTOR_ID,
+        H.HASTA_ID,
+        SUM(T1.ALACAK) AS TOPLAM_TUTAR,
+        COUNT(*) AS TAHSILAT_SAYISI,
+        MAX(T1.TARIH) AS SON_TAHSILAT_TARIHI
+    FROM carihareket AS T1
+    LEFT JOIN karthasta AS H ON T1.KAYNAK_CARI_ID = H.HASTA_ID
+    WHERE T1.SILINDI='False'
+      AND T1.ALACAK > 0
+      AND T1.HAREKETTYPE IN ('T','ST','CT')
+      AND H.HASTA_ID IN ({hasta_placeholders})
+    GROUP BY T1.HEDEF_ILGILI_DOKTOR_ID, H.HASTA_ID
+    """
+    return pd.read_sql(sqlalchemy.text(query), get_engine(), params=params)
+
+
+def hasta_adlarini_getir(hasta_ids):
+    """Hasta ID -> ad sözlüğü (tek sorguda)"""
+    if not hasta_ids:
+        return {}
+
+    hasta_placeholders, params = _in_parametreleri('hasta_name', hasta_ids)
+    query = f"""
+    SELECT HASTA_ID, CONCAT(IFNULL(ADI,''), ' ', IFNULL(SOYADI,'')) AS HASTA_ADI
+    FROM karthasta
+    WHERE HASTA_ID IN ({hasta_placeholders})
+    """
+    hasta_adlari_df = pd.read_sql(sqlalchemy.text(query), get_engine(), params=params)
+    return dict(zip(hasta_adlari_df["HASTA_ID"].astype(str), hasta_adlari_df["HASTA_ADI"]))
+
+
+# ==================== TEDAVİ MATRİSİ ====================
+
+def _tarih_metni(deger):
+    if deger is None or pd.isna(deger):
+        return None
+    return str(deger)
+
+
+def _matris_satirlari(ozet_df):
+    """MySQL özet satırlarını SQLite matrisine yazılacak demetlere çevir"""
+    return [
+        (
+            str(row.HASTA_ID),
+            '' if row.DOKTOR_ID is None or pd.isna(row.DOKTOR_ID) else str(row.DOKTOR_ID),
+            float(row.TEDAVI_TOPLAM or 0),
+            int(row.TEDAVI_SAYISI),
+            _tarih_metni(row.ILK_TEDAVI),
+            _tarih_metni(row.SON_TEDAVI)
+        )
+        for row in ozet_df.itertuples(index=False)
+    ]
+
+
+def _tam_yenileme_calis():
+    """Matrisi MySQL'den baştan oluştur (arka plan iş parçacığında çalışır)"""
+    global _son_matris_senkron, _matris_hazir
+
+    with _matris_lock:
+        try:
+            engine = get_engine()
+            ust = pd.read_sql(sqlalchemy.text("SELECT IFNULL(MAX(ROWNO), 0) AS UST FROM tedavi"), engine)["UST"].iloc[0]
+            ust = int(ust or 0)
+            parcalar = pd.read_sql(sqlalchemy.text(TEDAVI_OZET_SORGUSU), engine,
+                                   params={"alt": 0, "ust": ust}, chunksize=50000)
+            # Yeniden oluşturma tek transaction'dır; bitene kadar okuyucular son senkron matrisini görür
+            tedavi_matris_db.matris_yeniden_olustur((_matris_satirlari(p) for p in parcalar), ust)
+            _son_matris_senkron = time.monotonic()
+            _matris_hazir = True
+        except Exception as e:
+            logger.error(f"Tedavi matrisi arka plan yenileme hatası: {e}")
+
+
+def tam_yenilemeyi_baslat(zorla=False):
+    """
+    Matrisin tam yenilemesini arka planda başlat. Zaten çalışıyorsa veya son başarısız
+    denemenin üzerinden TAM_YENILEME_TEKRAR_DENEME geçmediyse (zorla=False) False döner.
+    """
+    global _tam_yenileme_is_parcacigi, _son_tam_yenileme_denemesi
+
+    with _tam_yenileme_kilidi:
+        if _tam_yenileme_is_parcacigi is not None and _tam_yenileme_is_parcacigi.is_alive():
+            return False
+        if (not zorla and _son_tam_yenileme_denemesi is not None
+                and time.monotonic() - _son_tam_yenileme_denemesi < TAM_YENILEME_TEKRAR_DENEME):
+            return False
+        _son_tam_yenileme_denemesi = time.monotonic()
+        _tam_yenileme_is_parcacigi = threading.Thread(
+            target=_tam_yenileme_calis, name="tedavi_matrisi_yenileme", daemon=True
+        )
+        _tam_yenileme_is_parcacigi.start()
+        logger.info("Tedavi matrisi tam yenilemesi arka planda başlatıldı")
+        return True
+
+
+def tam_yenileme_suruyor_mu():
+    """Arka plan tam yenilemesi şu anda çalışıyor mu"""
+    is_parcacigi = _tam_yenileme_is_parcacigi
+    return is_parcacigi is not None and is_parcacigi.is_alive()
+
+
+def tedavi_matrisini_guncelle(tam_yenileme=False):
+    """
+    Yerel hasta x hekim tedavi matrisini MySQL ile eşitle.
+    Yalnızca watermark'tan sonraki ROWNO'lar okunur. Silinen/düzeltilen eski tedavileri
+    yakalayan tam yenileme (ilk kullanımda, TEDAVI_MATRIS_TAM_YENILEME_ARALIGI dolduğunda
+    veya tam_yenileme=True ile) arka planda çalışır; o sürede son senkron matrisi kullanılır.
+    Kilit başka bir iş parçacığındaysa beklemeden False döner.
+    """
+    global _son_matris_senkron, _matris_hazir
+
+    if tam_yenileme:
+        return tam_yenilemeyi_baslat(zorla=True)
+    if time.monotonic() - _son_matris_senkron < TEDAVI_MATRIS_SENKRON_ARALIGI:
+        return False
+
+    # Ortak analiz havuzundaki işçi kilidi beklemez: başka bir senkron veya tam yenileme
+    # sürüyorsa bu analiz mevcut matrisle devam eder
+    if not _matris_lock.acquire(blocking=False):
+        return False
+    try:
+        if time.monotonic() - _son_matris_senkron < TEDAVI_MATRIS_SENKRON_ARALIGI:
+            return False
+
+        durum = tedavi_matris_db.durum_getir()
+        watermark = durum['watermark']
+
+        son_tam = durum.get('son_tam_yenileme')
+        if (not son_tam or (datetime.now() - datetime.fromisoformat(son_tam)).total_seconds()
+                > TEDAVI_MATRIS_TAM_YENILEME_ARALIGI):
+            tam_yenilemeyi_baslat()
+        if not watermark:
+            # Matris henüz hiç oluşturulmadı; ilk tam yenileme arka planda hazırlanıyor
+            return False
+
+        engine = get_engine()
+        ust = pd.read_sql(sqlalchemy.text("SELECT IFNULL(MAX(ROWNO), 0) AS UST FROM tedavi"), engine)["UST"].iloc[0]
+        ust = int(ust or 0)
+        if ust > watermark:
+            yeni_df = pd.read_sql(sqlalchemy.text(TEDAVI_OZET_SORGUSU), engine,
+                                  params={"alt": watermark, "ust": ust})
+            tedavi_matris_db.matris_birlestir(_matris_satirlari(yeni_df), ust)
+
+        _son_matris_senkron = time.monotonic()
+        _matris_hazir = True
+        return True
+    finally:
+        _matris_lock.release()
+
+
+def tedavi_ozetini_getir(hasta_ids):
+    """
+    Verilen hastaların hasta x hekim tedavi özeti (eski tum_tedavi_query kolonlarıyla).
+    Hekim adı ve şubesi referans önbelleğinden eklenir.
+    """
+    kolonlar = ["HASTA_ID", "DOKTOR_ID", "TEDAVI_TOPLAM", "TEDAVI_SAYISI", "ILK_TEDAVI", "SON_TEDAVI"]
+    satirlar = tedavi_matris_db.matris_getir(hasta_ids) if hasta_ids else []
+    df = pd.DataFrame(satirlar)
+    df = df.rename(columns={k.lower(): k for k in kolonlar}) if not df.empty else pd.DataFrame(columns=kolonlar)
+
+    doktorlar = doktor_bilgileri_getir()
+    doktorlar["CARI_ID"] = doktorlar["CARI_ID"].astype(str)
+    df = df.merge(doktorlar, how="left", left_on="DOKTOR_ID", right_on="CARI_ID").drop(columns=["CARI_ID"])
+    df["HEKIM_ADI"] = df["HEKIM_ADI"].fillna("")
+    return df
+
+
+def _tedavi_matrisini_hazirla():
+    """
+    Tedavi matrisini eşitle. Matris henüz hiç oluşturulmadıysa (ilk tam yenileme arka
+    planda sürüyor veya başarısız) eski tam tablo sorgusunun sonucunu döndürür, aksi halde None.
+    """
+    try:
+        tedavi_matrisini_guncelle()
+    except Exception as e:
+        logger.warning(f"Tedavi matrisi güncellenemedi, son senkron verisi kullanılacak: {e}")
+
+    if not _matris_hazir and not tedavi_matris_db.durum_getir()['watermark']:
+        logger.warning("Tedavi matrisi henüz oluşturulmadı, tam sorgu kullanılacak")
+        return pd.read_sql(TUM_TEDAVI_SORGUSU, get_engine())
+    return None
+
+
+def _tedavi_ozeti_hazirla(df, yedek_tedavi_df=None):
+    """
+    Analizdeki hastalar için tedavi özetini matristen getir.
+    yedek_tedavi_df verilmişse (matris oluşturulamadı) doğrudan o kullanılır.
+    """
+    if yedek_tedavi_df is not None:
+        return yedek_tedavi_df
+
+    analiz_hastalari = set(df["HASTA_ID"].dropna().astype(str))
+    aday_hastalar = tedavi_matris_db.coklu_hekim_hastalari_getir(analiz_hastalari)
+    return tedavi_ozetini_getir(aday_hastalar)
+
+
+def _zamanla(sureler, ad, fonksiyon, *args):
+    """Fonksiyonu çalıştır ve süresini saniye cinsinden sureler[ad]'a yaz"""
+    baslangic = time.perf_counter()
+    try:
+        return fonksiyon(*args)
+    finally:
+        sureler[ad] = round(time.perf_counter() - baslangic, 3)
+
+
+def tahsilat_analizi_yap(start_date, end_date, selected_branches, selected_doctors=None):
+    """
+    analyze_tahsilatlar ve download_tahsilatlar'ın ortak veri hazırlığı.
+    Tahsilat boşsa yalnızca 'df' dolu döner, çoklu hekim sorguları çalıştırılmaz.
+
+    Birbirinden bağımsız sorgular ortak havuz üzerinden paralel çalışır:
+      1. dönem tahsilatları | tedavi matrisi senkronu | hekim referans verisi
+      2. (hasta kümesi belli olunca) tüm zamanlar tahsilatları | hasta adları
+    Sorgu süreleri analiz["sureler"] içinde döner.
+    """
+    sureler = {}
+    baslangic = time.perf_counter()
+
+    tahsilat_isi = _analiz_havuzu.submit(_zamanla, sureler, "tahsilat", tahsilat_verilerini_getir,
+                                         start_date, end_date, selected_branches, selected_doctors)
+    matris_isi = _analiz_havuzu.submit(_zamanla, sureler, "tedavi_matrisi", _tedavi_matrisini_hazirla)
+    hekim_isi = _analiz_havuzu.submit(_zamanla, sureler, "hekimler", doktor_bilgileri_getir)
+
+    df = tahsilat_isi.result()
+    analiz = {
+        "df": df,
+        "multi_patients": [],
+        "tedavi_df": pd.DataFrame(),
+        "tum_tahsilat_df": pd.DataFrame(),
+        "hasta_adlari": {},
+        "sureler": sureler
+    }
+    if df.empty:
+        sureler["toplam"] = round(time.perf_counter() - baslangic, 3)
+        return analiz
+
+    # Çoklu hekim tespiti: tüm tedavi geçmişinin yerel matrisinden (analizdeki hastalarla sınırlı)
+    yedek_tedavi_df = matris_isi.result()
+    hekim_isi.result()
+    tum_tedavi_df = _zamanla(sureler, "tedavi_ozeti", _tedavi_ozeti_hazirla, df, yedek_tedavi_df)
+    multi_patients = coklu_hekim_hastalarini_bul(df, tum_tedavi_df, selected_branches, selected_doctors)
+
+    # Çoklu hekim işareti ekle (sadece filtrelenmiş veride)
+    df["IS_MULTI_DOCTOR"] = df["HASTA_ID"].astype(str).isin(multi_patients)
+
+    multi_patients = sorted(multi_patients)
+    tum_tahsilat_isi = _analiz_havuzu.submit(_zamanla, sureler, "tum_tahsilatlar",
+                                             hasta_tahsilat_ozetini_getir, multi_patients)
+    hasta_adi_isi = _analiz_havuzu.submit(_zamanla, sureler, "hasta_adlari",
+                                          hasta_adlarini_getir, multi_patients)
+
+    analiz.update({
+        "multi_patients": multi_patients,
+        "tedavi_df": tum_tedavi_df[tum_tedavi_df["HASTA_ID"].astype(str).isin(multi_patients)].copy(),
+        "tum_tahsilat_df": tum_tahsilat_isi.result(),
+        "hasta_adlari": hasta_adi_isi.result()
+    })
+
+    sureler["toplam"] = round(time.perf_counter() - baslangic, 3)
+    logger.info(f"Tahsilat analizi süreleri (sn): {sureler}")
+    return analiz
+
+
+# ==================== ÇOKLU HEKİM SORUNLARI ====================
+
+def _kimlik_metni(seri):
+    """ID kolonlarını karşılaştırma için metne çevir (boş değerler korunur)"""
+    return seri.where(seri.isna(), seri.astype(str))
+
+
+def coklu_hekim_sorunlarini_olustur(analiz, selected_doctors=None, sayfa=None, sayfa_boyutu=None):
+    """
+    Çoklu hekim hastaları için multi_doctor_issues yapısını tek merge/groupby ile üret.
+    Hasta başına tedavi ve tüm zamanlar tahsilat özetleri HASTA_ID/DOKTOR_ID üzerinden
+    outer join edilir. sayfa_boyutu verilmezse tüm hastalar döner; verilirse yalnızca istenen
+    sayfadaki hastalar (ve yalnızca onların popup detayları) döner. Excel raporu sayfalamaz.
+
+    Returns: (multi_doctor_issues, sayfalama bilgisi)
+    """
+    multi_patients = list(analiz["multi_patients"])
+    toplam_hasta = len(multi_patients)
+
+    if sayfa_boyutu:
+        sayfa = max(int(sayfa or 1), 1)
+        sayfa_boyutu = int(sayfa_boyutu)
+        multi_patients = multi_patients[(sayfa - 1) * sayfa_boyutu:sayfa * sayfa_boyutu]
+        toplam_sayfa = (toplam_hasta + sayfa_boyutu - 1) // sayfa_boyutu
+    else:
+        sayfa, toplam_sayfa = 1, 1
+
+    sayfalama = {
+        "toplam_hasta": toplam_hasta,
+        "sayfa": sayfa,
+        "sayfa_boyutu": sayfa_boyutu,
+        "toplam_sayfa": toplam_sayfa
+    }
+    if not multi_patients:
+        return [], sayfalama
+
+    hasta_kumesi = set(multi_patients)
+    df = analiz["df"]
+
+    # Tedavi ve tahsilat özetlerini sayfadaki hastalarla sınırla
+    tedavi = analiz["tedavi_df"]
+    tedavi = tedavi.assign(HASTA_ID=tedavi["HASTA_ID"].astype(str), DOKTOR_ID=_kimlik_metni(tedavi["DOKTOR_ID"]))
+    tedavi = tedavi[tedavi["HASTA_ID"].isin(hasta_kumesi)]
+
+    tahsilat = analiz["tum_tahsilat_df"]
+    if tahsilat.empty:
+        tahsilat = pd.DataFrame(columns=["DOKTOR_ID", "HASTA_ID", "TOPLAM_TUTAR",
+                                         "TAHSILAT_SAYISI", "SON_TAHSILAT_TARIHI"])
+    tahsilat = tahsilat.assign(HASTA_ID=tahsilat["HASTA_ID"].astype(str), DOKTOR_ID=_kimlik_metni(tahsilat["DOKTOR_ID"]))
+    tahsilat = tahsilat[tahsilat["HASTA_ID"].isin(hasta_kumesi)]
+
+    # Hasta bazında toplamlar (tüm hekimler dahil)
+    toplam_tedavi = tedavi.groupby("HASTA_ID")["TEDAVI_TOPLAM"].sum()
+    toplam_tahsilat = tahsilat.groupby("HASTA_ID")["TOPLAM_TUTAR"].sum()
+
+    # Hasta x hekim outer join
+    tedavi_kolonlari = ["HASTA_ID", "DOKTOR_ID", "HEKIM_ADI", "TEDAVI_TOPLAM",
+                        "TEDAVI_SAYISI", "ILK_TEDAVI", "SON_TEDAVI"]
+    tahsilat_kolonlari = ["HASTA_ID", "DOKTOR_ID", "TOPLAM_TUTAR", "TAHSILAT_SAYISI", "SON_TAHSILAT_TARIHI"]
+    birlesik = tedavi[tedavi_kolonlari].drop_duplicates(["HASTA_ID", "DOKTOR_ID"]).merge(
+        tahsilat[tahsilat_kolonlari].drop_duplicates(["HASTA_ID", "DOKTOR_ID"]),
+        on=["HASTA_ID", "DOKTOR_ID"], how="outer", indicator=True
+    )
+
+    tedavi_var = birlesik["_merge"] != "right_only"
+    tahsilat_var = birlesik["_merge"] != "left_only"
+    birlesik["TEDAVI_TOPLAM"] = birlesik["TEDAVI_TOPLAM"].fillna(0).astype(float)
+    birlesik["TEDAVI_SAYISI"] = birlesik["TEDAVI_SAYISI"].fillna(0).astype(int)
+    birlesik["TOPLAM_TUTAR"] = birlesik["TOPLAM_TUTAR"].fillna(0).astype(float)
+    birlesik["TAHSILAT_SAYISI"] = birlesik["TAHSILAT_SAYISI"].fillna(0).astype(int)
+    birlesik["ILK_TEDAVI"] = birlesik["ILK_TEDAVI"].astype(str).where(tedavi_var, "Tedavi Yok")
+    birlesik["SON_TEDAVI"] = birlesik["SON_TEDAVI"].astype(str).where(tedavi_var, "Tedavi Yok")
+    birlesik["SON_TAHSILAT_TARIHI"] = birlesik["SON_TAHSILAT_TARIHI"].astype(str).where(tahsilat_var, "Tahsilat Yok")
+
+    # Hekim adı: tedavi kaydından, yoksa referans önbelleğinden
+    hekim_adlari = doktor_adlari_getir(birlesik.loc[~tedavi_var, "DOKTOR_ID"].dropna().unique())
+    eksik_adlar = birlesik["DOKTOR_ID"].map(hekim_adlari)
+    eksik_adlar = eksik_adlar.fillna("Hekim ID: " + birlesik["DOKTOR_ID"].astype(str))
+    birlesik["HEKIM_ADI"] = birlesik["HEKIM_ADI"].where(tedavi_var, eksik_adlar)
+
+    secilenler = {str(d) for d in selected_doctors or []}
+    birlesik["IS_SELECTED"] = birlesik["DOKTOR_ID"].isin(secilenler) if secilenler else False
+    birlesik["FARK"] = birlesik["TOPLAM_TUTAR"] - birlesik["TEDAVI_TOPLAM"]
+
+    # Sıfır olmayan tutarları göster
+    birlesik = birlesik[(birlesik["TEDAVI_TOPLAM"] > 0) | (birlesik["TOPLAM_TUTAR"] > 0)]
+
+    hekimler = {}
+    for row in birlesik.itertuples(index=False):
+        hekimler.setdefault(row.HASTA_ID, []).append({
+            "hekim_adi": row.HEKIM_ADI,
+            "hekim_id": row.DOKTOR_ID,
+            "is_selected": bool(row.IS_SELECTED),
+            "tedavi_tutari": float(row.TEDAVI_TOPLAM),
+            "tedavi_sayisi": int(row.TEDAVI_SAYISI),
+            "tahsilat_tutari": float(row.TOPLAM_TUTAR),
+            "tahsilat_sayisi": int(row.TAHSILAT_SAYISI),
+            "son_tahsilat_tarihi": row.SON_TAHSILAT_TARIHI,
+            "fark": float(row.FARK),
+            "ilk_tedavi": row.ILK_TEDAVI,
+            "son_tedavi": row.SON_TEDAVI
+        })
+
+    # Hasta adı: dönem tahsilatından, yoksa karthasta'dan
+    hasta_adlari = df.assign(HASTA_ID=df["HASTA_ID"].astype(str)).drop_duplicates("HASTA_ID")
+    hasta_adlari = dict(zip(hasta_adlari["HASTA_ID"], hasta_adlari["HASTA_ADI"]))
+    tedavisi_olanlar = set(tedavi["HASTA_ID"])
+
+    multi_doctor_issues = []
+    for hasta_id in multi_patients:
+        hasta_adi = hasta_adlari.get(hasta_id) or analiz["hasta_adlari"].get(hasta_id, f"Hasta ID: {hasta_id}")
+        if not hasta_adi or (hasta_id not in hasta_adlari and hasta_id not in tedavisi_olanlar):
+            continue
+
+        hasta_hekimleri = hekimler.get(hasta_id, [])
+        tedavi_toplami = float(toplam_tedavi.get(hasta_id, 0.0))
+        tahsilat_toplami = float(toplam_tahsilat.get(hasta_id, 0.0))
+        multi_doctor_issues.append({
+            "hasta_id": hasta_id,
+            "hasta_adi": hasta_adi,
+            "hekim_sayisi": len(hasta_hekimleri),
+            "toplam_tedavi": tedavi_toplami,
+            "toplam_tahsilat": tahsilat_toplami,
+            "toplam_fark": tahsilat_toplami - tedavi_toplami,
+            "sorun_tipi": "Normal",
+            "hekimler": hasta_hekimleri
+        })
+
+    return multi_doctor_issues, sayfalama
+
+
+# ==================== ANALİZ SNAPSHOT'LARI ====================
+
+def snapshot_id_olustur(kullanici, start_date, end_date, selected_branches, selected_doctors=None):
+    """Filtreler + kullanıcıdan deterministik snapshot ID'si üret"""
+    anahtar = "|".join([
+        str(kullanici),
+        str(start_date),
+        str(end_date),
+        ",".join(sorted(str(b) for b in selected_branches or [])),
+        ",".join(sorted(str(d) for d in selected_doctors or []))
+    ])
+    return hashlib.sha1(anahtar.encode("utf-8")).hexdigest()[:24]
+
+
+def snapshot_kaydet(kullanici, start_date, end_date, selected_branches, selected_doctors, analiz):
+    """Analiz sonucunu sakla ve snapshot ID'sini döndür (saklanamazsa None)"""
+    snapshot_id = snapshot_id_olustur(kullanici, start_date, end_date, selected_branches, selected_doctors)
+    kayit = dict(analiz)
+    kayit.update({
+        "kullanici": kullanici,
+        "start_date": start_date,
+        "end_date": end_date,
+        "selected_branches": list(selected_branches or []),
+        "selected_doctors": list(selected_doctors or [])
+    })
+    if analiz_snapshotlari.koy(snapshot_id, kayit):
+        return snapshot_id
+    return None
+
+
+def snapshot_getir(snapshot_id, kullanici):
+    """Snapshot'ı döndür; yoksa, süresi dolduysa veya başka kullanıcıya aitse None"""
+    if not snapshot_id:
+        return None
+    kayit = analiz_snapshotlari.al(snapshot_id)
+    if kayit is None or kayit.get("kullanici") != kullanici:
+        return None
+    return kayit
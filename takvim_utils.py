@@ -0,0 +1,248 @@
+# takvim_utils.py - Randevu takvimi sorgu yardımcıları
+import hashlib
+import json
+import logging
+import uuid
+
+import config
+from cache_utils import LRUStore
+from mysql_db import doktor_adlari_getir, execute_query
+from yukleme_utils import TembelModul
+
+try:
+    import orjson
+except ImportError:  # orjson kurulu değilse standart json kullanılır
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# numpy/pandas ilk takvim isteğinde yüklenir
+np = TembelModul('numpy')
+pd = TembelModul('pandas')
+
+# Tek bir randevu satırının içerik özeti; değişiklik/ETag tespiti bu değer üzerinden yapılır
+SATIR_OZETI_SQL = "CRC32(CONCAT_WS('|', r.ROWNO, r.ADISOYADI, r.TARIH, r.SAATSTART, r.DAKKA, r.SUBE_ID, r.KAYNAKID))"
+
+# Hekim adı KAYNAKID üzerinden referans önbelleğinden eşlenir; KAYNAKID'ye fonksiyon
+# uygulanmadığı için randevu(SILINDI, TARIH, SUBE_ID, KAYNAKID) indeksi kullanılabilir
+OLAY_SORGUSU = f"""
+SELECT
+    r.ROWNO,
+    r.ADISOYADI AS hasta_adi,
+    s.UNVANI AS sube_adi,
+    r.TARIH,
+    r.SAATSTART,
+    r.DAKKA,
+    r.SUBE_ID,
+    r.KAYNAKID,
+    {SATIR_OZETI_SQL} AS SATIR_OZETI
+FROM randevu r
+LEFT JOIN subeler s ON r.SUBE_ID = s.CARI_ID
+WHERE {{kosul}}
+"""
+
+# Aralığın değişip değişmediğini tek satırla anlamak için parmak izi
+PARMAK_IZI_SORGUSU = f"""
+SELECT COUNT(*) AS ADET, IFNULL(BIT_XOR({SATIR_OZETI_SQL}), 0) AS OZET
+FROM randevu r
+WHERE {{kosul}}
+"""
+
+# Delta modu için satır kimlikleri ve özetleri (isim/join olmadan)
+SATIR_OZETLERI_SORGUSU = f"""
+SELECT r.ROWNO, {SATIR_OZETI_SQL} AS SATIR_OZETI
+FROM randevu r
+WHERE {{kosul}}
+"""
+
+# since= token'ları: token -> filtre anahtarı, ETag ve ROWNO -> satır özeti eşlemesi
+takvim_tokenlari = LRUStore(
+    max_kayit=getattr(config, 'TAKVIM_TOKEN_MAX_KAYIT', 500),
+    max_bayt=getattr(config, 'TAKVIM_TOKEN_MAX_MB', 64) * 1024 * 1024,
+    ttl=getattr(config, 'TAKVIM_TOKEN_TTL', 900)
+)
+
+# randevu.KAYNAKID hekimi 'DOK-<CARI_ID>' (eski kayıtlarda düz '<CARI_ID>') olarak tutar
+KAYNAK_ONEKI = 'DOK-'
+
+
+def kaynak_idleri(doktor_id):
+    """Hekim ID'sinin randevu tablosunda saklanabileceği KAYNAKID biçimleri"""
+    doktor_id = str(doktor_id).strip()
+    return [f"{KAYNAK_ONEKI}{doktor_id}", doktor_id]
+
+
+def kaynak_kosulu(onek, doktor_ids, params):
+    """
+    Hekim ID listesini KAYNAKID üzerinde indeks kullanabilen bir IN koşuluna çevir.
+    REPLACE(r.KAYNAKID, ...) yerine saklanan biçimler önceden üretilir.
+    """
+    degerler = []
+    for doktor_id in doktor_ids:
+        degerler.extend(kaynak_idleri(doktor_id))
+
+    placeholders = []
+    for i, deger in enumerate(degerler):
+        params[f"{onek}_{i}"] = deger
+        placeholders.append(f":{onek}_{i}")
+    return f"r.KAYNAKID IN ({','.join(placeholders)})"
+
+
+def doktor_id_ayikla(kaynak_seri):
+    """KAYNAKID kolonundan hekim ID'sini çıkar ('DOK-' öneki kaldırılır)"""
+    kaynak_seri = kaynak_seri.astype(str)
+    onekli = kaynak_seri.str.startswith(KAYNAK_ONEKI)
+    return kaynak_seri.where(~onekli, kaynak_seri.str.slice(len(KAYNAK_ONEKI)))
+
+
+def doktor_adlarini_esle(kaynak_seri):
+    """KAYNAKID kolonunu referans önbelleğindeki hekim adlarına eşle (JOIN yerine)"""
+    adlar = doktor_id_ayikla(kaynak_seri).map(doktor_adlari_getir()).astype(object)
+    # Eşleşmeyen hekimler LEFT JOIN'deki gibi None olsun
+    return adlar.where(adlar.notna(), None)
+
+
+# ==================== FULLCALENDAR ÇIKTISI ====================
+
+def json_kodla(veri):
+    """Veriyi UTF-8 JSON baytlarına çevir (varsa orjson ile)"""
+    if orjson is not None:
+        return orjson.dumps(veri)
+    return json.dumps(veri, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _iso_metinleri(zamanlar):
+    """datetime64 dizisini 'YYYY-MM-DDTHH:MM:SS' metinlerine çevir (NaT -> None)"""
+    degerler = zamanlar.to_numpy(dtype='datetime64[s]')
+    metinler = np.datetime_as_string(degerler, unit='s').astype(object)
+    metinler[np.isnat(degerler)] = None
+    return metinler.tolist()
+
+
+def _bos_olanlari_doldur(seri, varsayilan):
+    """None/NaN/boş metinleri varsayılan değerle değiştir"""
+    return seri.where(seri.notna() & (seri != ""), varsayilan).tolist()
+
+
+def takvim_olaylari(df):
+    """
+    Randevu DataFrame'inden FullCalendar olay listesini doğrudan kolon dizileriyle
+    üret (satır bazlı apply/kopya yok).
+    """
+    if df.empty:
+        return []
+
+    start = pd.to_datetime(
+        df["TARIH"].astype(str).str.strip() + " " + df["SAATSTART"].astype(str).str.strip(),
+        format="%Y-%m-%d %H:%M",
+        errors="coerce"
+    )
+    dakika = pd.to_numeric(df["DAKKA"], errors="coerce").fillna(30)
+    end = start + pd.to_timedelta(dakika, unit="m")
+
+    basliklar = df["hasta_adi"].astype(object)
+    olaylar = [
+        {
+            "id": rowno,
+            "title": baslik,
+            "start": baslangic,
+            "end": bitis,
+            "extendedProps": {"doktor": doktor, "sube": sube}
+        }
+        for rowno, baslik, baslangic, bitis, doktor, sube in zip(
+            df["ROWNO"].tolist(),
+            basliklar.where(basliklar.notna(), None).tolist(),
+            _iso_metinleri(start),
+            _iso_metinleri(end),
+            _bos_olanlari_doldur(df["doktor_adi"], "Belirtilmemiş"),
+            _bos_olanlari_doldur(df["sube_adi"], "Belirtilmemiş")
+        )
+    ]
+    return olaylar
+
+
+def takvim_olaylari_json(df):
+    """FullCalendar olay listesini JSON baytı olarak döndür"""
+    olaylar = takvim_olaylari(df)
+    return json_kodla(olaylar), len(olaylar)
+
+
+# ==================== ETAG VE DELTA SENKRONU ====================
+
+def _ozet_degeri(seri):
+    """Satır özetlerinin XOR'u (MySQL BIT_XOR ile aynı sonuç)"""
+    if seri.empty:
+        return 0
+    return int(np.bitwise_xor.reduce(seri.to_numpy(dtype=np.int64)))
+
+
+def etag_olustur(filtre_anahtari, adet, ozet):
+    """Filtreler + satır sayısı + içerik özetinden ETag değeri"""
+    filtre_ozeti = hashlib.sha1(filtre_anahtari.encode("utf-8")).hexdigest()[:12]
+    return f"{int(adet)}-{int(ozet):x}-{filtre_ozeti}"
+
+
+def parmak_izi_etag(filtre_anahtari, kosul, params):
+    """Aralığın güncel ETag'ini tek satırlık sorguyla hesapla"""
+    sonuc = execute_query(PARMAK_IZI_SORGUSU.format(kosul=kosul), params)
+    return etag_olustur(filtre_anahtari, sonuc["ADET"].iloc[0], sonuc["OZET"].iloc[0] or 0)
+
+
+def df_etag(filtre_anahtari, df):
+    """Sorgulanmış olay verisinden ETag (parmak izi sorgusuyla aynı formül)"""
+    return etag_olustur(filtre_anahtari, len(df), _ozet_degeri(df["SATIR_OZETI"]))
+
+
+def token_kaydet(filtre_anahtari, etag, df):
+    """Dönen olay kümesini hatırla ve bir sonraki delta isteği için token üret"""
+    token = uuid.uuid4().hex
+    ozetler = dict(zip(df["ROWNO"].tolist(), df["SATIR_OZETI"].tolist())) if not df.empty else {}
+    takvim_tokenlari.koy(token, {"filtre": filtre_anahtari, "etag": etag, "ozetler": ozetler})
+    return token
+
+
+def takvim_deltasi(token, filtre_anahtari, kosul, params):
+    """
+    since= token'ından bu yana eklenen/değişen ve silinen randevuları döndür.
+    Token bulunamazsa veya farklı filtreye aitse None döner (istemci tam yenileme yapmalı).
+    """
+    kayit = takvim_tokenlari.al(token)
+    if kayit is None or kayit["filtre"] != filtre_anahtari:
+        return None
+
+    # Hiçbir şey değişmediyse yalnızca parmak izi sorgusu çalışır
+    etag = parmak_izi_etag(filtre_anahtari, kosul, params)
+    if etag == kayit["etag"]:
+        return {"token": token, "etag": etag, "degisen": [], "silinen": []}
+
+    guncel = execute_query(SATIR_OZETLERI_SORGUSU.format(kosul=kosul), params)
+    eski_ozetler = kayit["ozetler"]
+    yeni_ozetler = dict(zip(guncel["ROWNO"].tolist(), guncel["SATIR_OZETI"].tolist()))
+
+    degisen_rownolar = [rowno for rowno, ozet in yeni_ozetler.items() if eski_ozetler.get(rowno) != ozet]
+    silinen = [rowno for rowno in eski_ozetler if rowno not in yeni_ozetler]
+
+    degisen = []
+    if degisen_rownolar:
+        rowno_params = dict(params)
+        placeholders = []
+        for i, rowno in enumerate(degisen_rownolar):
+            rowno_params[f"rowno_{i}"] = rowno
+            placeholders.append(f":rowno_{i}")
+        df = execute_query(
+            OLAY_SORGUSU.format(kosul=f"{kosul} AND r.ROWNO IN ({','.join(placeholders)})"),
+            rowno_params
+        )
+        if not df.empty:
+            df["doktor_adi"] = doktor_adlarini_esle(df["KAYNAKID"])
+        degisen = takvim_olaylari(df)
+
+    # Eski token'ı düşür, yeni durumu yeni token altında sakla
+    takvim_tokenlari.sil(token)
+    etag = etag_olustur(filtre_anahtari, len(yeni_ozetler),
+                        _ozet_degeri(pd.Series(list(yeni_ozetler.values()), dtype="int64")))
+    yeni_token = uuid.uuid4().hex
+    takvim_tokenlari.koy(yeni_token, {"filtre": filtre_anahtari, "etag": etag, "ozetler": yeni_ozetler})
+
+    logger.info(f"Takvim deltası: {len(degisen)} değişen, {len(silinen)} silinen")
+    return {"token": yeni_token, "etag": etag, "degisen": degisen, "silinen": silinen}
@@ -0,0 +1,136 @@
+# yukleme_utils.py - Tembel (ilk kullanımda) yükleme yardımcıları ve açılış süresi raporu
+import importlib
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Ölçülen yüklemeler: (tür, ad, süre ms, süreç başlangıcından beri saniye)
+_olcumler = []
+_olcum_kilidi = threading.Lock()
+_surec_baslangici = time.perf_counter()
+
+
+def _olcum_ekle(tur, ad, baslangic):
+    bitis = time.perf_counter()
+    with _olcum_kilidi:
+        _olcumler.append((tur, ad, (bitis - baslangic) * 1000, bitis - _surec_baslangici))
+
+
+class TembelModul:
+    """
+    İlk öznitelik erişiminde içe aktarılan modül. `pd = TembelModul('pandas')` ile
+    pandas modül yüklenirken değil, ilk pd.DataFrame(...) çağrısında yüklenir;
+    çağrı yerleri değişmez.
+    """
+    __slots__ = ('_ad', '_modul', '_kilit')
+
+    def __init__(self, ad):
+        object.__setattr__(self, '_ad', ad)
+        object.__setattr__(self, '_modul', None)
+        object.__setattr__(self, '_kilit', threading.Lock())
+
+    def _yukle(self):
+        modul = self._modul
+        if modul is None:
+            with self._kilit:
+                modul = self._modul
+                if modul is None:
+                    baslangic = time.perf_counter()
+                    yuklu_muydu = self._ad in sys.modules
+                    modul = importlib.import_module(self._ad)
+                    if not yuklu_muydu:
+                        _olcum_ekle('tembel_modul', self._ad, baslangic)
+                    object.__setattr__(self, '_modul', modul)
+        return modul
+
+    def __getattr__(self, ad):
+        return getattr(self._yukle(), ad)
+
+    def __setattr__(self, ad, deger):
+        setattr(self._yukle(), ad, deger)
+
+    def __repr__(self):
+        durum = 'yüklendi' if self._modul is not None else 'yüklenmedi'
+        return f"<TembelModul {self._ad} ({durum})>"
+
+
+class TembelOrnek:
+    """
+    İlk kullanımda oluşturulan nesne. Açılışta dosya/DDL işi yapan global veritabanı
+    nesneleri (prim_db, cari_db, ...) modül içe aktarılırken değil, ilk metot
+    çağrısında oluşturulur; eşzamanlı ilk çağrılarda fabrika bir kez çalışır.
+    """
+    __slots__ = ('_fabrika', '_ad', '_nesne', '_kilit')
+
+    def __init__(self, fabrika, ad=None):
+        object.__setattr__(self, '_fabrika', fabrika)
+        object.__setattr__(self, '_ad', ad or getattr(fabrika, '__name__', repr(fabrika)))
+        object.__setattr__(self, '_nesne', None)
+        object.__setattr__(self, '_kilit', threading.Lock())
+
+    def _olustur(self):
+        nesne = self._nesne
+        if nesne is None:
+            with self._kilit:
+                nesne = self._nesne
+                if nesne is None:
+                    baslangic = time.perf_counter()
+                    nesne = self._fabrika()
+                    _olcum_ekle('tembel_nesne', self._ad, baslangic)
+                    object.__setattr__(self, '_nesne', nesne)
+        return nesne
+
+    @property
+    def olusturuldu_mu(self):
+        return self._nesne is not None
+
+    def __getattr__(self, ad):
+        return getattr(self._olustur(), ad)
+
+    def __setattr__(self, ad, deger):
+        setattr(self._olustur(), ad, deger)
+
+    def __repr__(self):
+        durum = 'oluşturuldu' if self._nesne is not None else 'oluşturulmadı'
+        return f"<TembelOrnek {self._ad} ({durum})>"
+
+
+def sureli_ice_aktar(*modul_adlari):
+    """
+    Modülleri sırayla içe aktarıp her birinin süresini kaydet. Süre, o ana kadar
+    yüklenmemiş bağımlılıkları da kapsar; bu yüzden bağımlılıklar önce verilmelidir.
+    """
+    for ad in modul_adlari:
+        if ad in sys.modules:
+            continue
+        baslangic = time.perf_counter()
+        importlib.import_module(ad)
+        _olcum_ekle('ice_aktarma', ad, baslangic)
+
+
+def acilis_raporu():
+    """İçe aktarma ve tembel yükleme sürelerini (ms) ölçüm sırasıyla döndür"""
+    with _olcum_kilidi:
+        olcumler = list(_olcumler)
+    return {
+        "ice_aktarma": [
+            {"modul": ad, "ms": round(ms, 1)}
+            for tur, ad, ms, _ in olcumler if tur == 'ice_aktarma'
+        ],
+        "ice_aktarma_toplam_ms": round(sum(ms for tur, _, ms, _ in olcumler if tur == 'ice_aktarma'), 1),
+        "tembel_yuklemeler": [
+            {"tur": tur, "ad": ad, "ms": round(ms, 1), "acilistan_sonra_sn": round(zaman, 1)}
+            for tur, ad, ms, zaman in olcumler if tur != 'ice_aktarma'
+        ]
+    }
+
+
+def acilis_raporunu_logla():
+    """Açılış süresi raporunu tek satırda logla"""
+    rapor = acilis_raporu()
+    moduller = ", ".join(f"{m['modul']} {m['ms']:.0f} ms" for m in rapor["ice_aktarma"])
+    logger.info(f"Açılış: içe aktarma {rapor['ice_aktarma_toplam_ms']:.0f} ms ({moduller})")
+    return rapor